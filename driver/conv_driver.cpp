@@ -82,6 +82,7 @@ static int next_pow2(int n) {
 typedef struct {
     int return_code;
     float duration_ms;
+    float memset_ms;            // zero output before atomics of gemm_k_split, not in duration_ms
     std::string kernel_name;
 } result_t;
 
@@ -291,6 +292,8 @@ int main(int argc, char **argv) {
     float *host_input = (float *)malloc(n * c * hi * wi * sizeof(float));
     float *host_weight = (float *)malloc(k * c * y * x * sizeof(float));
     float *host_output = (float *)malloc(n * k * ho * wo * sizeof(float));
+    float *host_bias = (float *)malloc(k * sizeof(float));
+    float *host_output_epilogue = (float *)malloc(n * k * ho * wo * sizeof(float));
 
     int need_verify = conv_args.get_int("verify");
 
@@ -310,6 +313,7 @@ int main(int argc, char **argv) {
         // gen rand
         gen_rand_vector<float>(host_input, n * c * hi * wi, 0.0, 1.0);
         gen_rand_vector<float>(host_weight, k * c * y * x, -0.5, 0.5);
+        gen_rand_vector<float>(host_bias, k, -1.0, 1.0);
         // gen_rand_vector<float>(host_input, n*c*hi*wi, 1.0, 1.0);
         // gen_rand_vector<float>(host_weight, k*c*y*x, 0.5, 0.5);
 
@@ -323,6 +327,7 @@ int main(int argc, char **argv) {
     float *device_input;
     float *device_weight;
     float *device_output;
+    float *device_bias;
     float *device_output_to_host =
         (float *)malloc(n * k * ho * wo * sizeof(float));
 
@@ -330,38 +335,33 @@ int main(int argc, char **argv) {
     HIP_CALL(hipMalloc(&device_input, n * c * hi * wi * sizeof(float)));
     HIP_CALL(hipMalloc(&device_weight, k * c * y * x * sizeof(float)));
     HIP_CALL(hipMalloc(&device_output, n * k * ho * wo * sizeof(float)));
+    HIP_CALL(hipMalloc(&device_bias, k * sizeof(float)));
     HIP_CALL(hipMemcpy(device_input, host_input,
                        n * c * hi * wi * sizeof(float), hipMemcpyHostToDevice));
     HIP_CALL(hipMemcpy(device_weight, host_weight,
                        k * c * y * x * sizeof(float), hipMemcpyHostToDevice));
+    HIP_CALL(hipMemcpy(device_bias, host_bias,
+                       k * sizeof(float), hipMemcpyHostToDevice));
 
     
     {
         igemm_v4r1_dynamic_driver_t conv_driver;
         for (int i = 0; i < tunables.size(); i++) {
-            bool kernel_1x1 = false;
-            if ((y == 1) && (x == 1))
-            {
-                kernel_1x1 = true;
-            }
-        
             igemm_v4r1_dynamic_tunable_t *tunable = &tunables[i];
             // if(std::string("igemm_v4r1_dynamic_64x64x8_8x8_4x4x2x4x2x4_8x1x8x1_4x16")
             // != conv_driver.get_kernel_name(tunable))
             //    continue;
-            if (tunable->OPT_1x1){
-                if (!kernel_1x1)
-                {
-                    continue;
-                }
-            }
+            // 1x1, no_pad, unit_stride kernel only for the conv they are specialized for
+            if (!conv_driver.tunable_is_applicable(&conv_args, tunable))
+                continue;
             printf("  %s, ", conv_driver.get_kernel_name(tunable).c_str());
             if (need_verify)
                 HIP_CALL(hipMemset(device_output, 0,
                                    n * k * ho * wo * sizeof(float)));
             result_t result =
                 conv_driver.run(&conv_args, tunable, module, device_input,
-                                device_weight, device_output, warmup, repeat);
+                                device_weight, device_output, device_bias,
+                                warmup, repeat);
             if (result.return_code != 0)
                 continue;
             double gflops = measured_fp32_conv_gflops(
@@ -369,11 +369,21 @@ int main(int argc, char **argv) {
                 dilation_h, dilation_w, pad_h, pad_w);
             printf("cost:%.3fms, gflops:%.1f(%.2f%%)", result.duration_ms,
                    gflops, (gflops / fp32_gflops) * 100);
+            if (tunable->gemm_k_split)
+                printf(", memset:%.3fms", result.memset_ms);
             if (need_verify) {
                 HIP_CALL(hipMemcpy(device_output_to_host, device_output,
                                    n * k * ho * wo * sizeof(float),
                                    hipMemcpyDeviceToHost));
-                bool is_valid = valid_vector(host_output, device_output_to_host,
+                float *host_ref = host_output;
+                if (tunable->bias || tunable->activation) {
+                    memcpy(host_output_epilogue, host_output, n * k * ho * wo * sizeof(float));
+                    naive_conv_fwd_epilogue_nchw(host_output_epilogue, tunable->bias ? host_bias : NULL,
+                                                 n, k, ho, wo, tunable->activation,
+                                                 IGEMM_V4R1_DYNAMIC_CLAMP_MIN, IGEMM_V4R1_DYNAMIC_CLAMP_MAX);
+                    host_ref = host_output_epilogue;
+                }
+                bool is_valid = valid_vector(host_ref, device_output_to_host,
                                              n * k * ho * wo);
                 printf(", valid:%s", is_valid ? "y" : "n");
                 if (!is_valid) {
@@ -389,9 +399,12 @@ int main(int argc, char **argv) {
     free(host_input);
     free(host_weight);
     free(host_output);
+    free(host_bias);
+    free(host_output_epilogue);
     free(device_output_to_host);
 
     hipFree(device_input);
     hipFree(device_weight);
     hipFree(device_output);
+    hipFree(device_bias);
 }
\ No newline at end of file
@@ -28,6 +28,9 @@
 #define __IGEMM_V4R1_DYNAMIC_DRIVER_H
 
 #include "config_parser.h"
+#include <algorithm>
+#include <stdint.h>
+#include <string.h>
 #include <string>
 #include <unistd.h>
 #include <vector>
@@ -56,6 +59,27 @@ typedef struct {
     int wei_block_copy_cluster_lengths_k;
 
     int OPT_1x1;
+    int kernarg_compact;
+    int magic_div;
+    int grid_2d;
+    int swizzle_group;
+    int gemm_k_split;
+    int persistent;
+    int bias;
+    int activation;
+    int vector_store;
+    int no_pad;
+    int unit_stride;
+    int slice_table;
+
+    // passes over the kernel body, only the kernel name is affected here
+    int peephole;
+    int waitcnt;
+    int sched;
+    int sched_lds_latency;
+    int sched_vmem_latency;
+    int vgpr_alloc;
+    int sgpr_alloc;
 } igemm_v4r1_dynamic_tunable_t;
 
 static inline std::vector<igemm_v4r1_dynamic_tunable_t>
@@ -93,6 +117,44 @@ igemm_v4r1_dynamic_tunable_from_config(const config_content_t &content) {
             tunable.wei_block_copy_cluster_lengths_k =
                 sec.at("wei_block_copy_cluster_lengths_k").get_int();
             tunable.OPT_1x1 = 0;
+            tunable.kernarg_compact = sec.count("kernarg_compact") ?
+                sec.at("kernarg_compact").get_int() : 0;
+            tunable.magic_div = sec.count("magic_div") ?
+                sec.at("magic_div").get_int() : 0;
+            tunable.grid_2d = sec.count("grid_2d") ?
+                sec.at("grid_2d").get_int() : 0;
+            tunable.swizzle_group = sec.count("swizzle_group") ?
+                sec.at("swizzle_group").get_int() : 0;
+            tunable.gemm_k_split = sec.count("gemm_k_split") ?
+                sec.at("gemm_k_split").get_int() : 0;
+            tunable.persistent = sec.count("persistent") ?
+                sec.at("persistent").get_int() : 0;
+            tunable.bias = sec.count("bias") ?
+                sec.at("bias").get_int() : 0;
+            tunable.activation = sec.count("activation") ?
+                sec.at("activation").get_int() : 0;
+            tunable.vector_store = sec.count("vector_store") ?
+                sec.at("vector_store").get_int() : 0;
+            tunable.no_pad = sec.count("no_pad") ?
+                sec.at("no_pad").get_int() : 0;
+            tunable.unit_stride = sec.count("unit_stride") ?
+                sec.at("unit_stride").get_int() : 0;
+            tunable.slice_table = sec.count("slice_table") ?
+                sec.at("slice_table").get_int() : 0;
+            tunable.peephole = sec.count("peephole") ?
+                sec.at("peephole").get_int() : 0;
+            tunable.waitcnt = sec.count("waitcnt") ?
+                sec.at("waitcnt").get_int() : 0;
+            tunable.sched = sec.count("sched") ?
+                sec.at("sched").get_int() : 0;
+            tunable.sched_lds_latency = sec.count("sched_lds_latency") ?
+                sec.at("sched_lds_latency").get_int() : 64;
+            tunable.sched_vmem_latency = sec.count("sched_vmem_latency") ?
+                sec.at("sched_vmem_latency").get_int() : 300;
+            tunable.vgpr_alloc = sec.count("vgpr_alloc") ?
+                sec.at("vgpr_alloc").get_int() : 0;
+            tunable.sgpr_alloc = sec.count("sgpr_alloc") ?
+                sec.at("sgpr_alloc").get_int() : 0;
             tunables.push_back(tunable);
         }
         else if (sec.get_name() == "v4r1_1x1_dynamic_kernel") {
@@ -126,6 +188,44 @@ igemm_v4r1_dynamic_tunable_from_config(const config_content_t &content) {
             tunable.wei_block_copy_cluster_lengths_k =
                 sec.at("wei_block_copy_cluster_lengths_k").get_int();
             tunable.OPT_1x1 = 1;
+            tunable.kernarg_compact = sec.count("kernarg_compact") ?
+                sec.at("kernarg_compact").get_int() : 0;
+            tunable.magic_div = sec.count("magic_div") ?
+                sec.at("magic_div").get_int() : 0;
+            tunable.grid_2d = sec.count("grid_2d") ?
+                sec.at("grid_2d").get_int() : 0;
+            tunable.swizzle_group = sec.count("swizzle_group") ?
+                sec.at("swizzle_group").get_int() : 0;
+            tunable.gemm_k_split = sec.count("gemm_k_split") ?
+                sec.at("gemm_k_split").get_int() : 0;
+            tunable.persistent = sec.count("persistent") ?
+                sec.at("persistent").get_int() : 0;
+            tunable.bias = sec.count("bias") ?
+                sec.at("bias").get_int() : 0;
+            tunable.activation = sec.count("activation") ?
+                sec.at("activation").get_int() : 0;
+            tunable.vector_store = sec.count("vector_store") ?
+                sec.at("vector_store").get_int() : 0;
+            tunable.no_pad = sec.count("no_pad") ?
+                sec.at("no_pad").get_int() : 0;
+            tunable.unit_stride = sec.count("unit_stride") ?
+                sec.at("unit_stride").get_int() : 0;
+            tunable.slice_table = sec.count("slice_table") ?
+                sec.at("slice_table").get_int() : 0;
+            tunable.peephole = sec.count("peephole") ?
+                sec.at("peephole").get_int() : 0;
+            tunable.waitcnt = sec.count("waitcnt") ?
+                sec.at("waitcnt").get_int() : 0;
+            tunable.sched = sec.count("sched") ?
+                sec.at("sched").get_int() : 0;
+            tunable.sched_lds_latency = sec.count("sched_lds_latency") ?
+                sec.at("sched_lds_latency").get_int() : 64;
+            tunable.sched_vmem_latency = sec.count("sched_vmem_latency") ?
+                sec.at("sched_vmem_latency").get_int() : 300;
+            tunable.vgpr_alloc = sec.count("vgpr_alloc") ?
+                sec.at("vgpr_alloc").get_int() : 0;
+            tunable.sgpr_alloc = sec.count("sgpr_alloc") ?
+                sec.at("sgpr_alloc").get_int() : 0;
             tunables.push_back(tunable);
         }
     }
@@ -154,6 +254,71 @@ typedef struct {
     int __pack0;
 } __attribute__((packed)) igemm_v4r1_dynamic_karg_t;
 
+// kernarg_compact = 1, products only depend on problem size are computed here
+typedef struct {
+    float *p_in;
+    float *p_wei;
+    float *p_out;
+    int hi;
+    int wi;
+    int wo;
+    int stride_h;
+    int stride_w;
+    int dilation_h;
+    int dilation_w;
+    int pad_h;
+    int pad_w;
+    int y;
+    int x;
+    int in_stride_n2;   // c*hi*wi
+    int wei_stride_k;   // c*y*x
+    int out_stride_k1;  // ho*wo
+    int out_stride_n2;  // k*ho*wo
+    int b_block_work;   // n/(gemm_n_repeat*gemm_n_per_thread_subc)*ho*wo/b_per_block
+} __attribute__((packed)) igemm_v4r1_dynamic_karg_compact_t;
+
+// magic_div = 1, follow either karg struct above. divisors are b_block_work, ho*wo, wo, y*x, x
+typedef struct {
+    uint32_t magic_0;
+    uint32_t magic_1;
+    uint32_t magic_2;
+    uint32_t shift_pack_0;  // 6 bits for each shift
+    uint32_t magic_3;
+    uint32_t magic_4;
+} __attribute__((packed)) igemm_v4r1_dynamic_magic_div_t;
+
+typedef struct {
+    uint32_t magic;
+    uint32_t shift;
+} magic_div_u32_t;
+
+// n/d = (__umulhi(n, magic) + n) >> shift, for n, d < 2^31. same as amdgpu_magic_div_u32_gen()
+static inline magic_div_u32_t magic_div_u32_gen(uint32_t d) {
+    assert(d >= 1 && d <= INT32_MAX);
+    uint32_t shift;
+    for (shift = 0; shift < 32; shift++)
+        if ((1U << shift) >= d)
+            break;
+    uint64_t one = 1;
+    uint64_t magic = ((one << 32) * ((one << shift) - d)) / d + 1;
+    assert(magic <= 0xffffffffUL);
+    magic_div_u32_t result;
+    result.magic = (uint32_t)magic;
+    result.shift = shift;
+    return result;
+}
+
+// same as V4R1_DYNAMIC_GEMM_K_SPLIT_MIN_E_LOOP, V4R1_DYNAMIC_UNIT_COST, V4R1_DYNAMIC_ATOMIC_COST
+#define IGEMM_V4R1_DYNAMIC_GEMM_K_SPLIT_MIN_E_LOOP 4
+#define IGEMM_V4R1_DYNAMIC_UNIT_COST 2
+#define IGEMM_V4R1_DYNAMIC_ATOMIC_COST 2
+// activation of epilogue, same as IGEMM_ACTIVATION_* of igemm_base.py
+#define IGEMM_V4R1_DYNAMIC_ACTIVATION_NONE 0
+#define IGEMM_V4R1_DYNAMIC_ACTIVATION_RELU 1
+#define IGEMM_V4R1_DYNAMIC_ACTIVATION_CLAMP 2
+#define IGEMM_V4R1_DYNAMIC_CLAMP_MIN 0.0f
+#define IGEMM_V4R1_DYNAMIC_CLAMP_MAX 6.0f
+
 #define VALID_COND_RTN_FALSE(cond)                                             \
     do {                                                                       \
         if (!(cond)) {                                                         \
@@ -221,7 +386,27 @@ class igemm_v4r1_dynamic_driver_t {
                std::to_string(in_block_copy_cluster_lengths_b) + "x" +
                std::to_string(in_block_copy_cluster_lengths_n2) + "_" +
                std::to_string(wei_block_copy_cluster_lengths_e) + "x" +
-               std::to_string(wei_block_copy_cluster_lengths_k);
+               std::to_string(wei_block_copy_cluster_lengths_k) +
+               (tunable->kernarg_compact ? std::string("_kpack") : std::string("")) +
+               (tunable->magic_div ? std::string("_mdiv") : std::string("")) +
+               (tunable->grid_2d ? std::string("_g2d") : std::string("")) +
+               (tunable->swizzle_group > 1 ? std::string("_swz") + std::to_string(tunable->swizzle_group) : std::string("")) +
+               (tunable->gemm_k_split ? std::string("_gks") : std::string("")) +
+               (tunable->persistent ? std::string("_pst") : std::string("")) +
+               (tunable->bias ? std::string("_bias") : std::string("")) +
+               (tunable->activation == IGEMM_V4R1_DYNAMIC_ACTIVATION_RELU ? std::string("_relu") :
+                tunable->activation == IGEMM_V4R1_DYNAMIC_ACTIVATION_CLAMP ? std::string("_clamp") : std::string("")) +
+               (tunable->vector_store ? std::string("_vst") : std::string("")) +
+               (tunable->no_pad ? std::string("_npad") : std::string("")) +
+               (tunable->unit_stride ? std::string("_us1") : std::string("")) +
+               (tunable->slice_table ? std::string("_stbl") : std::string("")) +
+               (tunable->peephole ? std::string("_pho") : std::string("")) +
+               (tunable->waitcnt ? std::string("_wcnt") : std::string("")) +
+               (tunable->sched ? std::string("_sch") +
+                    (tunable->sched_lds_latency != 64 || tunable->sched_vmem_latency != 300 ?
+                        std::to_string(tunable->sched_lds_latency) + "x" + std::to_string(tunable->sched_vmem_latency) : std::string("")) : std::string("")) +
+               (tunable->vgpr_alloc ? std::string("_valloc") : std::string("")) +
+               (tunable->sgpr_alloc ? std::string("_salloc") : std::string(""));
     }
     int get_block_size(const igemm_v4r1_dynamic_tunable_t *tunable) {
         return tunable->gemm_m_level0_cluster * tunable->gemm_n_level0_cluster *
@@ -269,9 +454,138 @@ class igemm_v4r1_dynamic_driver_t {
                     tunable->b_per_block * tunable->gemm_n_per_thread_subc;
         return 2 * next_pow2(next_pow2(lds_a) + next_pow2(lds_b));
     }
+    // same as v4r1_dynamic_get_blocks_per_cu()
+    int get_blocks_per_cu(const igemm_v4r1_dynamic_tunable_t *tunable) {
+        int waves_per_block = get_block_size(tunable) / 64;
+        return std::max(std::min(65536 / get_lds_size(tunable), 40 / waves_per_block), 1);
+    }
+    // same as v4r1_dynamic_quantization_t.get_cycles(), in e_per_block loops
+    int get_persistent_cycles(int num_tile, int split, int loops, int slots) {
+        int rounds = (num_tile * split + slots - 1) / slots;
+        return rounds * (loops / split + IGEMM_V4R1_DYNAMIC_UNIT_COST +
+                         (split > 1 ? IGEMM_V4R1_DYNAMIC_ATOMIC_COST : 0));
+    }
+    // same as v4r1_dynamic_get_gemm_k_split(), number of split along c, is grid z
+    int get_gemm_k_split(const args_t *arg,
+                         const igemm_v4r1_dynamic_tunable_t *tunable, int num_cu) {
+        if (!tunable->gemm_k_split)
+            return 1;
+        int c = arg->get_int("in_channels");
+        int yx = arg->get_int("fil_h") * arg->get_int("fil_w");
+        int slots = num_cu * get_blocks_per_cu(tunable);
+        int grid_size = get_grid_size(arg, tunable);
+        int split = 1;
+        if (tunable->persistent) {
+            // split of least cycles, stream-k
+            int loops = c * yx / tunable->e_per_block;
+            int cycles = get_persistent_cycles(grid_size, 1, loops, slots);
+            for (int s = 2; s <= c; s++) {
+                if (c % s != 0 || (c / s) * yx % tunable->e_per_block != 0 ||
+                    (c / s) * yx < IGEMM_V4R1_DYNAMIC_GEMM_K_SPLIT_MIN_E_LOOP * tunable->e_per_block)
+                    continue;
+                int s_cycles = get_persistent_cycles(grid_size, s, loops, slots);
+                if (s_cycles < cycles) {
+                    cycles = s_cycles;
+                    split = s;
+                }
+            }
+            return split;
+        }
+        for (int s = 2; s <= c; s++) {
+            if (grid_size * s > slots ||
+                (c / s) * yx < IGEMM_V4R1_DYNAMIC_GEMM_K_SPLIT_MIN_E_LOOP * tunable->e_per_block)
+                break;
+            if (c % s == 0 && (c / s) * yx % tunable->e_per_block == 0)
+                split = s;
+        }
+        return split;
+    }
+    // same as v4r1_dynamic_is_applicable(), kernel specialized for 1x1, pad 0, or stride/dilation 1
+    bool tunable_is_applicable(const args_t *arg,
+                               const igemm_v4r1_dynamic_tunable_t *tunable) {
+        int y = arg->get_int("fil_h");
+        int x = arg->get_int("fil_w");
+        if (tunable->OPT_1x1 && (y != 1 || x != 1))
+            return false;
+        if (tunable->no_pad && (arg->get_int("pad_h") != 0 || arg->get_int("pad_w") != 0))
+            return false;
+        if (tunable->unit_stride && (arg->get_int("conv_stride_h") != 1 || arg->get_int("conv_stride_w") != 1))
+            return false;
+        if (tunable->unit_stride && !tunable->OPT_1x1 &&
+            (arg->get_int("dilation_h") != 1 || arg->get_int("dilation_w") != 1))
+            return false;
+        // input of a thread is loaded by vector of sub_b along b, need contiguous wo inside one row
+        int in_block_copy_sub_lengths_b =
+            tunable->b_per_block / tunable->in_block_copy_cluster_lengths_b;
+        if (in_block_copy_sub_lengths_b != 1) {
+            int ho = conv_out_size(arg->get_int("in_h"), arg->get_int("pad_h"),
+                                   arg->get_int("dilation_h"), y, arg->get_int("conv_stride_h"));
+            int wo = conv_out_size(arg->get_int("in_w"), arg->get_int("pad_w"),
+                                   arg->get_int("dilation_w"), x, arg->get_int("conv_stride_w"));
+            if (arg->get_int("conv_stride_w") != 1 || arg->get_int("pad_w") != 0)
+                return false;
+            if (tunable->OPT_1x1 && (arg->get_int("conv_stride_h") != 1 || arg->get_int("pad_h") != 0 ||
+                                     (ho * wo) % in_block_copy_sub_lengths_b != 0))
+                return false;
+            if (!tunable->OPT_1x1 && wo % in_block_copy_sub_lengths_b != 0)
+                return false;
+        }
+        return true;
+    }
+    // same as v4r1_dynamic_get_slice_table(), step of input slice window of each phase iy*x+ix of e.
+    // {offset of input in byte, byte offset of the entry of next phase, ihi, iwi} of every phase
+    std::vector<int> get_slice_table(const args_t *arg,
+                                     const igemm_v4r1_dynamic_tunable_t *tunable) {
+        int hi = arg->get_int("in_h");
+        int wi = arg->get_int("in_w");
+        int y = arg->get_int("fil_h");
+        int x = arg->get_int("fil_w");
+        int dilation_h = arg->get_int("dilation_h");
+        int dilation_w = arg->get_int("dilation_w");
+        std::vector<int> table;
+        for (int p = 0; p < y * x; p++) {
+            int e = p + tunable->e_per_block;
+            int next = e % (y * x);
+            int dihi = dilation_h * (next / x - p / x);
+            int diwi = dilation_w * (next % x - p % x);
+            table.push_back(4 * ((e / (y * x)) * hi * wi + dihi * wi + diwi));
+            table.push_back(16 * next);
+            table.push_back(dihi);
+            table.push_back(diwi);
+        }
+        return table;
+    }
+    // same as v4r1_dynamic_get_swizzle_karg(), group * b_block_work, first workgroup of the last group,
+    // k blocks of the last group. with magic_div, magic numbers of the two divisors and their shifts
+    std::vector<int> get_swizzle_karg(const args_t *arg,
+                                      const igemm_v4r1_dynamic_tunable_t *tunable) {
+        int n = arg->get_int("batchsize");
+        int k = arg->get_int("out_channels");
+        int ho = conv_out_size(arg->get_int("in_h"), arg->get_int("pad_h"), arg->get_int("dilation_h"),
+                               arg->get_int("fil_h"), arg->get_int("conv_stride_h"));
+        int wo = conv_out_size(arg->get_int("in_w"), arg->get_int("pad_w"), arg->get_int("dilation_w"),
+                               arg->get_int("fil_w"), arg->get_int("conv_stride_w"));
+        int group = tunable->swizzle_group;
+        int k_block_work = k / tunable->k_per_block;
+        int b_block_work = (n / (tunable->gemm_n_repeat * tunable->gemm_n_per_thread_subc)) * ho * wo /
+                           tunable->b_per_block;
+        int num_group = (k_block_work + group - 1) / group;
+        int group_work = group * b_block_work;
+        int last_group_k = k_block_work - (num_group - 1) * group;
+        std::vector<int> karg = {group_work, (num_group - 1) * group_work, last_group_k};
+        if (tunable->magic_div) {
+            magic_div_u32_t mdiv_5 = magic_div_u32_gen(group_work);
+            magic_div_u32_t mdiv_6 = magic_div_u32_gen(last_group_k);
+            karg.push_back((int)mdiv_5.magic);
+            karg.push_back((int)mdiv_6.magic);
+            karg.push_back((int)(mdiv_5.shift | (mdiv_6.shift << 6)));
+        }
+        return karg;
+    }
     bool tunable_is_valid(const args_t *arg,
                           const igemm_v4r1_dynamic_tunable_t *tunable) {
         // PerformanceImplicitGemmV4R1::IsValid
+        VALID_COND_RTN_FALSE(tunable_is_applicable(arg, tunable));
         int hi = arg->get_int("in_h");
         int wi = arg->get_int("in_w");
         int n = arg->get_int("batchsize");
@@ -381,7 +695,11 @@ class igemm_v4r1_dynamic_driver_t {
                              wei_block_copy_cluster_lengths_e *
                                  wei_block_copy_cluster_lengths_k);
 
-        VALID_COND_RTN_FALSE(gemm_m_repeat == 2 && gemm_n_repeat == 2);
+        // any power of 2 repeat and sub tile, see fma_main_loop_sub_tile_double_buffer()
+        VALID_COND_RTN_FALSE(gemm_m_repeat > 0 && (gemm_m_repeat & (gemm_m_repeat - 1)) == 0 &&
+                             gemm_n_repeat > 0 && (gemm_n_repeat & (gemm_n_repeat - 1)) == 0 &&
+                             (gemm_m_per_thread_subc & (gemm_m_per_thread_subc - 1)) == 0 &&
+                             (gemm_n_per_thread_subc & (gemm_n_per_thread_subc - 1)) == 0);
 
         int lds_size = get_lds_size(tunable);
         VALID_COND_RTN_FALSE(lds_size <= 65536);
@@ -389,14 +707,16 @@ class igemm_v4r1_dynamic_driver_t {
             e_per_block / in_block_copy_cluster_lengths_e;
         int in_block_copy_sub_lengths_b =
             b_per_block / in_block_copy_cluster_lengths_b;
-        VALID_COND_RTN_FALSE(in_block_copy_sub_lengths_e == 1 &&
-                             in_block_copy_sub_lengths_b == 1);
+        VALID_COND_RTN_FALSE((in_block_copy_sub_lengths_e == 1 || tunable->OPT_1x1) &&
+                             (in_block_copy_sub_lengths_b == 1 ||
+                              in_block_copy_sub_lengths_b == 2 ||
+                              in_block_copy_sub_lengths_b == 4));
         return true;
     }
 
     result_t run(const args_t *arg, const igemm_v4r1_dynamic_tunable_t *tunable,
                  hipModule_t module, float *p_in, float *p_wei, float *p_out,
-                 int warmup, int repeat) {
+                 float *p_bias, int warmup, int repeat) {
         if (!tunable_is_valid(arg, tunable)) {
             result_t result;
             result.return_code = -1;
@@ -429,12 +749,141 @@ class igemm_v4r1_dynamic_driver_t {
         karg.wo = conv_out_size(karg.wi, karg.pad_w, karg.dilation_w, karg.x,
                                 karg.stride_w);
 
-        void *config[] = {HIP_LAUNCH_PARAM_BUFFER_POINTER, &karg,
-                          HIP_LAUNCH_PARAM_BUFFER_SIZE, &karg_size,
-                          HIP_LAUNCH_PARAM_END};
+        void *karg_ptr = &karg;
+        igemm_v4r1_dynamic_karg_compact_t karg_compact;
+        if (tunable->kernarg_compact) {
+            int n_per_b = tunable->gemm_n_repeat * tunable->gemm_n_per_thread_subc;
+            karg_compact.p_in = karg.p_in;
+            karg_compact.p_wei = karg.p_wei;
+            karg_compact.p_out = karg.p_out;
+            karg_compact.hi = karg.hi;
+            karg_compact.wi = karg.wi;
+            karg_compact.wo = karg.wo;
+            karg_compact.stride_h = karg.stride_h;
+            karg_compact.stride_w = karg.stride_w;
+            karg_compact.dilation_h = karg.dilation_h;
+            karg_compact.dilation_w = karg.dilation_w;
+            karg_compact.pad_h = karg.pad_h;
+            karg_compact.pad_w = karg.pad_w;
+            karg_compact.y = karg.y;
+            karg_compact.x = karg.x;
+            karg_compact.in_stride_n2 = karg.c * karg.hi * karg.wi;
+            karg_compact.wei_stride_k = karg.c * karg.y * karg.x;
+            karg_compact.out_stride_k1 = karg.ho * karg.wo;
+            karg_compact.out_stride_n2 = karg.k * karg.ho * karg.wo;
+            karg_compact.b_block_work = (karg.n / n_per_b) * karg.ho *
+                                        karg.wo / tunable->b_per_block;
+            karg_ptr = &karg_compact;
+            karg_size = sizeof(karg_compact);
+        }
+
+        unsigned char karg_buffer[sizeof(karg_compact) + sizeof(igemm_v4r1_dynamic_magic_div_t) + 4 * sizeof(int) +
+                                  sizeof(float *) + 2 * sizeof(float) + sizeof(int *) + 6 * sizeof(int) + 8];
+        if (tunable->magic_div) {
+            int n_per_b = tunable->gemm_n_repeat * tunable->gemm_n_per_thread_subc;
+            uint32_t divisors[5] = {(uint32_t)((karg.n / n_per_b) * karg.ho * karg.wo / tunable->b_per_block),
+                                    (uint32_t)(karg.ho * karg.wo), (uint32_t)karg.wo,
+                                    (uint32_t)(karg.y * karg.x), (uint32_t)karg.x};
+            magic_div_u32_t mdiv[5];
+            for (int i = 0; i < 5; i++)
+                mdiv[i] = magic_div_u32_gen(divisors[i]);
+            igemm_v4r1_dynamic_magic_div_t karg_magic_div;
+            karg_magic_div.magic_0 = mdiv[0].magic;
+            karg_magic_div.magic_1 = mdiv[1].magic;
+            karg_magic_div.magic_2 = mdiv[2].magic;
+            karg_magic_div.magic_3 = mdiv[3].magic;
+            karg_magic_div.magic_4 = mdiv[4].magic;
+            karg_magic_div.shift_pack_0 = 0;
+            for (int i = 0; i < 5; i++)
+                karg_magic_div.shift_pack_0 |= mdiv[i].shift << (6 * i);
+            // both karg struct are 88 bytes, kernel expect magic numbers right after
+            static_assert(sizeof(karg) == 88 && sizeof(karg_compact) == 88, "karg size");
+            memcpy(karg_buffer, karg_ptr, karg_size);
+            memcpy(karg_buffer + karg_size, &karg_magic_div, sizeof(karg_magic_div));
+            karg_ptr = karg_buffer;
+            karg_size += sizeof(karg_magic_div);
+        }
+
+        // gemm_k_split = 1, split_c follow all of above, each workgroup of z do c/split of c
+        int num_cu;
+        HIP_CALL(hipDeviceGetAttribute(&num_cu, hipDeviceAttributeMultiprocessorCount, 0));
+        int split = get_gemm_k_split(arg, tunable, num_cu);
+        if (tunable->gemm_k_split) {
+            int split_c = karg.c / split;
+            if (karg_ptr != karg_buffer)
+                memcpy(karg_buffer, karg_ptr, karg_size);
+            memcpy(karg_buffer + karg_size, &split_c, sizeof(split_c));
+            karg_ptr = karg_buffer;
+            karg_size += sizeof(split_c);
+        }
 
         int block_size = get_block_size(tunable);
         int grid_size = get_grid_size(arg, tunable);
+        // grid_2d = 1, x is b block and y is k block, kernel need no division for them
+        int grid_size_y = tunable->grid_2d ? karg.k / tunable->k_per_block : 1;
+        int grid_size_x = grid_size / grid_size_y;
+        int grid_size_z = split;
+
+        // persistent = 1, a grid filling every CU loop over units, tile of every split. num_tile, num_unit
+        // and grid_size follow all of above
+        if (tunable->persistent) {
+            int num_unit = grid_size * split;
+            grid_size_x = std::min(num_unit, num_cu * get_blocks_per_cu(tunable));
+            grid_size_z = 1;
+            int karg_persistent[3] = {grid_size, num_unit, grid_size_x};
+            if (karg_ptr != karg_buffer)
+                memcpy(karg_buffer, karg_ptr, karg_size);
+            memcpy(karg_buffer + karg_size, karg_persistent, sizeof(karg_persistent));
+            karg_ptr = karg_buffer;
+            karg_size += sizeof(karg_persistent);
+        }
+
+        // bias = 1 or activation = 2, p_bias then clamp_min, clamp_max follow all of above, 8 byte aligned
+        if (tunable->bias || tunable->activation == IGEMM_V4R1_DYNAMIC_ACTIVATION_CLAMP) {
+            if (karg_ptr != karg_buffer)
+                memcpy(karg_buffer, karg_ptr, karg_size);
+            karg_ptr = karg_buffer;
+            karg_size = (karg_size + 7) / 8 * 8;
+            if (tunable->bias) {
+                memcpy(karg_buffer + karg_size, &p_bias, sizeof(p_bias));
+                karg_size += sizeof(p_bias);
+            }
+            if (tunable->activation == IGEMM_V4R1_DYNAMIC_ACTIVATION_CLAMP) {
+                float karg_clamp[2] = {IGEMM_V4R1_DYNAMIC_CLAMP_MIN, IGEMM_V4R1_DYNAMIC_CLAMP_MAX};
+                memcpy(karg_buffer + karg_size, karg_clamp, sizeof(karg_clamp));
+                karg_size += sizeof(karg_clamp);
+            }
+        }
+
+        // slice_table = 1, pointer of the step table of input slice window follow all of above, 8 byte aligned
+        int *p_slice_table = NULL;
+        if (tunable->slice_table) {
+            std::vector<int> slice_table = get_slice_table(arg, tunable);
+            HIP_CALL(hipMalloc(&p_slice_table, slice_table.size() * sizeof(int)));
+            HIP_CALL(hipMemcpy(p_slice_table, slice_table.data(), slice_table.size() * sizeof(int),
+                               hipMemcpyHostToDevice));
+            if (karg_ptr != karg_buffer)
+                memcpy(karg_buffer, karg_ptr, karg_size);
+            karg_ptr = karg_buffer;
+            karg_size = (karg_size + 7) / 8 * 8;
+            memcpy(karg_buffer + karg_size, &p_slice_table, sizeof(p_slice_table));
+            karg_size += sizeof(p_slice_table);
+        }
+
+        // swizzle_group > 1, group work and last group of grouped block order follow all of above, 8 byte aligned
+        if (tunable->swizzle_group > 1) {
+            std::vector<int> karg_swizzle = get_swizzle_karg(arg, tunable);
+            if (karg_ptr != karg_buffer)
+                memcpy(karg_buffer, karg_ptr, karg_size);
+            karg_ptr = karg_buffer;
+            karg_size = (karg_size + 7) / 8 * 8;
+            memcpy(karg_buffer + karg_size, karg_swizzle.data(), karg_swizzle.size() * sizeof(int));
+            karg_size += karg_swizzle.size() * sizeof(int);
+        }
+
+        void *config[] = {HIP_LAUNCH_PARAM_BUFFER_POINTER, karg_ptr,
+                          HIP_LAUNCH_PARAM_BUFFER_SIZE, &karg_size,
+                          HIP_LAUNCH_PARAM_END};
 
         hipFunction_t kernel_func;
         std::string kernel_name = get_kernel_name(tunable);
@@ -443,24 +892,42 @@ class igemm_v4r1_dynamic_driver_t {
             hipModuleGetFunction(&kernel_func, module, kernel_name.c_str()));
         gpu_timer_t timer(NULL);
         for (int i = 0; i < warmup; i++) {
-            HIP_CALL(hipModuleLaunchKernel(kernel_func, grid_size, 1, 1,
+            HIP_CALL(hipModuleLaunchKernel(kernel_func, grid_size_x, grid_size_y, grid_size_z,
                                            block_size, 1, 1, 0, 0, NULL,
                                            (void **)&config));
         }
         timer.start();
         for (int i = 0; i < repeat; i++) {
-            HIP_CALL(hipModuleLaunchKernel(kernel_func, grid_size, 1, 1,
+            HIP_CALL(hipModuleLaunchKernel(kernel_func, grid_size_x, grid_size_y, grid_size_z,
                                            block_size, 1, 1, 0, 0, NULL,
                                            (void **)&config));
         }
         timer.stop();
         float duration_ms = timer.duration();
 
+        // split accumulate into output with atomics, the launches above summed into it many times. zero
+        // it and launch once more for output to verify, the memset is timed on its own, not in duration_ms
+        float memset_ms = 0;
+        if (tunable->gemm_k_split) {
+            gpu_timer_t memset_timer(NULL);
+            memset_timer.start();
+            HIP_CALL(hipMemset(p_out, 0, (size_t)karg.n * karg.k * karg.ho * karg.wo * sizeof(float)));
+            memset_timer.stop();
+            memset_ms = memset_timer.duration();
+            HIP_CALL(hipModuleLaunchKernel(kernel_func, grid_size_x, grid_size_y, grid_size_z,
+                                           block_size, 1, 1, 0, 0, NULL,
+                                           (void **)&config));
+            HIP_CALL(hipDeviceSynchronize());
+        }
+        if (p_slice_table)
+            HIP_CALL(hipFree(p_slice_table));
+
         usleep(1000 * 10);
 
         result_t result;
         result.return_code = 0;
         result.duration_ms = duration_ms / repeat;
+        result.memset_ms = memset_ms;
         result.kernel_name = kernel_name;
         return result;
     }
@@ -141,6 +141,28 @@ static inline void naive_conv_fwd_nchw(const float *src, const float *filter,
     }
 #endif
 }
+// epilogue of fwd output, add bias of k if not null, then activation 1:relu, 2:clamp to [cmin, cmax]
+static inline void naive_conv_fwd_epilogue_nchw(float *dst, const float *bias,
+                                       size_t n, size_t k, size_t oh,
+                                       size_t ow, int activation, float cmin,
+                                       float cmax) {
+    size_t in, ik, i;
+    for (in = 0; in < n; in++) {
+        for (ik = 0; ik < k; ik++) {
+            float *p = dst + in * k * oh * ow + ik * oh * ow;
+            for (i = 0; i < oh * ow; i++) {
+                float value = p[i];
+                if (bias)
+                    value += bias[ik];
+                if (activation == 1)
+                    value = value > .0f ? value : .0f;
+                else if (activation == 2)
+                    value = value < cmin ? cmin : (value > cmax ? cmax : value);
+                p[i] = value;
+            }
+        }
+    }
+}
 static inline void naive_conv_fwd_cnhw(const float *src, const float *filter,
                                        float *dst, size_t n, size_t w, size_t h,
                                        size_t c, size_t k, size_t fx, size_t fy,
@@ -26,6 +26,9 @@
 # pylint: disable=maybe-no-member
 import os
 import subprocess
+import hashlib
+import json
+import tempfile
 from .codegen import *
 AMDGPU_PRECISION_FP32   = (0 << 20)
 AMDGPU_PRECISION_FP16   = (1 << 20)
@@ -142,6 +145,16 @@ def amdgpu_calculate_occupancy(arch_detail, vgpr_per_thread, block_size, lds_per
 
     return min(blocks_consider_vgpr, blocks_consider_lds)
 
+AMDGPU_VGPR_GRANULE = 4
+
+def amdgpu_calculate_waves_per_cu(arch_detail, vgpr_per_thread, block_size, lds_per_block):
+    '''
+    waves resident in a CU, vgpr of a thread is allocated in granule
+    '''
+    vgpr_per_thread = ((vgpr_per_thread + AMDGPU_VGPR_GRANULE - 1) // AMDGPU_VGPR_GRANULE) * AMDGPU_VGPR_GRANULE
+    occupancy = amdgpu_calculate_occupancy(arch_detail, vgpr_per_thread, block_size, lds_per_block)
+    return min(occupancy * (block_size // arch_detail.wavefront_size), arch_detail.max_waves_per_cu)
+
 def amdgpu_valid_occupancy_with_max_waves(arch_detail, block_size, occupancy):
     assert block_size >= arch_detail.wavefront_size and \
             block_size % arch_detail.wavefront_size == 0
@@ -158,7 +171,8 @@ def get_amdgpu_gfx906_60cu():
     gfx906_60cu.lds_size        = 65536
     gfx906_60cu.lds_banks       = 32
     gfx906_60cu.l1_size         = 16384
-    gfx906_60cu.l2_size         = 0
+    gfx906_60cu.l2_size         = 4194304
+    gfx906_60cu.l2_cache_line   = 64
     gfx906_60cu.mem_channels    = 0
     gfx906_60cu.vgpr_per_cu     = 65536
     gfx906_60cu.sgpr_per_cu     = 3200
@@ -580,6 +594,64 @@ class emit_int_div_ss_t(amdgpu_asm_utils_t):
             self._emit("v_cmp_ne_i32      vcc,          s[\\s_d],   0")
             self._emit("v_cndmask_b32     v[\\v_q],      -1,         v[\\v_tmp4+2],      vcc")
 
+def amdgpu_magic_div_u32_gen(d):
+    '''
+    (magic, shift) of unsigned division by d, for n/d with both n and d less than 2^31:
+        q = (mul_hi(n, magic) + n) >> shift
+    magic + 2^32 is ceil(2^(32+shift)/d), the add can not overflow since mul_hi(n, magic) < n
+    '''
+    assert d >= 1 and d <= 0x7fffffff
+    shift = 0
+    while (1 << shift) < d:
+        shift += 1
+    magic = ((1 << 32) * ((1 << shift) - d)) // d + 1
+    assert magic <= 0xffffffff
+    return magic, shift
+
+def amdgpu_magic_div_u32(n, magic, shift):
+    '''
+    what .v_mdiv_u32_vs/.s_mdiv_u32_ss compute, in 32 bit
+    '''
+    return ((((n * magic) >> 32) + n) & 0xffffffff) >> shift
+
+AMDGPU_MAGIC_DIV_SHIFT_BITS = 6     # width of each shift packed in one dword
+
+def amdgpu_magic_div_shift_pack(shifts):
+    assert len(shifts) * AMDGPU_MAGIC_DIV_SHIFT_BITS <= 32
+    return sum(shift << (AMDGPU_MAGIC_DIV_SHIFT_BITS * i) for i, shift in enumerate(shifts))
+
+class emit_mdiv_u32_vs_t(amdgpu_asm_utils_t):
+    '''
+    v_q = v_n / d, magic and shift of d from amdgpu_magic_div_u32_gen(). v_q can be v_n
+    '''
+    def name(self):
+        return '.v_mdiv_u32_vs'
+    def __init__(self, mc):
+        amdgpu_asm_utils_t.__init__(self, mc)
+    def __call__(self, v_q, v_n, s_magic, s_shift, v_tmp):
+        return '{} {}, {}, {}, {}, {}'.format(self.name(), v_q, v_n, s_magic, s_shift, v_tmp)
+    def emit(self):
+        with self._emit_macro_indented(".macro {} v_q, v_n, s_magic, s_shift, v_tmp".format(self.name())):
+            self._emit("v_mul_hi_u32      v[\\v_tmp],     s[\\s_magic],  v[\\v_n]")
+            self._emit("v_add_u32         v[\\v_tmp],     v[\\v_tmp],    v[\\v_n]")
+            self._emit("v_lshrrev_b32     v[\\v_q],       s[\\s_shift],  v[\\v_tmp]")
+
+class emit_mdiv_u32_ss_t(amdgpu_asm_utils_t):
+    '''
+    s_q = s_n / d, all scalar
+    '''
+    def name(self):
+        return '.s_mdiv_u32_ss'
+    def __init__(self, mc):
+        amdgpu_asm_utils_t.__init__(self, mc)
+    def __call__(self, s_q, s_n, s_magic, s_shift, s_tmp):
+        return '{} {}, {}, {}, {}, {}'.format(self.name(), s_q, s_n, s_magic, s_shift, s_tmp)
+    def emit(self):
+        with self._emit_macro_indented(".macro {} s_q, s_n, s_magic, s_shift, s_tmp".format(self.name())):
+            self._emit("s_mul_hi_u32      s[\\s_tmp],     s[\\s_magic],  s[\\s_n]")
+            self._emit("s_add_u32         s[\\s_tmp],     s[\\s_tmp],    s[\\s_n]")
+            self._emit("s_lshr_b32        s[\\s_q],       s[\\s_tmp],    s[\\s_shift]")
+
 class emit_c_clear_t(amdgpu_asm_utils_t):
     def name(self):
         return '.v_clear_nc'
@@ -675,15 +747,16 @@ class emit_write_4d_strided_t(amdgpu_asm_utils_t):
         emit_write3d_strided()
         emit_write4d_strided()
 
+_AMDGPU_SWAP_SEQUENCER_CACHE = dict()  # (row, col) -> swap_list, planned once per process
+
 class amdgpu_swap_sequencer_t(object):
     '''
     partial-transpose 2d matrix in register, by using swap.
     currently only consider continus register in same col, aka col major
 
-    after transpose, the num of col/row should be the same
+    row and col can differ, row r is in register r*col ~ r*col+col-1 right after swaps of row r
 
-    And be aware that, this method still is not straight-forward and not optimal,
-    for v_swap_b32 have half speed. In this case better use several tmp register serve as vector buffer
+    And be aware that, v_swap_b32 have half speed. In this case better use several tmp register serve as vector buffer
     Hopefully in the future could have full speed v_swap_b32
 
         k0 k1 k2 k3          k0 k1 k2 k3
@@ -697,100 +770,43 @@ class amdgpu_swap_sequencer_t(object):
     e3  3  7  b  f       e3 c  d  e  f
     '''
     def create_2d_swap(self):
-        def init_2d_indice(row, col):
-            indice_2d = []
-            for r in range(row):
-                indice_2d.append([r+c*row for c in range(col)])
-            return indice_2d
-        def check_row_can_omit_swap(indice_2d, cur_row):
-            '''
-            if current row already fit in vector pattern, can omit out
-            '''
-            row = len(indice_2d)
-            col = len(indice_2d[0])
-            targeting_vector_pattern = []
-            for c in range(col):
-                targeting_vector_pattern.append(c)
-            vector_diff = []
+        '''
+        element (r, c) start in register r+c*row, and want register r*col+c. the move is a permutation,
+        fill target register one by one in row order, a swap put the wanted element there and the element
+        it push out move one step along its cycle. every swap fix at least one register, so it is
+        row*col minus number of cycles, the least any swap sequence can get.
+        register of a row is never touched after the row is done, so each row can be written right after its swaps
+        '''
+        row, col = self.row, self.col
+        element = list(range(row * col))    # register -> element, in initial register
+        position = list(range(row * col))   # element -> register
+        swap_list = []
+        for r in range(row):
+            swap_list_per_row = []
             for c in range(col):
-                vector_diff.append(abs(indice_2d[cur_row][c] - targeting_vector_pattern[c]))
-            lasf_diff = vector_diff[0]
-            #print('xxx {}'.format(vector_diff))
-            if lasf_diff % 2 != 0:
-                return False
-            for c in range(1, col):
-                if lasf_diff != vector_diff[c]:
-                    return False
-            return True
-        def scan_2d_indice(indice_2d):
-            def locate_indice(indice_2d, target_indice, start_row):
-                row = len(indice_2d)
-                col = len(indice_2d[0])
-                (tr, tc) = (start_row, 0)
-                found = False
-                for tr in range(start_row, row):
-                    for tc in range(0, col):
-                        #print(target_indice, indice_2d[tr][tc])
-                        if target_indice == indice_2d[tr][tc]:
-                            found = True
-                            break
-                    if found:
-                        break
-                assert found
-                return (tr, tc)
-            swap_list = []
-            row = len(indice_2d)
-            col = len(indice_2d[0])
-
-            class touch_row_t(object):
-                def __init__(self, row):
-                    self.row = row
-                    self.row_touched = [ 0 for r in range(row)]
-                    self.row_touched_index = 0
-                def next_untouched_row(self):
-                    for r in range(self.row_touched_index, self.row):
-                        if self.row_touched[r] == 0:
-                            self.row_touched_index = r
-                            return r
-                    assert False
-                def touch(self, row_index):
-                    self.row_touched[row_index] = 1
-            touch_row = touch_row_t(row)
-            for r in range(row):
-                if check_row_can_omit_swap(indice_2d, r):
-                    swap_list.append('unified for row {}'.format(r))
-                    touch_row.touch( indice_2d[r][0] // col)
+                target = r * col + c
+                wanted = r + c * row
+                if element[target] == wanted:
                     continue
-                swap_list_per_row = []
-                for c in range(col):
-                    target_indice = touch_row.next_untouched_row()*col + c
-                    origin_indice = indice_2d[r][c]
-                    if origin_indice == target_indice:
-                        continue
-                    #print('to find:{}'.format(target_indice))
-                    (tr, tc) = locate_indice(indice_2d, target_indice, r)
-                    # swap and record indice
-                    indice_2d[tr][tc] = origin_indice
-                    indice_2d[r][c] = target_indice
-                    #print('swapper:{}'.format(indice_2d))
-                    swap_list_per_row.append((origin_indice, target_indice))
-                swap_list.append(swap_list_per_row)
-                touch_row.touch(r)
-            return swap_list
-        indice_2d = init_2d_indice(self.row, self.col)
-        #print(indice_2d)
-        swap_list = scan_2d_indice(indice_2d)
+                origin = position[wanted]
+                swap_list_per_row.append((origin, target))
+                element[origin], element[target] = element[target], wanted
+                position[element[origin]], position[wanted] = origin, target
+            swap_list.append(swap_list_per_row if swap_list_per_row else 'unified for row {}'.format(r))
         return swap_list
 
     def __init__(self, row, col):
         assert col != 1 and row != 1
         self.col = col
         self.row = row
-        self.swap_list = self.create_2d_swap()
+        if (row, col) not in _AMDGPU_SWAP_SEQUENCER_CACHE:
+            _AMDGPU_SWAP_SEQUENCER_CACHE[(row, col)] = self.create_2d_swap()
+        self.swap_list = _AMDGPU_SWAP_SEQUENCER_CACHE[(row, col)]
 
     def __call__(self):
         '''
-        return list of tuple of the row row_idx what swap should take
+        return list of tuple of the row row_idx what swap should take, or a str if the row need no swap.
+        the list is shared by every sequencer of the same shape, do not modify
         '''
         return self.swap_list
 
@@ -808,6 +824,34 @@ class gpr_sequencer_t(object):
     def get(self):
         return self.cnt
 
+class amdgpu_symbol_table_t(object):
+    '''
+    ordered '.set symbol, value' of a kernel, e.g. kernarg/sgpr/vgpr layout.
+    the table is built without rendering any text, count is the total size.
+    '''
+    def __init__(self, title, count = 0):
+        self.title = title
+        self.symbols = []
+        self.values = dict()
+        self.count = count
+    def add(self, symbol, value):
+        assert symbol not in self.values, 'duplicated symbol {}'.format(symbol)
+        self.symbols.append(symbol)
+        self.values[symbol] = value
+        return value
+    def __contains__(self, symbol):
+        return symbol in self.values
+    def __getitem__(self, symbol):
+        return self.values[symbol]
+    def __iter__(self):
+        return self.symbols.__iter__()
+    def set_count(self, count):
+        self.count = count
+    def get_count(self):
+        return self.count
+    def lines(self):
+        return ['; ' + self.title] + ['.set {:<23}{}'.format(symbol + ',', self.values[symbol]) for symbol in self.symbols]
+
 class gpr_t(object):
     def __init__(self, var):
         assert type(var) is str
@@ -845,6 +889,15 @@ class ds_read_t(object):
             return 'ds_read_b128 v[{}:{}+3], v[{}] {}'.format(vdst, vdst, vaddr, self.get_offset(offset))
         assert False
 
+DS_READ_BYTES = (4, 8, 12, 16)      # b32, b64, b96, b128 of ds_read_t
+
+def amdgpu_ds_read_split(bytes):
+    '''
+    read of bytes by the widest ds_read_t dividing it. return list of (ds_read_t, byte offset)
+    '''
+    width = max(w for w in DS_READ_BYTES if bytes % w == 0)
+    return [(ds_read_t(width), i * width) for i in range(bytes // width)]
+
 class ds_write_t(object):
     def __init__(self, bytes):
         self.bytes = bytes
@@ -918,8 +971,8 @@ class amdgpu_build_asm_t(object):
         # TODO: current compiler treat cov3 as default, so no need add extra flag
         cmd += ['{}'.format(self.asm_file_name)]
         cmd += ['-o', '{}'.format(self.target_hsaco)]
-        p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr = subprocess.STDOUT)
         try:
+            p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr = subprocess.STDOUT)
             (out, _) = p.communicate()
             if p.returncode != 0:
                 print('build fail:{}'.format(cmd))
@@ -931,7 +984,131 @@ class amdgpu_build_asm_t(object):
             print('err:{}'.format(e))
             return False
 
+class amdgpu_toolchain_t(object):
+    '''
+    assembler/linker used by amdgpu_build_incremental_t. default is rocm clang, but any command
+    can be used instead, e.g. a stand-in script to test the build logic without rocm:
+        <assembler> <src.s> -o <obj.o>
+        <linker> <obj.o> ... -o <target.hsaco>
+    commands are launched in work_dir, so a relative .include is found there
+    '''
+    def __init__(self, arch_config, assembler = None, linker = None, work_dir = None):
+        self.arch_config = arch_config
+        self.work_dir = work_dir
+        arch_str = amdgpu_arch_to_string(arch_config.arch)
+        if amdgpu_check_hip_clang():
+            clang = ['/opt/rocm/llvm/bin/clang++']
+        else:
+            clang = ['/opt/rocm/hcc/bin/clang']
+        if assembler:
+            self.assembler = assembler
+        else:
+            self.assembler = clang + ['-x', 'assembler', '-target', 'amdgcn--amdhsa', '-mcpu={}'.format(arch_str)]
+            if arch_config.code_object == AMDGPU_CODEOBJECT_V2:
+                self.assembler += ['-mno-code-object-v3']
+            self.assembler += ['-c']
+        if linker:
+            self.linker = linker
+        else:
+            self.linker = clang + ['-target', 'amdgcn--amdhsa', '-mcpu={}'.format(arch_str)]
+
+    def run(self, cmd):
+        try:
+            p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr = subprocess.STDOUT, cwd = self.work_dir)
+            (out, _) = p.communicate()
+            if p.returncode != 0:
+                print('build fail:{}'.format(cmd))
+                print('{}'.format(out.decode('utf-8')))
+                return False
+            return True
+        except Exception as e:
+            print('fail to run cmd:{}'.format(cmd))
+            print('err:{}'.format(e))
+            return False
+
+    def assemble(self, asm_file_name, obj_file_name):
+        return self.run(self.assembler + [os.path.abspath(asm_file_name), '-o', os.path.abspath(obj_file_name)])
+
+    def link(self, obj_file_names, target):
+        return self.run(self.linker + [os.path.abspath(o) for o in obj_file_names] + ['-o', os.path.abspath(target)])
+
+class amdgpu_build_incremental_t(object):
+    '''
+    assemble each source into its own object, only if the hash of the source, its dependent
+    files and the assembler command changed since last build. then link objects into target,
+    if any object or the link command changed. hashes are kept in a json manifest.
+    '''
+    def __init__(self, toolchain, manifest_file):
+        self.toolchain = toolchain
+        self.manifest_file = manifest_file
+        self.num_assembled = 0
+        self.num_skipped = 0
+        self.linked = False
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_file) as f:
+                manifest = json.load(f)
+        except (IOError, OSError, ValueError):
+            return {'objects' : {}, 'link' : ''}
+        return manifest
+
+    def save_manifest(self, manifest):
+        with open(self.manifest_file, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+
+    @staticmethod
+    def hash_files(cmd, file_names):
+        h = hashlib.sha1()
+        h.update(' '.join(cmd).encode())
+        for file_name in file_names:
+            with open(file_name, 'rb') as f:
+                h.update(f.read())
+        return h.hexdigest()
+
+    def build(self, sources, target):
+        '''
+        sources is list of (asm_file_name, obj_file_name, [dependent file_name])
+        '''
+        manifest = self.load_manifest()
+        objects = {}
+        for asm_file_name, obj_file_name, deps in sources:
+            h = self.hash_files(self.toolchain.assembler, [asm_file_name] + deps)
+            if manifest['objects'].get(obj_file_name) == h and os.path.exists(obj_file_name):
+                self.num_skipped += 1
+            else:
+                if not self.toolchain.assemble(asm_file_name, obj_file_name):
+                    manifest['objects'].pop(obj_file_name, None)
+                    self.save_manifest(manifest)
+                    return False
+                self.num_assembled += 1
+            objects[obj_file_name] = h
+            manifest['objects'][obj_file_name] = h
+
+        obj_file_names = [obj for _, obj, _ in sources]
+        link_hash = hashlib.sha1(' '.join(self.toolchain.linker + [objects[o] for o in obj_file_names]).encode()).hexdigest()
+        manifest['objects'] = objects   # drop objects not used any more
+        if manifest['link'] != link_hash or not os.path.exists(target):
+            if not self.toolchain.link(obj_file_names, target):
+                manifest['link'] = ''
+                self.save_manifest(manifest)
+                return False
+            self.linked = True
+        manifest['link'] = link_hash
+        self.save_manifest(manifest)
+        return True
+
+    def get_stats(self):
+        return 'incremental build: {} assembled, {} up to date, {}'.format(self.num_assembled,
+                self.num_skipped, 'linked' if self.linked else 'link up to date')
+
 class amdgpu_build_host_t(object):
+    '''
+    build host executable. start() launch the compiler in background and wait() join it,
+    build() do both. build is skipped if the compile command and every source file in the
+    directory of host_cpp is the same as last successful build, recorded in a stamp file.
+    compiler output goes to a temp file, not a pipe nobody read till wait(), and is printed if it fail
+    '''
     def __init__(self, arch_config, host_cpp, target_exec = ''):
         self.host_cpp = host_cpp
         if target_exec == '':
@@ -943,8 +1120,15 @@ class amdgpu_build_host_t(object):
                 assert False
         else:
             self.target_exec = target_exec
+        self.stamp_file = self.target_exec + '.stamp'
         self.arch_config = arch_config
-    def build(self, **kwargs):
+        self.process = None
+        self.cmd = None
+        self.stamp = None
+        self.skipped = False
+        self.log = None
+
+    def get_cmd(self, **kwargs):
         arch_str = amdgpu_arch_to_string(self.arch_config.arch)
         use_hip_clang = amdgpu_check_hip_clang()
         if use_hip_clang:
@@ -984,16 +1168,74 @@ class amdgpu_build_host_t(object):
                     '-ldl', '-lm', '-lpthread', '-lhc_am',
                     '-Wl,--whole-archive', '-lmcwamp', '-lhip_hcc', '-lhsa-runtime64', '-lhsakmt', '-Wl,--no-whole-archive']
             cmd += ['-o', self.target_exec]
+        return cmd
+
+    def get_stamp(self, cmd):
+        host_cpps = [self.host_cpp] if type(self.host_cpp) is str else self.host_cpp
+        src_dirs = sorted(set(os.path.dirname(os.path.abspath(f)) for f in host_cpps))
+        h = hashlib.sha1()
+        h.update(' '.join(cmd).encode())
+        for src_dir in src_dirs:
+            for file_name in sorted(os.listdir(src_dir)):
+                if os.path.splitext(file_name)[1] in ('.h', '.hpp', '.c', '.cc', '.cpp'):
+                    h.update(file_name.encode())
+                    with open(os.path.join(src_dir, file_name), 'rb') as f:
+                        h.update(f.read())
+        return h.hexdigest()
+
+    def is_up_to_date(self, stamp):
+        if not os.path.exists(self.target_exec):
+            return False
+        try:
+            with open(self.stamp_file) as f:
+                return f.read().strip() == stamp
+        except (IOError, OSError):
+            return False
 
-        p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr = subprocess.STDOUT)
+    def start(self, **kwargs):
+        self.cmd = self.get_cmd(**kwargs)
+        self.stamp = self.get_stamp(self.cmd)
+        if self.is_up_to_date(self.stamp):
+            self.skipped = True
+            return True
+        if os.path.exists(self.stamp_file):
+            os.remove(self.stamp_file)
         try:
-            (out, _) = p.communicate()
-            if p.returncode != 0:
-                print('build fail:{}'.format(cmd))
-                print('{}'.format(out.decode('utf-8')))
-                return False
+            self.log = tempfile.TemporaryFile()
+            self.process = subprocess.Popen(self.cmd, stdout=self.log, stderr = subprocess.STDOUT)
+        except Exception as e:
+            print('fail to run cmd:{}'.format(self.cmd))
+            print('err:{}'.format(e))
+            if self.log is not None:
+                self.log.close()
+                self.log = None
+            return False
+        return True
+
+    def wait(self):
+        if self.skipped:
             return True
+        if self.process is None:
+            return False
+        try:
+            if self.process.wait() != 0:
+                self.log.seek(0)
+                print('build fail:{}'.format(self.cmd))
+                print('{}'.format(self.log.read().decode('utf-8', 'replace')))
+                return False
         except Exception as e:
-            print('fail to run cmd:{}'.format(cmd))
+            print('fail to run cmd:{}'.format(self.cmd))
             print('err:{}'.format(e))
-            return False
\ No newline at end of file
+            return False
+        finally:
+            self.process = None
+            self.log.close()
+            self.log = None
+        with open(self.stamp_file, 'w') as f:
+            f.write(self.stamp)
+        return True
+
+    def build(self, **kwargs):
+        if not self.start(**kwargs):
+            return False
+        return self.wait()
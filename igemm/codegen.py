@@ -23,8 +23,12 @@
 #  SOFTWARE.
 # 
 ################################################################################
-import sys
+import sys, os
 import inspect
+import hashlib
+import json
+import pickle
+from .codegen_ir import *
 
 class codegen_dict_with_default_t(object):
     def __init__(self, d):
@@ -56,11 +60,13 @@ class _codegen_indent_t(object):
         self.level = 0
         self.indent_char = indent_char
         self.indent = ''
+        self.indent_cache = ['']     # indent prefix per level, built once
     def __call__(self):
         return self.indent
     def _update_indent(self):
-        self.indent = ''.join(self.indent_char
-            for i in range(self.indent_size_per_level * self.level))
+        while len(self.indent_cache) <= self.level:
+            self.indent_cache.append(self.indent_char * (self.indent_size_per_level * len(self.indent_cache)))
+        self.indent = self.indent_cache[self.level]
     def inc(self):
         self.level += 1
         self._update_indent()
@@ -125,20 +131,55 @@ class codegen_emit_to_file_t(object):
     def get_indent(self):
         return self.indent.get()
 
+class codegen_emit_to_buffer_t(object):
+    '''
+    collect lines in memory, get_buffer() return the text. pending lines are packed
+    into chunks every chunk_lines, so the list does not grow with the whole text.
+    '''
+    def __init__(self, indent = None, chunk_lines = 4096):
+        self.indent = indent if indent is not None else _codegen_indent_t(4)
+        self.chunk_lines = chunk_lines
+        self.chunks = []
+        self.lines = []
+    def emit(self, s):
+        lines = self.lines
+        lines.append(self.indent.indent + s)
+        if len(lines) >= self.chunk_lines:
+            self.chunks.append('\n'.join(lines) + '\n')
+            self.lines = []
+    def open(self):
+        pass
+    def close(self):
+        pass
+    def get_buffer(self):
+        if self.lines:
+            self.chunks.append('\n'.join(self.lines) + '\n')
+            self.lines = []
+        return ''.join(self.chunks)
+    def indent_context(self,enter_func=None, exit_func=None):
+        return _codegen_indent_context_manager_t(self.indent,enter_func, exit_func)
+    def inc_indent(self):
+        self.indent.inc()
+    def dec_indent(self):
+        self.indent.dec()
+    def set_indent(self, level):
+        self.indent.set(level)
+    def get_indent(self):
+        return self.indent.get()
+
 class codegen_deferred_emit_t(object):
     '''
-    print to string buffer and manage indent
+    print to string buffer and manage indent. lines are kept in a list and only
+    joined when the buffer is read
     '''
     def __init__(self, upper_emitter):
         self.indent = upper_emitter.indent  # manage the indent here
-        self.buffer = ''
-        self.is_first_line = True
+        self.buffer = []
     def emit(self, s):
-        if self.is_first_line:
-            self.buffer += s
-            self.is_first_line = False
+        if self.buffer:
+            self.buffer.append(self.indent() + s)
         else:
-            self.buffer += '\n' + self.indent() + s
+            self.buffer.append(s)   # first line is not indented, upper emitter will do
     def open(self):
         pass
     def close(self):
@@ -154,7 +195,118 @@ class codegen_deferred_emit_t(object):
     def get_indent(self):
         return self.indent.get()
     def get_buffer(self):
-        return self.buffer
+        return '\n'.join(self.buffer)
+
+class codegen_emit_to_ir_t(object):
+    '''
+    parse every emitted line into ir_stream_t, with the indent of the upper emitter.
+    the stream render() to the same text as the upper emitter would write
+    '''
+    def __init__(self, upper_emitter, macro_names = None):
+        self.indent = upper_emitter.indent
+        self.parser = ir_parser_t(macro_names)
+        self.stream = ir_stream_t()
+    def emit(self, s):
+        self.stream.extend(self.parser.parse_text(self.indent() + s))
+    def open(self):
+        pass
+    def close(self):
+        pass
+    def indent_context(self, enter_func=None, exit_func=None):
+        return _codegen_indent_context_manager_t(self.indent, enter_func, exit_func)
+    def inc_indent(self):
+        self.indent.inc()
+    def dec_indent(self):
+        self.indent.dec()
+    def set_indent(self, level):
+        self.indent.set(level)
+    def get_indent(self):
+        return self.indent.get()
+    def get_stream(self):
+        return self.stream
+
+def codegen_generator_fingerprint():
+    '''
+    hash of all source of this package, any change of the generator invalidate cached fragments
+    '''
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    h = hashlib.sha1()
+    for file_name in sorted(os.listdir(package_dir)):
+        if file_name.endswith('.py'):
+            h.update(file_name.encode())
+            with open(os.path.join(package_dir, file_name), 'rb') as f:
+                h.update(f.read())
+    return h.hexdigest()
+
+class codegen_fragment_cache_t(object):
+    '''
+    content-addressed on-disk cache of rendered fragments, one pickle file per key.
+    evict() removes least recently used entries while the total size is over max_bytes,
+    called once after a run, not per put(), since it scans the whole directory.
+    '''
+    def __init__(self, cache_dir, max_bytes = 256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.frag')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        os.utime(path, None)    # mtime is the LRU timestamp
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, path)
+
+    def evict(self):
+        entries = []
+        total = 0
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith('.frag'):
+                continue
+            path = os.path.join(self.cache_dir, file_name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except OSError:
+                if os.path.exists(path):
+                    continue
+                # removed by another codegen sharing the cache
+            total -= size
+
+    def get_stats(self):
+        return 'fragment cache {}: {} hit, {} miss, {} evicted'.format(self.cache_dir, self.hits, self.misses, self.evictions)
 
 class codegen_asm_printer_t(object):
     '''
@@ -164,6 +316,7 @@ class codegen_asm_printer_t(object):
         self.emitter = emitter
         self.emitter.open()
         self.deferred_buffer = ''
+        self.ir_stream = None
         self.global_macro_bucket = set()
         self.arch_config = arch_config
 
@@ -210,6 +363,15 @@ class codegen_asm_printer_t(object):
         self.global_macro_bucket.add(e.name())
         e.emit()
 
+    def emit_unique_text(self, name, text):
+        '''
+        same rule as emit_unique_macro, for a macro already rendered to text
+        '''
+        if name in self.global_macro_bucket:
+            return
+        self.global_macro_bucket.add(name)
+        self.emit(text)
+
     def emit(self, s):
         self.emitter.emit(s)
 
@@ -259,6 +421,30 @@ class codegen_asm_printer_t(object):
     def get_deferred(self):
         return self.deferred_buffer
 
+    def ir_context(self, macro_names = None):
+        '''
+        inside this context, emitted lines are recorded as ir_stream_t instead of printed.
+        get_ir() return the stream after exit, emit_ir() print a stream
+        '''
+        class ir_context_t(object):
+            def __init__(self, outter):
+                self.outter = outter
+                self.original_emitter = outter.emitter
+                self.ir_emitter = codegen_emit_to_ir_t(self.original_emitter, macro_names)
+            def __enter__(self):
+                self.outter.emitter = self.ir_emitter
+            def __exit__(self, type, value, traceback):
+                self.outter.emitter = self.original_emitter
+                self.outter.ir_stream = self.ir_emitter.get_stream()
+        return ir_context_t(self)
+
+    def get_ir(self):
+        return self.ir_stream
+
+    def emit_ir(self, stream):
+        # nodes carry their own indent
+        self.emit_front(stream.render())
+
     def inject(self, other):
         '''
         useful to inject some control func here
@@ -278,3 +464,6 @@ class codegen_asm_printer_t(object):
         other._indent_context = self.indent_context
         other._deferred_context = self.deferred_context
         other._get_deferred = self.get_deferred
+        other._ir_context = self.ir_context
+        other._get_ir = self.get_ir
+        other._emit_ir = self.emit_ir
@@ -0,0 +1,896 @@
+################################################################################
+#
+#  MIT License
+#
+#  Copyright (c) 2020 Advanced Micro Devices, Inc.
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+################################################################################
+# typed instruction stream of the generated asm.
+# every emitted line is parsed into a node (instruction, label, macro invocation,
+# directive, symbol assignment, comment...). a node keeps the line it came from and
+# render() it unchanged, so a stream recorded from the generators print back to the
+# very same text. a node modified by a pass is rendered from its fields instead.
+import re
+
+IR_REG_VGPR     = 'v'
+IR_REG_SGPR     = 's'
+
+# registers with a fixed name, and their width in dword
+IR_SPECIAL_REGS = {
+    'vcc'       : 2,
+    'vcc_lo'    : 1,
+    'vcc_hi'    : 1,
+    'exec'      : 2,
+    'exec_lo'   : 1,
+    'exec_hi'   : 1,
+    'scc'       : 1,
+    'm0'        : 1,
+    'vccz'      : 1,
+    'execz'     : 1,
+    'off'       : 1,
+}
+
+# instruction modifiers without value. modifiers with value are in form of "name:value"
+IR_MODIFIERS = ('offen', 'idxen', 'glc', 'slc', 'dlc', 'lds', 'tfe', 'gds', 'clamp', 'addr64')
+
+# everything of these blocks is kept as raw text
+IR_RAW_BLOCKS = {
+    '.amd_kernel_code_t'        : '.end_amd_kernel_code_t',
+    '.amdgpu_metadata'          : '.end_amdgpu_metadata',
+    '.amd_amdgpu_hsa_metadata'  : '.end_amd_amdgpu_hsa_metadata',
+}
+
+IR_DIRECTIVES = ('.set', '.macro', '.endm', '.rept', '.endr', '.if', '.ifdef', '.ifndef', '.else',
+                '.elseif', '.endif', '.include', '.text', '.rodata', '.globl', '.p2align', '.type',
+                '.size', '.section', '.byte', '.short', '.long', '.quad', '.error', '.warning', '.print')
+
+def ir_split_top_level(s, sep = ','):
+    '''
+    split s by sep, but not inside () or []. sep None means any white space
+    '''
+    result = []
+    depth = 0
+    current = []
+    for c in s:
+        if c in '([':
+            depth += 1
+        elif c in ')]':
+            depth -= 1
+        if depth == 0 and ((sep is None and c.isspace()) or c == sep):
+            result.append(''.join(current))
+            current = []
+            continue
+        current.append(c)
+    result.append(''.join(current))
+    if sep is None:
+        return [r for r in result if r]
+    return result
+
+def _ir_split_comment(s):
+    '''
+    split line into (code, comment). comment start from ';', include the white space before it
+    '''
+    in_string = False
+    for i, c in enumerate(s):
+        if c == '"':
+            in_string = not in_string
+        elif c == ';' and not in_string:
+            code = s[:i].rstrip()
+            return code, s[len(code):]
+        # '//' is also a comment for llvm-mc
+        elif c == '/' and not in_string and s[i:i+2] == '//':
+            code = s[:i].rstrip()
+            return code, s[len(code):]
+    return s, ''
+
+_IR_TOKEN_RE = re.compile(r'\s*(?:(0[xX][0-9a-fA-F]+|\d+\.\d*(?:[eE][-+]?\d+)?|\d+)|(\\?[A-Za-z_.$][A-Za-z0-9_.$]*)|(<<|>>|<=|>=|==|!=|&&|\|\||[-+*/%&|^~()<>!]))')
+_IR_PY_OPERATORS = {'/' : '//', '&&' : ' and ', '||' : ' or ', '!' : ' not '}
+
+class ir_eval_error_t(Exception):
+    pass
+
+def ir_eval_expr(expr, symbols):
+    '''
+    evaluate an asm expression, symbols is a dict of name->value. raise ir_eval_error_t
+    if a symbol is not known or the expression is not understood
+    '''
+    expr = expr.strip()
+    if re.match(r'^-?\d+$', expr):
+        return int(expr)
+    if expr in symbols:
+        return symbols[expr]
+    py = []
+    pos = 0
+    while pos < len(expr):
+        m = _IR_TOKEN_RE.match(expr, pos)
+        if not m or m.end() == pos:
+            if expr[pos:].strip() == '':
+                break
+            raise ir_eval_error_t('can not parse "{}"'.format(expr))
+        number, name, op = m.groups()
+        if number is not None:
+            py.append(number)
+        elif name is not None:
+            if name not in symbols:
+                raise ir_eval_error_t('unknown symbol "{}" in "{}"'.format(name, expr))
+            py.append('({})'.format(int(symbols[name])))
+        else:
+            py.append(_IR_PY_OPERATORS.get(op, op))
+        pos = m.end()
+    try:
+        value = eval(''.join(py), {'__builtins__' : {}}, {})
+    except Exception as e:
+        raise ir_eval_error_t('can not evaluate "{}", {}'.format(expr, e))
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+class ir_operand_t(object):
+    def render(self):
+        assert False, "not implemented"
+    def __str__(self):
+        return self.render()
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, self.render())
+
+class ir_reg_t(ir_operand_t):
+    '''
+    v[lo], v[lo:hi], s[lo:hi] or direct form v0/s0. lo/hi are expression string
+    '''
+    def __init__(self, kind, lo, hi = None, direct = False):
+        assert kind in (IR_REG_VGPR, IR_REG_SGPR)
+        self.kind = kind
+        self.lo = lo
+        self.hi = hi
+        self.direct = direct
+    def render(self):
+        if self.direct:
+            return '{}{}'.format(self.kind, self.lo)
+        if self.hi is None:
+            return '{}[{}]'.format(self.kind, self.lo)
+        return '{}[{}:{}]'.format(self.kind, self.lo, self.hi)
+    def resolve(self, symbols):
+        '''
+        return (index, width) of this register
+        '''
+        lo = ir_eval_expr(self.lo, symbols)
+        if self.hi is None:
+            return lo, 1
+        hi = ir_eval_expr(self.hi, symbols)
+        assert hi >= lo, "bad register range {}".format(self.render())
+        return lo, hi - lo + 1
+    def width(self, symbols):
+        return self.resolve(symbols)[1]
+
+class ir_special_t(ir_operand_t):
+    def __init__(self, name):
+        self.name = name
+    def render(self):
+        return self.name
+    def width(self, symbols = None):
+        return IR_SPECIAL_REGS[self.name]
+
+class ir_expr_t(ir_operand_t):
+    '''
+    immediate, or expression of symbols
+    '''
+    def __init__(self, text):
+        self.text = text
+    def render(self):
+        return self.text
+    def value(self, symbols):
+        return ir_eval_expr(self.text, symbols)
+
+class ir_label_ref_t(ir_operand_t):
+    def __init__(self, name):
+        self.name = name
+    def render(self):
+        return self.name
+
+def ir_is_branch(opcode):
+    return opcode == 's_branch' or opcode.startswith('s_cbranch_')
+
+def ir_parse_operand(s, opcode = ''):
+    s = s.strip()
+    m = re.match(r'^([vs])\[(.*)\]$', s)
+    if m:
+        inside = ir_split_top_level(m.group(2), ':')
+        if len(inside) == 1:
+            return ir_reg_t(m.group(1), inside[0])
+        assert len(inside) == 2, "bad register operand {}".format(s)
+        return ir_reg_t(m.group(1), inside[0], inside[1])
+    m = re.match(r'^([vs])(\d+)$', s)
+    if m:
+        return ir_reg_t(m.group(1), m.group(2), direct = True)
+    if s in IR_SPECIAL_REGS:
+        return ir_special_t(s)
+    if ir_is_branch(opcode):
+        return ir_label_ref_t(s)
+    return ir_expr_t(s)
+
+def _ir_is_modifier(s):
+    return s in IR_MODIFIERS or re.match(r'^[A-Za-z_]\w*:\S', s) is not None
+
+class ir_node_t(object):
+    '''
+    one line of asm. text is the original line, None once the node is created or
+    modified by a pass, then the line is rendered from the fields.
+    '''
+    def __init__(self, indent = '', comment = '', text = None):
+        self.indent = indent
+        self.comment = comment
+        self.text = text
+    def dirty(self):
+        self.text = None
+    def body(self):
+        return ''
+    def render(self):
+        if self.text is not None:
+            return self.text
+        return self.indent + self.body() + self.comment
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, self.render().strip())
+
+class ir_empty_t(ir_node_t):
+    pass
+
+class ir_comment_t(ir_node_t):
+    def render(self):
+        if self.text is not None:
+            return self.text
+        return self.indent + self.comment
+
+class ir_raw_t(ir_node_t):
+    '''
+    line inside a raw block, like .amd_kernel_code_t and metadata
+    '''
+    def __init__(self, raw, indent = '', comment = '', text = None):
+        ir_node_t.__init__(self, indent, comment, text)
+        self.raw = raw
+    def body(self):
+        return self.raw
+
+class ir_label_t(ir_node_t):
+    def __init__(self, name, indent = '', comment = '', text = None):
+        ir_node_t.__init__(self, indent, comment, text)
+        self.name = name
+    def body(self):
+        return self.name + ':'
+
+class ir_assign_t(ir_node_t):
+    '''
+    symbol assignment, .itr_k = .itr_k + 1
+    '''
+    def __init__(self, symbol, expr, indent = '', comment = '', text = None):
+        ir_node_t.__init__(self, indent, comment, text)
+        self.symbol = symbol
+        self.expr = expr
+    def body(self):
+        return '{} = {}'.format(self.symbol, self.expr)
+
+class ir_directive_t(ir_node_t):
+    '''
+    assembler directive, args is the raw string after the name
+    '''
+    def __init__(self, name, args = '', indent = '', comment = '', text = None):
+        ir_node_t.__init__(self, indent, comment, text)
+        self.name = name
+        self.args = args
+    def get_args(self):
+        if not self.args.strip():
+            return []
+        return [a.strip() for a in ir_split_top_level(self.args)]
+    def body(self):
+        if self.args:
+            return '{} {}'.format(self.name, self.args)
+        return self.name
+
+class ir_macro_call_t(ir_node_t):
+    def __init__(self, name, args, indent = '', comment = '', text = None):
+        ir_node_t.__init__(self, indent, comment, text)
+        self.name = name
+        self.args = args
+    def body(self):
+        if self.args:
+            return '{} {}'.format(self.name, ', '.join(self.args))
+        return self.name
+
+class ir_inst_t(ir_node_t):
+    '''
+    opcode, list of ir_operand_t and list of modifier string like "offen", "offset:256"
+    '''
+    def __init__(self, opcode, operands = None, modifiers = None, indent = '', comment = '', text = None):
+        ir_node_t.__init__(self, indent, comment, text)
+        self.opcode = opcode
+        self.operands = operands if operands is not None else []
+        self.modifiers = modifiers if modifiers is not None else []
+    def body(self):
+        s = self.opcode
+        if self.operands:
+            s += ' ' + ', '.join(o.render() for o in self.operands)
+        if self.modifiers:
+            s += ' ' + ' '.join(self.modifiers)
+        return s
+    def get_modifier(self, name, default_value = None):
+        for m in self.modifiers:
+            if m == name:
+                return True
+            if m.startswith(name + ':'):
+                return m[len(name) + 1:]
+        return default_value
+    def regs(self):
+        return [o for o in self.operands if isinstance(o, (ir_reg_t, ir_special_t))]
+
+class ir_parser_t(object):
+    '''
+    line parser, keep state across lines for block comment, raw block and macro names
+    '''
+    def __init__(self, macro_names = None):
+        self.macro_names = set(macro_names) if macro_names else set()
+        self.in_block_comment = False
+        self.raw_end = None
+
+    def parse_text(self, text):
+        return [self.parse_line(line) for line in text.split('\n')]
+
+    def parse_line(self, line):
+        stripped = line.strip()
+        indent = line[:len(line) - len(line.lstrip())]
+        if self.in_block_comment:
+            if '*/' in line:
+                self.in_block_comment = False
+            return ir_comment_t(indent, stripped, line)
+        if stripped.startswith('/*'):
+            if '*/' not in stripped:
+                self.in_block_comment = True
+            return ir_comment_t(indent, stripped, line)
+        if self.raw_end:
+            if stripped.split(' ')[0] == self.raw_end:
+                self.raw_end = None
+                return ir_directive_t(stripped, '', indent, '', line)
+            return ir_raw_t(stripped, indent, '', line)
+        if stripped == '':
+            return ir_empty_t(indent, '', line)
+
+        code, comment = _ir_split_comment(line[len(indent):])
+        if code == '':
+            return ir_comment_t(indent, comment.lstrip(), line)
+
+        m = re.match(r'^([A-Za-z_.$][\w.$]*):$', code)
+        if m:
+            return ir_label_t(m.group(1), indent, comment, line)
+
+        m = re.match(r'^(\\?[A-Za-z_.$][\w.$]*)\s*=(?!=)\s*(.*)$', code)
+        if m:
+            return ir_assign_t(m.group(1), m.group(2), indent, comment, line)
+
+        parts = code.split(None, 1)
+        name = parts[0]
+        rest = parts[1] if len(parts) > 1 else ''
+        if name.startswith('.'):
+            if name in IR_RAW_BLOCKS:
+                self.raw_end = IR_RAW_BLOCKS[name]
+                return ir_directive_t(name, rest, indent, comment, line)
+            if name == '.macro':
+                self.macro_names.add(ir_split_top_level(rest, None)[0].rstrip(','))
+                return ir_directive_t(name, rest, indent, comment, line)
+            if name in self.macro_names or not (name in IR_DIRECTIVES or name.startswith('.amd') or \
+                                        name.startswith('.end') or name.startswith('.hsa_')):
+                args = [a.strip() for a in ir_split_top_level(rest)] if rest.strip() else []
+                return ir_macro_call_t(name, args, indent, comment, line)
+            return ir_directive_t(name, rest, indent, comment, line)
+
+        operands = []
+        modifiers = []
+        if rest.strip():
+            for piece in ir_split_top_level(rest):
+                tokens = ir_split_top_level(piece, None)
+                # modifiers are at the end of an operand, or an operand themselves (offset0:0, offset1:64)
+                piece_modifiers = []
+                while tokens and _ir_is_modifier(tokens[-1]):
+                    piece_modifiers.insert(0, tokens.pop())
+                modifiers.extend(piece_modifiers)
+                if tokens:
+                    operands.append(ir_parse_operand(' '.join(tokens), name))
+        return ir_inst_t(name, operands, modifiers, indent, comment, line)
+
+class ir_stream_t(object):
+    '''
+    list of nodes, render() give back the text
+    '''
+    def __init__(self, nodes = None):
+        self.nodes = nodes if nodes is not None else []
+    def __iter__(self):
+        return iter(self.nodes)
+    def __len__(self):
+        return len(self.nodes)
+    def __getitem__(self, i):
+        return self.nodes[i]
+    def append(self, node):
+        self.nodes.append(node)
+    def extend(self, nodes):
+        self.nodes.extend(nodes)
+    def render(self):
+        return '\n'.join(n.render() for n in self.nodes)
+    def instructions(self):
+        return [n for n in self.nodes if isinstance(n, ir_inst_t)]
+    def get_symbols(self, symbols = None):
+        '''
+        value of symbols by .set and top level assignment, in order. symbols can not be
+        evaluated (like the ones only known inside a macro) are skipped
+        '''
+        symbols = dict(symbols) if symbols else {}
+        depth = 0
+        for n in self.nodes:
+            if isinstance(n, ir_directive_t):
+                if n.name in ('.macro', '.rept'):
+                    depth += 1
+                elif n.name in ('.endm', '.endr'):
+                    depth -= 1
+                elif n.name == '.set' and depth == 0:
+                    args = n.get_args()
+                    if len(args) == 2:
+                        try:
+                            symbols[args[0]] = ir_eval_expr(args[1], symbols)
+                        except ir_eval_error_t:
+                            pass
+            elif isinstance(n, ir_assign_t) and depth == 0:
+                try:
+                    symbols[n.symbol] = ir_eval_expr(n.expr, symbols)
+                except ir_eval_error_t:
+                    pass
+        return symbols
+
+def ir_parse(text, macro_names = None):
+    return ir_stream_t(ir_parser_t(macro_names).parse_text(text))
+
+class ir_macro_t(object):
+    '''
+    body of .macro name params ... .endm, as nodes
+    '''
+    def __init__(self, name, params, body):
+        self.name = name
+        self.params = params    # list of (name, default value or None)
+        self.body = body
+
+def ir_collect_macros(stream, macros = None):
+    '''
+    dict of name -> ir_macro_t of every .macro defined in stream
+    '''
+    macros = dict(macros) if macros else {}
+    current = None
+    for n in stream:
+        if isinstance(n, ir_directive_t) and n.name == '.macro':
+            tokens = ir_split_top_level(n.args.replace(',', ' '), None)
+            params = []
+            for p in tokens[1:]:
+                p_name, _, p_default = p.partition('=')
+                params.append((p_name.split(':')[0], p_default if p_default else None))
+            current = ir_macro_t(tokens[0], params, [])
+        elif isinstance(n, ir_directive_t) and n.name == '.endm':
+            macros[current.name] = current
+            current = None
+        elif current is not None:
+            current.body.append(n)
+    return macros
+
+_IR_IDENTIFIER_RE = re.compile(r'(?<![\w.$\\])([A-Za-z_.$][\w.$]*)')
+
+class ir_expander_t(object):
+    '''
+    expand macro invocations, .rept and .if of a stream, like the assembler does.
+    symbols assigned with "=" are replaced by their value, so the result is a flat list of
+    instructions/labels/comments. symbols from .set (kernel layout) are kept as is, they are
+    used to evaluate .rept/.if conditions and register index only.
+    '''
+    def __init__(self, macros, symbols = None, keep_macro_comment = False):
+        self.macros = macros
+        self.symbols = dict(symbols) if symbols else {}
+        self.local_symbols = {}
+        self.local_texts = {}
+        self.keep_macro_comment = keep_macro_comment
+        self.parser = ir_parser_t(macros.keys())
+
+    def eval(self, expr):
+        symbols = dict(self.symbols)
+        symbols.update(self.local_symbols)
+        return ir_eval_expr(expr, symbols)
+
+    def assign(self, symbol, expr):
+        '''
+        value of a local symbol. if it is "layout symbol + constant", like _v = v_gld_b + 1,
+        it is kept in that form when substituted, so the register name is not lost
+        '''
+        value = self.eval(expr)
+        self.local_symbols[symbol] = value
+        self.local_texts[symbol] = str(value)
+        names = set(m.group(1) for m in _IR_IDENTIFIER_RE.finditer(expr) if m.group(1) in self.symbols)
+        if len(names) == 1:
+            name = names.pop()
+            symbols = dict(self.symbols)
+            symbols[name] += 1024
+            try:
+                linear = ir_eval_expr(expr, symbols) == value + 1024
+            except ir_eval_error_t:
+                linear = False
+            if linear:
+                offset = value - self.symbols[name]
+                self.local_texts[symbol] = name if offset == 0 else '{}{:+d}'.format(name, offset)
+
+    def substitute(self, text):
+        '''
+        replace locally assigned symbols by value, and fold constant expressions
+        '''
+        if not self.local_texts:
+            return text
+        changed = [False]
+        def repl(m):
+            if m.group(1) in self.local_texts:
+                changed[0] = True
+                return self.local_texts[m.group(1)]
+            return m.group(1)
+        code, comment = _ir_split_comment(text)
+        code = _IR_IDENTIFIER_RE.sub(repl, code)
+        if not changed[0]:
+            return text
+        return code + comment
+
+    def _fold(self, node):
+        # fold expression made of numbers only, after symbol substitution
+        def fold(text):
+            if re.match(r'^-?(0[xX][0-9a-fA-F]+|\d+)$', text.strip()):
+                return text
+            try:
+                return str(ir_eval_expr(text, {}))
+            except ir_eval_error_t:
+                pass
+            names = set(m.group(1) for m in _IR_IDENTIFIER_RE.finditer(text))
+            if len(names) != 1 or not names <= set(self.symbols):
+                return text
+            name = names.pop()
+            symbols = {name : self.symbols[name] + 1024}
+            try:
+                value = ir_eval_expr(text, {name : self.symbols[name]})
+                if ir_eval_expr(text, symbols) != value + 1024:
+                    return text
+            except ir_eval_error_t:
+                return text
+            offset = value - self.symbols[name]
+            return name if offset == 0 else '{}{:+d}'.format(name, offset)
+        for o in node.operands:
+            if isinstance(o, ir_expr_t):
+                o.text = fold(o.text)
+            elif isinstance(o, ir_reg_t) and not o.direct:
+                o.lo = fold(o.lo)
+                if o.hi is not None:
+                    o.hi = fold(o.hi)
+        modifiers = []
+        for m in node.modifiers:
+            name, sep, value = m.partition(':')
+            modifiers.append(name + sep + fold(value) if sep else m)
+        node.modifiers = modifiers
+
+    def _block(self, nodes, start, begins, ends, splits = ()):
+        '''
+        nodes[start] is the begin directive, return (list of branches, index of end directive).
+        branches are split by directive in splits at the same nesting level
+        '''
+        depth = 0
+        branches = [(nodes[start], [])]
+        i = start + 1
+        while i < len(nodes):
+            n = nodes[i]
+            if isinstance(n, ir_directive_t):
+                if n.name in begins:
+                    depth += 1
+                elif n.name in ends:
+                    if depth == 0:
+                        return branches, i
+                    depth -= 1
+                elif n.name in splits and depth == 0:
+                    branches.append((n, []))
+                    i += 1
+                    continue
+            branches[-1][1].append(n)
+            i += 1
+        assert False, 'no {} for {}'.format(ends, nodes[start].render())
+
+    def expand(self, nodes, indent = None, in_macro = False):
+        result = []
+        i = 0
+        while i < len(nodes):
+            n = nodes[i]
+            out_indent = n.indent if indent is None else indent
+            if isinstance(n, ir_directive_t) and n.name == '.rept':
+                branches, end = self._block(nodes, i, ('.rept', '.irp'), ('.endr',))
+                for _ in range(self.eval(self.substitute(n.args))):
+                    result.extend(self.expand(branches[0][1], out_indent, in_macro))
+                i = end + 1
+                continue
+            if isinstance(n, ir_directive_t) and n.name in ('.if', '.ifdef', '.ifndef'):
+                branches, end = self._block(nodes, i, ('.if', '.ifdef', '.ifndef'), ('.endif',), ('.else', '.elseif'))
+                for cond, body in branches:
+                    if cond.name == '.else':
+                        taken = True
+                    elif cond.name == '.ifdef':
+                        taken = cond.args.strip() in self.symbols or cond.args.strip() in self.local_symbols
+                    elif cond.name == '.ifndef':
+                        taken = not (cond.args.strip() in self.symbols or cond.args.strip() in self.local_symbols)
+                    else:
+                        taken = self.eval(self.substitute(cond.args)) != 0
+                    if taken:
+                        result.extend(self.expand(body, out_indent, in_macro))
+                        break
+                i = end + 1
+                continue
+            if isinstance(n, ir_assign_t):
+                self.assign(n.symbol, self.substitute(n.expr))
+            elif isinstance(n, ir_macro_call_t) and n.name in self.macros:
+                result.extend(self.expand_macro(n, out_indent))
+            elif isinstance(n, ir_inst_t):
+                rendered = n.render()
+                text = self.substitute(rendered)
+                substituted = text != rendered
+                if not substituted and indent is None:
+                    result.append(n)
+                else:
+                    inst = self.parser.parse_line(out_indent + text.lstrip())
+                    if substituted or in_macro:
+                        self._fold(inst)
+                        inst.dirty()
+                    result.append(inst)
+            elif isinstance(n, (ir_comment_t, ir_empty_t)):
+                if not in_macro or self.keep_macro_comment:
+                    result.append(n)
+            else:
+                result.append(n)
+            i += 1
+        return result
+
+    def expand_macro(self, call, indent):
+        macro = self.macros[call.name]
+        args = list(call.args)
+        assert len(args) <= len(macro.params), 'too many args for {}'.format(call.render())
+        values = {}
+        for k, (p_name, p_default) in enumerate(macro.params):
+            if k < len(args) and args[k] != '':
+                values[p_name] = self.substitute(args[k])
+            else:
+                # like the assembler, missing arg without default is empty
+                values[p_name] = p_default if p_default is not None else ''
+        def repl(m):
+            if m.group(1) in values:
+                return values[m.group(1)]
+            return m.group(0)
+        text = '\n'.join(re.sub(r'\\(\w+)(\\\(\))?', repl, n.render()) for n in macro.body)
+        parser = ir_parser_t(self.macros.keys())
+        return self.expand(parser.parse_text(text), indent, True)
+
+def ir_expand(stream, macros, symbols = None):
+    return ir_stream_t(ir_expander_t(macros, symbols).expand(stream.nodes))
+
+# instruction class, used by passes to know what an instruction touches
+IR_INST_VMEM_LOAD   = 'vmem_load'
+IR_INST_VMEM_STORE  = 'vmem_store'
+IR_INST_LDS_LOAD    = 'lds_load'
+IR_INST_LDS_STORE   = 'lds_store'
+IR_INST_SMEM_LOAD   = 'smem_load'
+IR_INST_VALU        = 'valu'
+IR_INST_SALU        = 'salu'
+IR_INST_BRANCH      = 'branch'
+IR_INST_WAITCNT     = 'waitcnt'
+IR_INST_BARRIER     = 'barrier'
+IR_INST_OTHER       = 'other'
+
+def ir_inst_class(opcode):
+    if opcode.startswith(('buffer_', 'global_', 'flat_', 'tbuffer_')):
+        if 'atomic' in opcode:
+            return IR_INST_VMEM_STORE
+        return IR_INST_VMEM_LOAD if '_load' in opcode else IR_INST_VMEM_STORE
+    if opcode.startswith('ds_'):
+        return IR_INST_LDS_LOAD if opcode.startswith(('ds_read', 'ds_load')) else IR_INST_LDS_STORE
+    if opcode.startswith(('s_load_', 's_buffer_load_')):
+        return IR_INST_SMEM_LOAD
+    if opcode == 's_waitcnt':
+        return IR_INST_WAITCNT
+    if opcode == 's_barrier':
+        return IR_INST_BARRIER
+    if ir_is_branch(opcode):
+        return IR_INST_BRANCH
+    if opcode.startswith('v_'):
+        return IR_INST_VALU
+    if opcode in ('s_endpgm', 's_nop', 's_setprio', 's_sleep', 's_dcache_wb', 's_icache_inv'):
+        return IR_INST_OTHER
+    if opcode.startswith('s_'):
+        return IR_INST_SALU
+    return IR_INST_OTHER
+
+# SALU writing scc
+_IR_SALU_SCC_DEF = ('s_add_', 's_addc_', 's_sub_', 's_subb_', 's_and_', 's_or_', 's_xor_', 's_andn2_',
+                    's_orn2_', 's_nand_', 's_nor_', 's_xnor_', 's_not_', 's_lshl', 's_lshr_', 's_ashr_',
+                    's_cmp_', 's_bfe_', 's_min_', 's_max_', 's_abs_', 's_bcnt', 's_absdiff_', 's_bitcmp')
+
+def ir_reg_units(operand, symbols):
+    '''
+    register units of an operand, ('v', index) / ('s', index) / ('x', name) for special register
+    '''
+    if isinstance(operand, ir_reg_t):
+        index, width = operand.resolve(symbols)
+        return [(operand.kind, index + i) for i in range(width)]
+    if isinstance(operand, ir_special_t):
+        if operand.name in ('vcc', 'exec'):
+            return [('x', operand.name + '_lo'), ('x', operand.name + '_hi')]
+        if operand.name in ('vccz', 'execz'):
+            return [('x', operand.name[:-1] + '_lo'), ('x', operand.name[:-1] + '_hi')]
+        if operand.name == 'off':
+            return []
+        return [('x', operand.name)]
+    return []
+
+IR_EXEC_UNITS = [('x', 'exec_lo'), ('x', 'exec_hi')]
+IR_VCC_UNITS = [('x', 'vcc_lo'), ('x', 'vcc_hi')]
+IR_SCC_UNITS = [('x', 'scc')]
+
+def ir_def_use(inst, symbols):
+    '''
+    (defs, uses) list of register units of an instruction, implicit exec/vcc/scc included.
+    v_mac/v_fmac and v_swap read their destination, masked VALU write does not fully kill
+    a register, this is left to the passes (see ir_is_masked_write)
+    '''
+    op = inst.opcode
+    cls = ir_inst_class(op)
+    units = [ir_reg_units(o, symbols) for o in inst.operands]
+    defs = []
+    uses = []
+    def flat(lists):
+        return [u for l in lists for u in l]
+    if cls in (IR_INST_VMEM_STORE, IR_INST_LDS_STORE):
+        if 'atomic' in op and inst.get_modifier('glc'):
+            defs = units[0]
+        uses = flat(units)
+        uses += IR_EXEC_UNITS
+    elif cls in (IR_INST_VMEM_LOAD, IR_INST_LDS_LOAD, IR_INST_SMEM_LOAD):
+        defs = units[0] if units else []
+        uses = flat(units[1:])
+        if cls != IR_INST_SMEM_LOAD:
+            uses += IR_EXEC_UNITS
+    elif cls == IR_INST_BRANCH:
+        if op in ('s_cbranch_scc0', 's_cbranch_scc1'):
+            uses = IR_SCC_UNITS
+        elif op in ('s_cbranch_vccz', 's_cbranch_vccnz'):
+            uses = IR_VCC_UNITS
+        elif op in ('s_cbranch_execz', 's_cbranch_execnz'):
+            uses = IR_EXEC_UNITS
+    elif cls == IR_INST_VALU:
+        if op.startswith(('v_cmp_', 'v_cmpx_')):
+            defs = units[0] if units else []
+            uses = flat(units[1:])
+            if op.startswith('v_cmpx_'):
+                defs = defs + IR_EXEC_UNITS
+        elif op == 'v_swap_b32':
+            defs = units[0] + units[1]
+            uses = units[0] + units[1]
+        elif op.startswith(('v_add_co_', 'v_sub_co_', 'v_subrev_co_')) or (op in ('v_add_i32', 'v_sub_i32', 'v_subrev_i32') and len(units) == 4):
+            defs = units[0] + units[1]
+            uses = flat(units[2:])
+        elif op.startswith(('v_addc_', 'v_subb_', 'v_subbrev_')):
+            defs = units[0] + units[1]
+            uses = flat(units[2:])
+        elif op.startswith(('v_mac_', 'v_fmac_')):
+            defs = units[0]
+            uses = flat(units)
+        elif op == 'v_readfirstlane_b32' or op == 'v_readlane_b32':
+            defs = units[0]
+            uses = flat(units[1:])
+        else:
+            defs = units[0] if units else []
+            uses = flat(units[1:])
+        if op not in ('v_readfirstlane_b32', 'v_readlane_b32'):
+            uses = uses + IR_EXEC_UNITS
+    elif cls == IR_INST_SALU:
+        if op.startswith(('s_cmp_', 's_bitcmp')):
+            uses = flat(units)
+        elif op.startswith('s_setpc'):
+            uses = flat(units)
+        else:
+            defs = units[0] if units else []
+            uses = flat(units[1:])
+        if op.startswith(_IR_SALU_SCC_DEF):
+            defs = defs + IR_SCC_UNITS
+        if op.startswith(('s_addc_', 's_subb_', 's_cselect_', 's_cmov_', 's_cbranch_scc')):
+            uses = uses + IR_SCC_UNITS
+        if 'saveexec' in op:
+            defs = defs + IR_EXEC_UNITS + IR_SCC_UNITS
+            uses = uses + IR_EXEC_UNITS
+    return defs, uses
+
+def ir_is_masked_write(inst):
+    '''
+    instruction writes only lanes enabled by exec
+    '''
+    cls = ir_inst_class(inst.opcode)
+    if cls in (IR_INST_VMEM_LOAD, IR_INST_LDS_LOAD):
+        return True
+    return cls == IR_INST_VALU and not inst.opcode.startswith(('v_cmp_', 'v_cmpx_', 'v_readfirstlane', 'v_readlane'))
+
+def ir_parse_waitcnt(inst):
+    '''
+    dict of counter name -> count of a s_waitcnt, counters not given are not in the dict
+    '''
+    result = {}
+    text = ' '.join(o.render() for o in inst.operands)
+    for name, count in re.findall(r'(vmcnt|lgkmcnt|expcnt)\((\d+)\)', text):
+        result[name] = int(count)
+    if not result:
+        # raw encoding, like s_waitcnt 0
+        try:
+            if int(text.strip(), 0) == 0:
+                result = {'vmcnt' : 0, 'lgkmcnt' : 0, 'expcnt' : 0}
+        except ValueError:
+            pass
+    return result
+
+def ir_create_waitcnt(counts, indent = ''):
+    '''
+    s_waitcnt of counts, dict of counter name -> count
+    '''
+    cnt = ' '.join('{}({})'.format(name, counts[name]) for name in ('vmcnt', 'expcnt', 'lgkmcnt') if name in counts)
+    return ir_inst_t('s_waitcnt', [ir_expr_t(cnt)], [], indent)
+
+class ir_cfg_t(object):
+    '''
+    basic blocks of a macro expanded stream. a block start at a label, end after a branch or s_endpgm.
+    blocks[i] is list of node, succs[i]/preds[i] are block index. concat of blocks is the stream
+    '''
+    def __init__(self, nodes):
+        self.blocks = [[]]
+        for n in nodes:
+            if isinstance(n, ir_label_t) and self.blocks[-1]:
+                self.blocks.append([])
+            self.blocks[-1].append(n)
+            if isinstance(n, ir_inst_t) and (ir_is_branch(n.opcode) or n.opcode == 's_endpgm'):
+                self.blocks.append([])
+        if not self.blocks[-1]:
+            self.blocks.pop()
+        labels = {}
+        for i, block in enumerate(self.blocks):
+            for n in block:
+                if isinstance(n, ir_label_t):
+                    labels[n.name] = i
+        self.succs = []
+        for i, block in enumerate(self.blocks):
+            insts = [n for n in block if isinstance(n, ir_inst_t)]
+            last = insts[-1] if insts else None
+            succ = []
+            if last is not None and ir_is_branch(last.opcode):
+                target = last.operands[0].render()
+                assert target in labels, 'branch to unknown label {}'.format(target)
+                succ.append(labels[target])
+            fall_through = last is None or (last.opcode != 's_branch' and last.opcode != 's_endpgm')
+            if fall_through and i + 1 < len(self.blocks):
+                succ.append(i + 1)
+            self.succs.append(succ)
+        self.preds = [[] for _ in self.blocks]
+        for i, succ in enumerate(self.succs):
+            for s in succ:
+                self.preds[s].append(i)
+    def nodes(self):
+        return [n for block in self.blocks for n in block]
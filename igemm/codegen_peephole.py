@@ -0,0 +1,346 @@
+################################################################################
+#
+#  MIT License
+#
+#  Copyright (c) 2020 Advanced Micro Devices, Inc.
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+################################################################################
+# peephole pass over a macro-expanded kernel body (ir_stream_t).
+# every rule works inside a basic block, nothing is assumed across labels.
+from .codegen_ir import *
+import re
+
+PEEPHOLE_RULE_SELF_MOVE     = 'self_move'       # v_mov_b32 v[a], v[a]
+PEEPHOLE_RULE_IDENTITY      = 'identity'        # s_add_u32 a, b, 0 / s_mul_i32 a, 1, b -> mov, or removed if a == b
+PEEPHOLE_RULE_ADD_ZERO_PAIR = 'add_zero_pair'   # s_add_u32 a, a, 0 + s_addc_u32 a+1, a+1, 0
+PEEPHOLE_RULE_WAITCNT       = 'waitcnt'         # s_waitcnt weaker than a previous one, or back-to-back
+PEEPHOLE_RULE_DEAD_MOVE     = 'dead_move'       # mov overwritten before any read
+PEEPHOLE_RULE_MOV_B64       = 'mov_b64'         # two s_mov_b32 into an aligned pair -> s_mov_b64
+
+PEEPHOLE_RULES = (PEEPHOLE_RULE_SELF_MOVE, PEEPHOLE_RULE_IDENTITY, PEEPHOLE_RULE_ADD_ZERO_PAIR,
+                  PEEPHOLE_RULE_WAITCNT, PEEPHOLE_RULE_DEAD_MOVE, PEEPHOLE_RULE_MOV_B64)
+
+_PEEPHOLE_MOVES = ('v_mov_b32', 's_mov_b32', 's_mov_b64')
+
+def _peephole_next_reg(text):
+    '''
+    text of register index + 1, s_tmp+2 -> s_tmp+3, 4 -> 5
+    '''
+    if text.isdigit():
+        return str(int(text) + 1)
+    m = re.match(r'^([A-Za-z_.$][\w.$]*)\+(\d+)$', text)
+    if m:
+        return '{}+{}'.format(m.group(1), int(m.group(2)) + 1)
+    return '{}+1'.format(text)
+
+class peephole_t(object):
+    '''
+    run every rule until nothing changes. instructions removed/fused are counted per rule.
+    nodes other than instruction (comment, empty line) are kept
+    '''
+    def __init__(self, symbols, rules = PEEPHOLE_RULES):
+        self.symbols = symbols
+        self.rules = rules
+        self.stats = dict((r, 0) for r in PEEPHOLE_RULES)
+        self.num_inst_before = 0
+        self.num_inst_after = 0
+
+    def __call__(self, stream):
+        nodes = list(stream.nodes)
+        self.num_inst_before = len([n for n in nodes if isinstance(n, ir_inst_t)])
+        while True:
+            changed = False
+            blocks = self.split_blocks(nodes)
+            nodes = []
+            for block in blocks:
+                for rule in self.rules:
+                    block, c = getattr(self, 'rule_' + rule)(block)
+                    changed = changed or c
+                nodes.extend(block)
+            if not changed:
+                break
+        self.num_inst_after = len([n for n in nodes if isinstance(n, ir_inst_t)])
+        return ir_stream_t(nodes)
+
+    def get_removed(self):
+        return self.num_inst_before - self.num_inst_after
+
+    def get_stats(self):
+        return 'peephole removed {} of {} instructions ({})'.format(self.get_removed(), self.num_inst_before,
+                    ', '.join('{}:{}'.format(r, self.stats[r]) for r in PEEPHOLE_RULES if self.stats[r]))
+
+    def split_blocks(self, nodes):
+        '''
+        a block start at a label, or anything not an instruction/comment (it is a barrier to every rule),
+        and end after a branch
+        '''
+        blocks = [[]]
+        for n in nodes:
+            if isinstance(n, ir_inst_t):
+                blocks[-1].append(n)
+                if ir_inst_class(n.opcode) == IR_INST_BRANCH or n.opcode == 's_endpgm':
+                    blocks.append([])
+            elif isinstance(n, (ir_comment_t, ir_empty_t)):
+                blocks[-1].append(n)
+            else:
+                blocks.append([n])
+                blocks.append([])
+        return [b for b in blocks if b]
+
+    def units(self, operand):
+        try:
+            return ir_reg_units(operand, self.symbols)
+        except ir_eval_error_t:
+            return None
+
+    def imm(self, operand):
+        if not isinstance(operand, ir_expr_t):
+            return None
+        try:
+            return operand.value(self.symbols)
+        except ir_eval_error_t:
+            return None
+
+    def def_use(self, inst):
+        try:
+            return ir_def_use(inst, self.symbols)
+        except (ir_eval_error_t, IndexError):
+            return None
+
+    def scc_dead_after(self, block, i):
+        '''
+        scc is written before read after block[i]. at the end of block, it is dead only at s_endpgm
+        '''
+        for n in block[i + 1:]:
+            if not isinstance(n, ir_inst_t):
+                continue
+            du = self.def_use(n)
+            if du is None or IR_SCC_UNITS[0] in du[1]:
+                return False
+            if IR_SCC_UNITS[0] in du[0]:
+                return True
+            if n.opcode == 's_endpgm':
+                return True
+        return False
+
+    def remove(self, block, indices, rule):
+        self.stats[rule] += len(indices)
+        return [n for k, n in enumerate(block) if k not in indices]
+
+    def rule_self_move(self, block):
+        removed = set()
+        for i, n in enumerate(block):
+            if isinstance(n, ir_inst_t) and n.opcode in _PEEPHOLE_MOVES and len(n.operands) == 2:
+                dst = self.units(n.operands[0])
+                if dst and dst == self.units(n.operands[1]):
+                    removed.add(i)
+        return self.remove(block, removed, PEEPHOLE_RULE_SELF_MOVE), len(removed) != 0
+
+    def rule_identity(self, block):
+        '''
+        a = b + 0, a = b << 0, a = b * 1. s_add/s_lshl write scc, only when it is not read after
+        '''
+        removed = set()
+        changed = False
+        for i, n in enumerate(block):
+            if not isinstance(n, ir_inst_t) or len(n.operands) != 3 or n.modifiers:
+                continue
+            op = n.opcode
+            src = None
+            if op in ('s_add_u32', 's_add_i32', 's_sub_u32', 's_sub_i32', 's_lshl_b32', 's_lshr_b32', 's_or_b32', 's_xor_b32'):
+                if self.imm(n.operands[2]) == 0:
+                    src = n.operands[1]
+                elif op in ('s_add_u32', 's_add_i32', 's_or_b32', 's_xor_b32') and self.imm(n.operands[1]) == 0:
+                    src = n.operands[2]
+                if src is not None and not self.scc_dead_after(block, i):
+                    src = None
+            elif op in ('s_mul_i32', 'v_mul_lo_u32', 'v_mul_u32_u24', 'v_mul_i32_i24'):
+                if self.imm(n.operands[1]) == 1:
+                    src = n.operands[2]
+                elif self.imm(n.operands[2]) == 1:
+                    src = n.operands[1]
+            elif op in ('v_add_u32', 'v_or_b32', 'v_xor_b32'):
+                if self.imm(n.operands[1]) == 0:
+                    src = n.operands[2]
+                elif self.imm(n.operands[2]) == 0:
+                    src = n.operands[1]
+            elif op in ('v_lshlrev_b32', 'v_lshrrev_b32', 'v_sub_u32'):
+                if op == 'v_sub_u32' and self.imm(n.operands[2]) == 0:
+                    src = n.operands[1]
+                elif op != 'v_sub_u32' and self.imm(n.operands[1]) == 0:
+                    src = n.operands[2]
+            if src is None:
+                continue
+            dst_units = self.units(n.operands[0])
+            src_units = self.units(src)
+            if dst_units is None or len(dst_units) != 1 or (src_units is not None and len(src_units) > 1):
+                continue
+            if dst_units == src_units:
+                removed.add(i)
+                continue
+            mov = 'v_mov_b32' if op.startswith('v_') else 's_mov_b32'
+            if mov == 's_mov_b32' and src_units and src_units[0][0] == 'v':
+                continue
+            block[i] = ir_inst_t(mov, [n.operands[0], src], [], n.indent, n.comment)
+            self.stats[PEEPHOLE_RULE_IDENTITY] += 1
+            changed = True
+        return self.remove(block, removed, PEEPHOLE_RULE_IDENTITY), changed or len(removed) != 0
+
+    def rule_add_zero_pair(self, block):
+        removed = set()
+        insts = [i for i, n in enumerate(block) if isinstance(n, ir_inst_t)]
+        for j in range(len(insts) - 1):
+            i0, i1 = insts[j], insts[j + 1]
+            a, b = block[i0], block[i1]
+            if a.opcode != 's_add_u32' or b.opcode != 's_addc_u32' or i0 in removed:
+                continue
+            if len(a.operands) != 3 or len(b.operands) != 3:
+                continue
+            if self.imm(a.operands[2]) != 0 or self.imm(b.operands[2]) != 0:
+                continue
+            a_dst, a_src = self.units(a.operands[0]), self.units(a.operands[1])
+            b_dst, b_src = self.units(b.operands[0]), self.units(b.operands[1])
+            if not (a_dst and a_dst == a_src and b_dst and b_dst == b_src):
+                continue
+            if a_dst[0][0] != 's' or b_dst[0][1] != a_dst[0][1] + 1:
+                continue
+            if self.scc_dead_after(block, i1):
+                removed.update((i0, i1))
+        return self.remove(block, removed, PEEPHOLE_RULE_ADD_ZERO_PAIR), len(removed) != 0
+
+    def rule_waitcnt(self, block):
+        '''
+        upper bound of outstanding vm/lgkm operation is known after a s_waitcnt, and increase
+        by every issue. a counter in s_waitcnt not lower than the bound is useless. back-to-back
+        s_waitcnt are merged, keeping the lower count of each counter
+        '''
+        removed = set()
+        changed = False
+        bound = {}
+        last_wait = None    # index of s_waitcnt with nothing but comment after it
+        for i, n in enumerate(block):
+            if not isinstance(n, ir_inst_t):
+                continue
+            cls = ir_inst_class(n.opcode)
+            if cls == IR_INST_WAITCNT:
+                counts = ir_parse_waitcnt(n)
+                if not counts:
+                    last_wait = None
+                    bound = {}
+                    continue
+                useful = dict((c, v) for c, v in counts.items() if bound.get(c, 1 << 30) > v)
+                if last_wait is not None and useful:
+                    merged = ir_parse_waitcnt(block[last_wait])
+                    for c, v in useful.items():
+                        merged[c] = min(v, merged.get(c, v))
+                    block[last_wait] = ir_create_waitcnt(merged, block[last_wait].indent)
+                    removed.add(i)
+                elif not useful:
+                    removed.add(i)
+                elif useful != counts:
+                    block[i] = ir_create_waitcnt(useful, n.indent)
+                    changed = True
+                    last_wait = i
+                else:
+                    last_wait = i
+                for c, v in useful.items():
+                    bound[c] = v
+                continue
+            last_wait = None
+            if cls in (IR_INST_VMEM_LOAD, IR_INST_VMEM_STORE):
+                if 'vmcnt' in bound:
+                    bound['vmcnt'] += 1
+            elif cls in (IR_INST_LDS_LOAD, IR_INST_LDS_STORE, IR_INST_SMEM_LOAD):
+                if 'lgkmcnt' in bound:
+                    bound['lgkmcnt'] += 1
+        return self.remove(block, removed, PEEPHOLE_RULE_WAITCNT), changed or len(removed) != 0
+
+    def rule_dead_move(self, block):
+        '''
+        mov whose destination is written again before read. for VALU the write after must not
+        be under another exec, a masked write keep the other lanes of the mov
+        '''
+        removed = set()
+        for i, n in enumerate(block):
+            if not isinstance(n, ir_inst_t) or n.opcode not in _PEEPHOLE_MOVES or n.modifiers:
+                continue
+            du = self.def_use(n)
+            if du is None:
+                continue
+            pending = set(du[0])
+            for m in block[i + 1:]:
+                if not isinstance(m, ir_inst_t):
+                    continue
+                m_du = self.def_use(m)
+                if m_du is None or pending & set(m_du[1]):
+                    break
+                if n.opcode == 'v_mov_b32':
+                    if set(IR_EXEC_UNITS) & set(m_du[0]):
+                        break
+                pending -= set(m_du[0])
+                if not pending:
+                    removed.add(i)
+                    break
+        return self.remove(block, removed, PEEPHOLE_RULE_DEAD_MOVE), len(removed) != 0
+
+    def rule_mov_b64(self, block):
+        '''
+        s_mov_b32 s[2n], x + s_mov_b32 s[2n+1], y -> s_mov_b64 s[2n:2n+1], xy, if xy is
+        an inline constant, or a register pair s[2m:2m+1]
+        '''
+        removed = set()
+        changed = False
+        insts = [i for i, n in enumerate(block) if isinstance(n, ir_inst_t)]
+        j = 0
+        while j < len(insts) - 1:
+            i0, i1 = insts[j], insts[j + 1]
+            a, b = block[i0], block[i1]
+            j += 1
+            if a.opcode != 's_mov_b32' or b.opcode != 's_mov_b32':
+                continue
+            a_dst, b_dst = self.units(a.operands[0]), self.units(b.operands[0])
+            if not a_dst or not b_dst or a_dst[0][0] != 's' or b_dst[0][0] != 's':
+                continue
+            lo, hi = (a, b) if a_dst[0][1] < b_dst[0][1] else (b, a)
+            lo_dst = self.units(lo.operands[0])[0][1]
+            if self.units(hi.operands[0])[0][1] != lo_dst + 1 or lo_dst % 2 != 0:
+                continue
+            lo_imm, hi_imm = self.imm(lo.operands[1]), self.imm(hi.operands[1])
+            src = None
+            if lo_imm is not None and hi_imm is not None:
+                hi_imm = hi_imm - (1 << 32) if hi_imm >= (1 << 31) else hi_imm
+                if (0 <= lo_imm <= 64 and hi_imm == 0) or (-16 <= lo_imm < 0 and hi_imm == -1):
+                    src = ir_expr_t(str(lo_imm))
+            else:
+                lo_src, hi_src = self.units(lo.operands[1]), self.units(hi.operands[1])
+                if lo_src and hi_src and lo_src[0][0] == 's' and hi_src[0][0] == 's' and \
+                        isinstance(lo.operands[1], ir_reg_t) and \
+                        hi_src[0][1] == lo_src[0][1] + 1 and lo_src[0][1] % 2 == 0 and lo_src[0][1] != lo_dst:
+                    src = ir_reg_t('s', lo.operands[1].lo, _peephole_next_reg(lo.operands[1].lo))
+            if src is None:
+                continue
+            lo_reg = lo.operands[0]
+            block[i0] = ir_inst_t('s_mov_b64', [ir_reg_t('s', lo_reg.lo, _peephole_next_reg(lo_reg.lo)), src],
+                                [], a.indent, a.comment)
+            removed.add(i1)
+            changed = True
+            j += 1
+        return self.remove(block, removed, PEEPHOLE_RULE_MOV_B64), changed
@@ -0,0 +1,250 @@
+################################################################################
+#
+#  MIT License
+#
+#  Copyright (c) 2020 Advanced Micro Devices, Inc.
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+################################################################################
+# register allocation over a macro-expanded kernel body (ir_stream_t).
+# body is expanded with every symbol in its own range (the virtual layout), liveness is
+# computed per register unit, then symbols never live at the same time share registers.
+# only the value of the symbols change, text of the kernel is kept.
+from .codegen_ir import *
+
+def regalloc_alignment(kind, width):
+    '''
+    alignment of the first register of a width wide operand. sgpr pair is even, 4 or more
+    sgpr start at multiple of 4. vgpr has no alignment on gfx9
+    '''
+    if kind == IR_REG_SGPR and width >= 2:
+        return 2 if width == 2 else 4
+    return 1
+
+class regalloc_exec_t(object):
+    '''
+    exec of every instruction is full or not. exec is full at entry, s_and_saveexec make it
+    partial and save the old one, writing the saved one back or -1 make it full again
+    '''
+    def __init__(self, symbols):
+        self.symbols = symbols
+        self.full = dict()      # id of instruction -> exec is full when it issue
+
+    def transfer(self, block, state):
+        full, holders = state
+        for n in block:
+            if not isinstance(n, ir_inst_t):
+                continue
+            self.full[id(n)] = full
+            defs, uses = ir_def_use(n, self.symbols)
+            if not set(IR_EXEC_UNITS) & set(defs):
+                holders = holders - frozenset(defs)
+                continue
+            srcs = [ir_reg_units(o, self.symbols) for o in n.operands[1:]]
+            if 'saveexec' in n.opcode:
+                saved = frozenset(ir_reg_units(n.operands[0], self.symbols))
+                holders = (holders | saved) if full else (holders - saved)
+                full = False
+            elif n.opcode in ('s_or_b64', 's_mov_b64') and any(s and set(s) <= holders for s in srcs):
+                full = True
+            elif n.opcode == 's_mov_b64' and n.operands[1].render() == '-1':
+                full = True
+            else:
+                full = False
+        return full, holders
+
+    def __call__(self, cfg):
+        entry = [None] * len(cfg.blocks)
+        entry[0] = (True, frozenset())
+        work = [0]
+        while work:
+            i = work.pop(0)
+            out = self.transfer(cfg.blocks[i], entry[i])
+            for s in cfg.succs[i]:
+                merged = out if entry[s] is None else (entry[s][0] and out[0], entry[s][1] & out[1])
+                if merged != entry[s]:
+                    entry[s] = merged
+                    if s not in work:
+                        work.append(s)
+        return self.full
+
+class regalloc_t(object):
+    '''
+    allocate registers of one kind ('v' or 's') for a list of (symbol, size).
+    registers below reserved are set by hardware at entry (e.g. v0 is thread id), a symbol
+    in pinned keep its index there, other register of it are taken as an unnamed symbol.
+    symbols touched by one operand (like s_load_dwordx8 over several kernel args) keep their
+    order in entries and are allocated as a group.
+    get_virtual() is the layout to expand the body with, call with the expanded body, then
+    get_layout() is symbol -> index after allocation
+    '''
+    def __init__(self, kind, entries, reserved = 0, pinned = None):
+        self.kind = kind
+        self.entries = [(s, n) for s, n in entries]
+        self.reserved = reserved
+        self.pinned = dict(pinned) if pinned else dict()
+        self.size = dict(self.entries)
+        self.virtual = dict()
+        self.owner = dict()     # register index of virtual layout -> symbol
+        for symbol, index in self.pinned.items():
+            assert index + self.size[symbol] <= reserved, 'pinned {} out of reserved range'.format(symbol)
+            self.virtual[symbol] = index
+        for i in range(reserved):
+            if not any(self.pinned[s] <= i < self.pinned[s] + self.size[s] for s in self.pinned):
+                symbol = '{}{}'.format(kind, i)
+                self.size[symbol] = 1
+                self.pinned[symbol] = i
+                self.virtual[symbol] = i
+        cnt = reserved
+        for symbol, size in self.entries:
+            if symbol not in self.virtual:
+                self.virtual[symbol] = cnt
+                cnt += size
+        self.virtual_count = cnt
+        for symbol, index in self.virtual.items():
+            for i in range(self.size[symbol]):
+                self.owner[index + i] = symbol
+        self.layout = None
+        self.count = 0
+
+    def get_virtual(self):
+        return [(s, self.virtual[s]) for s, _ in self.entries], self.virtual_count
+
+    def units_of(self, units):
+        return [u[1] for u in units if u[0] == self.kind]
+
+    def check_units(self, units):
+        for i in units:
+            assert i in self.owner, '{}{} is not in any symbol'.format(self.kind, i)
+        return units
+
+    def liveness(self, cfg, symbols):
+        '''
+        return list of (inst, defs, kills, uses, operands) of every block and live in/out of blocks.
+        a masked write under partial exec keep other lanes, it does not kill
+        '''
+        full = regalloc_exec_t(symbols)(cfg)
+        infos = []
+        for block in cfg.blocks:
+            info = []
+            for n in block:
+                if not isinstance(n, ir_inst_t):
+                    continue
+                defs, uses = ir_def_use(n, symbols)
+                defs, uses = self.check_units(self.units_of(defs)), self.check_units(self.units_of(uses))
+                kills = defs if full.get(id(n), False) or not ir_is_masked_write(n) else []
+                operands = [o.resolve(symbols) for o in n.operands if isinstance(o, ir_reg_t) and o.kind == self.kind]
+                info.append((n, set(defs), set(kills), set(uses), operands))
+            infos.append(info)
+        live_in = [set() for _ in cfg.blocks]
+        live_out = [set() for _ in cfg.blocks]
+        changed = True
+        while changed:
+            changed = False
+            for i in reversed(range(len(cfg.blocks))):
+                out = set()
+                for s in cfg.succs[i]:
+                    out |= live_in[s]
+                live = set(out)
+                for _, defs, kills, uses, _ in reversed(infos[i]):
+                    live = (live - kills) | uses
+                if out != live_out[i] or live != live_in[i]:
+                    live_out[i], live_in[i] = out, live
+                    changed = True
+        return infos, live_out, live_in
+
+    def build_groups(self, infos):
+        '''
+        group of every symbol, by first symbol of the group. group_base is index in virtual layout
+        '''
+        joined = set()      # register index i is in the same group as i - 1
+        for info in infos:
+            for _, _, _, _, operands in info:
+                for index, width in operands:
+                    joined.update(range(index + 1, index + width))
+        self.group = dict()
+        self.group_base = dict()
+        self.group_size = dict()
+        head = None
+        for i in range(self.virtual_count):
+            symbol = self.owner[i]
+            if head is None or (i == self.virtual[symbol] and i not in joined):
+                head = symbol
+                self.group_base[head] = i
+                self.group_size[head] = 0
+            self.group[symbol] = head
+            self.group_size[head] = i + 1 - self.group_base[head]
+
+    def __call__(self, stream, symbols):
+        cfg = ir_cfg_t(stream.nodes)
+        infos, live_out, live_in = self.liveness(cfg, symbols)
+        self.build_groups(infos)
+        def groups(units):
+            return frozenset(self.group[self.owner[i]] for i in units)
+        cliques = set([groups(live_in[0])])
+        align = dict()      # group -> set of (alignment, offset % alignment)
+        first = dict()
+        position = 0
+        for i, info in enumerate(infos):
+            live = set(live_out[i])
+            for n, defs, kills, uses, operands in reversed(info):
+                # a load, or a write of more than one register, may write before its source is read
+                touched = live | defs
+                if len(defs) > 1 or ir_inst_class(n.opcode) in (IR_INST_VMEM_LOAD, IR_INST_LDS_LOAD, IR_INST_SMEM_LOAD):
+                    touched |= uses
+                cliques.add(groups(touched))
+                live = (live - kills) | uses
+            for n, _, _, _, operands in info:
+                for index, width in operands:
+                    g = self.group[self.owner[index]]
+                    first.setdefault(g, position)
+                    a = regalloc_alignment(self.kind, width)
+                    if a > 1:
+                        align.setdefault(g, set()).add((a, (index - self.group_base[g]) % a))
+                position += 1
+        interfere = dict((g, set()) for g in self.group_base)
+        for clique in cliques:
+            for g in clique:
+                interfere[g] |= clique - set([g])
+        base = dict()
+        for symbol, index in self.pinned.items():
+            g = self.group[symbol]
+            base[g] = index - (self.virtual[symbol] - self.group_base[g])
+        order = sorted((g for g in self.group_base if g not in base),
+                        key = lambda g: (-self.group_size[g], first.get(g, position), self.group_base[g]))
+        for g in order:
+            index = 0
+            while True:
+                end = index + self.group_size[g]
+                conflict = [base[o] + self.group_size[o] for o in interfere[g] if o in base and
+                                base[o] < end and index < base[o] + self.group_size[o]]
+                if not conflict and all((index + offset) % a == 0 for a, offset in align.get(g, [])):
+                    break
+                index = max(conflict) if conflict else index + 1
+            base[g] = index
+        self.layout = dict((s, base[self.group[s]] + self.virtual[s] - self.group_base[self.group[s]]) for s in self.virtual)
+        self.count = max([base[g] + self.group_size[g] for g in base] + [0])
+        return self.layout
+
+    def get_layout(self):
+        return [(s, self.layout[s]) for s, _ in self.entries]
+
+    def get_count(self):
+        return self.count
@@ -0,0 +1,272 @@
+################################################################################
+#
+#  MIT License
+#
+#  Copyright (c) 2020 Advanced Micro Devices, Inc.
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+################################################################################
+# list scheduler over the loop blocks of a macro-expanded kernel body (ir_stream_t).
+# s_waitcnt of vmcnt/lgkmcnt in a scheduled block are dropped, waitcnt_t must run after it.
+from .codegen_ir import *
+from .codegen_waitcnt import *
+
+SCHED_LDS_LATENCY   = 64
+SCHED_VMEM_LATENCY  = 300
+SCHED_SMEM_LATENCY  = 64
+SCHED_VALU_CYCLES   = 4     # wave64 on a simd16
+
+class sched_machine_t(object):
+    '''
+    single wave, in order issue. a register is ready when the instruction writing it is done,
+    memory operation of a counter come back in issue order, and at most WAITCNT_MAX of them
+    are outstanding. s_barrier wait for every LDS operation
+    '''
+    def __init__(self, symbols, lds_latency, vmem_latency):
+        self.symbols = symbols
+        self.latency = {IR_INST_LDS_LOAD : lds_latency, IR_INST_LDS_STORE : lds_latency,
+                        IR_INST_VMEM_LOAD : vmem_latency, IR_INST_VMEM_STORE : vmem_latency,
+                        IR_INST_SMEM_LOAD : SCHED_SMEM_LATENCY, IR_INST_VALU : SCHED_VALU_CYCLES}
+        self.time = 0
+        self.ready = dict()     # register unit -> cycle
+        self.outstanding = dict((c, []) for c in WAITCNT_COUNTERS)  # completion cycle, in issue order
+
+    def get_latency(self, inst):
+        return self.latency.get(ir_inst_class(inst.opcode), 1)
+
+    def get_issue_cycles(self, inst):
+        return SCHED_VALU_CYCLES if ir_inst_class(inst.opcode) == IR_INST_VALU else 1
+
+    def earliest(self, inst, du):
+        t = self.time
+        for u in du[0] + du[1]:
+            t = max(t, self.ready.get(u, 0))
+        if ir_inst_class(inst.opcode) == IR_INST_BARRIER and self.outstanding['lgkmcnt']:
+            t = max(t, self.outstanding['lgkmcnt'][-1])
+        counter = waitcnt_counter(inst)
+        if counter is not None:
+            pending = [c for c in self.outstanding[counter] if c > t]
+            if len(pending) >= WAITCNT_MAX[counter]:
+                t = max(t, pending[len(pending) - WAITCNT_MAX[counter]])
+        return t
+
+    def issue(self, inst, du, t):
+        counter = waitcnt_counter(inst)
+        done = t + self.get_latency(inst)
+        if counter is not None:
+            outstanding = self.outstanding[counter]
+            if outstanding:
+                done = max(done, outstanding[-1])
+            outstanding.append(done)
+        for u in du[0]:
+            self.ready[u] = done
+        self.time = t + self.get_issue_cycles(inst)
+
+class sched_t(object):
+    '''
+    schedule every block inside a loop. edges of register RAW/WAR/WAW and memory order, branch,
+    s_waitcnt kept and anything not known are fence. among instructions can issue
+    at current cycle, the one with the longest latency path to the end of block go first.
+    a block is kept as is if the estimated cycles is not better
+    '''
+    def __init__(self, symbols, lds_latency = SCHED_LDS_LATENCY, vmem_latency = SCHED_VMEM_LATENCY):
+        self.symbols = symbols
+        self.lds_latency = lds_latency
+        self.vmem_latency = vmem_latency
+        self.results = []       # (first label, num instructions, cycles before, cycles after)
+        self.entry_ready = {}   # register unit -> cycle, loaded by other block of the loop
+
+    def machine(self):
+        m = sched_machine_t(self.symbols, self.lds_latency, self.vmem_latency)
+        m.ready = dict(self.entry_ready)
+        return m
+
+    def def_use(self, inst):
+        try:
+            return ir_def_use(inst, self.symbols)
+        except (ir_eval_error_t, IndexError):
+            return None
+
+    def estimate(self, insts):
+        m = self.machine()
+        for inst, du in insts:
+            m.issue(inst, du, m.earliest(inst, du))
+        return m.time
+
+    def is_fence(self, inst, du):
+        cls = ir_inst_class(inst.opcode)
+        return du is None or cls in (IR_INST_WAITCNT, IR_INST_BRANCH, IR_INST_OTHER)
+
+    def build_dag(self, insts):
+        '''
+        preds[i] is list of (j, latency), instruction i can issue latency cycles after j.
+        loads of the same memory can pass each other, a store keep order with everything of its memory.
+        s_barrier is a store to LDS here, other memory is free to cross it
+        '''
+        m = self.machine()
+        preds = [[] for _ in insts]
+        last_def = {}
+        last_uses = {}
+        last_store = {}
+        loads_since_store = {}
+        last_fence = None
+        since_fence = []
+        for i, (inst, du) in enumerate(insts):
+            if self.is_fence(inst, du):
+                preds[i] = [(j, 0) for j in since_fence]
+                if last_fence is not None:
+                    preds[i].append((last_fence, 0))
+                last_fence = i
+                since_fence = []
+                continue
+            if last_fence is not None:
+                preds[i].append((last_fence, 0))
+            since_fence.append(i)
+            defs, uses = du
+            for u in uses:
+                if u in last_def:
+                    j = last_def[u]
+                    preds[i].append((j, m.get_latency(insts[j][0])))
+            for u in defs:
+                for j in last_uses.get(u, []):
+                    preds[i].append((j, 0))
+                if u in last_def:
+                    j = last_def[u]
+                    same_counter = waitcnt_counter(inst) is not None and waitcnt_counter(inst) == waitcnt_counter(insts[j][0])
+                    preds[i].append((j, 0 if same_counter else m.get_latency(insts[j][0])))
+            cls = ir_inst_class(inst.opcode)
+            mem, is_store = {IR_INST_LDS_LOAD : ('lds', False), IR_INST_LDS_STORE : ('lds', True),
+                    IR_INST_BARRIER : ('lds', True), IR_INST_VMEM_LOAD : ('vmem', False),
+                    IR_INST_VMEM_STORE : ('vmem', True)}.get(cls, (None, False))
+            if mem is not None:
+                if mem in last_store:
+                    preds[i].append((last_store[mem], 0))
+                if is_store:
+                    preds[i].extend((j, 0) for j in loads_since_store.get(mem, []))
+                    last_store[mem] = i
+                    loads_since_store[mem] = []
+                else:
+                    loads_since_store.setdefault(mem, []).append(i)
+            for u in uses:
+                last_uses.setdefault(u, []).append(i)
+            for u in defs:
+                last_def[u] = i
+                last_uses[u] = []
+        return preds
+
+    def schedule_insts(self, insts):
+        n = len(insts)
+        preds = self.build_dag(insts)
+        succs = [[] for _ in insts]
+        for i in range(n):
+            for j, lat in preds[i]:
+                succs[j].append((i, lat))
+        m = self.machine()
+        # priority, longest path to the end. a load consumed outside the block still need its latency
+        prio = [0] * n
+        for i in reversed(range(n)):
+            p = m.get_issue_cycles(insts[i][0])
+            if waitcnt_counter(insts[i][0]) is not None and insts[i][1] and insts[i][1][0]:
+                p = max(p, m.get_latency(insts[i][0]))
+            for j, lat in succs[i]:
+                p = max(p, lat + prio[j])
+            prio[i] = p
+        num_preds = [len(set(j for j, _ in preds[i])) for i in range(n)]
+        issued = [None] * n
+        candidates = [i for i in range(n) if num_preds[i] == 0]
+        order = []
+        while candidates:
+            best = None
+            for i in candidates:
+                t = m.earliest(*insts[i])
+                for j, lat in preds[i]:
+                    t = max(t, issued[j] + lat)
+                key = (max(t, m.time), -prio[i], i)
+                if best is None or key < best[0]:
+                    best = (key, i, t)
+            _, i, t = best
+            issued[i] = max(t, m.time)
+            m.issue(insts[i][0], insts[i][1], issued[i])
+            order.append(i)
+            candidates.remove(i)
+            for j in set(s for s, _ in succs[i]):
+                num_preds[j] -= 1
+                if num_preds[j] == 0:
+                    candidates.append(j)
+        assert len(order) == n
+        return [insts[i] for i in order]
+
+    def loop_blocks(self, cfg):
+        blocks = set()
+        for j, succ in enumerate(cfg.succs):
+            for i in succ:
+                if i <= j:
+                    blocks.update(range(i, j + 1))
+        return sorted(blocks)
+
+    def schedule_block(self, block):
+        head = []
+        for n in block:
+            if not isinstance(n, (ir_label_t, ir_comment_t, ir_empty_t)):
+                break
+            head.append(n)
+        insts = []
+        for n in block:
+            if isinstance(n, ir_inst_t):
+                if ir_inst_class(n.opcode) == IR_INST_WAITCNT and all(c in WAITCNT_COUNTERS for c in ir_parse_waitcnt(n)):
+                    continue
+                insts.append((n, self.def_use(n)))
+            elif n not in head and not isinstance(n, (ir_comment_t, ir_empty_t)):
+                return block    # something can not move
+        if not insts:
+            return block
+        scheduled = self.schedule_insts(insts)
+        before, after = self.estimate(insts), self.estimate(scheduled)
+        label = ([n.name for n in head if isinstance(n, ir_label_t)] + [''])[0]
+        if after >= before:
+            self.results.append((label, len(insts), before, before))
+            return block
+        self.results.append((label, len(insts), before, after))
+        indent = scheduled[0][0].indent
+        comment = ir_comment_t(indent, '; sched: {} instructions, estimated {} -> {} cycles (lds latency {}, vmem latency {})'.format(
+                            len(insts), before, after, self.lds_latency, self.vmem_latency))
+        return head + [comment] + [inst for inst, _ in scheduled]
+
+    def __call__(self, stream):
+        self.results = []
+        cfg = ir_cfg_t(stream.nodes)
+        loop_blocks = self.loop_blocks(cfg)
+        m = sched_machine_t(self.symbols, self.lds_latency, self.vmem_latency)
+        for i in loop_blocks:
+            # register loaded in another block of the loop is taken as issued right at block start
+            self.entry_ready = {}
+            for j in loop_blocks:
+                for n in cfg.blocks[j]:
+                    if j != i and isinstance(n, ir_inst_t) and waitcnt_counter(n) is not None:
+                        du = self.def_use(n)
+                        for u in (du[0] if du else []):
+                            self.entry_ready[u] = max(m.get_latency(n), self.entry_ready.get(u, 0))
+            cfg.blocks[i] = self.schedule_block(cfg.blocks[i])
+        self.entry_ready = {}
+        return ir_stream_t(cfg.nodes())
+
+    def get_stats(self):
+        return 'sched {} loop block, estimated {} -> {} cycles'.format(len(self.results),
+                    sum(r[2] for r in self.results), sum(r[3] for r in self.results))
@@ -0,0 +1,281 @@
+################################################################################
+#
+#  MIT License
+#
+#  Copyright (c) 2020 Advanced Micro Devices, Inc.
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+################################################################################
+# s_waitcnt insertion over a macro-expanded kernel body (ir_stream_t), and a checker of it.
+#
+# memory model (gfx9):
+#   vmcnt   : buffer/global load and store, complete in issue order
+#   lgkmcnt : ds_* complete in issue order, s_load complete out of order. once a s_load is
+#             outstanding, only lgkmcnt(0) guarantee anything
+#   store data/address and load address are read at issue, only the destination of a load
+#   is pending. s_barrier need every LDS operation done, other threads read them after it
+from .codegen_ir import *
+
+WAITCNT_COUNTERS = ('vmcnt', 'lgkmcnt')
+WAITCNT_MAX = {'vmcnt' : 63, 'lgkmcnt' : 15}
+
+def waitcnt_counter(inst):
+    cls = ir_inst_class(inst.opcode)
+    if cls in (IR_INST_VMEM_LOAD, IR_INST_VMEM_STORE):
+        return 'vmcnt'
+    if cls in (IR_INST_LDS_LOAD, IR_INST_LDS_STORE, IR_INST_SMEM_LOAD):
+        return 'lgkmcnt'
+    return None
+
+class waitcnt_state_t(object):
+    '''
+    pending[counter] is dict of register unit -> number of operation of the same counter issued
+    after the load of it. count[counter] is upper bound of outstanding operation
+    '''
+    def __init__(self):
+        self.pending = dict((c, dict()) for c in WAITCNT_COUNTERS)
+        self.count = dict((c, 0) for c in WAITCNT_COUNTERS)
+        self.smem = False
+
+    def copy(self):
+        s = waitcnt_state_t()
+        s.pending = dict((c, dict(p)) for c, p in self.pending.items())
+        s.count = dict(self.count)
+        s.smem = self.smem
+        return s
+
+    def key(self):
+        return (tuple(tuple(sorted(self.pending[c].items())) for c in WAITCNT_COUNTERS),
+                tuple(self.count[c] for c in WAITCNT_COUNTERS), self.smem)
+
+    def merge(self, other):
+        '''
+        state good for both path. a register pending in any of them is pending, with less
+        operations after it
+        '''
+        s = self.copy()
+        for c in WAITCNT_COUNTERS:
+            for u, k in other.pending[c].items():
+                s.pending[c][u] = min(k, s.pending[c].get(u, k))
+            s.count[c] = max(s.count[c], other.count[c])
+        s.smem = s.smem or other.smem
+        return s
+
+    def in_order(self, counter):
+        return counter == 'vmcnt' or not self.smem
+
+    def required(self, inst, du):
+        '''
+        weakest counts to wait before inst, dict of counter -> count
+        '''
+        need = {}
+        if du is None:
+            return dict((c, 0) for c in WAITCNT_COUNTERS if self.count[c])
+        defs, uses = du
+        counter = waitcnt_counter(inst)
+        if ir_inst_class(inst.opcode) == IR_INST_BARRIER and self.count['lgkmcnt']:
+            need['lgkmcnt'] = 0
+        for c in WAITCNT_COUNTERS:
+            pending = self.pending[c]
+            if not pending:
+                continue
+            for u in set(defs) | set(uses):
+                if u not in pending:
+                    continue
+                if counter == c and u not in uses and self.in_order(c) and \
+                        ir_inst_class(inst.opcode) != IR_INST_SMEM_LOAD:
+                    continue    # load into the same register again, come back later anyway
+                k = min(pending[u], WAITCNT_MAX[c]) if self.in_order(c) else 0
+                need[c] = min(k, need.get(c, k))
+        return need
+
+    def wait(self, counts):
+        for c, v in counts.items():
+            if c not in self.count:
+                continue
+            self.count[c] = min(self.count[c], v)
+            if v == 0:
+                self.pending[c] = dict()
+                if c == 'lgkmcnt':
+                    self.smem = False
+            elif self.in_order(c):
+                self.pending[c] = dict((u, k) for u, k in self.pending[c].items() if k < v)
+
+    def issue(self, inst, du):
+        counter = waitcnt_counter(inst)
+        defs = du[0] if du else []
+        for c in WAITCNT_COUNTERS:
+            for u in defs:
+                if c != counter:
+                    self.pending[c].pop(u, None)
+        if counter is None:
+            return
+        # a full counter stall the issue until the oldest one is back
+        self.count[counter] = min(self.count[counter] + 1, WAITCNT_MAX[counter])
+        pending = dict((u, min(k + 1, WAITCNT_MAX[counter])) for u, k in self.pending[counter].items())
+        if self.in_order(counter):
+            pending = dict((u, k) for u, k in pending.items() if k < self.count[counter])
+        if ir_inst_class(inst.opcode) == IR_INST_SMEM_LOAD:
+            self.smem = True
+        for u in defs:
+            pending[u] = 0
+        self.pending[counter] = pending
+
+class waitcnt_t(object):
+    '''
+    drop every vmcnt/lgkmcnt s_waitcnt of the stream, then put the weakest one right before
+    the instruction that need it. state at start of a block is merged from all predecessors,
+    until nothing changes
+    '''
+    def __init__(self, symbols):
+        self.symbols = symbols
+        self.num_wait_before = 0
+        self.num_wait_after = 0
+
+    def def_use(self, inst):
+        try:
+            return ir_def_use(inst, self.symbols)
+        except (ir_eval_error_t, IndexError):
+            return None
+
+    def removable(self, n):
+        if not isinstance(n, ir_inst_t) or ir_inst_class(n.opcode) != IR_INST_WAITCNT:
+            return False
+        counts = ir_parse_waitcnt(n)
+        return len(counts) != 0 and all(c in WAITCNT_COUNTERS for c in counts)
+
+    def transfer(self, block, state, out = None):
+        for n in block:
+            if isinstance(n, ir_inst_t):
+                if ir_inst_class(n.opcode) == IR_INST_WAITCNT:
+                    state.wait(ir_parse_waitcnt(n))
+                else:
+                    du = self.def_use(n)
+                    need = state.required(n, du)
+                    if need:
+                        state.wait(need)
+                        if out is not None:
+                            out.append(ir_create_waitcnt(need, n.indent))
+                    state.issue(n, du)
+            if out is not None:
+                out.append(n)
+        return state
+
+    def __call__(self, stream):
+        self.num_wait_before = len([n for n in stream.nodes if isinstance(n, ir_inst_t) and n.opcode == 's_waitcnt'])
+        cfg = ir_cfg_t([n for n in stream.nodes if not self.removable(n)])
+        entry = [None] * len(cfg.blocks)
+        entry[0] = waitcnt_state_t()
+        work = [0]
+        while work:
+            i = work.pop(0)
+            out = self.transfer(cfg.blocks[i], entry[i].copy())
+            for s in cfg.succs[i]:
+                merged = out if entry[s] is None else entry[s].merge(out)
+                if entry[s] is None or merged.key() != entry[s].key():
+                    entry[s] = merged
+                    if s not in work:
+                        work.append(s)
+        nodes = []
+        for i, block in enumerate(cfg.blocks):
+            if entry[i] is None:
+                nodes.extend(block)     # not reachable
+            else:
+                self.transfer(block, entry[i].copy(), nodes)
+        self.num_wait_after = len([n for n in nodes if isinstance(n, ir_inst_t) and n.opcode == 's_waitcnt'])
+        return ir_stream_t(nodes)
+
+    def get_stats(self):
+        return 'waitcnt {} s_waitcnt before, {} after'.format(self.num_wait_before, self.num_wait_after)
+
+class waitcnt_checker_t(object):
+    '''
+    walk every path of the kernel, keeping the list of outstanding memory operation. nothing
+    complete unless a s_waitcnt force it, s_load may complete in any order. report every
+    register touched while a load of it is still outstanding, and s_barrier with LDS operation
+    in flight. states already seen at a block are not walked again, so loops terminate
+    '''
+    def __init__(self, symbols, max_states = 200000):
+        self.symbols = symbols
+        self.max_states = max_states
+
+    def wait(self, ops, counts):
+        # ops is tuple of (counter, defs, is_smem), oldest first
+        for c, v in counts.items():
+            if c not in WAITCNT_COUNTERS:
+                continue
+            kept = []
+            younger = 0
+            for op in reversed(ops):
+                if op[0] != c:
+                    kept.append(op)
+                    continue
+                # smem can be any of the v left, others are left only if v younger ones are in order
+                if (op[2] and v > 0) or (not op[2] and younger < v):
+                    kept.append(op)
+                if not op[2]:
+                    younger += 1
+            ops = tuple(reversed(kept))
+        return ops
+
+    def step(self, n, ops, errors):
+        if ir_inst_class(n.opcode) == IR_INST_WAITCNT:
+            return self.wait(ops, ir_parse_waitcnt(n))
+        try:
+            defs, uses = ir_def_use(n, self.symbols)
+        except (ir_eval_error_t, IndexError):
+            errors.add((id(n), '{}: can not get register of instruction'.format(n.render().strip())))
+            return ()
+        counter = waitcnt_counter(n)
+        if ir_inst_class(n.opcode) == IR_INST_BARRIER and any(op[0] == 'lgkmcnt' and not op[2] for op in ops):
+            errors.add((id(n), 's_barrier: LDS operation still in flight'))
+        smem_pending = any(op[2] for op in ops)
+        for op in ops:
+            for u in op[1]:
+                if u in uses:
+                    errors.add((id(n), '{}: read {}{} before its load complete'.format(n.render().strip(), u[0], u[1])))
+                elif u in defs and not (counter == op[0] and not op[2] and not (counter == 'lgkmcnt' and smem_pending)):
+                    errors.add((id(n), '{}: write {}{} before its load complete'.format(n.render().strip(), u[0], u[1])))
+        if counter is not None:
+            if len([op for op in ops if op[0] == counter]) >= WAITCNT_MAX[counter]:
+                ops = self.wait(ops, {counter : WAITCNT_MAX[counter] - 1})
+            ops = ops + ((counter, frozenset(defs), ir_inst_class(n.opcode) == IR_INST_SMEM_LOAD),)
+        return ops
+
+    def __call__(self, stream):
+        '''
+        return list of error message, empty if every read is safe
+        '''
+        cfg = ir_cfg_t(stream.nodes)
+        errors = set()
+        seen = set()
+        work = [(0, ())]
+        while work:
+            i, ops = work.pop()
+            if (i, ops) in seen:
+                continue
+            seen.add((i, ops))
+            assert len(seen) < self.max_states, 'too many states to check'
+            for n in cfg.blocks[i]:
+                if isinstance(n, ir_inst_t):
+                    ops = self.step(n, ops, errors)
+            for s in cfg.succs[i]:
+                work.append((s, ops))
+        return sorted(set(msg for _, msg in errors))
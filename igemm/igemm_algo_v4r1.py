@@ -27,11 +27,21 @@
 from .igemm_base import *
 from .amdgpu import *
 from .codegen import *
+from .codegen_peephole import *
+from .codegen_waitcnt import *
+from .codegen_sched import *
+from .codegen_regalloc import *
 from .conv import *
 import copy
+import collections
+import multiprocessing
 
 IGEMM_EXPERIMENTAL_DOUBLE_LOCAL_PREFETCH = False
 
+# magic numbers of magic_div follow the args, same offset for every layout. see igemm_v4r1_dynamic_magic_div_t of the driver
+V4R1_DYNAMIC_KARG_MAGIC_DIV_OFFSET = 88
+V4R1_DYNAMIC_KARG_MAGIC_DIV_SIZE = 24
+
 class igemm_v4r1_dynamic_t(object):
     def __init__(self, mc, tunable):
         self.mc = mc
@@ -79,40 +89,70 @@ class emit_in_load_e_n1_b_n2_t(igemm_v4r1_dynamic_t):
     load input from global.
     '''
     def name(self):
-        return '.v_in_load_e_n1_b_n2_' + '1_{}_1_{}'.format(
+        return '.v_in_load_e_n1_b_n2_' + '{}_{}_{}_{}'.format(
+                                self.t_e,
                                 self.t_n1,
-                                self.t_n2)
+                                self.t_b,
+                                self.t_n2) + ('_npad' if self.no_pad else '')
     def __init__(self, mc, tunable):
         igemm_v4r1_dynamic_t.__init__(self, mc, tunable)
+        self.t_e = tunable.in_block_copy_sub_lengths_e     # 1x1 only, e is c and has a constant stride
         self.t_n1 = tunable.in_block_copy_sub_lengths_n1
+        self.t_b = tunable.in_block_copy_sub_lengths_b     # contiguous wo, loaded by one vector
         self.t_n2 = tunable.in_block_copy_sub_lengths_n2
+        self.no_pad = tunable.no_pad        # every load is inside input, v_flag is not used
         assert self.t_n2 != 1, "currently t_n2 should not be 1"
-    def __call__(self, v_dst, s_p_buf_in, v_in_os, s_in_stride_n1, s_in_stride_n2, v_flag, s_tmp4):
-        return '{} {}, {}, {}, {}, {}, {}, {}'.format(self.name(), v_dst, s_p_buf_in, v_in_os, s_in_stride_n1, s_in_stride_n2, v_flag, s_tmp4)
+        assert self.t_b == tunable.in_block_copy_src_data_per_read_b, "b should be one vector"
+    def __call__(self, v_dst, s_p_buf_in, v_in_os, s_in_stride_n1, s_in_stride_n2, s_in_stride_e, v_flag, s_tmp4):
+        if self.t_e == 1:
+            return '{} {}, {}, {}, {}, {}, {}, {}'.format(self.name(), v_dst, s_p_buf_in, v_in_os, s_in_stride_n1, s_in_stride_n2, v_flag, s_tmp4)
+        return '{} {}, {}, {}, {}, {}, {}, {}, {}'.format(self.name(), v_dst, s_p_buf_in, v_in_os, s_in_stride_n1, s_in_stride_n2, s_in_stride_e, v_flag, s_tmp4)
     def emit(self):
+        def buffer_load(idst, s_offset):
+            if self.t_b == 1:
+                return 'buffer_load_dword v[\\v_dst+{}], v[\\v_in_os], s[\\s_p_buf_in:\\s_p_buf_in+3], {} offen'.format(idst, s_offset)
+            return 'buffer_load_dwordx{} v[\\v_dst+{}:\\v_dst+{}], v[\\v_in_os], s[\\s_p_buf_in:\\s_p_buf_in+3], {} offen'.format(
+                                self.t_b, idst, idst + self.t_b - 1, s_offset)
         m_v_clear_nc = emit_c_clear_t(self.mc)
-        self._emit_macro_desc('{{e,n1,b,n2}}:{{{},{},{},{}}}'.format(1,self.t_n1,1,self.t_n2))
-        with self._emit_macro_indented(".macro {} v_dst, s_p_buf_in, v_in_os, s_in_stride_n1, s_in_stride_n2, v_flag, s_tmp4".format(self.name())):
-            self._emit(m_v_clear_nc('\\v_dst', self.t_n1 * self.t_n2))
-            self._emit('v_cmp_eq_u32 vcc, 1, v[\\v_flag]')
-            self._emit('s_and_saveexec_b64 s[\\s_tmp4+2:\\s_tmp4+3], vcc')
+        self._emit_macro_desc('{{e,n1,b,n2}}:{{{},{},{},{}}}'.format(self.t_e,self.t_n1,self.t_b,self.t_n2))
+        macro_args = 'v_dst, s_p_buf_in, v_in_os, s_in_stride_n1, s_in_stride_n2, ' + ('' if self.t_e == 1 else 's_in_stride_e, ') + 'v_flag, s_tmp4'
+        with self._emit_macro_indented(".macro {} {}".format(self.name(), macro_args)):
+            if not self.no_pad:
+                self._emit(m_v_clear_nc('\\v_dst', self.t_e * self.t_n1 * self.t_n2 * self.t_b))
+                self._emit('v_cmp_eq_u32 vcc, 1, v[\\v_flag]')
+                self._emit('s_and_saveexec_b64 s[\\s_tmp4+2:\\s_tmp4+3], vcc')
             idst = 0
-            for itr_n1 in range(self.t_n1):
-                for itr_n2 in range(self.t_n2):
-                    if idst == 0:
-                        self._emit('buffer_load_dword v[\\v_dst+{}], v[\\v_in_os], s[\\s_p_buf_in:\\s_p_buf_in+3], 0 offen'.format(idst))
+            # s_tmp4 is offset of each load, s_tmp4+1 is offset of current e
+            for itr_e in range(self.t_e):
+                for itr_n1 in range(self.t_n1):
+                    for itr_n2 in range(self.t_n2):
+                        if idst == 0:
+                            self._emit(buffer_load(idst, '0'))
+                        elif itr_n2 == 0 and itr_n1 == 0:
+                            self._emit(buffer_load(idst, 's[\\s_tmp4+1]'))
+                        else:
+                            self._emit(buffer_load(idst, 's[\\s_tmp4]'))
+                        if itr_n2 == 0 and itr_n1 == 0:
+                            if itr_e == 0:
+                                self._emit('s_mov_b32 s[\\s_tmp4], s[\\s_in_stride_n2]')
+                            else:
+                                self._emit('s_add_u32 s[\\s_tmp4], s[\\s_tmp4+1], s[\\s_in_stride_n2]')
+                        elif itr_n2 != self.t_n2 - 1:
+                            self._emit('s_add_u32 s[\\s_tmp4], s[\\s_tmp4], s[\\s_in_stride_n2]')
+
+                        idst = idst + self.t_b
+                    if self.t_n1 != 1:
+                        if itr_n1 != self.t_n1 - 1:
+                            self._emit('s_mul_i32 s[\\s_tmp4], {}, s[\\s_in_stride_n1]'.format(itr_n1+1))
+                            if itr_e != 0:
+                                self._emit('s_add_u32 s[\\s_tmp4], s[\\s_tmp4], s[\\s_tmp4+1]')
+                if itr_e != self.t_e - 1:
+                    if itr_e == 0:
+                        self._emit('s_mov_b32 s[\\s_tmp4+1], s[\\s_in_stride_e]')
                     else:
-                        self._emit('buffer_load_dword v[\\v_dst+{}], v[\\v_in_os], s[\\s_p_buf_in:\\s_p_buf_in+3], s[\\s_tmp4] offen'.format(idst))
-                    if itr_n2 == 0 and itr_n1 == 0:
-                        self._emit('s_mov_b32 s[\\s_tmp4], s[\\s_in_stride_n2]')
-                    elif itr_n2 != self.t_n2 - 1:
-                        self._emit('s_add_u32 s[\\s_tmp4], s[\\s_tmp4], s[\\s_in_stride_n2]')
-
-                    idst = idst + 1
-                if self.t_n1 != 1:
-                    if itr_n1 != self.t_n1 - 1:
-                        self._emit('s_mul_i32 s[\\s_tmp4], {}, s[\\s_in_stride_n1]'.format(itr_n1+1))
-            self._emit('s_or_b64 exec, exec, s[\\s_tmp4+2:\\s_tmp4+3]')
+                        self._emit('s_add_u32 s[\\s_tmp4+1], s[\\s_tmp4+1], s[\\s_in_stride_e]')
+            if not self.no_pad:
+                self._emit('s_or_b64 exec, exec, s[\\s_tmp4+2:\\s_tmp4+3]')
 
 class emit_wei_load_e_k_t(igemm_v4r1_dynamic_t):
     '''
@@ -166,28 +206,44 @@ class emit_in_sst_e_n1_b_n2_t(igemm_v4r1_dynamic_t):
     store input to LDS.
     '''
     def name(self):
-        return '.v_in_sst_e_n1_b_n2_1_{}_1_{}_n1s{}_n2v{}'.format(
+        return '.v_in_sst_e_n1_b_n2_{}_{}_{}_{}_n1s{}_n2v{}'.format(
+                    self.t_e,
                     self.t_n1,
+                    self.t_b,
                     self.t_n2,
                     self.t_n1_stride,
                     self.t_n2_vec_size)
     def __init__(self, mc, tunable):
         igemm_v4r1_dynamic_t.__init__(self, mc, tunable)
+        self.t_e = tunable.in_block_copy_sub_lengths_e
         self.t_n1 = tunable.in_block_copy_sub_lengths_n1
+        self.t_b = tunable.in_block_copy_sub_lengths_b
         self.t_n2 = tunable.in_block_copy_sub_lengths_n2
+        self.t_e_stride = tunable.gemm_n_repeat * tunable.gemm_n_per_thread_subc * tunable.b_per_block * 4
         self.t_n1_stride = tunable.gemm_n_per_thread_subc * tunable.b_per_block * 4
+        self.t_b_stride = tunable.gemm_n_per_thread_subc * 4
         self.t_n2_vec_size = tunable.in_block_copy_dst_data_per_write_n2
         assert self.t_n2 == self.t_n2_vec_size, "currently only implemented n2 equal n2_vector_size"
     def __call__(self, v_src, v_sst_os):
         return '{} {}, {}'.format(self.name(), v_src, v_sst_os)
     def emit(self):
-        self._emit_macro_desc('{{e,n1,b,n2}}:{{{},{},{},{}}}, stride_n1:{}, vector_n2:{}, offset:{}'.format(1,self.t_n1,1,self.t_n2,self.t_n1_stride,self.t_n2_vec_size,0))
+        self._emit_macro_desc('{{e,n1,b,n2}}:{{{},{},{},{}}}, stride_n1:{}, vector_n2:{}, offset:{}'.format(self.t_e,self.t_n1,self.t_b,self.t_n2,self.t_n1_stride,self.t_n2_vec_size,0))
         with self._emit_macro_indented('.macro {} v_src, v_sst_os'.format(self.name())):
             ds_write = ds_write_t(self.t_n2_vec_size * 4)
-            for itn1 in range(self.t_n1):
-                self._emit('{}'.format(ds_write('\\v_sst_os', gpr_t('\\v_src')(itn1*self.t_n2_vec_size), itn1 * self.t_n1_stride)))
+            # global load of a n1 is {n2, b}, LDS is {b, n2}. swap in place, a row of b is ready to store after its swaps
+            swap_list = amdgpu_swap_sequencer_t(self.t_b, self.t_n2)() if self.t_b != 1 else None
+            g_src = gpr_t('\\v_src')
+            for ite in range(self.t_e):
+                for itn1 in range(self.t_n1):
+                    base = (ite * self.t_n1 + itn1) * self.t_b * self.t_n2
+                    for itb in range(self.t_b):
+                        if swap_list is not None and type(swap_list[itb]) is not str:
+                            for sw_item in swap_list[itb]:
+                                self._emit('v_swap_b32 v[{}], v[{}]'.format(g_src(base + sw_item[0]), g_src(base + sw_item[1])))
+                        self._emit('{}'.format(ds_write('\\v_sst_os', g_src(base + itb*self.t_n2_vec_size),
+                                    ite * self.t_e_stride + itn1 * self.t_n1_stride + itb * self.t_b_stride)))
     def get_issues(self):
-        return self.t_n1
+        return self.t_e * self.t_n1 * self.t_b
 
 class emit_wei_ds_write2_likely_t(igemm_v4r1_dynamic_t):
     '''
@@ -398,9 +454,14 @@ class emit_in_move_slice_window_t(igemm_v4r1_dynamic_t):
     move input slice window. unified for all tunable along e=c*y*x
     '''
     def name(self):
-        return '.v_in_move_slice_window'
+        if self.slice_table:
+            return '.v_in_move_slice_window_tbl' + ('_npad' if self.no_pad else '')
+        return '.v_in_move_slice_window' + ('_npad' if self.no_pad else '') + ('_us1' if self.unit_stride else '')
     def __init__(self, mc, tunable):
         igemm_v4r1_dynamic_t.__init__(self, mc, tunable)
+        self.no_pad = tunable.no_pad            # need not track ihi, iwi for v_flag
+        self.unit_stride = tunable.unit_stride  # need not multiply by dilation
+        self.slice_table = tunable.slice_table  # step is loaded from table, dilation is already in it
     def __call__(self, v_in_os, v_in_ic, v_in_iy, v_in_ix, v_in_ihi, v_in_iwi, v_flag,
                         s_hi, s_wi, s_y, s_x, s_in_stride_c, s_dilation_h, s_dilation_w, s_in_ic, s_in_iy, s_in_ix,
                         v_idc, v_idy, v_idx, s_tmp2):
@@ -408,7 +469,25 @@ class emit_in_move_slice_window_t(igemm_v4r1_dynamic_t):
                         v_in_os, v_in_ic, v_in_iy, v_in_ix, v_in_ihi, v_in_iwi, v_flag,
                         s_hi, s_wi, s_y, s_x, s_in_stride_c, s_dilation_h, s_dilation_w, s_in_ic, s_in_iy, s_in_ix,
                         v_idc, v_idy, v_idx, s_tmp2)
+    def call_table(self, v_in_os, v_in_ihi, v_in_iwi, v_flag, s_hi, s_wi, v_in_tbl, s_tmp2):
+        return '{} {}, {}, {}, {}, {}, {}, {}, {}'.format(self.name(),
+                        v_in_os, v_in_ihi, v_in_iwi, v_flag, s_hi, s_wi, v_in_tbl, s_tmp2)
+    def emit_table(self):
+        # v_in_tbl is the step of current phase, see v4r1_dynamic_get_slice_table(). the one of next phase
+        # is loaded into it after this, by the offset in v_in_tbl+1
+        self._emit_macro_desc('\n; update v_in_os, v_flag, v_in_ihi, v_in_iwi by the step in v_in_tbl: {os, next, ihi, iwi}')
+        with self._emit_macro_indented('.macro {} v_in_os, v_in_ihi, v_in_iwi, v_flag, s_hi, s_wi, v_in_tbl, s_tmp2'.format(self.name())):
+            self._emit('v_add_u32 v[\\v_in_os], v[\\v_in_tbl], v[\\v_in_os]')
+            if not self.no_pad:
+                self._emit('v_add_u32 v[\\v_in_ihi], v[\\v_in_tbl+2], v[\\v_in_ihi]')
+                self._emit('v_add_u32 v[\\v_in_iwi], v[\\v_in_tbl+3], v[\\v_in_iwi]')
+                self._emit_empty_line()
+                self._emit('; update v_flag')
+                self._emit('.v_in_set_flag \\v_flag, \\v_in_ihi, \\v_in_iwi, \\s_hi, \\s_wi, \\s_tmp2')
     def emit(self):
+        if self.slice_table:
+            self.emit_table()
+            return
         self._emit_macro_desc('\n; update v_in_os, v_flag, update v_in_ic, v_in_iy, v_in_ix (zero or possitive), v_in_ihi, v_in_iwi (negative, zero, possitive)')
         with self._emit_macro_indented('.macro {} v_in_os, v_in_ic, v_in_iy, v_in_ix, v_in_ihi, v_in_iwi, v_flag, s_hi, s_wi, s_y, s_x, s_in_stride_c, s_dilation_h, s_dilation_w, s_in_ic, s_in_iy, s_in_ix, v_idc, v_idy, v_idx, s_tmp2'.format(self.name())):
             self._emit('; record old ic, iy, ix')
@@ -438,22 +517,29 @@ class emit_in_move_slice_window_t(igemm_v4r1_dynamic_t):
             self._emit('v_add_u32 v[\\v_in_ic], s[\\s_in_ic], v[\\v_in_ic]')
             self._emit('v_sub_u32 v[\\v_idc], v[\\v_in_ic], v[\\v_idc]')
             self._emit_empty_line()
-            self._emit('; calculate offset: idc*(s_hi*s_wi) + idy*s_dilation_h*s_wi + idx*s_dilation_w')
+            if self.unit_stride:
+                self._emit('; calculate offset: idc*(s_hi*s_wi) + idy*s_wi + idx, dilation is 1')
+            else:
+                self._emit('; calculate offset: idc*(s_hi*s_wi) + idy*s_dilation_h*s_wi + idx*s_dilation_w')
             self._emit('; we use i24 as multiplier, for 24bit(-8388607 ~ 8388608) is enough for index')
-            self._emit('; also, update ihi, iwi here')
-            self._emit('v_mul_i32_i24 v[\\v_idy], s[\\s_dilation_h], v[\\v_idy]')
-            self._emit('v_mul_i32_i24 v[\\v_idx], s[\\s_dilation_w], v[\\v_idx]')
-            self._emit('v_add_i32 v[\\v_in_ihi], v[\\v_idy], v[\\v_in_ihi]')
-            self._emit('v_add_i32 v[\\v_in_iwi], v[\\v_idx], v[\\v_in_iwi]')
+            if not self.no_pad:
+                self._emit('; also, update ihi, iwi here')
+            if not self.unit_stride:
+                self._emit('v_mul_i32_i24 v[\\v_idy], s[\\s_dilation_h], v[\\v_idy]')
+                self._emit('v_mul_i32_i24 v[\\v_idx], s[\\s_dilation_w], v[\\v_idx]')
+            if not self.no_pad:
+                self._emit('v_add_i32 v[\\v_in_ihi], v[\\v_idy], v[\\v_in_ihi]')
+                self._emit('v_add_i32 v[\\v_in_iwi], v[\\v_idx], v[\\v_in_iwi]')
             self._emit('v_mul_i32_i24 v[\\v_idy], s[\\s_wi], v[\\v_idy]')
             self._emit_empty_line()
             self._emit('v_add_i32 v[\\v_idx], v[\\v_idx], v[\\v_idy]')
             self._emit('v_mul_lo_u32 v[\\v_idc], s[\\s_in_stride_c], v[\\v_idc]')
             self._emit('v_add_i32 v[\\v_idc], v[\\v_idc], v[\\v_idx]')
             self._emit('v_lshl_add_u32 v[\\v_in_os], v[\\v_idc], 2, v[\\v_in_os]   ; indeed, v_idc here must be possitive')
-            self._emit_empty_line()
-            self._emit('; update v_flag')
-            self._emit('.v_in_set_flag \\v_flag, \\v_in_ihi, \\v_in_iwi, \\s_hi, \\s_wi, \\s_tmp2')
+            if not self.no_pad:
+                self._emit_empty_line()
+                self._emit('; update v_flag')
+                self._emit('.v_in_set_flag \\v_flag, \\v_in_ihi, \\v_in_iwi, \\s_hi, \\s_wi, \\s_tmp2')
 
 class emit_wei_move_slice_window_t(igemm_v4r1_dynamic_t):
     '''
@@ -470,211 +556,470 @@ class emit_wei_move_slice_window_t(igemm_v4r1_dynamic_t):
             self._emit('v_add_u32 v[\\v_wei_os],  s[\\s_wei_stride], v[\\v_wei_os]')
 
 class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
-    class kernel_karg_t(igemm_v4r1_dynamic_t):
+    class kernel_layout_t(igemm_v4r1_dynamic_t):
+        '''
+        base of kernarg/sgpr/vgpr layout. create_layout() build the symbol table once,
+        count and .set block are both read from the same table
+        '''
         def __init__(self, mc, tunable):
             igemm_v4r1_dynamic_t.__init__(self, mc, tunable)
+            self.layout = None
+        def create_layout(self):
+            assert False, 'no layout'
         def __call__(self):
-            with self._deferred_context():
-                # Note here, in this implementation, all kernel should be the same
-                # TODO: 1x1 is different
-                self._emit('; kernarg offset')
-                self._emit('.set k_p_in,                0')
-                self._emit('.set k_p_wei,               8')
-                self._emit('.set k_p_out,               16')
-                self._emit('.set k_hi,                  24')
-                self._emit('.set k_wi,                  28')
-                self._emit('.set k_n,                   32')
-                self._emit('.set k_k,                   36')
-                self._emit('.set k_c,                   40')
-                self._emit('.set k_ho,                  44')
-                self._emit('.set k_wo,                  48')
-                self._emit('.set k_stride_h,            52')
-                self._emit('.set k_stride_w,            56')
-                self._emit('.set k_dilation_h,          60')
-                self._emit('.set k_dilation_w,          64')
-                self._emit('.set k_pad_h,               68')
-                self._emit('.set k_pad_w,               72')
-                if self.tunable.is_1x1():
-                    self._emit('.set k_end,                 76')
-                else:
-                    self._emit('.set k_y,                   76')
-                    self._emit('.set k_x,                   80')
-                    self._emit('.set k_end,                 84')
-                self._emit_empty_line()
-            if self.tunable.is_1x1():
-                k_args_size = igemm_next_mul(76, 8)
-            else:
-                k_args_size = igemm_next_mul(84, 8)
-            return self._get_deferred(), k_args_size   # TODO: karg alignment
+            if self.layout is None:
+                self.layout = self.create_layout()
+            return self.layout
         def get_count(self):
-            _, cnt = self()
-            return cnt
+            return self().get_count()
         def emit(self):
-            code, _ = self()
-            self._emit(code)
+            for line in self().lines():
+                self._emit(line)
+            self._emit_empty_line()
 
-    class kernel_sgpr_t(igemm_v4r1_dynamic_t):
-        def __init__(self, mc, tunable):
-            igemm_v4r1_dynamic_t.__init__(self, mc, tunable)
-        def __call__(self):
-            with self._deferred_context():
-                s_seq = gpr_sequencer_t()
-                self._emit('; sgpr')
-                self._emit('.set s_ka,                  {}'.format(s_seq(2)))
-                self._emit('.set s_bx,                  {}'.format(s_seq(2)))
-                self._emit('.set s_p_in,                {}'.format(s_seq(2)))
-                self._emit('.set s_p_wei,               {}'.format(s_seq(2)))
-                self._emit('.set s_hi,                  {}'.format(s_seq(1)))
-                self._emit('.set s_wi,                  {}'.format(s_seq(1)))
-                self._emit('.set s_n,                   {}'.format(s_seq(1)))
-                self._emit('.set s_k,                   {}'.format(s_seq(1)))
-                self._emit('.set s_c,                   {}'.format(s_seq(1)))
-                self._emit('.set s_ho,                  {}'.format(s_seq(1)))
-                self._emit('.set s_wo,                  {}'.format(s_seq(1)))
-                self._emit('.set s_stride_h,            {}'.format(s_seq(1)))
-                self._emit('.set s_stride_w,            {}'.format(s_seq(1)))
-                self._emit('.set s_dilation_h,          {}'.format(s_seq(1)))
-                self._emit('.set s_dilation_w,          {}'.format(s_seq(1)))
-                self._emit('.set s_pad_h,               {}'.format(s_seq(1)))
-                if self.tunable.is_1x1():
-                    self._emit('.set s_pad_w,               {}'.format(s_seq(1)))
-                else:
-                    self._emit('.set s_pad_w,               {}'.format(s_seq(1)))
-                    self._emit('.set s_y,                   {}'.format(s_seq(1)))
-                    self._emit('.set s_x,                   {}'.format(s_seq(1)))
-                self._emit('.set s_p_out,               {}'.format(s_seq(2, 4)))
-                self._emit('.set s_block_ik,            {}'.format(s_seq(1)))
-                self._emit('.set s_block_ib,            {}'.format(s_seq(1)))
-                if self.tunable.is_1x1():
-                    self._emit('.set s_in_stride,           {}'.format(s_seq(1)))
-                else:
-                    self._emit('.set s_in_stride_c,         {}'.format(s_seq(1)))
-                self._emit('.set s_in_stride_n2,        {}'.format(s_seq(1)))
-                self._emit('.set s_in_stride_n1,        {}'.format(s_seq(1)))
-                if not(self.tunable.is_1x1()):
-                    self._emit('.set s_in_ic,               {}'.format(s_seq(1)))
-                    self._emit('.set s_in_iy,               {}'.format(s_seq(1)))
-                    self._emit('.set s_in_ix,               {}'.format(s_seq(1)))
+    class kernel_karg_t(kernel_layout_t):
+        def get_magic_div_list(self):
+            '''
+            (kernarg, sgpr) of magic numbers, after the args of both layouts. divisors are
+            b_block_work, ho*wo, wo, y*x, x in this order, shift of each is 6 bits of shift_pack_0.
+            1x1 only load the first 4
+            '''
+            ml = [('k_magic_0', 's_magic_0'), ('k_magic_1', 's_magic_1'), ('k_magic_2', 's_magic_2'),
+                    ('k_shift_pack_0', 's_shift_pack_0')]
+            if not self.tunable.is_1x1():
+                ml += [('k_magic_3', 's_magic_3'), ('k_magic_4', 's_magic_4')]
+            return ml
+
+        def add_magic_div(self, ka):
+            for i, (arg, _) in enumerate(self.get_magic_div_list()):
+                ka.add(arg,                     V4R1_DYNAMIC_KARG_MAGIC_DIV_OFFSET + 4 * i)
+            return V4R1_DYNAMIC_KARG_MAGIC_DIV_OFFSET + 4 * len(self.get_magic_div_list())
+
+        def add_gemm_k_split(self, ka):
+            '''
+            c of one split follow the magic numbers, host pass all 6 of them even for 1x1
+            '''
+            offset = V4R1_DYNAMIC_KARG_MAGIC_DIV_OFFSET + (V4R1_DYNAMIC_KARG_MAGIC_DIV_SIZE if self.tunable.magic_div else 0)
+            ka.add('k_split_c',             offset)
+            return offset + 4
 
-                if self.tunable.is_1x1():
-                    self._emit('.set s_wei_stride,          {}'.format(s_seq(1)))
-                    self._emit('.set s_wei_stride_k,        {}'.format(s_seq(1)))
-                else:
-                    self._emit('.set s_wei_stride,          {}'.format(s_seq(1)))
-                    self._emit('.set s_wei_stride_c,        {}'.format(s_seq(1)))
-                    self._emit('.set s_wei_stride_k,        {}'.format(s_seq(1)))
-
-                self._emit('.set s_out_stride_k0,       {}'.format(s_seq(1)))
-                self._emit('.set s_out_stride_k1,       {}'.format(s_seq(1)))
-                self._emit('.set s_out_stride_n1,       {}'.format(s_seq(1)))
-                self._emit('.set s_out_stride_n2,       {}'.format(s_seq(1)))
-                self._emit('.set s_kitr,                0')
-                self._emit('.set s_tmp,                 {}'.format(s_seq(4, 4)))
-                self._emit('.set s_p_buf_in,            s_p_in      ; 4 sgpr used for MUBUF')
-                self._emit('.set s_p_buf_wei,           {}'.format(s_seq(4, 4)))
-                self._emit('.set s_p_buf_out,           s_p_out')
-                self._emit('.set s_end,                 {}'.format(s_seq(0)))
-                self._emit_empty_line()
-            return self._get_deferred(), s_seq()
-        def get_count(self):
-            _, cnt = self()
-            return cnt
-        def emit(self):
-            code, _ = self()
-            self._emit(code)
+        def add_persistent(self, ka, offset):
+            '''
+            number of tile, number of unit (tile * split) and workgroups of the grid, after all above
+            '''
+            for i, arg in enumerate(['k_num_tile', 'k_num_unit', 'k_grid_size']):
+                ka.add(arg,                     offset + 4 * i)
+            return offset + 12
 
-    class kernel_vgpr_t(igemm_v4r1_dynamic_t):
-        def __init__(self, mc, tunable):
-            igemm_v4r1_dynamic_t.__init__(self, mc, tunable)
-        def __call__(self):
-            with self._deferred_context():
-                vseq = gpr_sequencer_t()
-                self._emit('; vgpr')
-                self._emit('.set v_c,                   {}'.format(vseq(self.tunable.num_accumulate_c_vgpr)))
-                if IGEMM_EXPERIMENTAL_DOUBLE_LOCAL_PREFETCH:
-                    self._emit('.set v_a0,                   {}'.format(vseq(self.tunable.num_accumulate_a_vgpr)))
-                    self._emit('.set v_b0,                   {}'.format(vseq(self.tunable.num_accumulate_b_vgpr)))
-                    self._emit('.set v_a1,                   {}'.format(vseq(self.tunable.num_accumulate_a_vgpr)))
-                    self._emit('.set v_b1,                   {}'.format(vseq(self.tunable.num_accumulate_b_vgpr)))
-                else:
-                    self._emit('.set v_a,                   {}'.format(vseq(self.tunable.num_accumulate_a_vgpr)))
-                    self._emit('.set v_b,                   {}'.format(vseq(self.tunable.num_accumulate_b_vgpr)))
-                self._emit('.set v_gld_a,               {}'.format(vseq(self.tunable.num_global_load_a_vgpr)))
-                self._emit('.set v_gld_b,               {}'.format(vseq(self.tunable.num_global_load_b_vgpr)))
-                self._emit('.set v_in_os,               {}'.format(vseq(1)))
-                self._emit('.set v_wei_os,              {}'.format(vseq(1)))
-                self._emit('.set v_sst_a_os,            {}'.format(vseq(1)))
-                self._emit('.set v_sst_b_os,            {}'.format(vseq(1)))
-                self._emit('.set v_sld_a_os,            {}'.format(vseq(1)))
-                self._emit('.set v_sld_b_os,            {}'.format(vseq(1)))
-                self._emit('.set v_out_os,              {}'.format(vseq(1)))
-                self._emit('.set v_flag,                {}'.format(vseq(1)))
-                if not(self.tunable.is_1x1()):
-                    self._emit('.set v_in_ic,               {}'.format(vseq(1)))
-                    self._emit('.set v_in_iy,               {}'.format(vseq(1)))
-                    self._emit('.set v_in_ix,               {}'.format(vseq(1)))
-                    self._emit('.set v_in_ihi,              {}'.format(vseq(1)))
-                    self._emit('.set v_in_iwi,              {}'.format(vseq(1)))
-
-                if self.tunable.num_accumulate_c_vgpr in range(6):
-                    self._emit('.set v_in_in0,              {}'.format(vseq(1)))
-                    self._emit('.set v_in_iho,              {}'.format(vseq(1)))
-                    self._emit('.set v_in_iwo,              {}'.format(vseq(1)))
-                    self._emit('.set v_in_ie,               {}'.format(vseq(1)))
-                else:
-                    self._emit('.set v_in_in0,              {}'.format(self.tunable.num_accumulate_c_vgpr - 1))
-                    self._emit('.set v_in_iho,              {}'.format(self.tunable.num_accumulate_c_vgpr - 2))
-                    self._emit('.set v_in_iwo,              {}'.format(self.tunable.num_accumulate_c_vgpr - 3))
-                    self._emit('.set v_in_ie,               {}'.format(self.tunable.num_accumulate_c_vgpr - 4))
-
-                if self.tunable.num_accumulate_c_vgpr in range(6, 9):
-                    self._emit('.set v_in_in1,              {}'.format(vseq(1)))
-                    self._emit('.set v_in_ib,               {}'.format(vseq(1)))
-                    self._emit('.set v_in_in2,              {}'.format(vseq(1)))
-                else:
-                    self._emit('.set v_in_in1,              {}'.format(self.tunable.num_accumulate_c_vgpr - 5))
-                    self._emit('.set v_in_ib,               {}'.format(self.tunable.num_accumulate_c_vgpr - 6))
-                    self._emit('.set v_in_in2,              {}'.format(self.tunable.num_accumulate_c_vgpr - 7))
-
-                if self.tunable.num_accumulate_c_vgpr in range(9, 12):
-                    self._emit('.set v_wei_ie,              {}'.format(vseq(1)))
-                    self._emit('.set v_wei_ik,              {}'.format(vseq(1)))
-                    self._emit('.set v_out_ik0,             {}'.format(vseq(1)))
-                else:
-                    self._emit('.set v_wei_ie,              {}'.format(self.tunable.num_accumulate_c_vgpr - 8))
-                    self._emit('.set v_wei_ik,              {}'.format(self.tunable.num_accumulate_c_vgpr - 9))
-                    self._emit('.set v_out_ik0,             {}'.format(self.tunable.num_accumulate_c_vgpr - 10))
-
-                if self.tunable.num_accumulate_c_vgpr in range(12, 16):
-                    self._emit('.set v_out_ik1,             {}'.format(vseq(1)))
-                    self._emit('.set v_out_ib,              {}'.format(vseq(1)))
-                    self._emit('.set v_gemm_in,             {}'.format(vseq(1)))
-                    self._emit('.set v_gemm_im,             {}'.format(vseq(1)))
-                else:
-                    self._emit('.set v_out_ik1,             {}'.format(self.tunable.num_accumulate_c_vgpr - 11))
-                    self._emit('.set v_out_ib,              {}'.format(self.tunable.num_accumulate_c_vgpr - 12))
-                    self._emit('.set v_gemm_in,             {}'.format(self.tunable.num_accumulate_c_vgpr - 13))
-                    self._emit('.set v_gemm_im,             {}'.format(self.tunable.num_accumulate_c_vgpr - 14))
+        def get_persistent_offset(self):
+            return V4R1_DYNAMIC_KARG_MAGIC_DIV_OFFSET + (V4R1_DYNAMIC_KARG_MAGIC_DIV_SIZE if self.tunable.magic_div else 0) + \
+                    (4 if self.tunable.gemm_k_split else 0)
 
-                if not(self.tunable.is_1x1()):
-                    self._emit('.set v_idc,                 {}'.format(vseq(1)))
-                    self._emit('.set v_idy,                 {}'.format(vseq(1)))
-                    self._emit('.set v_idx,                 {}'.format(vseq(1)))
+        def get_epilogue_offset(self):
+            return igemm_next_mul(self.get_persistent_offset() + (12 if self.tunable.persistent else 0), 8)
 
-                if self.tunable.num_accumulate_c_vgpr in range(16, 24):
-                    self._emit('.set v_tmp,                 {}'.format(vseq(6)))
-                    self._emit('.set v_end,                 {}'.format(vseq()))
-                else:
-                    self._emit('.set v_tmp,                 {}'.format(self.tunable.num_accumulate_c_vgpr - 20))
-                    self._emit('.set v_end,                 {}'.format(vseq()))
-                self._emit_empty_line()
-            return self._get_deferred(), vseq()
-        def get_count(self):
-            _, cnt = self()
-            return cnt
-        def emit(self):
-            code, _ = self()
-            self._emit(code) 
+        def add_epilogue(self, ka, offset):
+            '''
+            bias pointer, then clamp_min, clamp_max in float. both 8 byte aligned
+            '''
+            if self.tunable.bias:
+                ka.add('k_p_bias',              offset)
+                offset += 8
+            if self.tunable.activation == IGEMM_ACTIVATION_CLAMP:
+                ka.add('k_clamp_min',           offset)
+                ka.add('k_clamp_max',           offset + 4)
+                offset += 8
+            return offset
+
+        def get_slice_table_offset(self):
+            return self.get_epilogue_offset() + (8 if self.tunable.bias else 0) + \
+                    (8 if self.tunable.activation == IGEMM_ACTIVATION_CLAMP else 0)
+
+        def add_slice_table(self, ka, offset):
+            '''
+            pointer of the slice window step table, after all above, 8 byte aligned
+            '''
+            ka.add('k_p_slice_table',       offset)
+            return offset + 8
+
+        def get_swizzle_offset(self):
+            return self.get_slice_table_offset() + (8 if self.tunable.slice_table else 0)
+
+        def add_swizzle(self, ka, offset):
+            '''
+            group * b_block_work, first workgroup of the last group and k blocks of it, from
+            v4r1_dynamic_get_swizzle_karg(). with magic_div, magic numbers of group * b_block_work and
+            k blocks of last group, and shift of both in shift_pack_1, after all above
+            '''
+            args = ['k_swz_group_work', 'k_swz_last_bid', 'k_swz_last_group_k']
+            if self.tunable.magic_div:
+                args += ['k_magic_5', 'k_magic_6', 'k_shift_pack_1']
+            for i, arg in enumerate(args):
+                ka.add(arg,                     offset + 4 * i)
+            return offset + 4 * len(args)
+
+        def create_layout_compact(self):
+            '''
+            scalars are one s_load_dwordx16. n, k, c, ho are not needed by the kernel, products of
+            them are computed by host, same for 1x1 and others
+            '''
+            ka = amdgpu_symbol_table_t('kernarg offset')
+            ka.add('k_p_in',                0)
+            ka.add('k_p_wei',               8)
+            ka.add('k_p_out',               16)
+            for i, arg in enumerate(['k_hi', 'k_wi', 'k_wo', 'k_stride_h', 'k_stride_w', 'k_dilation_h', 'k_dilation_w',
+                        'k_pad_h', 'k_pad_w', 'k_y', 'k_x', 'k_in_stride_n2', 'k_wei_stride_k', 'k_out_stride_k1',
+                        'k_out_stride_n2', 'k_b_block_work']):
+                ka.add(arg,                     24 + 4 * i)
+            k_end = self.add_magic_div(ka) if self.tunable.magic_div else 24 + 4 * 16
+            if self.tunable.gemm_k_split:
+                k_end = self.add_gemm_k_split(ka)
+            if self.tunable.persistent:
+                k_end = self.add_persistent(ka, self.get_persistent_offset())
+            if self.tunable.bias or self.tunable.activation == IGEMM_ACTIVATION_CLAMP:
+                k_end = self.add_epilogue(ka, self.get_epilogue_offset())
+            if self.tunable.slice_table:
+                k_end = self.add_slice_table(ka, self.get_slice_table_offset())
+            if self.tunable.swizzle_group > 1:
+                k_end = self.add_swizzle(ka, self.get_swizzle_offset())
+            ka.add('k_end',                 k_end)
+            ka.set_count(ka['k_end'])
+            return ka
+
+        def create_layout(self):
+            if self.tunable.kernarg_compact:
+                return self.create_layout_compact()
+            # Note here, in this implementation, all kernel should be the same
+            # TODO: 1x1 is different
+            ka = amdgpu_symbol_table_t('kernarg offset')
+            ka.add('k_p_in',                0)
+            ka.add('k_p_wei',               8)
+            ka.add('k_p_out',               16)
+            ka.add('k_hi',                  24)
+            ka.add('k_wi',                  28)
+            ka.add('k_n',                   32)
+            ka.add('k_k',                   36)
+            ka.add('k_c',                   40)
+            ka.add('k_ho',                  44)
+            ka.add('k_wo',                  48)
+            ka.add('k_stride_h',            52)
+            ka.add('k_stride_w',            56)
+            ka.add('k_dilation_h',          60)
+            ka.add('k_dilation_w',          64)
+            ka.add('k_pad_h',               68)
+            ka.add('k_pad_w',               72)
+            if self.tunable.is_1x1():
+                k_end = 76
+            else:
+                ka.add('k_y',                   76)
+                ka.add('k_x',                   80)
+                k_end = 84
+            if self.tunable.magic_div:
+                k_end = self.add_magic_div(ka)
+            if self.tunable.gemm_k_split:
+                k_end = self.add_gemm_k_split(ka)
+            if self.tunable.persistent:
+                k_end = self.add_persistent(ka, self.get_persistent_offset())
+            if self.tunable.bias or self.tunable.activation == IGEMM_ACTIVATION_CLAMP:
+                k_end = self.add_epilogue(ka, self.get_epilogue_offset())
+            if self.tunable.slice_table:
+                k_end = self.add_slice_table(ka, self.get_slice_table_offset())
+            if self.tunable.swizzle_group > 1:
+                k_end = self.add_swizzle(ka, self.get_swizzle_offset())
+            ka.add('k_end',                 k_end)
+            ka.set_count(igemm_next_mul(ka['k_end'], 8))   # TODO: karg alignment
+            return ka
+
+    class kernel_sgpr_t(kernel_layout_t):
+        def get_sgpr_list(self):
+            '''
+            (symbol, number of sgpr, alignment) of every sgpr symbol, and (alias, value) of the ones
+            sharing another. kernel args loaded by the same s_load are in kernarg order
+            '''
+            is_1x1 = self.tunable.is_1x1()
+            in_stride_e = ['s_in_stride_e'] if self.tunable.in_block_copy_sub_lengths_e != 1 else []
+            if self.tunable.kernarg_compact:
+                args = ['s_hi', 's_wi', 's_wo', 's_stride_h', 's_stride_w', 's_dilation_h', 's_dilation_w', 's_pad_h', 's_pad_w',
+                        's_y', 's_x', 's_in_stride_n2', 's_wei_stride_k', 's_out_stride_k1', 's_out_stride_n2', 's_b_block_work']
+                others = ['s_block_ik', 's_block_ib'] + (['s_in_stride'] if is_1x1 else ['s_in_stride_c']) + ['s_in_stride_n1'] + in_stride_e
+                others += ([] if is_1x1 else ['s_in_ic', 's_in_iy', 's_in_ix', 's_wei_stride_c']) + ['s_wei_stride']
+                others += ['s_out_stride_k0', 's_out_stride_n1']
+            else:
+                args = ['s_hi', 's_wi', 's_n', 's_k', 's_c', 's_ho', 's_wo', 's_stride_h', 's_stride_w', 's_dilation_h',
+                        's_dilation_w', 's_pad_h', 's_pad_w'] + ([] if is_1x1 else ['s_y', 's_x'])
+                others = ['s_block_ik', 's_block_ib'] + (['s_in_stride'] if is_1x1 else ['s_in_stride_c']) + ['s_in_stride_n2', 's_in_stride_n1'] + in_stride_e
+                others += ([] if is_1x1 else ['s_in_ic', 's_in_iy', 's_in_ix', 's_wei_stride_c']) + ['s_wei_stride', 's_wei_stride_k']
+                others += ['s_out_stride_k0', 's_out_stride_k1', 's_out_stride_n1', 's_out_stride_n2']
+            sl = [('s_ka', 2, 0), ('s_bx', 1, 0)] + ([('s_by', 1, 0)] if self.tunable.grid_2d else [])
+            sl += [('s_bz', 1, 0)] if self.tunable.gemm_k_split else []
+            sl += [('s_ka_save', 2, 2), ('s_unit', 1, 0)] if self.tunable.persistent else []
+            sl += [('s_p_in', 4, 4), ('s_p_out', 4, 4), (args[0], 1, 4)]
+            sl += [(s, 1, 0) for s in args[1:]]
+            if self.tunable.magic_div:
+                # loaded by s_load_dwordx4 and s_load_dwordx2
+                sl += [(s, 1, {0 : 4, 4 : 2}.get(i, 0)) for i, s in enumerate(['s_magic_0', 's_magic_1', 's_magic_2',
+                            's_shift_pack_0'] + ([] if is_1x1 else ['s_magic_3', 's_magic_4']))]
+            if self.tunable.gemm_k_split:
+                sl += [('s_split_c', 1, 0)]
+            if self.tunable.persistent:
+                # num_tile and num_unit loaded by s_load_dwordx2
+                sl += [('s_num_tile', 1, 2), ('s_num_unit', 1, 0), ('s_grid_size', 1, 0)]
+            if self.tunable.bias:
+                sl += [('s_p_bias', 2, 2)]
+            if self.tunable.activation == IGEMM_ACTIVATION_CLAMP:
+                sl += [('s_clamp_min', 1, 2), ('s_clamp_max', 1, 0)]
+            if self.tunable.swizzle_group > 1:
+                # group_work and last_bid, magic numbers loaded by s_load_dwordx2
+                sl += [('s_swz_group_work', 1, 2), ('s_swz_last_bid', 1, 0), ('s_swz_last_group_k', 1, 0)]
+                sl += [('s_magic_5', 1, 2), ('s_magic_6', 1, 0), ('s_shift_pack_1', 1, 0)] if self.tunable.magic_div else []
+            sl += [(s, 1, 0) for s in others + ['s_kitr']]
+            sl += [('s_tmp', 4, 4), ('s_p_buf_wei', 4, 4)]
+            sl += [('s_p_buf_tbl', 4, 4)] if self.tunable.slice_table else []
+            aliases = [('s_p_wei', 's_p_in+2'), ('s_p_buf_in', 's_p_in'), ('s_p_buf_out', 's_p_out')]
+            return sl, aliases
+
+        def create_layout_from(self, sl, aliases, count):
+            sa = amdgpu_symbol_table_t('sgpr')
+            for symbol, index in sl:
+                sa.add(symbol, index)
+            for symbol, value in aliases:
+                sa.add(symbol, value)
+            sa.add('s_end', count)
+            sa.set_count(count)
+            return sa
+
+        def create_layout(self):
+            if self.tunable.kernarg_compact:
+                s_seq = gpr_sequencer_t()
+                sl, aliases = self.get_sgpr_list()
+                sl = [(symbol, s_seq(size, alignment)) for symbol, size, alignment in sl]
+                return self.create_layout_from(sl, aliases, s_seq())
+            s_seq = gpr_sequencer_t()
+            sa = amdgpu_symbol_table_t('sgpr')
+            sa.add('s_ka',                  s_seq(2))
+            sa.add('s_bx',                  s_seq(2))
+            if self.tunable.grid_2d:
+                sa.add('s_by',                  's_bx+1')
+            if self.tunable.gemm_k_split:
+                # workgroup id z follow y if there is
+                sa.add('s_bz',                  s_seq(1) if self.tunable.grid_2d else 's_bx+1')
+            sa.add('s_p_in',                s_seq(2, 4))
+            sa.add('s_p_wei',               s_seq(2))
+            sa.add('s_hi',                  s_seq(1))
+            sa.add('s_wi',                  s_seq(1))
+            sa.add('s_n',                   s_seq(1))
+            sa.add('s_k',                   s_seq(1))
+            sa.add('s_c',                   s_seq(1))
+            sa.add('s_ho',                  s_seq(1))
+            sa.add('s_wo',                  s_seq(1))
+            sa.add('s_stride_h',            s_seq(1))
+            sa.add('s_stride_w',            s_seq(1))
+            sa.add('s_dilation_h',          s_seq(1))
+            sa.add('s_dilation_w',          s_seq(1))
+            sa.add('s_pad_h',               s_seq(1))
+            sa.add('s_pad_w',               s_seq(1))
+            if not(self.tunable.is_1x1()):
+                sa.add('s_y',                   s_seq(1))
+                sa.add('s_x',                   s_seq(1))
+            sa.add('s_p_out',               s_seq(2, 4))
+            sa.add('s_block_ik',            s_seq(1))
+            sa.add('s_block_ib',            s_seq(1))
+            if self.tunable.is_1x1():
+                sa.add('s_in_stride',           s_seq(1))
+            else:
+                sa.add('s_in_stride_c',         s_seq(1))
+            sa.add('s_in_stride_n2',        s_seq(1))
+            sa.add('s_in_stride_n1',        s_seq(1))
+            if self.tunable.in_block_copy_sub_lengths_e != 1:
+                sa.add('s_in_stride_e',         s_seq(1))
+            if not(self.tunable.is_1x1()):
+                sa.add('s_in_ic',               s_seq(1))
+                sa.add('s_in_iy',               s_seq(1))
+                sa.add('s_in_ix',               s_seq(1))
+
+            if self.tunable.is_1x1():
+                sa.add('s_wei_stride',          s_seq(1))
+                sa.add('s_wei_stride_k',        s_seq(1))
+            else:
+                sa.add('s_wei_stride',          s_seq(1))
+                sa.add('s_wei_stride_c',        s_seq(1))
+                sa.add('s_wei_stride_k',        s_seq(1))
+
+            sa.add('s_out_stride_k0',       s_seq(1))
+            sa.add('s_out_stride_k1',       s_seq(1))
+            sa.add('s_out_stride_n1',       s_seq(1))
+            sa.add('s_out_stride_n2',       s_seq(1))
+            if self.tunable.magic_div:
+                sa.add('s_magic_0',             s_seq(1, 4))
+                sa.add('s_magic_1',             s_seq(1))
+                sa.add('s_magic_2',             s_seq(1))
+                sa.add('s_shift_pack_0',        s_seq(1))
+                if not(self.tunable.is_1x1()):
+                    sa.add('s_magic_3',             s_seq(1, 2))
+                    sa.add('s_magic_4',             s_seq(1))
+            if self.tunable.gemm_k_split:
+                sa.add('s_split_c',             s_seq(1))
+            if self.tunable.persistent:
+                sa.add('s_ka_save',             s_seq(2, 2))
+                sa.add('s_unit',                s_seq(1))
+                sa.add('s_num_tile',            s_seq(1, 2))
+                sa.add('s_num_unit',            s_seq(1))
+                sa.add('s_grid_size',           s_seq(1))
+            if self.tunable.bias:
+                sa.add('s_p_bias',              s_seq(2, 2))
+            if self.tunable.activation == IGEMM_ACTIVATION_CLAMP:
+                sa.add('s_clamp_min',           s_seq(1, 2))
+                sa.add('s_clamp_max',           s_seq(1))
+            if self.tunable.swizzle_group > 1:
+                sa.add('s_swz_group_work',      s_seq(1, 2))
+                sa.add('s_swz_last_bid',        s_seq(1))
+                sa.add('s_swz_last_group_k',    s_seq(1))
+                if self.tunable.magic_div:
+                    sa.add('s_magic_5',             s_seq(1, 2))
+                    sa.add('s_magic_6',             s_seq(1))
+                    sa.add('s_shift_pack_1',        s_seq(1))
+            sa.add('s_kitr',                0)
+            sa.add('s_tmp',                 s_seq(4, 4))
+            sa.add('s_p_buf_in',            's_p_in      ; 4 sgpr used for MUBUF')
+            sa.add('s_p_buf_wei',           s_seq(4, 4))
+            if self.tunable.slice_table:
+                sa.add('s_p_buf_tbl',           s_seq(4, 4))
+            sa.add('s_p_buf_out',           's_p_out')
+            sa.add('s_end',                 s_seq(0))
+            sa.set_count(s_seq())
+            return sa
+
+    class kernel_vgpr_t(kernel_layout_t):
+        def get_vgpr_list(self):
+            '''
+            (symbol, number of vgpr) of every vgpr symbol, without any aliasing. used by the allocator
+            '''
+            vl = [('v_c', self.tunable.num_accumulate_c_vgpr)]
+            if IGEMM_EXPERIMENTAL_DOUBLE_LOCAL_PREFETCH:
+                vl += [('v_a0', self.tunable.num_accumulate_a_vgpr), ('v_b0', self.tunable.num_accumulate_b_vgpr),
+                       ('v_a1', self.tunable.num_accumulate_a_vgpr), ('v_b1', self.tunable.num_accumulate_b_vgpr)]
+            else:
+                vl += [('v_a', self.tunable.num_accumulate_a_vgpr), ('v_b', self.tunable.num_accumulate_b_vgpr)]
+            vl += [('v_gld_a', self.tunable.num_global_load_a_vgpr), ('v_gld_b', self.tunable.num_global_load_b_vgpr)]
+            singles = ['v_in_os', 'v_wei_os', 'v_sst_a_os', 'v_sst_b_os', 'v_sld_a_os', 'v_sld_b_os', 'v_out_os', 'v_flag']
+            if not(self.tunable.is_1x1()):
+                singles += ['v_in_ic', 'v_in_iy', 'v_in_ix', 'v_in_ihi', 'v_in_iwi']
+            singles += ['v_in_in0', 'v_in_iho', 'v_in_iwo', 'v_in_ie', 'v_in_in1', 'v_in_ib', 'v_in_in2',
+                        'v_wei_ie', 'v_wei_ik', 'v_out_ik0', 'v_out_ik1', 'v_out_ib', 'v_gemm_in', 'v_gemm_im']
+            if self.tunable.slice_table:
+                vl += [('v_in_tbl', 2 if self.tunable.no_pad else 4)]
+            elif not(self.tunable.is_1x1()):
+                singles += ['v_idc', 'v_idy', 'v_idx']
+            if self.tunable.persistent:
+                singles += ['v_tid']
+            if self.tunable.bias:
+                singles += ['v_bias_os']
+            if self.tunable.vector_store:
+                singles += ['v_out_vec_os', 'v_sst_c_os', 'v_sld_c_os']
+            vl += [(v, 1) for v in singles]
+            vl += [('v_tmp', 7)]
+            return vl
+
+        def create_layout_from(self, vl, count):
+            va = amdgpu_symbol_table_t('vgpr')
+            for symbol, index in vl:
+                va.add(symbol, index)
+            va.add('v_end', count)
+            va.set_count(count)
+            return va
+
+        def create_layout(self):
+            vseq = gpr_sequencer_t()
+            va = amdgpu_symbol_table_t('vgpr')
+            num_c = self.tunable.num_accumulate_c_vgpr
+            va.add('v_c',                   vseq(num_c))
+            if IGEMM_EXPERIMENTAL_DOUBLE_LOCAL_PREFETCH:
+                va.add('v_a0',                  vseq(self.tunable.num_accumulate_a_vgpr))
+                va.add('v_b0',                  vseq(self.tunable.num_accumulate_b_vgpr))
+                va.add('v_a1',                  vseq(self.tunable.num_accumulate_a_vgpr))
+                va.add('v_b1',                  vseq(self.tunable.num_accumulate_b_vgpr))
+            else:
+                va.add('v_a',                   vseq(self.tunable.num_accumulate_a_vgpr))
+                va.add('v_b',                   vseq(self.tunable.num_accumulate_b_vgpr))
+            va.add('v_gld_a',               vseq(self.tunable.num_global_load_a_vgpr))
+            va.add('v_gld_b',               vseq(self.tunable.num_global_load_b_vgpr))
+            va.add('v_in_os',               vseq(1))
+            va.add('v_wei_os',              vseq(1))
+            va.add('v_sst_a_os',            vseq(1))
+            va.add('v_sst_b_os',            vseq(1))
+            va.add('v_sld_a_os',            vseq(1))
+            va.add('v_sld_b_os',            vseq(1))
+            va.add('v_out_os',              vseq(1))
+            va.add('v_flag',                vseq(1))
+            if not(self.tunable.is_1x1()):
+                va.add('v_in_ic',               vseq(1))
+                va.add('v_in_iy',               vseq(1))
+                va.add('v_in_ix',               vseq(1))
+                va.add('v_in_ihi',              vseq(1))
+                va.add('v_in_iwi',              vseq(1))
+
+            if num_c < 6:
+                va.add('v_in_in0',              vseq(1))
+                va.add('v_in_iho',              vseq(1))
+                va.add('v_in_iwo',              vseq(1))
+                va.add('v_in_ie',               vseq(1))
+            else:
+                va.add('v_in_in0',              num_c - 1)
+                va.add('v_in_iho',              num_c - 2)
+                va.add('v_in_iwo',              num_c - 3)
+                va.add('v_in_ie',               num_c - 4)
+
+            if num_c < 9:
+                va.add('v_in_in1',              vseq(1))
+                va.add('v_in_ib',               vseq(1))
+                va.add('v_in_in2',              vseq(1))
+            else:
+                va.add('v_in_in1',              num_c - 5)
+                va.add('v_in_ib',               num_c - 6)
+                va.add('v_in_in2',              num_c - 7)
+
+            if num_c < 12:
+                va.add('v_wei_ie',              vseq(1))
+                va.add('v_wei_ik',              vseq(1))
+                va.add('v_out_ik0',             vseq(1))
+            else:
+                va.add('v_wei_ie',              num_c - 8)
+                va.add('v_wei_ik',              num_c - 9)
+                va.add('v_out_ik0',             num_c - 10)
+
+            if num_c < 16:
+                va.add('v_out_ik1',             vseq(1))
+                va.add('v_out_ib',              vseq(1))
+                va.add('v_gemm_in',             vseq(1))
+                va.add('v_gemm_im',             vseq(1))
+            else:
+                va.add('v_out_ik1',             num_c - 11)
+                va.add('v_out_ib',              num_c - 12)
+                va.add('v_gemm_in',             num_c - 13)
+                va.add('v_gemm_im',             num_c - 14)
+
+            if self.tunable.slice_table:
+                va.add('v_in_tbl',              vseq(2 if self.tunable.no_pad else 4))
+            elif not(self.tunable.is_1x1()):
+                va.add('v_idc',                 vseq(1))
+                va.add('v_idy',                 vseq(1))
+                va.add('v_idx',                 vseq(1))
+            if self.tunable.persistent:
+                va.add('v_tid',                 vseq(1))
+            if self.tunable.bias:
+                va.add('v_bias_os',             vseq(1))
+            if self.tunable.vector_store:
+                va.add('v_out_vec_os',          vseq(1))
+                va.add('v_sst_c_os',            vseq(1))
+                va.add('v_sld_c_os',            vseq(1))
+
+            if num_c < 24:
+                va.add('v_tmp',                 vseq(6))
+            else:
+                va.add('v_tmp',                 num_c - 20)
+            va.add('v_end',                 vseq())
+            va.set_count(vseq())
+            return va
 
     def name(self):
         return igemm_encode_v4r1_kernel_name(self.tunable)
@@ -683,11 +1028,16 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
         self.kernel_karg = self.kernel_karg_t(mc, tunable)
         self.kernel_sgpr = self.kernel_sgpr_t(mc, tunable)
         self.kernel_vgpr = self.kernel_vgpr_t(mc, tunable)
+        self.gpr_alloc_stats = []
+        if self.tunable.sgpr_alloc or self.tunable.vgpr_alloc:
+            self.allocate_gpr()
 
     def get_kernel_code(self):
         kernel_code = amdgpu_kernel_code_t({
                 'enable_sgpr_kernarg_segment_ptr'   :   1,
                 'enable_sgpr_workgroup_id_x'        :   1,
+                'enable_sgpr_workgroup_id_y'        :   1 if self.tunable.grid_2d else 0,
+                'enable_sgpr_workgroup_id_z'        :   1 if self.tunable.gemm_k_split and not self.tunable.persistent else 0,
                 'enable_vgpr_workitem_id'           :   0,
                 'workgroup_group_segment_byte_size' :   self.tunable.byte_lds_total,
                 'kernarg_segment_byte_size'         :   self.kernel_karg.get_count(),
@@ -717,11 +1067,44 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
         int y;
         int x;
         int __pack0;
+
+        with kernarg_compact, see igemm_v4r1_dynamic_karg_compact_t of the driver. magic numbers of
+        magic_div follow both, then split_c of gemm_k_split, num_tile, num_unit, grid_size of persistent
+        and p_bias, clamp_min, clamp_max of epilogue, p_slice_table of slice_table, group work and last group of
+        swizzle_group
         '''
+        kas = self.get_kernel_args_without_magic_div()
+        if self.tunable.magic_div:
+            for i, (arg, _) in enumerate(self.kernel_karg.get_magic_div_list()):
+                kas.append(amdgpu_kernel_arg_t(arg[2:], 4, V4R1_DYNAMIC_KARG_MAGIC_DIV_OFFSET + 4 * i, 'by_value','i32'))
+        ka = self.kernel_karg()
+        for arg in (['k_split_c'] if self.tunable.gemm_k_split else []) + \
+                    (['k_num_tile', 'k_num_unit', 'k_grid_size'] if self.tunable.persistent else []):
+            kas.append(amdgpu_kernel_arg_t(arg[2:], 4, ka[arg], 'by_value','i32'))
+        if self.tunable.bias:
+            kas.append(amdgpu_kernel_arg_t('p_bias', 8, ka['k_p_bias'], 'global_buffer','f32',address_space='global',is_const='true'))
+        if self.tunable.activation == IGEMM_ACTIVATION_CLAMP:
+            kas.append(amdgpu_kernel_arg_t('clamp_min', 4, ka['k_clamp_min'], 'by_value','f32'))
+            kas.append(amdgpu_kernel_arg_t('clamp_max', 4, ka['k_clamp_max'], 'by_value','f32'))
+        if self.tunable.slice_table:
+            kas.append(amdgpu_kernel_arg_t('p_slice_table', 8, ka['k_p_slice_table'], 'global_buffer','i32',address_space='global',is_const='true'))
+        if self.tunable.swizzle_group > 1:
+            for arg in ['k_swz_group_work', 'k_swz_last_bid', 'k_swz_last_group_k'] + \
+                        (['k_magic_5', 'k_magic_6', 'k_shift_pack_1'] if self.tunable.magic_div else []):
+                kas.append(amdgpu_kernel_arg_t(arg[2:], 4, ka[arg], 'by_value','i32'))
+        return kas
+
+    def get_kernel_args_without_magic_div(self):
         kas = []
         # name: {}, .size: {}, .offset: {}, .value_kind: {}, .value_type
         kas.append(amdgpu_kernel_arg_t('p_in'  , 8,  0, 'global_buffer','f32',address_space='global',is_const='true'))
         kas.append(amdgpu_kernel_arg_t('p_wei' , 8,  8, 'global_buffer','f32',address_space='global',is_const='true'))
+        if self.tunable.kernarg_compact:
+            kas.append(amdgpu_kernel_arg_t('p_out' , 8, 16, 'global_buffer','f32',address_space='global',is_const='false'))
+            for i, name in enumerate(['hi', 'wi', 'wo', 'stride_h', 'stride_w', 'dilation_h', 'dilation_w', 'pad_h', 'pad_w',
+                            'y', 'x', 'in_stride_n2', 'wei_stride_k', 'out_stride_k1', 'out_stride_n2', 'b_block_work']):
+                kas.append(amdgpu_kernel_arg_t(name, 4, 24 + 4 * i, 'by_value','i32'))
+            return kas
         kas.append(amdgpu_kernel_arg_t('p_in'  , 8, 16, 'global_buffer','f32',address_space='global',is_const='false'))
         kas.append(amdgpu_kernel_arg_t('hi'    , 4, 24, 'by_value','i32'))
         kas.append(amdgpu_kernel_arg_t('wi'    , 4, 28, 'by_value','i32'))
@@ -768,9 +1151,157 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
         self._emit('{}:'.format(kernel_name))
     def emit_kernel_end(self):
         self._emit('s_endpgm')
+    def get_kernel_macros(self):
+        '''
+        every macro this kernel may call, parsed from the text of this tunable
+        '''
+        with self._ir_context():
+            for m in v4r1_dynamic_global_macro_list([self.tunable.to_dict()]):
+                m(self.mc).emit()
+            for m in V4R1_DYNAMIC_MACRO_LIST:
+                m(self.mc, self.tunable).emit()
+        return ir_collect_macros(self._get_ir())
+
+    def get_kernel_symbols(self, sgpr = None, vgpr = None):
+        '''
+        value of kernarg/sgpr/vgpr symbols, evaluated from the .set lines, some are alias of another
+        '''
+        sgpr = sgpr if sgpr is not None else self.kernel_sgpr()
+        vgpr = vgpr if vgpr is not None else self.kernel_vgpr()
+        lines = self.kernel_karg().lines() + sgpr.lines() + vgpr.lines()
+        return ir_parse('\n'.join(lines)).get_symbols()
+
+    def allocate_gpr(self):
+        '''
+        sgpr/vgpr layout from liveness of the kernel body, in place of the hand written one.
+        s[0:1] is kernarg pointer, s2 workgroup id and v0 thread id at entry. hand placed s_waitcnt
+        are checked again with the new layout, a register must not be reused while a load into it is in flight
+        '''
+        sl, aliases = self.kernel_sgpr.get_sgpr_list()
+        pinned = {'s_ka' : 0, 's_bx' : 2, 's_by' : 3} if self.tunable.grid_2d else {'s_ka' : 0, 's_bx' : 2}
+        if self.tunable.gemm_k_split and not self.tunable.persistent:
+            pinned['s_bz'] = len(pinned) + 1
+        sgpr_alloc = regalloc_t(IR_REG_SGPR, [(s, n) for s, n, _ in sl], len(pinned) + 1, pinned) if self.tunable.sgpr_alloc else None
+        vgpr_alloc = regalloc_t(IR_REG_VGPR, self.kernel_vgpr.get_vgpr_list(), 1) if self.tunable.vgpr_alloc else None
+        def layouts(get):
+            sgpr = self.kernel_sgpr.create_layout_from(get(sgpr_alloc)[0], aliases, get(sgpr_alloc)[1]) if sgpr_alloc else self.kernel_sgpr()
+            vgpr = self.kernel_vgpr.create_layout_from(*get(vgpr_alloc)) if vgpr_alloc else self.kernel_vgpr()
+            return sgpr, vgpr
+
+        with self._ir_context():
+            self.emit_kernel_body()
+        body = self._get_ir()
+        macros = self.get_kernel_macros()
+        symbols = self.get_kernel_symbols(*layouts(lambda ra: ra.get_virtual()))
+        stream = ir_expand(body, macros, symbols)
+        for ra in (sgpr_alloc, vgpr_alloc):
+            if ra:
+                ra(stream, symbols)
+        sgpr, vgpr = layouts(lambda ra: (ra.get_layout(), ra.get_count()))
+
+        symbols = self.get_kernel_symbols(sgpr, vgpr)
+        errors = waitcnt_checker_t(symbols)(ir_expand(body, macros, symbols))
+        assert not errors, '{}: register reused by in flight load\n{}'.format(self.name(), '\n'.join(errors))
+
+        if sgpr_alloc:
+            self.gpr_alloc_stats.append('sgpr alloc {} -> {} sgpr'.format(self.kernel_sgpr.create_layout().get_count(), sgpr.get_count()))
+            self.kernel_sgpr.layout = sgpr
+        if vgpr_alloc:
+            arch_detail = get_amdgpu_gfx906_60cu()
+            block_size = v4r1_dynamic_get_block_size(self.tunable)
+            hand = self.kernel_vgpr.create_layout().get_count()
+            self.gpr_alloc_stats.append('vgpr alloc {} -> {} vgpr, occupancy {} -> {} waves per CU'.format(hand, vgpr.get_count(),
+                        amdgpu_calculate_waves_per_cu(arch_detail, hand, block_size, self.tunable.byte_lds_total),
+                        amdgpu_calculate_waves_per_cu(arch_detail, vgpr.get_count(), block_size, self.tunable.byte_lds_total)))
+            self.kernel_vgpr.layout = vgpr
+
+    def process_kernel_ir(self, stream):
+        '''
+        hook for passes over the kernel body, stream is ir_stream_t.
+        with any pass, macros are expanded first, and passes work on the plain instructions
+        '''
+        stats = list(self.gpr_alloc_stats)
+        if self.tunable.sched or self.tunable.waitcnt or self.tunable.peephole:
+            stream = self.process_kernel_passes(stream, stats)
+        for stat in stats:
+            self._emit('; ' + stat)
+        return stream
+
+    def process_kernel_passes(self, stream, stats):
+        '''
+        expand macros, then sched, waitcnt and peephole if enabled. stat of each is appended to stats
+        '''
+        symbols = self.get_kernel_symbols()
+        stream = ir_expand(stream, self.get_kernel_macros(), symbols)
+        if self.tunable.sched:
+            # s_waitcnt of scheduled block are dropped, waitcnt pass put them back
+            sched = sched_t(symbols, self.tunable.sched_lds_latency, self.tunable.sched_vmem_latency)
+            stream = sched(stream)
+            stats.append(sched.get_stats())
+        if self.tunable.waitcnt or self.tunable.sched:
+            waitcnt = waitcnt_t(symbols)
+            stream = waitcnt(stream)
+            errors = waitcnt_checker_t(symbols)(stream)
+            assert not errors, '{}: wrong s_waitcnt\n{}'.format(self.name(), '\n'.join(errors))
+            stats.append(waitcnt.get_stats())
+        if self.tunable.peephole:
+            peephole = peephole_t(symbols)
+            stream = peephole(stream)
+            stats.append(peephole.get_stats())
+        return stream
     def emit_kernel_footer(self):
         self._emit_empty_line()
 
+    def emit_magic_div_shift(self, i):
+        '''
+        shift of divisor i into s_tmp+3, see kernel_karg_t.get_magic_div_list(). 5 and 6 are the ones
+        of swizzle in s_shift_pack_1, see kernel_karg_t.add_swizzle()
+        '''
+        self._emit('s_bfe_u32 s[s_tmp+3], s[s_shift_pack_{}], 0x{:x}'.format(i // 5,
+                    (AMDGPU_MAGIC_DIV_SHIFT_BITS << 16) | (AMDGPU_MAGIC_DIV_SHIFT_BITS * (i % 5))))
+
+    def emit_div_vs(self, v_q, v_n, s_d, i):
+        if self.tunable.magic_div:
+            self.emit_magic_div_shift(i)
+            self._emit('.v_mdiv_u32_vs {}, {}, s_magic_{}, s_tmp+3, v_tmp'.format(v_q, v_n, i))
+        else:
+            self._emit('.v_u32_div_vs {}, {}, {}, v_tmp, s_tmp'.format(v_q, v_n, s_d))
+
+    def emit_div_ss(self, s_q, s_n, s_d, i):
+        if self.tunable.magic_div:
+            self.emit_magic_div_shift(i)
+            self._emit('.s_mdiv_u32_ss {}, {}, s_magic_{}, s_tmp+3, s_tmp'.format(s_q, s_n, i))
+        else:
+            self._emit('.v_u32_div_ss v_tmp+4, {}, {}, v_tmp, s_tmp'.format(s_n, s_d))
+            self._emit('v_readfirstlane_b32 s[{}], v[v_tmp+4]'.format(s_q))
+
+    def emit_block_index_swizzle(self):
+        '''
+        s_block_ik/s_block_ib of grouped order, same as v4r1_dynamic_swizzle_block_id(). group * b_block_work
+        and the last group are from host, a full group is split by shift, only the last one need a division
+        '''
+        group = self.tunable.swizzle_group
+        label_last = 'L_{}_swz_last'.format(self.name())
+        label_end = 'L_{}_swz_end'.format(self.name())
+        self._emit('; swizzle, {} k blocks in a group, k fastest in a group'.format(group))
+        self.emit_div_ss('s_tmp', 's_bx', 's_swz_group_work', 5)
+        self._emit('s_mul_i32 s[s_tmp+1], s[s_tmp], s[s_swz_group_work]')
+        self._emit('s_sub_i32 s[s_block_ib], s[s_bx], s[s_tmp+1]               ; index in group')
+        self._emit('s_lshl_b32 s[s_block_ik], s[s_tmp], {}                    ; first k block of group'.format(igemm_log2(group)))
+        self._emit('s_cmp_lt_u32 s[s_bx], s[s_swz_last_bid]')
+        self._emit('s_cbranch_scc0 {}'.format(label_last))
+        self._emit('s_lshr_b32 s[s_tmp], s[s_block_ib], {}'.format(igemm_log2(group)))
+        self._emit('s_and_b32 s[s_tmp+1], s[s_block_ib], {}'.format(group - 1))
+        self._emit('s_branch {}'.format(label_end))
+        self._emit_front('{}:'.format(label_last))
+        self.emit_div_ss('s_tmp', 's_block_ib', 's_swz_last_group_k', 6)
+        self._emit('s_mul_i32 s[s_tmp+1], s[s_tmp], s[s_swz_last_group_k]')
+        self._emit('s_sub_i32 s[s_tmp+1], s[s_block_ib], s[s_tmp+1]')
+        self._emit_front('{}:'.format(label_end))
+        self._emit('s_add_u32 s[s_tmp+1], s[s_block_ik], s[s_tmp+1]')
+        self._emit('s_lshl_b32 s[s_block_ik], s[s_tmp+1], {}'.format(igemm_log2(self.tunable.k_per_block)))
+        self._emit('s_lshl_b32 s[s_block_ib], s[s_tmp], {}'.format(igemm_log2(self.tunable.b_per_block)))
+
     def emit_kernel_prepare_phase(self):
         in_load = emit_in_load_e_n1_b_n2_t(self.mc, self.tunable)
         wei_load = emit_wei_load_e_k_t(self.mc, self.tunable)
@@ -779,13 +1310,34 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
         '''
         self._emit('s_load_dwordx4  s[s_p_in:s_p_in+3],         s[s_ka:s_ka+1],     0+k_p_in')
         self._emit('s_load_dwordx2  s[s_p_out:s_p_out+1],       s[s_ka:s_ka+1],     0+k_p_out')
-        self._emit('s_load_dwordx8  s[s_hi:s_hi+7],             s[s_ka:s_ka+1],     0+k_hi')
-        self._emit('s_load_dwordx4  s[s_stride_w:s_stride_w+3], s[s_ka:s_ka+1],     0+k_stride_w')
-        if self.tunable.is_1x1():
-            self._emit('s_load_dword  s[s_pad_w],                   s[s_ka:s_ka+1],     0+k_pad_w')
+        if self.tunable.kernarg_compact:
+            self._emit('s_load_dwordx16 s[s_hi:s_hi+15],            s[s_ka:s_ka+1],     0+k_hi')
         else:
-            self._emit('s_load_dwordx2  s[s_pad_w:s_pad_w+1],       s[s_ka:s_ka+1],     0+k_pad_w')
-            self._emit('s_load_dword    s[s_x],                     s[s_ka:s_ka+1],     0+k_x')
+            self._emit('s_load_dwordx8  s[s_hi:s_hi+7],             s[s_ka:s_ka+1],     0+k_hi')
+            self._emit('s_load_dwordx4  s[s_stride_w:s_stride_w+3], s[s_ka:s_ka+1],     0+k_stride_w')
+            if self.tunable.is_1x1():
+                self._emit('s_load_dword  s[s_pad_w],                   s[s_ka:s_ka+1],     0+k_pad_w')
+            else:
+                self._emit('s_load_dwordx2  s[s_pad_w:s_pad_w+1],       s[s_ka:s_ka+1],     0+k_pad_w')
+                self._emit('s_load_dword    s[s_x],                     s[s_ka:s_ka+1],     0+k_x')
+        if self.tunable.magic_div:
+            self._emit('s_load_dwordx4  s[s_magic_0:s_magic_0+3],   s[s_ka:s_ka+1],     0+k_magic_0')
+            if not self.tunable.is_1x1():
+                self._emit('s_load_dwordx2  s[s_magic_3:s_magic_3+1],   s[s_ka:s_ka+1],     0+k_magic_3')
+        if self.tunable.gemm_k_split:
+            self._emit('s_load_dword    s[s_split_c],               s[s_ka:s_ka+1],     0+k_split_c')
+        if self.tunable.bias:
+            self._emit('s_load_dwordx2  s[s_p_bias:s_p_bias+1],     s[s_ka:s_ka+1],     0+k_p_bias')
+        if self.tunable.activation == IGEMM_ACTIVATION_CLAMP:
+            self._emit('s_load_dwordx2  s[s_clamp_min:s_clamp_min+1], s[s_ka:s_ka+1],   0+k_clamp_min')
+        if self.tunable.slice_table:
+            self._emit('s_load_dwordx2  s[s_p_buf_tbl:s_p_buf_tbl+1], s[s_ka:s_ka+1],   0+k_p_slice_table')
+        if self.tunable.swizzle_group > 1:
+            self._emit('s_load_dwordx2  s[s_swz_group_work:s_swz_group_work+1], s[s_ka:s_ka+1], 0+k_swz_group_work')
+            self._emit('s_load_dword    s[s_swz_last_group_k],      s[s_ka:s_ka+1],     0+k_swz_last_group_k')
+            if self.tunable.magic_div:
+                self._emit('s_load_dwordx2  s[s_magic_5:s_magic_5+1],   s[s_ka:s_ka+1],     0+k_magic_5')
+                self._emit('s_load_dword    s[s_shift_pack_1],          s[s_ka:s_ka+1],     0+k_shift_pack_1')
         self._emit_empty_line()
 
         # calculate cluster pattern of input, -> ib, in2, in1, ie
@@ -850,22 +1402,28 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
             self._emit('v_mov_b32 v[v_wei_ik], 0')
 
         # if 1x1 case set v_flag = 1
-        if self.tunable.is_1x1():
+        if self.tunable.is_1x1() and not self.tunable.no_pad:
             self._emit('v_mov_b32 v[v_flag], 1')
 
         self._emit('s_waitcnt lgkmcnt(0)')
         self._emit_empty_line()
         self._emit('; calculate index')
-        self._emit('s_mul_i32 s[s_out_stride_k1], s[s_ho], s[s_wo]')
+        if not self.tunable.kernarg_compact:
+            self._emit('s_mul_i32 s[s_out_stride_k1], s[s_ho], s[s_wo]')
         self._emit('s_lshl_b32 s[s_out_stride_k0], s[s_out_stride_k1], {}'.format(
                                                         igemm_log2(self.tunable.gemm_m_per_thread_subc)+
                                                         igemm_log2(self.tunable.gemm_m_level0_cluster)+
                                                         igemm_log2(self.tunable.gemm_m_level1_cluster)) )
-        self._emit('s_mul_i32 s[s_out_stride_n2], s[s_k], s[s_out_stride_k1]')
+        if not self.tunable.kernarg_compact:
+            self._emit('s_mul_i32 s[s_out_stride_n2], s[s_k], s[s_out_stride_k1]')
         self._emit('s_lshl_b32 s[s_out_stride_n1], s[s_out_stride_n2], {}'.format(igemm_log2(self.tunable.gemm_n_per_thread_subc)))
         
         if self.tunable.is_1x1():
             self._emit_empty_line()
+        elif self.tunable.kernarg_compact:
+            # c*hi*wi and c*y*x are from host
+            self._emit('s_mul_i32 s[s_in_stride_c], s[s_hi], s[s_wi]')
+            self._emit('s_mul_i32 s[s_wei_stride_c], s[s_y], s[s_x]')
         else:
             self._emit('s_mul_i32 s[s_in_stride_c], s[s_hi], s[s_wi]')
             self._emit('s_mul_i32 s[s_in_stride_n2], s[s_c], s[s_in_stride_c]')
@@ -877,23 +1435,57 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
         self._emit('s_mov_b32 s[s_p_buf_in+3], 0x27000')
         self._emit('s_mov_b32 s[s_p_buf_wei+2], 0xffffffff')
         self._emit('s_mov_b32 s[s_p_buf_wei+3], 0x27000')
+        if self.tunable.slice_table:
+            self._emit('s_mov_b32 s[s_p_buf_tbl+2], 0xffffffff')
+            self._emit('s_mov_b32 s[s_p_buf_tbl+3], 0x27000')
         self._emit_empty_line()
+        if self.tunable.gemm_k_split:
+            self._emit('; gemm k split, workgroup id z is the split, c of it start from s_bz * s_split_c')
+            self._emit('s_mul_i32 s[s_tmp], s[s_bz], s[s_split_c]')
+            self._emit('s_mul_i32 s[s_tmp+1], s[s_hi], s[s_wi]')
+            self._emit('s_mul_i32 s[s_tmp+1], s[s_tmp+1], s[s_tmp]')
+            self._emit('s_lshl_b32 s[s_tmp+1], s[s_tmp+1], 2')
+            self._emit('s_add_u32 s[s_p_buf_in], s[s_p_buf_in], s[s_tmp+1]')
+            self._emit('s_addc_u32 s[s_p_buf_in+1], s[s_p_buf_in+1], 0')
+            if not self.tunable.is_1x1():
+                self._emit('s_mul_i32 s[s_tmp], s[s_tmp], s[s_wei_stride_c]')
+            self._emit('s_lshl_b32 s[s_tmp], s[s_tmp], 2')
+            self._emit('s_add_u32 s[s_p_buf_wei], s[s_p_buf_wei], s[s_tmp]')
+            self._emit('s_addc_u32 s[s_p_buf_wei+1], s[s_p_buf_wei+1], 0')
+            self._emit_empty_line()
         self._emit('; block k, b index on global')
-        # N0 = N / (N1 * N2)
-        self._emit('s_lshr_b32 s[s_tmp], s[s_n], {}'.format(
-                            igemm_log2(self.tunable.gemm_n_repeat) + igemm_log2(self.tunable.gemm_n_per_thread_subc)))
-        # B = N0 * Ho * Wo')
-        self._emit('s_mul_i32 s[s_tmp+1], s[s_out_stride_k1], s[s_tmp]')
-        # BBlockWork = B / BPerBlock')
-        self._emit('s_lshr_b32 s[0], s[s_tmp+1], {}'.format(igemm_log2(self.tunable.b_per_block)) )
-        # KBlockID, BBlockID')
-        self._emit('.v_u32_div_ss v_tmp+5, s_bx, 0, v_tmp, s_tmp')
-        self._emit('v_readfirstlane_b32 s[s_tmp], v[v_tmp+5]')
-        self._emit('s_mul_i32 s[s_tmp+2], s[s_tmp], s[0]')
-        self._emit('s_sub_i32 s[s_tmp+1], s[s_bx], s[s_tmp+2]')
-        self._emit('s_lshl_b32 s[s_block_ik], s[s_tmp], {}'.format(igemm_log2(self.tunable.k_per_block)))
-        self._emit('s_lshl_b32 s[s_block_ib], s[s_tmp+1], {}'.format(igemm_log2(self.tunable.b_per_block)))
-        self._emit_empty_line()
+        if self.tunable.grid_2d:
+            # workgroup id x is BBlockID, y is KBlockID
+            self._emit('s_lshl_b32 s[s_block_ik], s[s_by], {}'.format(igemm_log2(self.tunable.k_per_block)))
+            self._emit('s_lshl_b32 s[s_block_ib], s[s_bx], {}'.format(igemm_log2(self.tunable.b_per_block)))
+            self._emit_empty_line()
+        elif self.tunable.swizzle_group > 1:
+            self.emit_block_index_swizzle()
+            self._emit_empty_line()
+        else:
+            if self.tunable.kernarg_compact:
+                # BBlockWork is from host
+                s_b_block_work = 's_b_block_work'
+            else:
+                # N0 = N / (N1 * N2)
+                self._emit('s_lshr_b32 s[s_tmp], s[s_n], {}'.format(
+                                    igemm_log2(self.tunable.gemm_n_repeat) + igemm_log2(self.tunable.gemm_n_per_thread_subc)))
+                # B = N0 * Ho * Wo')
+                self._emit('s_mul_i32 s[s_tmp+1], s[s_out_stride_k1], s[s_tmp]')
+                # BBlockWork = B / BPerBlock')
+                self._emit('s_lshr_b32 s[0], s[s_tmp+1], {}'.format(igemm_log2(self.tunable.b_per_block)) )
+                s_b_block_work = '0'
+            # KBlockID, BBlockID')
+            if self.tunable.magic_div:
+                self.emit_div_ss('s_tmp', 's_bx', s_b_block_work, 0)
+            else:
+                self._emit('.v_u32_div_ss v_tmp+5, s_bx, {}, v_tmp, s_tmp'.format(s_b_block_work))
+                self._emit('v_readfirstlane_b32 s[s_tmp], v[v_tmp+5]')
+            self._emit('s_mul_i32 s[s_tmp+2], s[s_tmp], s[{}]'.format(s_b_block_work))
+            self._emit('s_sub_i32 s[s_tmp+1], s[s_bx], s[s_tmp+2]')
+            self._emit('s_lshl_b32 s[s_block_ik], s[s_tmp], {}'.format(igemm_log2(self.tunable.k_per_block)))
+            self._emit('s_lshl_b32 s[s_block_ib], s[s_tmp+1], {}'.format(igemm_log2(self.tunable.b_per_block)))
+            self._emit_empty_line()
         '''
         input
 
@@ -926,10 +1518,10 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
         self._emit('; calculate input transform')
         self._emit('; e_n1_b_n2:b, transform: b -> n0*ho*wo')
         self._emit('v_add_u32 v[v_tmp+4], s[s_block_ib], v[v_in_ib]')
-        self._emit('.v_u32_div_vs v_in_in0, v_tmp+4, s_out_stride_k1, v_tmp, s_tmp')
+        self.emit_div_vs('v_in_in0', 'v_tmp+4', 's_out_stride_k1', 1)
         self._emit('v_mul_lo_u32 v[v_tmp], s[s_out_stride_k1], v[v_in_in0]')
         self._emit('v_sub_u32 v[v_tmp+4], v[v_tmp+4], v[v_tmp]')
-        self._emit('.v_u32_div_vs v_in_iho, v_tmp+4, s_wo, v_tmp, s_tmp')
+        self.emit_div_vs('v_in_iho', 'v_tmp+4', 's_wo', 2)
         self._emit('v_mul_lo_u32 v[v_tmp], s[s_wo], v[v_in_iho]')
         self._emit('v_sub_u32 v[v_in_iwo], v[v_tmp+4], v[v_tmp]')
         self._emit_empty_line()
@@ -937,41 +1529,60 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
 
         if not(self.tunable.is_1x1()):
             self._emit(';   1) transform e -> c*y*x')
-            self._emit('.v_u32_div_vs v_in_ic, v_in_ie, s_wei_stride_c, v_tmp, s_tmp')
+            self.emit_div_vs('v_in_ic', 'v_in_ie', 's_wei_stride_c', 3)
             self._emit('v_mul_lo_u32 v[v_tmp], s[s_wei_stride_c], v[v_in_ic]')
             self._emit('v_sub_u32 v[v_tmp+4], v[v_in_ie], v[v_tmp]')
-            self._emit('.v_u32_div_vs v_in_iy, v_tmp+4, s_x, v_tmp, s_tmp')
+            self.emit_div_vs('v_in_iy', 'v_tmp+4', 's_x', 4)
             self._emit('v_mul_lo_u32 v[v_tmp], s[s_x], v[v_in_iy]')
             self._emit('v_sub_u32 v[v_in_ix], v[v_tmp+4], v[v_tmp]')
+            if self.tunable.slice_table:
+                self._emit('v_lshlrev_b32 v[v_in_tbl+1], 4, v[v_tmp+4]    ; step of phase iy*x+ix in the table')
             self._emit_empty_line()
 
         self._emit(';   2) transform iho, iwo, iy, ix -> hip, wip')
         if self.tunable.is_1x1():
-            self._emit('v_mul_lo_u32 v[v_in_iho], s[s_stride_h], v[v_in_iho]')
-            self._emit('v_mul_lo_u32 v[v_in_iwo], s[s_stride_w], v[v_in_iwo]')
+            if self.tunable.unit_stride:
+                self._emit(';   stride is 1')
+            else:
+                self._emit('v_mul_lo_u32 v[v_in_iho], s[s_stride_h], v[v_in_iho]')
+                self._emit('v_mul_lo_u32 v[v_in_iwo], s[s_stride_w], v[v_in_iwo]')
+            hip, wip = None, None
+        elif self.tunable.unit_stride:
+            self._emit(';   stride and dilation are 1')
+            hip, wip = ('v_in_iho', 'v_in_iy'), ('v_in_iwo', 'v_in_ix')
         else:
             self._emit('v_mul_lo_u32 v[v_tmp], s[s_stride_h], v[v_in_iho]')
             self._emit('v_mul_lo_u32 v[v_tmp+1], s[s_stride_w], v[v_in_iwo]')
             self._emit('v_mul_lo_u32 v[v_tmp+2], s[s_dilation_h], v[v_in_iy]')
             self._emit('v_mul_lo_u32 v[v_tmp+3], s[s_dilation_w], v[v_in_ix]')
+            hip, wip = ('v_tmp', 'v_tmp+2'), ('v_tmp+1', 'v_tmp+3')
         self._emit_empty_line()
 
         self._emit(';   3) transform hip, wip -> hi, wi')
         if self.tunable.is_1x1():
-            self._emit('v_sub_i32 v[v_in_iho], v[v_in_iho], s[s_pad_h]')
-            self._emit('v_sub_i32 v[v_in_iwo], v[v_in_iwo], s[s_pad_w]')
+            if self.tunable.no_pad:
+                self._emit(';   pad is 0')
+            else:
+                self._emit('v_sub_i32 v[v_in_iho], v[v_in_iho], s[s_pad_h]')
+                self._emit('v_sub_i32 v[v_in_iwo], v[v_in_iwo], s[s_pad_w]')
+        elif self.tunable.no_pad:
+            self._emit('v_add_u32 v[v_in_ihi], v[{}], v[{}]'.format(*hip))
+            self._emit('v_add_u32 v[v_in_iwi], v[{}], v[{}]'.format(*wip))
         else:
-            self._emit('v_add_u32 v[v_tmp], v[v_tmp], v[v_tmp+2]')
-            self._emit('v_add_u32 v[v_tmp+1], v[v_tmp+1], v[v_tmp+3]')
+            self._emit('v_add_u32 v[v_tmp], v[{}], v[{}]'.format(*hip))
+            self._emit('v_add_u32 v[v_tmp+1], v[{}], v[{}]'.format(*wip))
             self._emit('v_sub_i32 v[v_in_ihi], v[v_tmp], s[s_pad_h]')
             self._emit('v_sub_i32 v[v_in_iwi], v[v_tmp+1], s[s_pad_w]')
             
         self._emit_empty_line()
         
-        self._emit('; set input flag')
-        if self.tunable.is_1x1():
+        if self.tunable.no_pad:
+            self._emit('; no input flag, pad is 0')
+        elif self.tunable.is_1x1():
+            self._emit('; set input flag')
             self._emit('.v_in_set_flag v_flag, v_in_iho, v_in_iwo, s_hi, s_wi, s_tmp')    
         else:
+            self._emit('; set input flag')
             self._emit('.v_in_set_flag v_flag, v_in_ihi, v_in_iwi, s_hi, s_wi, s_tmp')
         self._emit_empty_line()
 
@@ -981,9 +1592,12 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
             self._emit('s_mul_i32 s[s_tmp+1], s[s_wi], s[s_hi]')
             self._emit('v_add_u32 v[v_in_os], v[v_in_os], v[v_in_iwo]')
             self._emit('s_lshl_b32 s[s_in_stride], s[s_tmp+1], {}+2'.format(igemm_log2(self.tunable.e_per_block)))
+            if self.tunable.in_block_copy_sub_lengths_e != 1:
+                self._emit('s_lshl_b32 s[s_in_stride_e], s[s_tmp+1], 2')
             self._emit('v_lshl_add_u32 v[v_tmp+1], v[v_in_in0], {}, v[v_in_in2]'.format(igemm_log2(self.tunable.gemm_n_repeat) + igemm_log2(self.tunable.gemm_n_per_thread_subc)))
             self._emit('v_lshl_add_u32 v[v_tmp+1], v[v_in_in1], {}, v[v_tmp+1]'.format(igemm_log2(self.tunable.gemm_n_per_thread_subc)))
-            self._emit('s_mul_i32 s[s_in_stride_n2], s[s_tmp+1], s[s_c]')
+            if not self.tunable.kernarg_compact:
+                self._emit('s_mul_i32 s[s_in_stride_n2], s[s_tmp+1], s[s_c]')
             self._emit('v_mul_lo_u32 v[v_tmp], s[s_in_stride_n2], v[v_tmp+1]')
             self._emit('v_add_u32 v[v_in_os], v[v_in_os], v[v_tmp]')
             self._emit(';   v_in_os: offset, v_flag: is valid')
@@ -1014,20 +1628,20 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
 
         #; load input from global
         self._emit('; load input from global')
-        self._emit(in_load('v_gld_b', 's_p_buf_in', 'v_in_os', 's_in_stride_n1', 's_in_stride_n2', 'v_flag', 's_tmp'))
+        self._emit(in_load('v_gld_b', 's_p_buf_in', 'v_in_os', 's_in_stride_n1', 's_in_stride_n2', 's_in_stride_e', 'v_flag', 's_tmp'))
         self._emit_empty_line()
 
         if self.tunable.is_1x1():
             self._emit('; calculate SliceWindow e=c*y*x. for 1x1 case, it is not nacessary')
+        elif self.tunable.slice_table:
+            self._emit('; calculate SliceWindow e=c*y*x. step of input is from slice table')
         else:
             self._emit('; calculate SliceWindow e=c*y*x. this is same for both input/weight')
             self._emit('s_mov_b32 s[1], {}'.format(self.tunable.e_per_block))
-            self._emit('.v_u32_div_ss v_tmp+4, 1, s_wei_stride_c, v_tmp, s_tmp')
-            self._emit('v_readfirstlane_b32 s[s_in_ic], v[v_tmp+4]')
+            self.emit_div_ss('s_in_ic', '1', 's_wei_stride_c', 3)
             self._emit('s_mul_i32 s[s_tmp], s[s_wei_stride_c], s[s_in_ic]')
             self._emit('s_sub_i32 s[1], s[1], s[s_tmp]')
-            self._emit('.v_u32_div_ss v_tmp+4, 1, s_x, v_tmp, s_tmp')
-            self._emit('v_readfirstlane_b32 s[s_in_iy], v[v_tmp+4]')
+            self.emit_div_ss('s_in_iy', '1', 's_x', 4)
             self._emit('s_mul_i32 s[s_tmp], s[s_x], s[s_in_iy]')
             self._emit('s_sub_i32 s[s_in_ix], s[1], s[s_tmp]')
 
@@ -1078,10 +1692,12 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
         if self.tunable.is_1x1():
             self._emit('; weight offset and diff')
             self._emit('v_add_u32 v[v_tmp], s[s_block_ik], v[v_wei_ik]')
-            self._emit('v_mul_lo_u32 v[v_wei_os], s[s_c], v[v_tmp]')
+            # c*y*x is c for 1x1
+            s_c = 's_wei_stride_k' if self.tunable.kernarg_compact else 's_c'
+            self._emit('v_mul_lo_u32 v[v_wei_os], s[{}], v[v_tmp]'.format(s_c))
             self._emit('v_add_u32 v[v_tmp], v[v_wei_os], v[v_wei_ie]')
             self._emit('v_lshlrev_b32 v[v_wei_os], 2, v[v_tmp]')
-            self._emit('s_lshl_b32 s[s_wei_stride_k], s[s_c], 2')
+            self._emit('s_lshl_b32 s[s_wei_stride_k], s[{}], 2'.format(s_c))
             self._emit('s_mov_b32 s[s_wei_stride], {}*4'.format(self.tunable.e_per_block))
         else:
             self._emit('; calculate weight transform')
@@ -1094,6 +1710,7 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
 
         self._emit('; load wei from global')
         self._emit(wei_load('v_gld_a', 's_p_buf_wei', 'v_wei_os', 's_wei_stride_k', 's_tmp'))
+        self.emit_in_slice_table_load()
         self._emit_empty_line()
         '''
         ; out diff
@@ -1101,26 +1718,35 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
         ; k_thread_data_on_global / K1
         ; k_thread_data_on_global % K1
         '''
+        if self.tunable.vector_store:
+            self.emit_kernel_out_vector_prepare()
         self._emit('; calculate out index ik0, ik1, ib')
         self._emit('v_lshlrev_b32 v[v_tmp+1], {}, v[v_gemm_im]'.format(igemm_log2(self.tunable.gemm_m_per_thread_subc)))
         self._emit('v_add_u32 v[v_tmp], s[s_block_ik], v[v_tmp+1]')
+        if self.tunable.bias:
+            self._emit('v_lshlrev_b32 v[v_bias_os], 2, v[v_tmp]')
         self._emit('v_lshrrev_b32 v[v_out_ik0], {}, v[v_tmp]'.format(igemm_log2(self.tunable.gemm_m_per_thread_subc) + igemm_log2(self.tunable.gemm_m_level0_cluster) + igemm_log2(self.tunable.gemm_m_level1_cluster)))
         self._emit('v_and_b32 v[v_out_ik1], {}, v[v_tmp]'.format((self.tunable.gemm_m_per_thread_subc * self.tunable.gemm_m_level0_cluster * self.tunable.gemm_m_level1_cluster) - 1))
         self._emit_empty_line()
         # b_thread_data_on_global = b_block_data_on_global + c_thread_mtx_on_block.col / N2
         self._emit('v_add_u32 v[v_out_ib], s[s_block_ib], v[v_gemm_in]')
-        self._emit('.v_u32_div_vs v_tmp+4, v_out_ib, s_out_stride_k1, v_tmp, s_tmp')
+        self.emit_div_vs('v_tmp+4', 'v_out_ib', 's_out_stride_k1', 1)
         self._emit('v_mul_lo_u32 v[v_tmp+1], s[s_out_stride_k1], v[v_tmp+4]')
         self._emit('v_sub_u32 v[v_tmp+5], v[v_out_ib], v[v_tmp+1]')
-        self._emit('.v_u32_div_vs v_tmp+6, v_tmp+5, s_wo, v_tmp, s_tmp')
+        self.emit_div_vs('v_tmp+6', 'v_tmp+5', 's_wo', 2)
         self._emit('v_mul_lo_u32 v[v_tmp+1], s[s_wo], v[v_tmp+6]')
         self._emit('v_sub_u32 v[v_tmp+5], v[v_tmp+5], v[v_tmp+1]')
         self._emit('; v_tmp+4:n0, v_tmp+6:ho, v_tmp+5:wo')
         self._emit_empty_line()
         self._emit('v_mul_lo_u32 v[v_tmp], s[s_wo], v[v_tmp+6]')
-        self._emit('s_mul_i32 s[s_tmp], s[s_k], s[s_out_stride_k1]')
-        self._emit('v_add_u32 v[v_out_os], v[v_tmp], v[v_tmp+5]')
-        self._emit('s_lshl_b32 s[s_tmp+1], s[s_tmp], {}'.format(igemm_log2(self.tunable.gemm_n_repeat) + igemm_log2(self.tunable.gemm_n_per_thread_subc)))
+        if self.tunable.kernarg_compact:
+            # k*ho*wo is not yet scaled by 4 here
+            self._emit('v_add_u32 v[v_out_os], v[v_tmp], v[v_tmp+5]')
+            self._emit('s_lshl_b32 s[s_tmp+1], s[s_out_stride_n2], {}'.format(igemm_log2(self.tunable.gemm_n_repeat) + igemm_log2(self.tunable.gemm_n_per_thread_subc)))
+        else:
+            self._emit('s_mul_i32 s[s_tmp], s[s_k], s[s_out_stride_k1]')
+            self._emit('v_add_u32 v[v_out_os], v[v_tmp], v[v_tmp+5]')
+            self._emit('s_lshl_b32 s[s_tmp+1], s[s_tmp], {}'.format(igemm_log2(self.tunable.gemm_n_repeat) + igemm_log2(self.tunable.gemm_n_per_thread_subc)))
         self._emit('v_mul_lo_u32 v[v_tmp], s[s_tmp+1], v[v_tmp+4]')
         self._emit('v_add_u32 v[v_out_os], v[v_out_os], v[v_tmp]')
         self._emit_empty_line()
@@ -1154,12 +1780,36 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
         self._emit('.v_clear_nc v_c, {}'.format(self.tunable.num_accumulate_c_vgpr))
         self._emit_empty_line()
 
+    def emit_in_move_slice_window(self):
+        '''
+        non 1x1 only. carry ic, iy, ix by the step in s_in_ic, s_in_iy, s_in_ix, or add the step of current phase
+        from slice table
+        '''
+        in_move_slice_window = emit_in_move_slice_window_t(self.mc, self.tunable)
+        if self.tunable.slice_table:
+            self._emit(in_move_slice_window.call_table('v_in_os', 'v_in_ihi', 'v_in_iwi', 'v_flag', 's_hi', 's_wi', 'v_in_tbl', 's_tmp'))
+        else:
+            self._emit(in_move_slice_window('v_in_os', 'v_in_ic', 'v_in_iy', 'v_in_ix', 'v_in_ihi', 'v_in_iwi', 'v_flag',
+                        's_hi', 's_wi', 's_y', 's_x', 's_in_stride_c', 's_dilation_h', 's_dilation_w', 's_in_ic', 's_in_iy', 's_in_ix', 'v_idc', 'v_idy', 'v_idx', 's_tmp'))
+
+    def emit_in_slice_table_load(self):
+        '''
+        load step of next phase into v_in_tbl, at offset v_in_tbl+1. issued right after the global load of weight,
+        s_waitcnt vmcnt(wei_issues) before input sst still cover the input, vmcnt(0) before move cover this
+        '''
+        if not self.tunable.slice_table:
+            return
+        if self.tunable.no_pad:
+            self._emit('buffer_load_dwordx2 v[v_in_tbl:v_in_tbl+1], v[v_in_tbl+1], s[s_p_buf_tbl:s_p_buf_tbl+3], 0 offen')
+        else:
+            self._emit('buffer_load_dwordx4 v[v_in_tbl:v_in_tbl+3], v[v_in_tbl+1], s[s_p_buf_tbl:s_p_buf_tbl+3], 0 offen')
+
     def emit_kernel_fma_body(self):
-        def fma_main_loop_sub_2x2_double_buffer():
+        def fma_main_loop_sub_tile_double_buffer():
             '''
-            implement fma main loop with 2x2 sub buffer
-            4x4, 4x6, 4x8, 6x4, 6x6, 6x8, 8x4, 8x6, 8x8
-            other tile size may also useful, but can't form 2x2 sub buffer
+            implement fma main loop of gemm_m_repeat x gemm_n_repeat sub-tiles
+            sub-tile of a/b is read from LDS for next k once fma of this k is done with it, so
+            reads are overlapped with fma. 2x2 repeat read a0, b0, b1, a1 as the old 2x2 sub buffer
             '''
             kernel_name = self.name()
             label_fma_body = 'L_{}_fma_body'.format(kernel_name)
@@ -1168,7 +1818,6 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
             wei_issues = self.tunable.wei_block_copy_sub_lengths_k
             in_sst = emit_in_sst_e_n1_b_n2_t(self.mc, self.tunable)
             wei_sst = emit_wei_sst_e_k_t(self.mc, self.tunable)
-            in_move_slice_window = emit_in_move_slice_window_t(self.mc, self.tunable)
             wei_move_slice_window = emit_wei_move_slice_window_t(self.mc, self.tunable)
             in_load = emit_in_load_e_n1_b_n2_t(self.mc, self.tunable)
             wei_load = emit_wei_load_e_k_t(self.mc, self.tunable)
@@ -1183,6 +1832,8 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
             tile_n = self.tunable.thread_tile_n
             sub_tile_m = self.tunable.thread_sub_tile_m
             sub_tile_n = self.tunable.thread_sub_tile_n
+            repeat_m = self.tunable.gemm_m_repeat
+            repeat_n = self.tunable.gemm_n_repeat
             local_a = gpr_t('v_a')
             local_b = gpr_t('v_b')
             local_c = gpr_t('v_c')
@@ -1190,13 +1841,85 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
 
             fma_sub_tile = emit_fma_mxn_t(self.mc, self.tunable.thread_sub_tile_m, self.tunable.thread_sub_tile_n, self.tunable.thread_tile_n)
 
-            assert tile_m == 4 or tile_m == 6 or tile_m == 8
-            assert tile_n == 4 or tile_n == 6 or tile_n == 8
-            assert tile_m == sub_tile_m * 2
-            assert tile_n == sub_tile_n * 2
-
-            ds_read_a = ds_read_t(sub_tile_m * 4)
-            ds_read_b = ds_read_t(sub_tile_n * 4)
+            # a sub-tile is read by one or more ds_read, see amdgpu_ds_read_split()
+            ds_read_a = amdgpu_ds_read_split(sub_tile_m * 4)
+            ds_read_b = amdgpu_ds_read_split(sub_tile_n * 4)
+            lgkmcnt_max = 15
+
+            # fma of sub-tile (i_m, i_n), row by row. a of i_m is free after (i_m, repeat_n-1), b of i_n
+            # after (repeat_m-1, i_n). read of next k is issued in the order they are free, b first if
+            # both are free after the same fma. so reads in LDS queue are always in read_order
+            fma_list = [(i_m, i_n) for i_m in range(repeat_m) for i_n in range(repeat_n)]
+            free_at = dict()
+            for i_n in range(repeat_n):
+                free_at[('b', i_n)] = fma_list.index((repeat_m - 1, i_n))
+            for i_m in range(repeat_m):
+                free_at[('a', i_m)] = fma_list.index((i_m, repeat_n - 1))
+            read_order = sorted(free_at, key = lambda r: (free_at[r], r[0] == 'a', r[1]))
+
+            # fma of last unroll before LDS store of next loop, rest are after barrier
+            fma_before_sst = len(fma_list) // 2
+
+            class lds_queue_t(object):
+                '''
+                issued and not yet waited LDS instructions, by tag
+                '''
+                def __init__(self):
+                    self.tags = []
+                def issue(self, tag, count = 1):
+                    self.tags.extend([tag] * count)
+                def wait(self, *tags):
+                    '''
+                    lgkmcnt need for all of tags, or None if they are already done
+                    '''
+                    pending = [i for i, t in enumerate(self.tags) if t in tags]
+                    if not pending:
+                        return None
+                    cnt = min(len(self.tags) - pending[-1] - 1, lgkmcnt_max)
+                    self.tags = self.tags[len(self.tags) - cnt:]
+                    return cnt
+
+            def emit_read(queue, r, itr_k_offset):
+                ab, i = r
+                if ab == 'a':
+                    pieces, local, lds_base, lds_width, sub_tile, repeat, v_sld = ds_read_a, local_a, lds_base_m, lds_width_m, sub_tile_m, repeat_m, 'v_sld_a_os'
+                else:
+                    pieces, local, lds_base, lds_width, sub_tile, repeat, v_sld = ds_read_b, local_b, lds_base_n, lds_width_n, sub_tile_n, repeat_n, 'v_sld_b_os'
+                for ds_read, byte_offset in pieces:
+                    offset = i * lds_width // repeat + byte_offset
+                    if itr_k_offset:
+                        offset = '{}+(.itr_k+1)*{}'.format(lds_base, lds_width) + ('+{}'.format(offset) if offset != 0 else '')
+                    else:
+                        offset = lds_base + offset
+                    self._emit(ds_read(local(i * sub_tile + byte_offset // 4), v_sld, offset))
+                queue.issue(r, len(pieces))
+
+            def emit_fma(queue, f, empty_line = True):
+                i_m, i_n = fma_list[f]
+                cnt = queue.wait(('a', i_m), ('b', i_n))
+                if cnt is not None:
+                    self._emit('s_waitcnt lgkmcnt({})'.format(cnt))
+                self._emit(fma_sub_tile(local_c(i_m * sub_tile_m * tile_n + i_n * sub_tile_n), local_a(i_m * sub_tile_m), local_b(i_n * sub_tile_n)))
+                if empty_line:
+                    self._emit_empty_line()
+
+            def emit_unroll_k(queue):
+                '''
+                read of first k, and fma of unroll_k-1 k with read of next k. queue is of last k after it
+                '''
+                for r in read_order:
+                    emit_read(queue, r, False)
+                self._emit('.itr_k = 0')
+                self._emit('.rept {}'.format(unroll_k-1))
+                with self._indent_context():
+                    for f in range(len(fma_list)):
+                        emit_fma(queue, f)
+                        for r in read_order:
+                            if free_at[r] == f:
+                                emit_read(queue, r, True)
+                    self._emit('.itr_k = .itr_k + 1')
+                self._emit('.endr')
+                self._emit_empty_line()
 
             # start emit
             self._emit('; start FMA loop, {}x{} thread tile with {}x{} sub-tile'.format(
@@ -1209,7 +1932,22 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
             self._emit(wei_sst('v_gld_a', 'v_sst_a_os'))
             self._emit_empty_line()
 
-            if self.tunable.is_1x1():
+            if self.tunable.gemm_k_split:
+                self._emit('; E = C / split * Y * X')
+                if self.tunable.is_1x1():
+                    self._emit('s_sub_i32 s[s_kitr], s[s_split_c], {}'.format(unroll_k))
+                else:
+                    self._emit('s_mul_i32 s[s_tmp], s[s_split_c], s[s_wei_stride_c]')
+                    self._emit('s_sub_i32 s[s_kitr], s[s_tmp], {}'.format(unroll_k))
+                self._emit('s_cmp_gt_i32 s[s_kitr], 0')
+                self._emit('s_cbranch_scc0 {}'.format(label_fma_end))
+            elif self.tunable.kernarg_compact:
+                self._emit('; E = C * Y * X, s_wei_stride_k is already in byte')
+                self._emit('s_lshr_b32 s[s_tmp], s[s_wei_stride_k], 2')
+                self._emit('s_sub_i32 s[s_kitr], s[s_tmp], {}'.format(unroll_k))
+                self._emit('s_cmp_gt_i32 s[s_kitr], 0')
+                self._emit('s_cbranch_scc0 {}'.format(label_fma_end))
+            elif self.tunable.is_1x1():
                 self._emit('; E = C * 1 * 1')
                 self._emit('s_sub_i32 s[s_kitr], s[s_c], {}'.format(unroll_k))
                 self._emit('s_cmp_gt_i32 s[s_kitr], 0')
@@ -1228,8 +1966,7 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
                 self._emit('s_add_u32 s[s_p_buf_wei], s[s_p_buf_wei], s[s_wei_stride]')
                 self._emit('s_addc_u32 s[s_p_buf_wei+1], s[s_p_buf_wei+1], 0')
             else:
-                self._emit(in_move_slice_window('v_in_os', 'v_in_ic', 'v_in_iy', 'v_in_ix', 'v_in_ihi', 'v_in_iwi', 'v_flag',
-                            's_hi', 's_wi', 's_y', 's_x', 's_in_stride_c', 's_dilation_h', 's_dilation_w', 's_in_ic', 's_in_iy', 's_in_ix', 'v_idc', 'v_idy', 'v_idx', 's_tmp'))
+                self.emit_in_move_slice_window()
                 self._emit(wei_move_slice_window('v_wei_os', 's_wei_stride'))
 
             self._emit('v_xor_b32 v[v_sst_b_os], {}, v[v_sst_b_os] ; switch double buffer b store'.format(hex(lds_single)))
@@ -1237,65 +1974,29 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
             self._emit('s_waitcnt lgkmcnt(0)')
             self._emit('s_barrier')
             self._emit_empty_line()
-            self._emit(in_load('v_gld_b', 's_p_buf_in', 'v_in_os', 's_in_stride_n1', 's_in_stride_n2', 'v_flag', 's_tmp'))
+            self._emit(in_load('v_gld_b', 's_p_buf_in', 'v_in_os', 's_in_stride_n1', 's_in_stride_n2', 's_in_stride_e', 'v_flag', 's_tmp'))
             self._emit(wei_load('v_gld_a', 's_p_buf_wei', 'v_wei_os', 's_wei_stride_k', 's_tmp'))
+            self.emit_in_slice_table_load()
             self._emit_empty_line()
 
             # Label: start of fma body
             self._emit_front('{}:'.format(label_fma_body))
             self._emit('; do fma accumulate with unroll {}'.format(unroll_k))
-            self._emit(ds_read_a(local_a(), 'v_sld_a_os', lds_base_m))
-            self._emit(ds_read_b(local_b(), 'v_sld_b_os', lds_base_n))
-            self._emit(ds_read_b(local_b(sub_tile_n), 'v_sld_b_os', lds_base_n + lds_width_n//2 ))
-            self._emit(ds_read_a(local_a(sub_tile_m), 'v_sld_a_os', lds_base_m + lds_width_m//2 ))
-            self._emit('.itr_k = 0')
-            self._emit('.rept {}'.format(unroll_k-1))
-            with self._indent_context():
-                # 1st fma
-                self._emit('s_waitcnt lgkmcnt(2)')
-                self._emit(fma_sub_tile(local_c(), local_a(), local_b()))
-                self._emit_empty_line()
-
-                # 2nd fma
-                self._emit('s_waitcnt lgkmcnt(1)')
-                self._emit(fma_sub_tile(local_c(sub_tile_n), local_a(), local_b(sub_tile_n)))
-                self._emit_empty_line()
-
-                # 3rd fma
-                self._emit(ds_read_a(local_a(), 'v_sld_a_os', '{}+(.itr_k+1)*{}'.format(lds_base_m, lds_width_m)))
-                self._emit('s_waitcnt lgkmcnt(1)')
-                self._emit(fma_sub_tile(local_c(sub_tile_m*tile_n), local_a(sub_tile_m), local_b()))
-                self._emit_empty_line()
-
-                # 4th fma
-                self._emit(ds_read_b(local_b(), 'v_sld_b_os', '{}+(.itr_k+1)*{}'.format(lds_base_n, lds_width_n)))
-                self._emit(fma_sub_tile(local_c(sub_tile_m*tile_n+sub_tile_n), local_a(sub_tile_m), local_b(sub_tile_n)))
-                self._emit_empty_line()
-
-                # last
-                self._emit(ds_read_b(local_b(sub_tile_n), 'v_sld_b_os', '{}+(.itr_k+1)*{}+{}'.format(lds_base_n, lds_width_n, lds_width_n//2)))
-                self._emit(ds_read_a(local_a(sub_tile_m), 'v_sld_a_os', '{}+(.itr_k+1)*{}+{}'.format(lds_base_m, lds_width_m, lds_width_m//2)))
-                self._emit('.itr_k = .itr_k + 1')
-            self._emit('.endr')
-            self._emit_empty_line()
+            queue = lds_queue_t()
+            emit_unroll_k(queue)
             self._emit('; last unroll')
             self._emit('v_xor_b32 v[v_sld_b_os], {}, v[v_sld_b_os] ; switch double buffer b load'.format(hex(lds_single)))
             self._emit('v_xor_b32 v[v_sld_a_os], {}, v[v_sld_a_os] ; switch double buffer a load'.format(hex(lds_single)))
-            # 1st fma
-            self._emit('s_waitcnt lgkmcnt(2)')
-            self._emit(fma_sub_tile(local_c(), local_a(), local_b()))
-            self._emit_empty_line()
-
-            # 2nd fma
-            self._emit('s_waitcnt lgkmcnt(1)')
-            self._emit(fma_sub_tile(local_c(sub_tile_n), local_a(), local_b(sub_tile_n)))
-            self._emit_empty_line()
+            for f in range(fma_before_sst):
+                emit_fma(queue, f)
 
             #       wait global and store to LDS
             self._emit('s_waitcnt vmcnt({})'.format(wei_issues))
             self._emit(in_sst('v_gld_b', 'v_sst_b_os'))
             self._emit('s_waitcnt vmcnt(0)')
             self._emit(wei_sst('v_gld_a', 'v_sst_a_os'))
+            queue.issue('sst', in_sst.get_issues() + wei_sst.get_issues())
+            queue_finishing = copy.deepcopy(queue)
 
             #       iteration--
             self._emit('s_sub_i32 s[s_kitr], s[s_kitr], {}'.format(unroll_k))
@@ -1310,93 +2011,41 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
                 self._emit('s_addc_u32 s[s_p_buf_wei+1], s[s_p_buf_wei+1], 0')
 
             else:
-                self._emit(in_move_slice_window('v_in_os', 'v_in_ic', 'v_in_iy', 'v_in_ix', 'v_in_ihi', 'v_in_iwi', 'v_flag',
-                            's_hi', 's_wi', 's_y', 's_x', 's_in_stride_c', 's_dilation_h', 's_dilation_w', 's_in_ic', 's_in_iy', 's_in_ix', 'v_idc', 'v_idy', 'v_idx', 's_tmp'))
+                self.emit_in_move_slice_window()
                 self._emit(wei_move_slice_window('v_wei_os', 's_wei_stride'))
 
-            # 3rd fma
-            self._emit('s_waitcnt lgkmcnt({})'.format(in_sst.get_issues() + wei_sst.get_issues()))
-            self._emit(fma_sub_tile(local_c(sub_tile_m*tile_n), local_a(sub_tile_m), local_b()))
-            self._emit_empty_line()
+            emit_fma(queue, fma_before_sst)
 
             self._emit('v_xor_b32 v[v_sst_b_os], {}, v[v_sst_b_os] ; switch double buffer b store'.format(hex(lds_single)))
             self._emit('v_xor_b32 v[v_sst_a_os], {}, v[v_sst_a_os] ; switch double buffer a store'.format(hex(lds_single)))
             #       barrier here!
             self._emit('s_waitcnt lgkmcnt(0)')
             self._emit('s_barrier')
+            queue = lds_queue_t()
 
             #       load next from global
-            self._emit(in_load('v_gld_b', 's_p_buf_in', 'v_in_os', 's_in_stride_n1', 's_in_stride_n2', 'v_flag', 's_tmp'))
+            self._emit(in_load('v_gld_b', 's_p_buf_in', 'v_in_os', 's_in_stride_n1', 's_in_stride_n2', 's_in_stride_e', 'v_flag', 's_tmp'))
             self._emit(wei_load('v_gld_a', 's_p_buf_wei', 'v_wei_os', 's_wei_stride_k', 's_tmp'))
+            self.emit_in_slice_table_load()
 
-            # 4th fma
-            self._emit(fma_sub_tile(local_c(sub_tile_m*tile_n+sub_tile_n), local_a(sub_tile_m), local_b(sub_tile_n)))
-            self._emit_empty_line()
+            for f in range(fma_before_sst + 1, len(fma_list)):
+                emit_fma(queue, f)
             self._emit('s_branch {}'.format(label_fma_body))
 
             # Label: finishing of fma body
             self._emit_front('{}:'.format(label_fma_finishing))
-            self._emit('s_waitcnt lgkmcnt({})'.format(in_sst.get_issues() + wei_sst.get_issues()))
-            self._emit(fma_sub_tile(local_c(sub_tile_m*tile_n), local_a(sub_tile_m), local_b()))
-            self._emit(fma_sub_tile(local_c(sub_tile_m*tile_n+sub_tile_n), local_a(sub_tile_m), local_b(sub_tile_n)))
+            for f in range(fma_before_sst, len(fma_list)):
+                emit_fma(queue_finishing, f, False)
 
             # Label: end of fma body
             self._emit_front('{}:'.format(label_fma_end))
             self._emit('s_waitcnt lgkmcnt(0)')
             self._emit('s_barrier')
-            self._emit(ds_read_a(local_a(), 'v_sld_a_os', lds_base_m))
-            self._emit(ds_read_b(local_b(), 'v_sld_b_os', lds_base_n))
-            self._emit(ds_read_b(local_b(sub_tile_n), 'v_sld_b_os', lds_base_n + lds_width_n//2 ))
-            self._emit(ds_read_a(local_a(sub_tile_m), 'v_sld_a_os', lds_base_m + lds_width_m//2 ))
-            self._emit('.itr_k = 0')
-            self._emit('.rept {}'.format(unroll_k - 1))
-            with self._indent_context():
-                # 1st fma
-                self._emit('s_waitcnt lgkmcnt(2)')
-                self._emit(fma_sub_tile(local_c(), local_a(), local_b()))
-                self._emit_empty_line()
-
-                # 2nd fma
-                self._emit('s_waitcnt lgkmcnt(1)')
-                self._emit(fma_sub_tile(local_c(sub_tile_n), local_a(), local_b(sub_tile_n)))
-                self._emit_empty_line()
-
-                # 3rd fma
-                self._emit(ds_read_a(local_a(), 'v_sld_a_os', '{}+(.itr_k+1)*{}'.format(lds_base_m, lds_width_m)))
-                self._emit('s_waitcnt lgkmcnt(1)')
-                self._emit(fma_sub_tile(local_c(sub_tile_m*tile_n), local_a(sub_tile_m), local_b()))
-                self._emit_empty_line()
-
-                # 4th fma
-                self._emit(ds_read_b(local_b(), 'v_sld_b_os', '{}+(.itr_k+1)*{}'.format(lds_base_n, lds_width_n)))
-                self._emit(fma_sub_tile(local_c(sub_tile_m*tile_n+sub_tile_n), local_a(sub_tile_m), local_b(sub_tile_n)))
-                self._emit_empty_line()
-
-                # last
-                self._emit(ds_read_b(local_b(sub_tile_n), 'v_sld_b_os', '{}+(.itr_k+1)*{}+{}'.format(lds_base_n, lds_width_n, lds_width_n//2)))
-                self._emit(ds_read_a(local_a(sub_tile_m), 'v_sld_a_os', '{}+(.itr_k+1)*{}+{}'.format(lds_base_m, lds_width_m, lds_width_m//2)))
-                self._emit('.itr_k = .itr_k + 1')
-            self._emit('.endr')
-            self._emit_empty_line()
+            queue = lds_queue_t()
+            emit_unroll_k(queue)
             self._emit('; last unroll')
-            # 1st fma
-            self._emit('s_waitcnt lgkmcnt(2)')
-            self._emit(fma_sub_tile(local_c(), local_a(), local_b()))
-            self._emit_empty_line()
-
-            # 2nd fma
-            self._emit('s_waitcnt lgkmcnt(1)')
-            self._emit(fma_sub_tile(local_c(sub_tile_n), local_a(), local_b(sub_tile_n)))
-            self._emit_empty_line()
-
-            # 3rd fma
-            self._emit('s_waitcnt lgkmcnt(0)')
-            self._emit(fma_sub_tile(local_c(sub_tile_m*tile_n), local_a(sub_tile_m), local_b()))
-            self._emit_empty_line()
-
-            # 4th fma
-            self._emit(fma_sub_tile(local_c(sub_tile_m*tile_n+sub_tile_n), local_a(sub_tile_m), local_b(sub_tile_n)))
-            self._emit_empty_line()
+            for f in range(len(fma_list)):
+                emit_fma(queue, f)
 
         def fma_main_loop_sub_2x2_double_buffer_double_local_prefetch():
             '''
@@ -1411,7 +2060,6 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
             wei_issues = self.tunable.wei_block_copy_sub_lengths_k
             in_sst = emit_in_sst_e_n1_b_n2_t(self.mc, self.tunable)
             wei_sst = emit_wei_sst_e_k_t(self.mc, self.tunable)
-            in_move_slice_window = emit_in_move_slice_window_t(self.mc, self.tunable)
             wei_move_slice_window = emit_wei_move_slice_window_t(self.mc, self.tunable)
             in_load = emit_in_load_e_n1_b_n2_t(self.mc, self.tunable)
             wei_load = emit_wei_load_e_k_t(self.mc, self.tunable)
@@ -1455,7 +2103,22 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
             self._emit(wei_sst('v_gld_a', 'v_sst_a_os'))
             self._emit_empty_line()
 
-            if self.tunable.is_1x1():
+            if self.tunable.gemm_k_split:
+                self._emit('; E = C / split * Y * X')
+                if self.tunable.is_1x1():
+                    self._emit('s_sub_i32 s[s_kitr], s[s_split_c], {}'.format(unroll_k))
+                else:
+                    self._emit('s_mul_i32 s[s_tmp], s[s_split_c], s[s_wei_stride_c]')
+                    self._emit('s_sub_i32 s[s_kitr], s[s_tmp], {}'.format(unroll_k))
+                self._emit('s_cmp_gt_i32 s[s_kitr], 0')
+                self._emit('s_cbranch_scc0 {}'.format(label_fma_end))
+            elif self.tunable.kernarg_compact:
+                self._emit('; E = C * Y * X, s_wei_stride_k is already in byte')
+                self._emit('s_lshr_b32 s[s_tmp], s[s_wei_stride_k], 2')
+                self._emit('s_sub_i32 s[s_kitr], s[s_tmp], {}'.format(unroll_k))
+                self._emit('s_cmp_gt_i32 s[s_kitr], 0')
+                self._emit('s_cbranch_scc0 {}'.format(label_fma_end))
+            elif self.tunable.is_1x1():
                 self._emit('; E = C * 1 * 1')
                 self._emit('s_sub_i32 s[s_kitr], s[s_c], {}'.format(unroll_k))
                 self._emit('s_cmp_gt_i32 s[s_kitr], 0')
@@ -1474,8 +2137,7 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
                 self._emit('s_add_u32 s[s_p_buf_wei], s[s_p_buf_wei], s[s_wei_stride]')
                 self._emit('s_addc_u32 s[s_p_buf_wei+1], s[s_p_buf_wei+1], 0')
             else:
-                self._emit(in_move_slice_window('v_in_os', 'v_in_ic', 'v_in_iy', 'v_in_ix', 'v_in_ihi', 'v_in_iwi', 'v_flag',
-                            's_hi', 's_wi', 's_y', 's_x', 's_in_stride_c', 's_dilation_h', 's_dilation_w', 's_in_ic', 's_in_iy', 's_in_ix', 'v_idc', 'v_idy', 'v_idx', 's_tmp'))
+                self.emit_in_move_slice_window()
                 self._emit(wei_move_slice_window('v_wei_os', 's_wei_stride'))
 
             self._emit('v_xor_b32 v[v_sst_b_os], {}, v[v_sst_b_os] ; switch double buffer b store'.format(hex(lds_single)))
@@ -1483,8 +2145,9 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
             self._emit('s_waitcnt lgkmcnt(0)')
             self._emit('s_barrier')
             self._emit_empty_line()
-            self._emit(in_load('v_gld_b', 's_p_buf_in', 'v_in_os', 's_in_stride_n1', 's_in_stride_n2', 'v_flag', 's_tmp'))
+            self._emit(in_load('v_gld_b', 's_p_buf_in', 'v_in_os', 's_in_stride_n1', 's_in_stride_n2', 's_in_stride_e', 'v_flag', 's_tmp'))
             self._emit(wei_load('v_gld_a', 's_p_buf_wei', 'v_wei_os', 's_wei_stride_k', 's_tmp'))
+            self.emit_in_slice_table_load()
             self._emit_empty_line()
 
             # Label: start of fma body
@@ -1606,8 +2269,7 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
                 self._emit('s_addc_u32 s[s_p_buf_wei+1], s[s_p_buf_wei+1], 0')
 
             else:
-                self._emit(in_move_slice_window('v_in_os', 'v_in_ic', 'v_in_iy', 'v_in_ix', 'v_in_ihi', 'v_in_iwi', 'v_flag',
-                            's_hi', 's_wi', 's_y', 's_x', 's_in_stride_c', 's_dilation_h', 's_dilation_w', 's_in_ic', 's_in_iy', 's_in_ix', 'v_idc', 'v_idy', 'v_idx', 's_tmp'))
+                self.emit_in_move_slice_window()
                 self._emit(wei_move_slice_window('v_wei_os', 's_wei_stride'))
 
             # 3rd fma
@@ -1622,8 +2284,9 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
             self._emit('s_barrier')
 
             #       load next from global
-            self._emit(in_load('v_gld_b', 's_p_buf_in', 'v_in_os', 's_in_stride_n1', 's_in_stride_n2', 'v_flag', 's_tmp'))
+            self._emit(in_load('v_gld_b', 's_p_buf_in', 'v_in_os', 's_in_stride_n1', 's_in_stride_n2', 's_in_stride_e', 'v_flag', 's_tmp'))
             self._emit(wei_load('v_gld_a', 's_p_buf_wei', 'v_wei_os', 's_wei_stride_k', 's_tmp'))
+            self.emit_in_slice_table_load()
 
             # 4th fma
             self._emit(fma_sub_tile(local_c(sub_tile_m*tile_n+sub_tile_n), local_a1(sub_tile_m), local_b1(sub_tile_n)))
@@ -1747,15 +2410,210 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
         if IGEMM_EXPERIMENTAL_DOUBLE_LOCAL_PREFETCH:
             fma_main_loop_sub_2x2_double_buffer_double_local_prefetch()
         else:
-            fma_main_loop_sub_2x2_double_buffer()
+            fma_main_loop_sub_tile_double_buffer()
+
+    def emit_kernel_writeout_atomic_add(self):
+        '''
+        add to output with buffer_atomic_cmpswap, gfx906 has no float atomic add. same order and
+        offset as .v_write4d_strided. output is zero filled by host, so 0 is the first guess of
+        the old value. every thread is active here, exec is all 1 after each loop.
+        v_tmp may overlap v_c, the pair of new/old value is in v_a which is free after fma, igemm_tunable_parameter_t
+        make sure v_a has 2 vgpr at least
+        '''
+        t_n2, t_n1, t_k1, t_k0 = self.tunable.gemm_n_per_thread_subc, self.tunable.gemm_n_repeat, \
+                    self.tunable.gemm_m_per_thread_subc, self.tunable.gemm_m_repeat
+        v_cas = 'v_a0' if IGEMM_EXPERIMENTAL_DOUBLE_LOCAL_PREFETCH else 'v_a'
+        strides = ['s_out_stride_n2', 's_out_stride_n1', 's_out_stride_k1', 's_out_stride_k0']
+        self._emit('; gemm k split, add to output')
+        for i in range(t_n2 * t_n1 * t_k1 * t_k0):
+            label = 'L_{}_atomic_add_{}'.format(self.name(), i)
+            self._emit('v_mov_b32 v[{}+1], 0'.format(v_cas))
+            self._emit_front('{}:'.format(label))
+            self._emit('v_add_f32 v[{0}], v[{0}+1], v[v_c+{1}]'.format(v_cas, i))
+            self._emit('buffer_atomic_cmpswap v[{0}:{0}+1], v[v_out_os], s[s_p_buf_out:s_p_buf_out+3], s[s_tmp] offen glc'.format(v_cas))
+            self._emit('s_waitcnt vmcnt(0)')
+            self._emit('v_cmp_ne_u32 vcc, v[{0}], v[{0}+1]'.format(v_cas))
+            self._emit('v_mov_b32 v[{0}+1], v[{0}]'.format(v_cas))
+            self._emit('s_and_b64 exec, exec, vcc')
+            self._emit('s_cbranch_execnz {}'.format(label))
+            self._emit('s_mov_b64 exec, -1')
+            # move to next element, dim of n2 is the fastest
+            for d, dim in enumerate([t_n2, t_n1, t_k1, t_k0]):
+                index = i
+                for t in [t_n2, t_n1, t_k1, t_k0][:d]:
+                    index //= t
+                if index % dim != dim - 1:
+                    s_dst_os = ['s_tmp', 's_tmp+1', 's_tmp+2', 's_tmp+3']
+                    self._emit('s_add_u32 s[{}], s[{}], s[{}]'.format(s_dst_os[d], s_dst_os[d], strides[d]))
+                    for j in reversed(range(d)):
+                        self._emit('s_mov_b32 s[{}], s[{}]'.format(s_dst_os[j], s_dst_os[j + 1]))
+                    break
+
+    def emit_kernel_writeout_epilogue(self):
+        '''
+        add bias of k then activation, on v_c right before store. v_c is k0, k1, n1, n2 from slowest, bias of
+        k0 is t_k1 continuous floats at v_bias_os + k0 * k1 stride, loaded into v_a which is free after fma.
+        s_p_buf_wei is also free, is the buffer resource of bias
+        '''
+        t_n2, t_n1, t_k1, t_k0 = self.tunable.gemm_n_per_thread_subc, self.tunable.gemm_n_repeat, \
+                    self.tunable.gemm_m_per_thread_subc, self.tunable.gemm_m_repeat
+        v_bias = 'v_a0' if IGEMM_EXPERIMENTAL_DOUBLE_LOCAL_PREFETCH else 'v_a'
+        self._emit('; epilogue, bias:{}, activation:{}'.format(self.tunable.bias, IGEMM_ACTIVATION_NAME[self.tunable.activation] or 'none'))
+        if self.tunable.bias:
+            k0_stride = 4 * t_k1 * self.tunable.gemm_m_level0_cluster * self.tunable.gemm_m_level1_cluster
+            assert (t_k0 - 1) * k0_stride < 4096 and t_k1 in (1, 2, 4)
+            self._emit('s_mov_b64 s[s_p_buf_wei:s_p_buf_wei+1], s[s_p_bias:s_p_bias+1]')
+            for i_k0 in range(t_k0):
+                self._emit('buffer_load_dword{} v[{}+{}:{}+{}], v[v_bias_os], s[s_p_buf_wei:s_p_buf_wei+3], 0 offen offset:{}'.format(
+                            '' if t_k1 == 1 else 'x{}'.format(t_k1), v_bias, i_k0 * t_k1, v_bias, (i_k0 + 1) * t_k1 - 1, i_k0 * k0_stride))
+            self._emit('s_waitcnt vmcnt(0)')
+        for i in range(t_n2 * t_n1 * t_k1 * t_k0):
+            if self.tunable.bias:
+                self._emit('v_add_f32 v[v_c+{}], v[{}+{}], v[v_c+{}]'.format(i, v_bias, i // (t_n2 * t_n1), i))
+            if self.tunable.activation == IGEMM_ACTIVATION_RELU:
+                self._emit('v_max_f32 v[v_c+{}], 0, v[v_c+{}]'.format(i, i))
+            elif self.tunable.activation == IGEMM_ACTIVATION_CLAMP:
+                self._emit('v_max_f32 v[v_c+{}], s[s_clamp_min], v[v_c+{}]'.format(i, i))
+                self._emit('v_min_f32 v[v_c+{}], s[s_clamp_max], v[v_c+{}]'.format(i, i))
+
+    def emit_kernel_out_vector_prepare(self):
+        '''
+        offsets of vector_store. c of a k0, n1 is staged in LDS as k1 x b x n2, each thread store t_n2 continuous n2
+        for t_k1 of its k1. after that thread is k x b/vec, read vec continuous b of a k, vec = t_k1 = t_n2
+        '''
+        vec = self.tunable.gemm_n_per_thread_subc
+        b_vec = self.tunable.b_per_block // vec
+        self._emit('; vector store, lds offset of k1 x b x n2 and out offset of {} continuous b'.format(vec))
+        self._emit('v_lshl_or_b32 v[v_sst_c_os], v[v_gemm_im], {}, v[v_gemm_in]'.format(igemm_log2(self.tunable.gemm_m_per_thread_subc) + igemm_log2(self.tunable.b_per_block)))
+        self._emit('v_lshlrev_b32 v[v_sst_c_os], {}, v[v_sst_c_os]'.format(igemm_log2(self.tunable.gemm_n_per_thread_subc) + 2))
+        self._emit('v_lshlrev_b32 v[v_sld_c_os], {}, v0'.format(igemm_log2(vec * self.tunable.gemm_n_per_thread_subc) + 2))
+        self._emit('v_and_b32 v[v_tmp+4], {}, v0'.format(b_vec - 1))
+        self._emit('v_lshl_add_u32 v[v_tmp+4], v[v_tmp+4], {}, s[s_block_ib]'.format(igemm_log2(vec)))
+        self.emit_div_vs('v_out_vec_os', 'v_tmp+4', 's_out_stride_k1', 1)
+        self._emit('v_mul_lo_u32 v[v_tmp], s[s_out_stride_k1], v[v_out_vec_os]')
+        self._emit('v_sub_u32 v[v_tmp+4], v[v_tmp+4], v[v_tmp]')
+        self._emit('v_lshrrev_b32 v[v_tmp+5], {}, v0'.format(igemm_log2(b_vec)))
+        self._emit('v_add_u32 v[v_tmp+5], s[s_block_ik], v[v_tmp+5]')
+        self._emit('v_mul_lo_u32 v[v_tmp+5], s[s_out_stride_k1], v[v_tmp+5]')
+        self._emit('v_add_u32 v[v_tmp+4], v[v_tmp+4], v[v_tmp+5]')
+        self._emit('s_lshl_b32 s[s_tmp], s[s_out_stride_n1], {}'.format(igemm_log2(self.tunable.gemm_n_repeat)))
+        self._emit('v_mul_lo_u32 v[v_out_vec_os], s[s_tmp], v[v_out_vec_os]')
+        self._emit('v_add_u32 v[v_out_vec_os], v[v_out_vec_os], v[v_tmp+4]')
+        self._emit('v_lshlrev_b32 v[v_out_vec_os], 2, v[v_out_vec_os]')
+        self._emit_empty_line()
+
+    def emit_kernel_writeout_vector(self, label_scalar):
+        '''
+        store c with buffer_store_dwordx{vec} along b, one k0, n1 at a time through LDS, see emit_kernel_out_vector_prepare().
+        rows of vec b x t_n2 read back are transposed in register by amdgpu_swap_sequencer_t, interleaved with the store.
+        b of vec continuous threads is continuous in out only if ho*wo is multiple of vec, else go to scalar store
+        '''
+        t_n2, t_n1, t_k1, t_k0 = self.tunable.gemm_n_per_thread_subc, self.tunable.gemm_n_repeat, \
+                    self.tunable.gemm_m_per_thread_subc, self.tunable.gemm_m_repeat
+        vec = t_n2
+        k1_stride = 4 * self.tunable.b_per_block * t_n2
+        swap_list = amdgpu_swap_sequencer_t(t_n2, vec)()
+        self._emit('; vector store, ho*wo need be multiple of {}'.format(vec))
+        self._emit('s_and_b32 s[s_tmp], s[s_out_stride_k1], {}'.format(4 * vec - 1))
+        self._emit('s_cmp_eq_u32 s[s_tmp], 0')
+        self._emit('s_cbranch_scc0 {}'.format(label_scalar))
+        self._emit('s_mov_b32 s[s_tmp+2], 0')
+        for i_k0 in range(t_k0):
+            for i_n1 in range(t_n1):
+                # t_n2 registers of k1 (or row after read back) of this k0, n1
+                row = lambda r: ((i_k0 * t_k1 + r) * t_n1 + i_n1) * t_n2
+                reg = lambda i: row(i // t_n2) + i % t_n2
+                self._emit('s_barrier')
+                for i_k1 in range(t_k1):
+                    self._emit('ds_write_b{} v[v_sst_c_os], v[v_c+{}:v_c+{}] offset:{}'.format(32 * t_n2, row(i_k1), row(i_k1) + t_n2 - 1, i_k1 * k1_stride))
+                self._emit('s_waitcnt lgkmcnt(0)')
+                self._emit('s_barrier')
+                for r in range(vec):
+                    self._emit('ds_read_b{} v[v_c+{}:v_c+{}], v[v_sld_c_os] offset:{}'.format(32 * t_n2, row(r), row(r) + t_n2 - 1, 4 * r * t_n2))
+                self._emit('s_waitcnt lgkmcnt(0)')
+                if i_n1 == 0:
+                    self._emit('s_mov_b32 s[s_tmp], s[s_tmp+2]')
+                else:
+                    self._emit('s_add_u32 s[s_tmp], s[s_tmp], s[s_out_stride_n1]')
+                for i_n2 in range(t_n2):
+                    if type(swap_list[i_n2]) is not str:
+                        for sw in swap_list[i_n2]:
+                            self._emit('v_swap_b32 v[v_c+{}], v[v_c+{}]'.format(reg(sw[0]), reg(sw[1])))
+                    if i_n2 == 0:
+                        self._emit('s_mov_b32 s[s_tmp+1], s[s_tmp]')
+                    else:
+                        self._emit('s_add_u32 s[s_tmp+1], s[s_tmp+1], s[s_out_stride_n2]')
+                    self._emit('buffer_store_dwordx{} v[v_c+{}:v_c+{}], v[v_out_vec_os], s[s_p_buf_out:s_p_buf_out+3], s[s_tmp+1] offen'.format(
+                                vec, row(i_n2), row(i_n2) + vec - 1))
+            if i_k0 != t_k0 - 1:
+                self._emit('s_add_u32 s[s_tmp+2], s[s_tmp+2], s[s_out_stride_k0]')
 
     def emit_kernel_writeout(self):
         out_write = emit_out_write_k0_k1_n1_b_n2_t(self.mc, self.tunable)
+        if self.tunable.bias or self.tunable.activation:
+            self.emit_kernel_writeout_epilogue()
+        if self.tunable.vector_store:
+            label_scalar = 'L_{}_out_scalar'.format(self.name())
+            label_end = 'L_{}_out_end'.format(self.name())
+            self.emit_kernel_writeout_vector(label_scalar)
+            self._emit('s_branch {}'.format(label_end))
+            self._emit_front('{}:'.format(label_scalar))
         self._emit('s_mov_b32 s[s_tmp], 0')
         self._emit('s_mov_b32 s[s_tmp+1], 0')
         self._emit('s_mov_b32 s[s_tmp+2], 0')
         self._emit('s_mov_b32 s[s_tmp+3], 0')
+        if self.tunable.gemm_k_split:
+            self.emit_kernel_writeout_atomic_add()
+            return
         self._emit(out_write('v_c', 's_p_buf_out', 'v_out_os', 's_out_stride_k0', 's_out_stride_k1', 's_out_stride_n1', 's_out_stride_n2', 's_tmp'))
+        if self.tunable.vector_store:
+            self._emit_front('{}:'.format(label_end))
+
+    def emit_kernel_persistent_begin(self):
+        '''
+        persistent kernel, s_grid_size workgroups loop over s_num_unit units, unit s_bx + i * s_grid_size
+        of workgroup s_bx. unit is a tile, or a tile of one split for gemm_k_split, unit = bz * num_tile + bx.
+        kernarg pointer and thread id are kept here, prepare phase run again from them for every unit
+        '''
+        label = 'L_{}_unit'.format(self.name())
+        self._emit('s_load_dwordx2  s[s_num_tile:s_num_tile+1], s[s_ka:s_ka+1],     0+k_num_tile')
+        self._emit('s_load_dword    s[s_grid_size],             s[s_ka:s_ka+1],     0+k_grid_size')
+        self._emit('s_mov_b64 s[s_ka_save:s_ka_save+1], s[s_ka:s_ka+1]')
+        self._emit('s_mov_b32 s[s_unit], s[s_bx]')
+        self._emit('v_mov_b32 v[v_tid], v0')
+        self._emit('s_waitcnt lgkmcnt(0)')
+        self._emit_front('{}:'.format(label))
+        self._emit('s_mov_b64 s[s_ka:s_ka+1], s[s_ka_save:s_ka_save+1]')
+        self._emit('v_mov_b32 v0, v[v_tid]')
+        if self.tunable.gemm_k_split:
+            self._emit('.v_u32_div_ss v_tmp+4, s_unit, s_num_tile, v_tmp, s_tmp')
+            self._emit('v_readfirstlane_b32 s[s_bz], v[v_tmp+4]')
+            self._emit('s_mul_i32 s[s_tmp], s[s_bz], s[s_num_tile]')
+            self._emit('s_sub_u32 s[s_bx], s[s_unit], s[s_tmp]')
+        else:
+            self._emit('s_mov_b32 s[s_bx], s[s_unit]')
+        self._emit_empty_line()
+
+    def emit_kernel_persistent_end(self):
+        '''
+        every wave of a workgroup loop the same times. LDS of this unit must be all read before next one write
+        '''
+        label = 'L_{}_unit'.format(self.name())
+        self._emit('; next unit')
+        self._emit('s_barrier')
+        self._emit('s_add_u32 s[s_unit], s[s_unit], s[s_grid_size]')
+        self._emit('s_cmp_lt_u32 s[s_unit], s[s_num_unit]')
+        self._emit('s_cbranch_scc1 {}'.format(label))
+
+    def emit_kernel_body(self):
+        if self.tunable.persistent:
+            self.emit_kernel_persistent_begin()
+        self.emit_kernel_prepare_phase()
+        self.emit_kernel_fma_body()
+        self.emit_kernel_writeout()
+        if self.tunable.persistent:
+            self.emit_kernel_persistent_end()
+        self.emit_kernel_end()
 
     def emit(self):
         self._emit(';----------------------------------------------------------')
@@ -1771,10 +2629,10 @@ class emit_v4r1_dynamic_kernel_t(igemm_v4r1_dynamic_t):
         with self._indent_context():
             if self.mc.arch_config.code_object == AMDGPU_CODEOBJECT_V2:
                 self.emit_kernel_amd_kernel_code_t()
-            self.emit_kernel_prepare_phase()
-            self.emit_kernel_fma_body()
-            self.emit_kernel_writeout()
-            self.emit_kernel_end()
+            # kernel body is recorded as instruction stream, passes can work on it before print
+            with self._ir_context():
+                self.emit_kernel_body()
+            self._emit_ir(self.process_kernel_ir(self._get_ir()))
         if self.mc.arch_config.code_object == AMDGPU_CODEOBJECT_V3:
             self.emit_kernel_amd_kernel_code_t()
         self.emit_kernel_footer()
@@ -1829,6 +2687,41 @@ def v4r1_dynamic_get_block_size(tunable):
     return tunable.gemm_m_level0_cluster * tunable.gemm_n_level0_cluster * \
                     tunable.gemm_m_level1_cluster * tunable.gemm_n_level1_cluster
 
+def v4r1_dynamic_swizzle_block_id(bid, k_block_work, b_block_work, group):
+    '''
+    (block_id_b, block_id_k) of a workgroup of 1d grid. without group, b is fastest. with group, k
+    blocks are cut into groups of group blocks, inside a group k is fastest then b, so workgroups
+    launched together share input tiles, and weight tiles of a group are reused by all b. last group may be smaller
+    '''
+    if group <= 1:
+        return bid % b_block_work, bid // b_block_work
+    group_id = bid // (group * b_block_work)
+    first_k = group_id * group
+    group_size_k = min(k_block_work - first_k, group)
+    index = bid % (group * b_block_work)
+    return index // group_size_k, first_k + index % group_size_k
+
+def v4r1_dynamic_get_swizzle_karg(tunable, conv_param):
+    '''
+    kernel args of swizzle_group, same as get_swizzle_karg() of the driver. group * b_block_work,
+    first workgroup of the last group, k blocks of the last group. with magic_div, magic numbers of
+    the two divisors and their shifts packed in one dword
+    '''
+    group = tunable.swizzle_group
+    n1 = tunable.gemm_n_repeat
+    n2 = tunable.gemm_n_per_thread_subc
+    k_block_work = conv_param.k // tunable.k_per_block
+    b_block_work = (conv_param.n // (n1 * n2)) * conv_param.ho * conv_param.wo // tunable.b_per_block
+    num_group = (k_block_work + group - 1) // group
+    group_work = group * b_block_work
+    last_group_k = k_block_work - (num_group - 1) * group
+    karg = [group_work, (num_group - 1) * group_work, last_group_k]
+    if tunable.magic_div:
+        magic_5, shift_5 = amdgpu_magic_div_u32_gen(group_work)
+        magic_6, shift_6 = amdgpu_magic_div_u32_gen(last_group_k)
+        karg += [magic_5, magic_6, amdgpu_magic_div_shift_pack([shift_5, shift_6])]
+    return karg
+
 def v4r1_dynamic_get_dynamic_index(tunable, conv_param, tid, bid):
     # For simplicity following calculation use divide/mod insteat of and/shift, since we are in cpu world
     dynamic_index = v4r1_dynamic_index_t()
@@ -1878,8 +2771,12 @@ def v4r1_dynamic_get_dynamic_index(tunable, conv_param, tid, bid):
 
     # k_block_work = conv_param.k // tunable.k_per_block
     b_block_work = b // tunable.b_per_block
-    block_id_b = bid % b_block_work
-    block_id_k = bid // b_block_work
+    if tunable.grid_2d:
+        # bid is (workgroup id x, workgroup id y)
+        block_id_b, block_id_k = bid
+    else:
+        block_id_b, block_id_k = v4r1_dynamic_swizzle_block_id(bid, conv_param.k // tunable.k_per_block,
+                                        b_block_work, tunable.swizzle_group)
     dynamic_index.s_block_ib = block_id_b * tunable.b_per_block
     dynamic_index.s_block_ik = block_id_k * tunable.k_per_block
 
@@ -1964,6 +2861,234 @@ def v4r1_dynamic_get_dynamic_index(tunable, conv_param, tid, bid):
     dynamic_index.v_sld_a_os += tunable.byte_lds_b_np2
     return dynamic_index
 
+V4R1_DYNAMIC_GEMM_K_SPLIT_MIN_E_LOOP = 4     # e_per_block loops of a split at least
+
+def v4r1_dynamic_get_blocks_per_cu(arch_detail, tunable):
+    '''
+    workgroups resident in a CU, limited by LDS and waves. vgpr is not known before emit
+    '''
+    waves_per_block = v4r1_dynamic_get_block_size(tunable) // arch_detail.wavefront_size
+    return max(min(arch_detail.lds_size // tunable.byte_lds_total, arch_detail.max_waves_per_cu // waves_per_block), 1)
+
+def v4r1_dynamic_get_gemm_k_split(arch_detail, tunable, conv_param):
+    '''
+    number of split along c for gemm_k_split, is workgroup id z. grid is split until it fill every CU once,
+    c*y*x of a split must be multiple of e_per_block, and loop at least V4R1_DYNAMIC_GEMM_K_SPLIT_MIN_E_LOOP times.
+    same as get_gemm_k_split() of the driver. persistent kernel take the one of least cycles from v4r1_dynamic_quantization_t
+    '''
+    if not tunable.gemm_k_split:
+        return 1
+    if tunable.persistent:
+        return v4r1_dynamic_quantization_t(arch_detail, tunable, conv_param).suggest()
+    n1 = tunable.gemm_n_repeat
+    n2 = tunable.gemm_n_per_thread_subc
+    grid_size = (conv_param.k // tunable.k_per_block) * \
+                ((conv_param.n // (n1 * n2)) * conv_param.ho * conv_param.wo // tunable.b_per_block)
+    max_grid_size = arch_detail.num_cu * v4r1_dynamic_get_blocks_per_cu(arch_detail, tunable)
+    yx = conv_param.y * conv_param.x
+    split = 1
+    for s in range(2, conv_param.c + 1):
+        if grid_size * s > max_grid_size or \
+                (conv_param.c // s) * yx < V4R1_DYNAMIC_GEMM_K_SPLIT_MIN_E_LOOP * tunable.e_per_block:
+            break
+        if conv_param.c % s == 0 and (conv_param.c // s) * yx % tunable.e_per_block == 0:
+            split = s
+    return split
+
+def v4r1_dynamic_is_applicable(tunable, conv_param):
+    '''
+    if the kernel can run this conv. 1x1 kernel need y = x = 1, no_pad need pad 0, unit_stride need stride 1,
+    and dilation 1 if not 1x1. input loaded by vector of sub_b need stride_w 1, pad_w 0 and wo multiple
+    of it, or ho*wo with stride 1, pad 0 for 1x1. same as tunable_is_applicable() of the driver
+    '''
+    if tunable.is_1x1() and (conv_param.y != 1 or conv_param.x != 1):
+        return False
+    if tunable.no_pad and (conv_param.py != 0 or conv_param.px != 0):
+        return False
+    if tunable.unit_stride and (conv_param.sy != 1 or conv_param.sx != 1):
+        return False
+    if tunable.unit_stride and not tunable.is_1x1() and (conv_param.dy != 1 or conv_param.dx != 1):
+        return False
+    sub_b = tunable.in_block_copy_sub_lengths_b
+    if sub_b != 1:
+        if conv_param.sx != 1 or conv_param.px != 0:
+            return False
+        if tunable.is_1x1() and (conv_param.sy != 1 or conv_param.py != 0 or (conv_param.ho * conv_param.wo) % sub_b != 0):
+            return False
+        if not tunable.is_1x1() and conv_param.wo % sub_b != 0:
+            return False
+    return True
+
+def v4r1_dynamic_is_valid(tunable, conv_param):
+    '''
+    v4r1_dynamic_is_applicable(), and n, k, b, e can be divided into blocks of the kernel. the conv dependent
+    part of tunable_is_valid() of the driver, others are checked by igemm_tunable_parameter_t
+    '''
+    if not v4r1_dynamic_is_applicable(tunable, conv_param):
+        return False
+    n1n2 = tunable.gemm_n_repeat * tunable.gemm_n_per_thread_subc
+    if conv_param.n % n1n2 != 0 or conv_param.k % tunable.k_per_block != 0:
+        return False
+    b = (conv_param.n // n1n2) * conv_param.ho * conv_param.wo
+    return b % tunable.b_per_block == 0 and \
+            (conv_param.c * conv_param.y * conv_param.x) % tunable.e_per_block == 0
+
+def v4r1_dynamic_select_variant(tunables, conv_param):
+    '''
+    tunables are variants of a kernel, with or without no_pad, unit_stride. pick the applicable one
+    with most specialization, first one if equal. None if none can run
+    '''
+    candidates = [t for t in tunables if v4r1_dynamic_is_applicable(t, conv_param)]
+    if not candidates:
+        return None
+    return max(candidates, key = lambda t: (t.no_pad + t.unit_stride, -candidates.index(t)))
+
+def v4r1_dynamic_get_slice_table(tunable, conv_param):
+    '''
+    step table of slice_table, same as get_slice_table() of the driver. e of a thread move by e_per_block
+    every loop, step only depends on phase iy*x+ix of e. 4 int of each phase: offset of input in byte,
+    byte offset of the entry of next phase, ihi, iwi
+    '''
+    yx = conv_param.y * conv_param.x
+    table = []
+    for p in range(yx):
+        e = p + tunable.e_per_block
+        d_ihi = conv_param.dy * ((e % yx) // conv_param.x - p // conv_param.x)
+        d_iwi = conv_param.dx * ((e % yx) % conv_param.x - p % conv_param.x)
+        table += [4 * ((e // yx) * conv_param.hi * conv_param.wi + d_ihi * conv_param.wi + d_iwi),
+                  16 * (e % yx), d_ihi, d_iwi]
+    return table
+
+V4R1_DYNAMIC_UNIT_COST = 2          # prepare phase and writeout of a unit, in e_per_block loops
+V4R1_DYNAMIC_ATOMIC_COST = 2        # more of a unit added to output by atomics
+
+class v4r1_dynamic_quantization_t(object):
+    '''
+    wave quantization of a launch. num_cu * (workgroups per CU) slots run at a time, a unit of work
+    is a k_per_block x b_per_block tile over c / split, cost c/split*y*x/e_per_block loops and a fixed
+    overhead. units run round by round on the slots, efficiency is loops of the conv over slots * cycles.
+    split 1 is tile mode, one tile a workgroup or persistent kernel looping over tiles are the same rounds.
+    split > 1 is stream-k mode of persistent and gemm_k_split, every split of every tile is a unit of the
+    fixed grid, partial sums are added to output by atomics
+    '''
+    def __init__(self, arch_detail, tunable, conv_param):
+        self.arch_detail = arch_detail
+        self.tunable = tunable
+        self.conv_param = conv_param
+        self.slots = arch_detail.num_cu * v4r1_dynamic_get_blocks_per_cu(arch_detail, tunable)
+        n1 = tunable.gemm_n_repeat
+        n2 = tunable.gemm_n_per_thread_subc
+        self.num_tile = (conv_param.k // tunable.k_per_block) * \
+                ((conv_param.n // (n1 * n2)) * conv_param.ho * conv_param.wo // tunable.b_per_block)
+        self.yx = conv_param.y * conv_param.x
+        self.loops = conv_param.c * self.yx // tunable.e_per_block
+
+    def get_splits(self):
+        '''
+        split of c, same condition as v4r1_dynamic_get_gemm_k_split()
+        '''
+        if not (self.tunable.gemm_k_split and self.tunable.persistent):
+            return [1]
+        c, e = self.conv_param.c, self.tunable.e_per_block
+        return [1] + [s for s in range(2, c + 1) if c % s == 0 and (c // s) * self.yx % e == 0 and \
+                        (c // s) * self.yx >= V4R1_DYNAMIC_GEMM_K_SPLIT_MIN_E_LOOP * e]
+
+    def get_cycles(self, split):
+        '''
+        in e_per_block loops
+        '''
+        rounds = (self.num_tile * split + self.slots - 1) // self.slots
+        return rounds * (self.loops // split + V4R1_DYNAMIC_UNIT_COST + (V4R1_DYNAMIC_ATOMIC_COST if split > 1 else 0))
+
+    def __call__(self, split = 1):
+        '''
+        0 if there is no tile, the conv is smaller than one tile
+        '''
+        if self.num_tile == 0:
+            return 0.0
+        return self.num_tile * self.loops / float(self.slots * self.get_cycles(split))
+
+    def suggest(self):
+        return min(self.get_splits(), key = lambda s: (self.get_cycles(s), s))
+
+class v4r1_dynamic_l2_estimator_t(object):
+    '''
+    bytes read from memory by a 1d grid launch with swizzle_group, on a LRU L2 of arch_detail.l2_size.
+    workgroups run in waves of num_cu * (workgroups per CU), and a wave read the input tile of each
+    b block (e * b_per_block * n1 * n2 floats) and weight tile of each k block (e * k_per_block floats)
+    once, workgroups of a wave sharing a tile read it together. all tiles of a wave are streamed along e,
+    so a tile is rarely kept whole. a part at p (0~1) of e read by previous wave is still in L2 when
+    current wave read it again, if bytes read after it, footprint_prev * (1 - p) + footprint_cur * p,
+    fit in L2. the fraction of e satisfying this is reused, only from the previous wave.
+    halo between b blocks and the output are not counted
+    '''
+    def __init__(self, arch_detail, tunable, conv_param, waves_per_cu = 0):
+        assert arch_detail.l2_size > 0
+        self.arch_detail = arch_detail
+        self.tunable = tunable
+        self.conv_param = conv_param
+        waves_per_block = v4r1_dynamic_get_block_size(tunable) // arch_detail.wavefront_size
+        if waves_per_cu == 0:
+            blocks_per_cu = v4r1_dynamic_get_blocks_per_cu(arch_detail, tunable)
+        else:
+            blocks_per_cu = max(waves_per_cu // waves_per_block, 1)
+        self.concurrent_blocks = arch_detail.num_cu * blocks_per_cu
+
+        n1 = tunable.gemm_n_repeat
+        n2 = tunable.gemm_n_per_thread_subc
+        e = conv_param.c * conv_param.y * conv_param.x
+        self.k_block_work = conv_param.k // tunable.k_per_block
+        self.b_block_work = (conv_param.n // (n1 * n2)) * conv_param.ho * conv_param.wo // tunable.b_per_block
+        self.byte_tile_b = e * tunable.b_per_block * n1 * n2 * 4     # sizeof(float)
+        self.byte_tile_k = e * tunable.k_per_block * 4
+
+    def get_reuse(self, footprint_prev, footprint_cur):
+        '''
+        fraction p of e in [0, 1] with footprint_prev * (1 - p) + footprint_cur * p <= l2_size
+        '''
+        l2_size = self.arch_detail.l2_size
+        if footprint_prev == footprint_cur:
+            return 1.0 if footprint_cur <= l2_size else 0.0
+        p = (l2_size - footprint_prev) / (footprint_cur - footprint_prev)
+        if footprint_cur > footprint_prev:
+            return min(max(p, 0.0), 1.0)            # p below it
+        return 1.0 - min(max(p, 0.0), 1.0)          # p above it
+
+    def __call__(self, group):
+        traffic = 0
+        tiles_prev = set()
+        footprint_prev = 0
+        num_blocks = self.k_block_work * self.b_block_work
+        for start in range(0, num_blocks, self.concurrent_blocks):
+            tiles = set()
+            for bid in range(start, min(start + self.concurrent_blocks, num_blocks)):
+                block_id_b, block_id_k = v4r1_dynamic_swizzle_block_id(bid, self.k_block_work, self.b_block_work, group)
+                tiles.add((0, block_id_b))
+                tiles.add((1, block_id_k))
+            footprint = sum(self.byte_tile_k if tile[0] else self.byte_tile_b for tile in tiles)
+            reused = sum(self.byte_tile_k if tile[0] else self.byte_tile_b for tile in tiles & tiles_prev)
+            traffic += footprint - reused * self.get_reuse(footprint_prev, footprint)
+            tiles_prev = tiles
+            footprint_prev = footprint
+        return int(traffic)
+
+    def get_groups(self):
+        groups = [0]
+        group = 2
+        while group <= self.k_block_work:
+            groups.append(group)
+            group *= 2
+        return groups
+
+    def suggest(self):
+        '''
+        swizzle_group of least traffic, smaller one if equal. None if there is no tile, the conv is
+        smaller than one tile
+        '''
+        if self.k_block_work * self.b_block_work == 0:
+            return None
+        return min(self.get_groups(), key = lambda g: (self(g), g))
+
 class igemm_v4r1_kernel_detail_t(igemm_kernel_detail_base_t):
     def __init__(self):
         super().__init__()
@@ -2036,6 +3161,8 @@ class igemm_v4r1_kernel_detail_t(igemm_kernel_detail_base_t):
         tunable_dict['in_block_copy_cluster_lengths_n2'] = self.in_copy_block_n2
         tunable_dict['wei_block_copy_cluster_lengths_e'] = self.wei_copy_block_e
         tunable_dict['wei_block_copy_cluster_lengths_k'] = self.wei_copy_block_k
+        if self.in_copy_thread_e != 1:
+            tunable_dict['name']                         = 'v4r1_1x1_dynamic_kernel'
         return igemm_tunable_parameter_t(tunable_dict)
 
 class v4r1_dynamic_kernel_sequencer_t(object):
@@ -2060,6 +3187,14 @@ class v4r1_dynamic_kernel_sequencer_t(object):
         self.in_thread_copy_cal_from_block = True
         self.wei_thread_copy_cal_from_block = True
 
+    def in_copy_vgpr_increase(self, in_copy_thread_e, in_copy_thread_b):
+        '''
+        vgpr of a thread added by input copy of thread_e x thread_b, against the one of 1 x 1. v_gld_b is
+        vgpr_b_global_fetch for any shape and b vector is transposed in place. thread_e more than 1 is a 1x1
+        kernel, without v_in_ic, v_in_iy, v_in_ix, v_in_ihi, v_in_iwi and v_idc, v_idy, v_idx of the slice window
+        '''
+        return 0 if in_copy_thread_e == 1 else -8
+
     def step_one_gemm_kernel(self, thread_m, thread_n, block_m, block_n, unroll_k, buffers):
         '''
         return true for valid, false for invalid
@@ -2196,73 +3331,59 @@ class v4r1_dynamic_kernel_sequencer_t(object):
             #   4) in_copy_thread_e * in_copy_thread_n1 * in_copy_thread_b * in_copy_thread_n2 = vgpr_b_global_fetch
             #   5) in_copy_block_e * in_copy_block_n1 * in_copy_block_b * in_copy_block_n2 = block_size
             #
-            #   if keep in_copy_thread_e=1, in_copy_thread_b=1, can have less variations
-            #
             assert detail.block_size == detail.unroll_k * detail.block_n // detail.vgpr_b_global_fetch
             kernel_detail_possible_in_list = []
 
-            # keep this factor to 1
-            in_copy_thread_e = 1
-            in_copy_thread_b = 1
-            in_copy_block_e = detail.unroll_k
-            in_copy_block_b = detail.b_per_block
-
-            # TODO: since we force thread_e, thread_b to be 1, there will be some configuration not passed due to this constrains.
-            # it might be a good idea to relax this constrain to support more config, but the performance need clearly consider
-
-            if in_copy_block_e * in_copy_block_b > detail.block_size:
-                # print('XXX in fail in_copy_block_e:{}, in_copy_block_b:{}, block_size:{}'.format(in_copy_block_e, in_copy_block_b, detail.block_size))
-                return kernel_detail_possible_in_list # empty
-
-            assert detail.block_size % in_copy_block_e == 0
-            assert detail.block_size % (in_copy_block_e * in_copy_block_b) == 0
-            in_copy_block_n1_n2 = detail.block_size // (in_copy_block_e * in_copy_block_b)
-
-            log2_list = [2**i for i in range(igemm_log2(in_copy_block_n1_n2)+1)]
-
-            for ib in log2_list:
-                in_copy_block_n1 = ib
-                in_copy_block_n2 = in_copy_block_n1_n2 // ib
-                #print('block_size:{}, in_copy_block_n1_n2:{}, in_copy_block_n2:{}, in_copy_block_b:{}, in_copy_block_e:{}, ib:{}'.format(
-                #        detail.block_size,in_copy_block_n1_n2,in_copy_block_n2, in_copy_block_b, in_copy_block_e, ib))
-
-                if self.in_thread_copy_cal_from_block:
-                    #assert (detail.gemm_n_repeat % in_copy_block_n1) == 0
-                    #assert (detail.gemm_n_per_thread_subc % in_copy_block_n2) == 0
-                    if detail.gemm_n_repeat % in_copy_block_n1 != 0:
-                        continue
-                    if detail.gemm_n_per_thread_subc % in_copy_block_n2 != 0:
-                        continue
-                    in_copy_thread_n1 = detail.gemm_n_repeat // in_copy_block_n1
-                    in_copy_thread_n2 = detail.gemm_n_per_thread_subc // in_copy_block_n2
-                    assert in_copy_thread_n1 * in_copy_thread_n2 == detail.vgpr_b_global_fetch
-                    assert in_copy_block_n1 * in_copy_block_b * in_copy_block_n2 * \
-                            in_copy_thread_n1 * in_copy_thread_b * in_copy_thread_n2 \
-                                == detail.block_n
-                    d = copy.deepcopy(detail)
-                    d.in_copy_block_e = in_copy_block_e
-                    d.in_copy_block_n1 = in_copy_block_n1
-                    d.in_copy_block_b = in_copy_block_b
-                    d.in_copy_block_n2 = in_copy_block_n2
-                    d.in_copy_thread_e = in_copy_thread_e
-                    d.in_copy_thread_n1 = in_copy_thread_n1
-                    d.in_copy_thread_b = in_copy_thread_b
-                    d.in_copy_thread_n2 = in_copy_thread_n2
-                    kernel_detail_possible_in_list.append(d)
-                else:
-                    _log2_list_thrd = [2**k for k in range(igemm_log2(detail.vgpr_b_global_fetch)+1)]
-                    for i3 in _log2_list_thrd:
-                        in_copy_thread_n1 = i3
-                        in_copy_thread_n2 = detail.vgpr_b_global_fetch // i3
-                        # print("in_copy_block_n1:{}, in_copy_block_b:{}, in_copy_block_n2:{}, in_copy_thread_n1:{}, in_copy_thread_b:{}, in_copy_thread_n2:{}, block_n:{}".format(
-                        #     in_copy_block_n1, in_copy_block_b, in_copy_block_n2,
-                        #     in_copy_thread_n1, in_copy_thread_b, in_copy_thread_n2,\
-                        #     detail.block_n
-                        # ))
-                        if in_copy_block_n1 * in_copy_block_b * in_copy_block_n2 * \
-                            in_copy_thread_n1 * in_copy_thread_b * in_copy_thread_n2 \
-                                != detail.block_n:
+            # thread_e more than 1 is 1x1 only, see to_tunable(). thread_b of 2, 4 load input by dwordx2/x4 along wo,
+            # kernel is only applicable if wo is multiple of it. a shape is skipped if the vgpr it adds drops the
+            # occupancy of the gemm, or a shape before it already populated the same vector width and number
+            # of buffer_load of a thread, thread_e of 1 first.
+            in_copy_thread_e_b_list = [(2**i, b) for i in range(igemm_log2(detail.unroll_k)+1) for b in (1, 2, 4)]
+            populated_in_load = set()
+
+            for in_copy_thread_e, in_copy_thread_b in in_copy_thread_e_b_list:
+                if amdgpu_calculate_occupancy(self.arch_detail, detail.vgpr_total + self.in_copy_vgpr_increase(in_copy_thread_e,
+                            in_copy_thread_b), detail.block_size, detail.lds_total) < detail.occupancy:
+                    continue
+                in_load = (in_copy_thread_b, detail.vgpr_b_global_fetch // in_copy_thread_b)
+                if in_load in populated_in_load:
+                    continue
+                num_populated = len(kernel_detail_possible_in_list)
+                in_copy_block_e = detail.unroll_k // in_copy_thread_e
+                if detail.b_per_block % in_copy_thread_b != 0:
+                    continue
+                in_copy_block_b = detail.b_per_block // in_copy_thread_b
+                if in_copy_block_e * in_copy_block_b > detail.block_size:
+                    # print('XXX in fail in_copy_block_e:{}, in_copy_block_b:{}, block_size:{}'.format(in_copy_block_e, in_copy_block_b, detail.block_size))
+                    continue
+
+                assert detail.block_size % in_copy_block_e == 0
+                assert detail.block_size % (in_copy_block_e * in_copy_block_b) == 0
+                in_copy_block_n1_n2 = detail.block_size // (in_copy_block_e * in_copy_block_b)
+
+                log2_list = [2**i for i in range(igemm_log2(in_copy_block_n1_n2)+1)]
+
+                for ib in log2_list:
+                    in_copy_block_n1 = ib
+                    in_copy_block_n2 = in_copy_block_n1_n2 // ib
+                    #print('block_size:{}, in_copy_block_n1_n2:{}, in_copy_block_n2:{}, in_copy_block_b:{}, in_copy_block_e:{}, ib:{}'.format(
+                    #        detail.block_size,in_copy_block_n1_n2,in_copy_block_n2, in_copy_block_b, in_copy_block_e, ib))
+
+                    if self.in_thread_copy_cal_from_block:
+                        #assert (detail.gemm_n_repeat % in_copy_block_n1) == 0
+                        #assert (detail.gemm_n_per_thread_subc % in_copy_block_n2) == 0
+                        if detail.gemm_n_repeat % in_copy_block_n1 != 0:
                             continue
+                        if detail.gemm_n_per_thread_subc % in_copy_block_n2 != 0:
+                            continue
+                        in_copy_thread_n1 = detail.gemm_n_repeat // in_copy_block_n1
+                        in_copy_thread_n2 = detail.gemm_n_per_thread_subc // in_copy_block_n2
+                        if (in_copy_thread_e, in_copy_thread_b) != (1, 1) and in_copy_thread_n2 == 1:
+                            continue    # in_load need n2 vector, and b vector is transposed to it before LDS store
+                        assert in_copy_thread_e * in_copy_thread_n1 * in_copy_thread_b * in_copy_thread_n2 == detail.vgpr_b_global_fetch
+                        assert in_copy_block_n1 * in_copy_block_b * in_copy_block_n2 * \
+                                in_copy_thread_n1 * in_copy_thread_b * in_copy_thread_n2 \
+                                    == detail.block_n
                         d = copy.deepcopy(detail)
                         d.in_copy_block_e = in_copy_block_e
                         d.in_copy_block_n1 = in_copy_block_n1
@@ -2273,7 +3394,36 @@ class v4r1_dynamic_kernel_sequencer_t(object):
                         d.in_copy_thread_b = in_copy_thread_b
                         d.in_copy_thread_n2 = in_copy_thread_n2
                         kernel_detail_possible_in_list.append(d)
-            assert len(kernel_detail_possible_in_list) != 0
+                    else:
+                        if detail.vgpr_b_global_fetch % (in_copy_thread_e * in_copy_thread_b) != 0:
+                            continue
+                        _log2_list_thrd = [2**k for k in range(igemm_log2(detail.vgpr_b_global_fetch // (in_copy_thread_e * in_copy_thread_b))+1)]
+                        for i3 in _log2_list_thrd:
+                            in_copy_thread_n1 = i3
+                            in_copy_thread_n2 = detail.vgpr_b_global_fetch // (i3 * in_copy_thread_e * in_copy_thread_b)
+                            if (in_copy_thread_e, in_copy_thread_b) != (1, 1) and in_copy_thread_n2 == 1:
+                                continue
+                            # print("in_copy_block_n1:{}, in_copy_block_b:{}, in_copy_block_n2:{}, in_copy_thread_n1:{}, in_copy_thread_b:{}, in_copy_thread_n2:{}, block_n:{}".format(
+                            #     in_copy_block_n1, in_copy_block_b, in_copy_block_n2,
+                            #     in_copy_thread_n1, in_copy_thread_b, in_copy_thread_n2,\
+                            #     detail.block_n
+                            # ))
+                            if in_copy_block_n1 * in_copy_block_b * in_copy_block_n2 * \
+                                in_copy_thread_n1 * in_copy_thread_b * in_copy_thread_n2 \
+                                    != detail.block_n:
+                                continue
+                            d = copy.deepcopy(detail)
+                            d.in_copy_block_e = in_copy_block_e
+                            d.in_copy_block_n1 = in_copy_block_n1
+                            d.in_copy_block_b = in_copy_block_b
+                            d.in_copy_block_n2 = in_copy_block_n2
+                            d.in_copy_thread_e = in_copy_thread_e
+                            d.in_copy_thread_n1 = in_copy_thread_n1
+                            d.in_copy_thread_b = in_copy_thread_b
+                            d.in_copy_thread_n2 = in_copy_thread_n2
+                            kernel_detail_possible_in_list.append(d)
+                if len(kernel_detail_possible_in_list) != num_populated:
+                    populated_in_load.add(in_load)
             return kernel_detail_possible_in_list
 
         def populate_weight_tiling(detail):
@@ -2323,13 +3473,20 @@ class v4r1_dynamic_kernel_sequencer_t(object):
         kernel_detail.e_per_block = kernel_detail.unroll_k
         kernel_detail.k_per_block = kernel_detail.block_m
 
-        # still assume 2x2 sub tiling, assert here.
-        assert kernel_detail.thread_m in (4,6,8) and kernel_detail.thread_n in (4,6,8)
+        def populate_gemm_repeat(thread):
+            '''
+            gemm repeat of a thread tile, rest of it is the sub-tile. sub-tile is read from LDS by at most
+            a ds_read_b128, and is 1 only if thread tile is 1
+            '''
+            assert igemm_is_pow2(thread)
+            return [r for r in [2**i for i in range(igemm_log2(thread)+1)] \
+                        if thread // r <= 4 and (thread // r != 1 or thread == 1)]
 
-        kernel_detail.gemm_m_repeat = 2
-        kernel_detail.gemm_n_repeat = 2
-        kernel_detail.gemm_m_per_thread_subc = kernel_detail.thread_m // kernel_detail.gemm_m_repeat
-        kernel_detail.gemm_n_per_thread_subc = kernel_detail.thread_n // kernel_detail.gemm_n_repeat
+        def gemm_repeat_lds_read(thread, repeat):
+            '''
+            ds_read of a thread for each k. thread * 4 byte are read for any repeat, by repeat times the ds_read of a sub-tile
+            '''
+            return repeat * len(amdgpu_ds_read_split(thread // repeat * 4))
 
         kernel_detail.b_per_block = kernel_detail.block_n // kernel_detail.thread_n
 
@@ -2338,17 +3495,34 @@ class v4r1_dynamic_kernel_sequencer_t(object):
 
         assert gemm_m_clusters * gemm_n_clusters == kernel_detail.block_size
 
+        # every repeat of the thread tile read the same byte from LDS for each FMA, and hold the same thread_m + thread_n
+        # vgpr of a and b. repeats of less ds_read dominate the others, which are only populated if no tiling comes out
+        # of the former, before they multiply with the thread mapping and copy tilings.
+        gemm_repeat_list = [(m, n) for m in populate_gemm_repeat(kernel_detail.thread_m) for n in populate_gemm_repeat(kernel_detail.thread_n)]
+        lds_read_list = [gemm_repeat_lds_read(kernel_detail.thread_m, m) + gemm_repeat_lds_read(kernel_detail.thread_n, n) for m, n in gemm_repeat_list]
+
         possible_igemm_tiling_list = []
-        kernel_detail_thread_mapping_list = populate_thread_mapping_2d(kernel_detail, gemm_m_clusters, gemm_n_clusters)
-
-        for kd in kernel_detail_thread_mapping_list:
-            kernel_detail_input_tiling_list = populate_input_tiling(kd)
-            if not kernel_detail_input_tiling_list:
-                kernel_detail.msg = 'input_tiling_fail'
-                continue
-            for ki in kernel_detail_input_tiling_list:
-                kernel_detail_wei_tiling_list = populate_weight_tiling(ki)
-                possible_igemm_tiling_list.extend(kernel_detail_wei_tiling_list)
+        for num_lds_read in sorted(set(lds_read_list)):
+            for (gemm_m_repeat, gemm_n_repeat), lds_read in zip(gemm_repeat_list, lds_read_list):
+                if lds_read != num_lds_read:
+                    continue
+                kd_repeat = copy.deepcopy(kernel_detail)
+                kd_repeat.gemm_m_repeat = gemm_m_repeat
+                kd_repeat.gemm_n_repeat = gemm_n_repeat
+                kd_repeat.gemm_m_per_thread_subc = kernel_detail.thread_m // gemm_m_repeat
+                kd_repeat.gemm_n_per_thread_subc = kernel_detail.thread_n // gemm_n_repeat
+                kernel_detail_thread_mapping_list = populate_thread_mapping_2d(kd_repeat, gemm_m_clusters, gemm_n_clusters)
+
+                for kd in kernel_detail_thread_mapping_list:
+                    kernel_detail_input_tiling_list = populate_input_tiling(kd)
+                    if not kernel_detail_input_tiling_list:
+                        kernel_detail.msg = 'input_tiling_fail'
+                        continue
+                    for ki in kernel_detail_input_tiling_list:
+                        kernel_detail_wei_tiling_list = populate_weight_tiling(ki)
+                        possible_igemm_tiling_list.extend(kernel_detail_wei_tiling_list)
+            if possible_igemm_tiling_list:
+                break
         return possible_igemm_tiling_list
 
     def __call__(self):
@@ -2392,19 +3566,42 @@ class v4r1_dynamic_kernel_sequencer_t(object):
         #         cnt += 1
 
 
+V4R1_DYNAMIC_GLOBAL_MACRO_LIST = [emit_int_div_vv_t,
+                            emit_int_div_vs_t,
+                            emit_int_div_ss_t,
+                            emit_write_4d_strided_t,
+                            emit_c_clear_t]
+
+# only emitted if any kernel use magic_div, after emit_int_div_ss_t
+V4R1_DYNAMIC_MDIV_MACRO_LIST = [emit_mdiv_u32_vs_t,
+                            emit_mdiv_u32_ss_t]
+
+def v4r1_dynamic_global_macro_list(tunable_dicts):
+    '''
+    global macros needed by these tunables, so file without magic_div kernel does not change
+    '''
+    macro_list = list(V4R1_DYNAMIC_GLOBAL_MACRO_LIST)
+    if any(igemm_tunable_parameter_t(td).magic_div for td in tunable_dicts):
+        i = macro_list.index(emit_int_div_ss_t) + 1
+        macro_list[i:i] = V4R1_DYNAMIC_MDIV_MACRO_LIST
+    return macro_list
+
+V4R1_DYNAMIC_MACRO_LIST = [emit_fma_subtile_t,
+                            emit_in_set_flag_t,
+                            emit_in_load_e_n1_b_n2_t,
+                            emit_wei_load_e_k_t,
+                            emit_in_sst_e_n1_b_n2_t,
+                            emit_wei_sst_e_k_t,
+                            emit_out_write_k0_k1_n1_b_n2_t,
+                            emit_in_move_slice_window_t,
+                            emit_wei_move_slice_window_t]
+
 def emit_v4r1_dynamic_macros(mc, tunable_dicts):
     def emit_per_macro(m):
         for tunable_dict in tunable_dicts:
             m(mc, igemm_tunable_parameter_t(tunable_dict))._emit_unique_macro()
-    emit_per_macro(emit_fma_subtile_t)
-    emit_per_macro(emit_in_set_flag_t)
-    emit_per_macro(emit_in_load_e_n1_b_n2_t)
-    emit_per_macro(emit_wei_load_e_k_t)
-    emit_per_macro(emit_in_sst_e_n1_b_n2_t)
-    emit_per_macro(emit_wei_sst_e_k_t)
-    emit_per_macro(emit_out_write_k0_k1_n1_b_n2_t)
-    emit_per_macro(emit_in_move_slice_window_t)
-    emit_per_macro(emit_wei_move_slice_window_t)
+    for m in V4R1_DYNAMIC_MACRO_LIST:
+        emit_per_macro(m)
 
 def emit_v4r1_dynamic_kernel(mc, tunable_dicts):
     kernel_info_list = []
@@ -2414,3 +3611,90 @@ def emit_v4r1_dynamic_kernel(mc, tunable_dicts):
         kernel_info_list.append(kernel.get_kernel_info())
 
     emit_amd_metadata_t(mc, kernel_info_list).emit()
+
+class v4r1_dynamic_fragment_t(object):
+    '''
+    text of one tunable, rendered without the final mc.
+    macros is list of (name, text), same order as V4R1_DYNAMIC_MACRO_LIST
+    '''
+    def __init__(self, macros, kernel_name, kernel_text, kernel_info):
+        self.macros = macros
+        self.kernel_name = kernel_name
+        self.kernel_text = kernel_text
+        self.kernel_info = kernel_info
+
+def v4r1_dynamic_render_fragment(arch_config, tunable_dict):
+    '''
+    render macros and kernel of a single tunable, each to its own text.
+    indent is 0 here, same as in the final mc, so the text can be emitted as is
+    '''
+    mc = codegen_asm_printer_t(codegen_emit_to_buffer_t(), arch_config)
+    tunable = igemm_tunable_parameter_t(tunable_dict)
+    def render(e):
+        with mc.deferred_context():
+            e.emit()
+        return e.name(), mc.get_deferred()
+    macros = [render(m(mc, tunable)) for m in V4R1_DYNAMIC_MACRO_LIST]
+    kernel = emit_v4r1_dynamic_kernel_t(mc, tunable)
+    kernel_name, kernel_text = render(kernel)
+    return v4r1_dynamic_fragment_t(macros, kernel_name, kernel_text, kernel.get_kernel_info())
+
+def _v4r1_dynamic_render_fragment_worker(arg):
+    return v4r1_dynamic_render_fragment(*arg)
+
+def emit_v4r1_dynamic_fragments(mc, fragments):
+    '''
+    merge fragments in config order. macros are deduplicated by name exactly as
+    emit_v4r1_dynamic_macros does, then kernels, then one metadata block
+    '''
+    for i in range(len(V4R1_DYNAMIC_MACRO_LIST)):
+        for fragment in fragments:
+            mc.emit_unique_text(*fragment.macros[i])
+    for fragment in fragments:
+        mc.emit_unique_text(fragment.kernel_name, fragment.kernel_text)
+    emit_amd_metadata_t(mc, [fragment.kernel_info for fragment in fragments]).emit()
+
+def v4r1_dynamic_fragment_key(arch_config, tunable_dict, fingerprint):
+    return codegen_fragment_cache_t.key(igemm_tunable_parameter_t(tunable_dict).to_dict(),
+                vars(arch_config), arch_config.code_object, fingerprint)
+
+def v4r1_dynamic_render_fragments(arch_config, tunable_dicts, jobs = 1, cache = None):
+    '''
+    fragment of every tunable, in config order. fragment found in cache is not rendered,
+    the rest is rendered in a pool of jobs worker process, if jobs > 1
+    '''
+    fragments = [None] * len(tunable_dicts)
+    keys = [None] * len(tunable_dicts)
+    if cache:
+        fingerprint = codegen_generator_fingerprint()
+        for i, tunable_dict in enumerate(tunable_dicts):
+            keys[i] = v4r1_dynamic_fragment_key(arch_config, tunable_dict, fingerprint)
+            fragments[i] = cache.get(keys[i])
+
+    missing = [i for i in range(len(tunable_dicts)) if fragments[i] is None]
+    args = [(arch_config, tunable_dicts[i]) for i in missing]
+    if jobs > 1 and len(args) > 1:
+        pool = multiprocessing.Pool(processes=min(jobs, len(args)))
+        try:
+            rendered = pool.map(_v4r1_dynamic_render_fragment_worker, args, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        rendered = [_v4r1_dynamic_render_fragment_worker(arg) for arg in args]
+
+    for i, fragment in zip(missing, rendered):
+        fragments[i] = fragment
+        if cache:
+            cache.put(keys[i], fragment)
+    if cache and missing:
+        cache.evict()
+    return fragments
+
+def emit_v4r1_dynamic_parallel(mc, tunable_dicts, jobs, cache = None):
+    '''
+    same output as emit_v4r1_dynamic_macros() + emit_v4r1_dynamic_kernel(), but each
+    tunable is rendered in a pool of jobs worker process, or taken from the fragment cache
+    '''
+    fragments = v4r1_dynamic_render_fragments(mc.arch_config, tunable_dicts, jobs, cache)
+    emit_v4r1_dynamic_fragments(mc, fragments)
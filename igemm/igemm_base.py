@@ -28,6 +28,12 @@ import sys
 import numpy as np
 from .amdgpu import *
 
+# activation of the epilogue, applied after bias
+IGEMM_ACTIVATION_NONE   = 0
+IGEMM_ACTIVATION_RELU   = 1
+IGEMM_ACTIVATION_CLAMP  = 2     # to [clamp_min, clamp_max] from kernel args
+IGEMM_ACTIVATION_NAME = {IGEMM_ACTIVATION_NONE : '', IGEMM_ACTIVATION_RELU : 'relu', IGEMM_ACTIVATION_CLAMP : 'clamp'}
+
 def igemm_get_vector_size(v):
     vec_size = 1
     if v % 4 == 0:
@@ -92,6 +98,30 @@ class igemm_tunable_parameter_t(object):
             self.name                            = tunable_dict['name']
         else:
             self.name                            = 'n/a'
+        # optional passes over generated kernel body, off by default
+        self.peephole                            = codegen_dict_with_default_t(tunable_dict)('peephole', 0)
+        self.waitcnt                             = codegen_dict_with_default_t(tunable_dict)('waitcnt', 0)
+        self.sched                               = codegen_dict_with_default_t(tunable_dict)('sched', 0)
+        self.sched_lds_latency                   = codegen_dict_with_default_t(tunable_dict)('sched_lds_latency', 64)
+        self.sched_vmem_latency                  = codegen_dict_with_default_t(tunable_dict)('sched_vmem_latency', 300)
+        self.vgpr_alloc                          = codegen_dict_with_default_t(tunable_dict)('vgpr_alloc', 0)
+        self.sgpr_alloc                          = codegen_dict_with_default_t(tunable_dict)('sgpr_alloc', 0)
+        self.kernarg_compact                     = codegen_dict_with_default_t(tunable_dict)('kernarg_compact', 0)
+        self.magic_div                           = codegen_dict_with_default_t(tunable_dict)('magic_div', 0)
+        self.grid_2d                             = codegen_dict_with_default_t(tunable_dict)('grid_2d', 0)
+        self.swizzle_group                       = codegen_dict_with_default_t(tunable_dict)('swizzle_group', 0)
+        self.gemm_k_split                        = codegen_dict_with_default_t(tunable_dict)('gemm_k_split', 0)
+        self.persistent                          = codegen_dict_with_default_t(tunable_dict)('persistent', 0)
+        # epilogue of writeout, add per k bias then activation
+        self.bias                                = codegen_dict_with_default_t(tunable_dict)('bias', 0)
+        self.activation                          = codegen_dict_with_default_t(tunable_dict)('activation', IGEMM_ACTIVATION_NONE)
+        # store output with dwordx2/x4 of continuous b, regrouped through LDS and v_swap_b32
+        self.vector_store                        = codegen_dict_with_default_t(tunable_dict)('vector_store', 0)
+        # specialized for pad 0 (input window never out of hi/wi, no v_flag), stride and dilation 1
+        self.no_pad                              = codegen_dict_with_default_t(tunable_dict)('no_pad', 0)
+        self.unit_stride                         = codegen_dict_with_default_t(tunable_dict)('unit_stride', 0)
+        # move input slice window by a step table of each (y, x) phase, built by host
+        self.slice_table                         = codegen_dict_with_default_t(tunable_dict)('slice_table', 0)
 
         self.gemm_m_repeat = self.k_per_block // (self.gemm_m_per_thread_subc * self.gemm_m_level0_cluster * self.gemm_m_level1_cluster)
 
@@ -104,8 +134,22 @@ class igemm_tunable_parameter_t(object):
 
         self.block_size                          = self.gemm_m_level0_cluster * self.gemm_n_level0_cluster * self.gemm_m_level1_cluster * self.gemm_n_level1_cluster
 
-        assert self.in_block_copy_sub_lengths_e == 1 and self.in_block_copy_sub_lengths_b == 1, \
-                'in_sub_e:{}, in_sub_b:{}'.format(self.in_block_copy_sub_lengths_e, self.in_block_copy_sub_lengths_b)
+        assert (self.in_block_copy_sub_lengths_e == 1 or self.is_1x1()) and self.in_block_copy_sub_lengths_b in (1, 2, 4), \
+                'in_sub_e:{} (more than 1 for 1x1 only), in_sub_b:{}'.format(self.in_block_copy_sub_lengths_e, self.in_block_copy_sub_lengths_b)
+        assert self.swizzle_group <= 1 or (igemm_is_pow2(self.swizzle_group) and not self.grid_2d), \
+                'swizzle_group:{} must be power of 2, and is for 1d grid only'.format(self.swizzle_group)
+        assert not (self.persistent and self.grid_2d), 'persistent kernel loop over 1d grid only'
+        assert self.activation in IGEMM_ACTIVATION_NAME, 'activation:{} is not known'.format(self.activation)
+        assert not ((self.bias or self.activation) and self.gemm_k_split), 'epilogue can not apply on partial sum of gemm_k_split'
+        assert not (self.gemm_k_split and self.gemm_m_repeat * self.gemm_m_per_thread_subc == 1), \
+                'gemm_k_split need 2 vgpr of v_a for cmpswap, gemm_m_repeat:{} x gemm_m_per_thread_subc:{} give only 1'.format(self.gemm_m_repeat, self.gemm_m_per_thread_subc)
+        assert not self.vector_store or (self.gemm_m_per_thread_subc == self.gemm_n_per_thread_subc and \
+                self.gemm_n_per_thread_subc in (2, 4) and not self.gemm_k_split), \
+                'vector_store need square k1 x n2 sub tile of 2 or 4, and no gemm_k_split'
+        assert not (self.slice_table and self.is_1x1()), '1x1 kernel has no input slice window to move'
+        assert all(igemm_is_pow2(x) for x in (self.gemm_m_repeat, self.gemm_n_repeat, self.gemm_m_per_thread_subc, self.gemm_n_per_thread_subc)), \
+                'gemm_m_repeat:{}, gemm_n_repeat:{}, sub tile {}x{} must be power of 2'.format(self.gemm_m_repeat, self.gemm_n_repeat,
+                self.gemm_m_per_thread_subc, self.gemm_n_per_thread_subc)
 
         self.in_block_copy_src_data_per_read_b   = igemm_get_vector_size(self.in_block_copy_sub_lengths_b)
         self.in_block_copy_dst_data_per_write_n2 = igemm_get_vector_size(self.in_block_copy_sub_lengths_n2)
@@ -127,6 +171,10 @@ class igemm_tunable_parameter_t(object):
         self.byte_lds_b_np2                     = igemm_next_pow2( self.byte_lds_b)
         self.byte_lds_single                    = igemm_next_pow2( self.byte_lds_a_np2 + self.byte_lds_b_np2)
         self.byte_lds_total                     = (2*self.byte_lds_single)
+        # vector_store stage one k0, n1 of c tile at a time, k1 x b x n2
+        self.byte_lds_out                       = 4 * (self.k_per_block // self.gemm_m_repeat) * self.b_per_block * self.gemm_n_per_thread_subc
+        if self.vector_store:
+            self.byte_lds_total                 = max(self.byte_lds_total, self.byte_lds_out)
         # TODO: LDS size check
 
         # some parameter not in modular_conv
@@ -157,6 +205,25 @@ class igemm_tunable_parameter_t(object):
         tunable_dict['wei_block_copy_cluster_lengths_e']  = self.wei_block_copy_cluster_lengths_e
         tunable_dict['wei_block_copy_cluster_lengths_k']  = self.wei_block_copy_cluster_lengths_k
         tunable_dict['name']                              = self.name
+        tunable_dict['peephole']                          = self.peephole
+        tunable_dict['waitcnt']                           = self.waitcnt
+        tunable_dict['sched']                             = self.sched
+        tunable_dict['sched_lds_latency']                 = self.sched_lds_latency
+        tunable_dict['sched_vmem_latency']                = self.sched_vmem_latency
+        tunable_dict['vgpr_alloc']                        = self.vgpr_alloc
+        tunable_dict['sgpr_alloc']                        = self.sgpr_alloc
+        tunable_dict['kernarg_compact']                   = self.kernarg_compact
+        tunable_dict['magic_div']                         = self.magic_div
+        tunable_dict['grid_2d']                           = self.grid_2d
+        tunable_dict['swizzle_group']                     = self.swizzle_group
+        tunable_dict['gemm_k_split']                      = self.gemm_k_split
+        tunable_dict['persistent']                        = self.persistent
+        tunable_dict['bias']                              = self.bias
+        tunable_dict['activation']                        = self.activation
+        tunable_dict['vector_store']                      = self.vector_store
+        tunable_dict['no_pad']                            = self.no_pad
+        tunable_dict['unit_stride']                       = self.unit_stride
+        tunable_dict['slice_table']                       = self.slice_table
         return tunable_dict
 
     def serialize(self, line_starter = '; '):
@@ -240,12 +307,35 @@ def igemm_encode_v4r1_kernel_name(tunable):
     else:
         name_prefix = 'igemm_v4r1_dynamic_'
 
+    # kernel with compact kernarg or magic numbers need another host side argument struct, 2d grid, split and persistent another launch, epilogue more args, vector_store another writeout,
+    # no_pad and unit_stride only valid for some conv, slice_table another kernel arg
+    name_suffix = '_kpack' if tunable_dict.get('kernarg_compact', 0) else ''
+    name_suffix += '_mdiv' if tunable_dict.get('magic_div', 0) else ''
+    name_suffix += '_g2d' if tunable_dict.get('grid_2d', 0) else ''
+    name_suffix += '_swz{}'.format(tunable_dict['swizzle_group']) if tunable_dict.get('swizzle_group', 0) > 1 else ''
+    name_suffix += '_gks' if tunable_dict.get('gemm_k_split', 0) else ''
+    name_suffix += '_pst' if tunable_dict.get('persistent', 0) else ''
+    name_suffix += '_bias' if tunable_dict.get('bias', 0) else ''
+    name_suffix += '_' + IGEMM_ACTIVATION_NAME[tunable_dict['activation']] if tunable_dict.get('activation', 0) else ''
+    name_suffix += '_vst' if tunable_dict.get('vector_store', 0) else ''
+    name_suffix += '_npad' if tunable_dict.get('no_pad', 0) else ''
+    name_suffix += '_us1' if tunable_dict.get('unit_stride', 0) else ''
+    name_suffix += '_stbl' if tunable_dict.get('slice_table', 0) else ''
+    # passes over the kernel body, so the same tiling with and without a pass can be in one config
+    name_suffix += '_pho' if tunable_dict.get('peephole', 0) else ''
+    name_suffix += '_wcnt' if tunable_dict.get('waitcnt', 0) else ''
+    if tunable_dict.get('sched', 0):
+        sched_latency = (tunable_dict.get('sched_lds_latency', 64), tunable_dict.get('sched_vmem_latency', 300))
+        name_suffix += '_sch' + ('{}x{}'.format(*sched_latency) if sched_latency != (64, 300) else '')
+    name_suffix += '_valloc' if tunable_dict.get('vgpr_alloc', 0) else ''
+    name_suffix += '_salloc' if tunable_dict.get('sgpr_alloc', 0) else ''
+
     return name_prefix + '{}x{}x{}_{}x{}_{}x{}x{}x{}x{}x{}_{}x{}x{}x{}_{}x{}'.format(
                 k_per_block, b_per_block*gemm_n_repeat*gemm_n_per_thread_subc, e_per_block, 
                 thread_tile_m, thread_tile_n,
                 gemm_m_per_thread_subc,gemm_m_level0_cluster,gemm_m_level1_cluster,gemm_n_per_thread_subc,gemm_n_level0_cluster,gemm_n_level1_cluster,
                 in_block_copy_cluster_lengths_e,in_block_copy_cluster_lengths_n1,in_block_copy_cluster_lengths_b,in_block_copy_cluster_lengths_n2,
-                wei_block_copy_cluster_lengths_e,wei_block_copy_cluster_lengths_k)
+                wei_block_copy_cluster_lengths_e,wei_block_copy_cluster_lengths_k) + name_suffix
 
 class igemm_kernel_detail_base_t(object):
     # gemm problem details
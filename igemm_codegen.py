@@ -25,7 +25,7 @@
 ################################################################################
 from __future__ import print_function
 import argparse
-import sys, os, shutil
+import sys, os, shutil, shlex
 
 from igemm.amdgpu import *
 from igemm.codegen import *
@@ -37,6 +37,10 @@ OUT_DIR='out'
 CPP_DIR='driver'
 
 def igemm_host_driver(args, config_content):
+    '''
+    start building host driver in background, return the builder to wait() on.
+    skipped if neither driver source nor defines changed since last build
+    '''
     cpp_src = os.path.join(CPP_DIR, "conv_driver.cpp")
     target_exe = os.path.join(args.dir, "conv_driver.exe")
     sec_root = config_content.get_section('codegen')[0]
@@ -45,52 +49,157 @@ def igemm_host_driver(args, config_content):
     builder = amdgpu_build_host_t(arch, cpp_src, target_exe)
     config_file_name = os.path.abspath(args.config_file)
     hsaco_name = os.path.splitext(os.path.basename(args.config_file))[0] + '.hsaco'
-    rtn = builder.build(cxxflags=['-DIGEMM_CONFIG_FILE=\"{}\"'.format(config_file_name), \
+    builder.start(cxxflags=['-DIGEMM_CONFIG_FILE=\"{}\"'.format(config_file_name), \
                         '-DIGEMM_HSACO=\"{}\"'.format(hsaco_name)])
-    if not rtn:
-        assert False
-
-def igemm_v4r1_emit(args, config_content):
-    '''
-    codegen driver for v4r1
-    '''
-    asm_target = os.path.join(args.dir, os.path.splitext(os.path.basename(args.config_file))[0] + '.s')
-    emitter = codegen_emit_to_file_t(asm_target)
-    sec_root = config_content.get_section('codegen')[0]
-    arch = amdgpu_arch_config_t({
-        'arch'          :   amdgpu_string_to_arch( sec_root['arch'] ),
-        'data_type'     :   AMDGPU_PRECISION_FP32,
-        'code_object'   :   amdgpu_string_to_codeobj( sec_root['code_object']) })
+    return builder
 
-    # create mc
-    mc = codegen_asm_printer_t(emitter, arch)
+def igemm_v4r1_tunable_dicts(config_content):
+    return [sec.to_dict() for sec in config_content if \
+        sec.get_name() == 'v4r1_dynamic_kernel' or sec.get_name() == 'v4r1_1x1_dynamic_kernel']
 
+def igemm_v4r1_emit_global_macros(mc, tunable_dicts):
     # emit hsa header, for once. This be will ignored in cov3
     emit_hsa_header_t(mc).emit()
 
-    # emit global macro, independent of tunable
-    emit_int_div_vv_t(mc).emit()
-    emit_int_div_vs_t(mc).emit()
-    emit_int_div_ss_t(mc).emit()
-    emit_write_4d_strided_t(mc).emit()
-    emit_c_clear_t(mc).emit()
+    # emit global macro, independent of tunable, except the ones of magic_div
+    for m in v4r1_dynamic_global_macro_list(tunable_dicts):
+        m(mc).emit()
 
-    tunable_dicts = [sec.to_dict() for sec in config_content if \
-        sec.get_name() == 'v4r1_dynamic_kernel' or sec.get_name() == 'v4r1_1x1_dynamic_kernel']
+def igemm_v4r1_emit_content(mc, config_content, jobs = 1, cache = None):
+    '''
+    emit everything of v4r1 into mc, without building
+    '''
+    tunable_dicts = igemm_v4r1_tunable_dicts(config_content)
+
+    igemm_v4r1_emit_global_macros(mc, tunable_dicts)
 
     #print(',\n'.join(igemm_tunable_parameter_t(td).serialize_as_init_list() for td in tunable_dicts))
 
+    if jobs > 1 or cache:
+        # render macros and kernel of each tunable in worker process or take them from cache,
+        # output is the same
+        emit_v4r1_dynamic_parallel(mc, tunable_dicts, jobs, cache)
+        return
+
     # emit v4r1 related macros, with different tunable
     emit_v4r1_dynamic_macros(mc, tunable_dicts)
 
     # emit the kernel
     emit_v4r1_dynamic_kernel(mc, tunable_dicts)
 
+def igemm_v4r1_arch_config(config_content):
+    sec_root = config_content.get_section('codegen')[0]
+    return amdgpu_arch_config_t({
+        'arch'          :   amdgpu_string_to_arch( sec_root['arch'] ),
+        'data_type'     :   AMDGPU_PRECISION_FP32,
+        'code_object'   :   amdgpu_string_to_codeobj( sec_root['code_object']) })
+
+def igemm_fragment_cache(args):
+    if args.cache_dir:
+        return codegen_fragment_cache_t(args.cache_dir, args.cache_size * 1024 * 1024)
+    return None
+
+def igemm_v4r1_emit(args, config_content):
+    '''
+    codegen driver for v4r1
+    '''
+    asm_target = os.path.join(args.dir, os.path.splitext(os.path.basename(args.config_file))[0] + '.s')
+    emitter = codegen_emit_to_file_t(asm_target)
+    arch = igemm_v4r1_arch_config(config_content)
+
+    # create mc
+    mc = codegen_asm_printer_t(emitter, arch)
+
+    cache = igemm_fragment_cache(args)
+    igemm_v4r1_emit_content(mc, config_content, args.jobs, cache)
+    if cache:
+        print(cache.get_stats())
 
     builder = amdgpu_build_asm_t(mc, asm_target)
-    rtn = builder.build()
-    if not rtn:
-        assert False
+    return builder.build()
+
+def igemm_v4r1_emit_incremental(args, config_content):
+    '''
+    codegen driver for v4r1, incremental build. macros go to a shared include, each kernel to
+    its own .s, metadata to another .s. only objects whose source changed are assembled, then
+    all objects are linked into the same hsaco as the full build
+    '''
+    arch = igemm_v4r1_arch_config(config_content)
+    if arch.code_object != AMDGPU_CODEOBJECT_V3:
+        print('incremental build only support cov3, fall back to full build')
+        return igemm_v4r1_emit(args, config_content)
+
+    base_name = os.path.splitext(os.path.basename(args.config_file))[0]
+    obj_dir = os.path.join(args.dir, base_name)
+    if not os.path.isdir(obj_dir):
+        os.makedirs(obj_dir)
+
+    cache = igemm_fragment_cache(args)
+    fragments = v4r1_dynamic_render_fragments(arch, igemm_v4r1_tunable_dicts(config_content), args.jobs, cache)
+    if cache:
+        print(cache.get_stats())
+
+    def write_if_changed(file_name, emit_func):
+        # keep file untouched if content is the same
+        mc = codegen_asm_printer_t(codegen_emit_to_buffer_t(), arch)
+        emit_func(mc)
+        content = mc.emitter.get_buffer()
+        if os.path.exists(file_name):
+            with open(file_name) as f:
+                if f.read() == content:
+                    return
+        with open(file_name, 'w') as f:
+            f.write(content)
+
+    macro_inc = os.path.join(args.dir, base_name + '.inc')
+    def emit_macros(mc):
+        igemm_v4r1_emit_global_macros(mc, igemm_v4r1_tunable_dicts(config_content))
+        for i in range(len(V4R1_DYNAMIC_MACRO_LIST)):
+            for fragment in fragments:
+                mc.emit_unique_text(*fragment.macros[i])
+    write_if_changed(macro_inc, emit_macros)
+
+    sources = []
+    kernel_names = set()
+    for fragment in fragments:
+        if fragment.kernel_name in kernel_names:
+            continue
+        kernel_names.add(fragment.kernel_name)
+        def emit_kernel(mc):
+            mc.emit('.include "{}"'.format(os.path.basename(macro_inc)))
+            mc.emit_empty_line()
+            mc.emit(fragment.kernel_text)
+        kernel_asm = os.path.join(obj_dir, fragment.kernel_name + '.s')
+        write_if_changed(kernel_asm, emit_kernel)
+        sources.append((kernel_asm, os.path.splitext(kernel_asm)[0] + '.o', [macro_inc]))
+
+    metadata_asm = os.path.join(obj_dir, base_name + '_metadata.s')
+    write_if_changed(metadata_asm, lambda mc: emit_amd_metadata_t(mc, [f.kernel_info for f in fragments]).emit())
+    sources.append((metadata_asm, os.path.splitext(metadata_asm)[0] + '.o', []))
+
+    toolchain = amdgpu_toolchain_t(arch, shlex.split(args.assembler) if args.assembler else None,
+                        shlex.split(args.linker) if args.linker else None, os.path.abspath(args.dir))
+    builder = amdgpu_build_incremental_t(toolchain, os.path.join(obj_dir, 'manifest.json'))
+    rtn = builder.build(sources, os.path.join(args.dir, base_name + '.hsaco'))
+    print(builder.get_stats())
+    return rtn
+
+def igemm_clean_dir(dir_name, keep_files):
+    '''
+    remove everything in dir_name, except keep_files
+    '''
+    if not os.path.isdir(dir_name):
+        os.makedirs(dir_name)
+        return
+    keep = set(os.path.abspath(f) for f in keep_files)
+    for file_name in os.listdir(dir_name):
+        path = os.path.join(dir_name, file_name)
+        if os.path.abspath(path) in keep:
+            continue
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
 
 def igemm_v4r1_sequence(args, config_content):
     kseq = v4r1_dynamic_kernel_sequencer_t(get_amdgpu_gfx906_60cu(),
@@ -101,6 +210,12 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("config_file", help="config file as input")
     parser.add_argument("-d", "--dir", help="directory of output files", default = OUT_DIR)
+    parser.add_argument("-j", "--jobs", type=int, help="number of process to emit kernels in parallel", default = 1)
+    parser.add_argument("--cache-dir", help="directory of kernel fragment cache, disabled if not given", default = None)
+    parser.add_argument("--cache-size", type=int, help="max size of kernel fragment cache in MiB", default = 256)
+    parser.add_argument("-i", "--incremental", action="store_true", help="keep output directory, only assemble changed kernels")
+    parser.add_argument("--assembler", help="assembler command for incremental build, called as <assembler> src.s -o obj.o", default = None)
+    parser.add_argument("--linker", help="linker command for incremental build, called as <linker> obj.o ... -o target.hsaco", default = None)
     args = parser.parse_args()
 
     config_parser = config_parser_t(args.config_file)
@@ -109,10 +224,30 @@ if __name__ == '__main__':
     #config_content.dump()
 
     if config_content.get_section('codegen')[0]['mode'] in ('flat', 'flatten'):
-        shutil.rmtree(args.dir, ignore_errors=True)
-        os.mkdir(args.dir)
-        igemm_host_driver(args, config_content)
-        igemm_v4r1_emit(args, config_content)
+        if args.incremental:
+            if not os.path.isdir(args.dir):
+                os.makedirs(args.dir)
+        else:
+            # host driver is kept, it is only rebuilt when source or defines changed
+            host_exe = os.path.join(args.dir, "conv_driver.exe")
+            igemm_clean_dir(args.dir, [host_exe, host_exe + '.stamp'])
+        # host driver is built in background while kernels are emitted and assembled
+        host_builder = igemm_host_driver(args, config_content)
+        try:
+            if args.incremental:
+                kernel_rtn = igemm_v4r1_emit_incremental(args, config_content)
+            else:
+                kernel_rtn = igemm_v4r1_emit(args, config_content)
+        finally:
+            host_rtn = host_builder.wait()
+        if host_builder.skipped:
+            print('host driver {} is up to date'.format(host_builder.target_exec))
+        if not host_rtn:
+            print('fail to build host driver {}'.format(host_builder.target_exec))
+        if not kernel_rtn:
+            print('fail to build kernels of {}'.format(args.config_file))
+        if not (host_rtn and kernel_rtn):
+            sys.exit(1)
 
     if config_content.get_section('codegen')[0]['mode'] in ('seq', 'sequencer'):
         # config_content.dump()
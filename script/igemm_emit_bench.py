@@ -0,0 +1,107 @@
+################################################################################
+#
+#  MIT License
+#
+#  Copyright (c) 2020 Advanced Micro Devices, Inc.
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+################################################################################
+# microbenchmark of the asm emitter, lines/second.
+#   python3 script/igemm_emit_bench.py config/igemm_v4r1_dynamic.config
+# emit the whole config through codegen_emit_to_file_t and codegen_emit_to_buffer_t (used by
+# worker process of --jobs), check both texts are byte-identical, then replay the recorded emits
+# through codegen_emit_to_file_t alone. lines are the ones of the .s, a kernel body is emitted
+# as one multi-line string.
+from __future__ import print_function
+import argparse
+import sys, os, time, tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from igemm.codegen import *
+from igemm.codegen import _codegen_indent_t
+from igemm.config_parser import *
+from igemm_codegen import igemm_v4r1_emit_content, igemm_v4r1_arch_config
+
+class _emit_recorder_t(object):
+    '''
+    wrap an emitter, record (indent level, line) of every emit for later replay
+    '''
+    def __init__(self, emitter):
+        self.emitter = emitter
+        self.indent = emitter.indent
+        self.records = []
+    def emit(self, s):
+        self.records.append((self.indent.get(), s))
+        self.emitter.emit(s)
+    def __getattr__(self, name):
+        return getattr(self.emitter, name)
+
+def bench_full(config_content, new_emitter, repeat):
+    best = None
+    for _ in range(repeat):
+        emitter = new_emitter()
+        recorder = _emit_recorder_t(emitter)
+        start = time.time()
+        mc = codegen_asm_printer_t(recorder, igemm_v4r1_arch_config(config_content))
+        igemm_v4r1_emit_content(mc, config_content)
+        mc.close()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, recorder.records, emitter
+
+def bench_replay(records, asm_file, repeat):
+    best = None
+    for _ in range(repeat):
+        emitter = codegen_emit_to_file_t(asm_file, _codegen_indent_t(4))
+        emitter.open()
+        start = time.time()
+        for level, s in records:
+            if level != emitter.get_indent():
+                emitter.set_indent(level)
+            emitter.emit(s)
+        emitter.close()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("config_file", help="config file as input")
+    parser.add_argument("-r", "--repeat", type=int, help="repeat count, best is reported", default = 5)
+    args = parser.parse_args()
+    config_content = config_parser_t(args.config_file)()
+
+    asm_file = os.path.join(tempfile.mkdtemp(), 'bench.s')
+    t_file, records, _ = bench_full(config_content, lambda: codegen_emit_to_file_t(asm_file, _codegen_indent_t(4)), args.repeat)
+    t_buffer, _, buffer_emitter = bench_full(config_content, lambda: codegen_emit_to_buffer_t(_codegen_indent_t(4)), args.repeat)
+    t_replay = bench_replay(records, asm_file, args.repeat)
+
+    with open(asm_file) as f:
+        text = f.read()
+    identical = text == buffer_emitter.get_buffer()
+    lines = text.count('\n')
+    print('{} lines of .s in {} emits, output identical:{}'.format(lines, len(records), identical))
+    print('{:<26} full codegen {:>10.0f} lines/s'.format('codegen_emit_to_file_t', lines / t_file))
+    print('{:<26} full codegen {:>10.0f} lines/s'.format('codegen_emit_to_buffer_t', lines / t_buffer))
+    print('{:<26} emitter only {:>10.0f} lines/s, {:.1f}% of full codegen'.format('codegen_emit_to_file_t',
+                lines / t_replay, 100.0 * t_replay / t_file))
+    if not identical:
+        sys.exit(1)
@@ -0,0 +1,133 @@
+################################################################################
+#
+#  MIT License
+#
+#  Copyright (c) 2020 Advanced Micro Devices, Inc.
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+################################################################################
+# check the bias/activation epilogue of every kernel in a config, on cpu. need numpy.
+#   python3 script/igemm_epilogue_check.py config/igemm_v4r1_dynamic.config
+# bias and activation of each kernel are replaced by every variant of them. emitted epilogue
+# is run for all threads of a workgroup, v_c of a thread is k0, k1, n1, n2 from slowest, and
+# compared with epilogue_ref() on the same output tile. exit 1 if anything differ.
+from __future__ import print_function
+import argparse
+import sys, os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from igemm.codegen import *
+from igemm.igemm_base import *
+from igemm.igemm_algo_v4r1 import *
+from igemm.config_parser import *
+from igemm_codegen import igemm_v4r1_arch_config, igemm_v4r1_tunable_dicts
+
+try:
+    import numpy as np
+except ImportError:
+    print('numpy is needed by this check')
+    sys.exit(1)
+
+from igemm_lane_emulator import *
+
+CLAMP_MIN = np.float32(0.0)     # same as IGEMM_V4R1_DYNAMIC_CLAMP_MIN/MAX of driver
+CLAMP_MAX = np.float32(6.0)
+
+def epilogue_ref(out, bias, activation, clamp_min, clamp_max):
+    '''
+    out is [k, n] of a tile, bias is [k] or None
+    '''
+    out = out.copy()
+    if bias is not None:
+        out = out + bias[:, None]
+    if activation == IGEMM_ACTIVATION_RELU:
+        out = np.maximum(out, np.float32(0))
+    elif activation == IGEMM_ACTIVATION_CLAMP:
+        out = np.minimum(np.maximum(out, clamp_min), clamp_max)
+    return out
+
+def thread_k_n(tunable):
+    '''
+    k and n index in tile of every v_c of every thread, [thread, i]
+    '''
+    t_n2, t_n1, t_k1, t_k0 = tunable.gemm_n_per_thread_subc, tunable.gemm_n_repeat, \
+                tunable.gemm_m_per_thread_subc, tunable.gemm_m_repeat
+    m_cluster = tunable.gemm_m_level0_cluster * tunable.gemm_m_level1_cluster
+    n_cluster = tunable.gemm_n_level0_cluster * tunable.gemm_n_level1_cluster
+    tid_m, tid_n = np.meshgrid(np.arange(m_cluster), np.arange(n_cluster), indexing='ij')
+    tid_m, tid_n = tid_m.reshape(-1, 1), tid_n.reshape(-1, 1)
+    i = np.arange(t_k0 * t_k1 * t_n1 * t_n2).reshape(1, -1)
+    i_n2, i_n1, i_k1, i_k0 = i % t_n2, (i // t_n2) % t_n1, (i // (t_n2 * t_n1)) % t_k1, i // (t_n2 * t_n1 * t_k1)
+    k = i_k0 * t_k1 * m_cluster + tid_m * t_k1 + i_k1
+    n = i_n1 * t_n2 * n_cluster + tid_n * t_n2 + i_n2
+    return k, n, tid_m * t_k1
+
+def check(arch, tunable_dict, rng):
+    tunable = igemm_tunable_parameter_t(tunable_dict)
+    mc = codegen_asm_printer_t(codegen_emit_to_buffer_t(), arch)
+    kernel = emit_v4r1_dynamic_kernel_t(mc, tunable)
+    symbols = kernel.get_kernel_symbols()
+    k, n, k_thread = thread_k_n(tunable)
+    num_k, num_n = k.max() + 1, n.max() + 1
+    block_ik = tunable.k_per_block * rng.randint(0, 4)
+    out = rng.uniform(-8, 8, (num_k, num_n)).astype(np.float32)
+    bias = rng.uniform(-4, 4, block_ik + 2 * num_k).astype(np.float32)
+
+    # bias pointer is not a number here, the sgpr pair holding it is marked by 'bias'
+    m = lane_machine_t(symbols, k.shape[0], buffers = {'bias' : f32_to_bits(bias)})
+    for i in range(k.shape[1]):
+        m.vgpr[symbols['v_c'] + i] = f32_to_bits(out[k[:, i], n[:, i]])
+    if 'v_bias_os' in symbols:
+        m.vgpr[symbols['v_bias_os']] = (4 * (block_ik + k_thread[:, 0])).astype(np.uint64)
+    if 's_p_bias' in symbols:
+        m.sgpr[symbols['s_p_bias']], m.sgpr[symbols['s_p_bias'] + 1] = 'bias', 'bias'
+    if 's_clamp_min' in symbols:
+        m.sgpr[symbols['s_clamp_min']], m.sgpr[symbols['s_clamp_max']] = int(f32_to_bits(CLAMP_MIN)), int(f32_to_bits(CLAMP_MAX))
+    m.run(kernel_stream(kernel, kernel.emit_kernel_writeout_epilogue))
+
+    ref = epilogue_ref(out, bias[block_ik:block_ik + num_k] if tunable.bias else None, tunable.activation, CLAMP_MIN, CLAMP_MAX)
+    wrong = 0
+    for i in range(k.shape[1]):
+        wrong += int(np.count_nonzero(bits_to_f32(m.vgpr[symbols['v_c'] + i]) != ref[k[:, i], n[:, i]]))
+    return kernel.name(), wrong
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("config_file", help="config file as input")
+    parser.add_argument("--seed", type=int, help="seed of random output and bias", default = 0)
+    args = parser.parse_args()
+    config_content = config_parser_t(args.config_file)()
+    arch = igemm_v4r1_arch_config(config_content)
+    rng = np.random.RandomState(args.seed)
+
+    failed = False
+    for tunable_dict in igemm_v4r1_tunable_dicts(config_content):
+        for bias in (0, 1):
+            for activation in sorted(IGEMM_ACTIVATION_NAME):
+                if not bias and activation == IGEMM_ACTIVATION_NONE:
+                    continue
+                td = dict(tunable_dict)
+                td['bias'], td['activation'], td['gemm_k_split'] = bias, activation, 0
+                name, wrong = check(arch, td, rng)
+                print('{}: {} wrong'.format(name, wrong))
+                failed = failed or wrong != 0
+    if failed:
+        sys.exit(1)
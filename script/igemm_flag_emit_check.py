@@ -0,0 +1,120 @@
+################################################################################
+#
+#  MIT License
+#
+#  Copyright (c) 2020 Advanced Micro Devices, Inc.
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+# emit a kernel for every combination of the grid and writeout flags, on tiles of different shape.
+#   python3 script/igemm_flag_emit_check.py
+# a combination is either rejected by igemm_tunable_parameter_t with a message, or need be emitted
+# without any error. an assert in the emitter means the constructor let an invalid combination in.
+# gemm_k_split on a 1-wide m tile of a thread must be rejected, cmpswap need 2 vgpr of v_a.
+from __future__ import print_function
+import argparse
+import itertools
+import sys, os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from igemm.amdgpu import *
+from igemm.codegen import *
+from igemm.codegen import _codegen_indent_t
+from igemm.igemm_base import *
+from igemm.igemm_algo_v4r1 import *
+from igemm_codegen import igemm_v4r1_emit_global_macros
+
+def tile_dict(name, b, k, e, n_repeat, m_subc, n_subc, m_cluster, n_cluster, in_cluster, wei_cluster):
+    return {'name' : name, 'b_per_block' : b, 'k_per_block' : k, 'e_per_block' : e, 'gemm_n_repeat' : n_repeat,
+            'gemm_m_per_thread_subc' : m_subc, 'gemm_n_per_thread_subc' : n_subc,
+            'gemm_m_level0_cluster' : m_cluster[0], 'gemm_m_level1_cluster' : m_cluster[1],
+            'gemm_n_level0_cluster' : n_cluster[0], 'gemm_n_level1_cluster' : n_cluster[1],
+            'in_block_copy_cluster_lengths_e' : in_cluster[0], 'in_block_copy_cluster_lengths_n1' : in_cluster[1],
+            'in_block_copy_cluster_lengths_b' : in_cluster[2], 'in_block_copy_cluster_lengths_n2' : in_cluster[3],
+            'wei_block_copy_cluster_lengths_e' : wei_cluster[0], 'wei_block_copy_cluster_lengths_k' : wei_cluster[1]}
+
+# (name, tunable dict), m x n of a thread is 8x8, 4x4, 1x8 and 1x4
+TILES = [
+    ('8x8',     tile_dict('v4r1_dynamic_kernel', 16, 128, 16, 2, 4, 4, (4, 4), (4, 4), (16, 1, 16, 1), (4, 64))),
+    ('4x4',     tile_dict('v4r1_dynamic_kernel', 16, 64, 8, 1, 4, 4, (4, 4), (4, 4), (8, 1, 16, 2), (8, 32))),
+    ('1x8',     tile_dict('v4r1_dynamic_kernel', 8, 16, 8, 2, 1, 4, (8, 2), (1, 8), (8, 1, 8, 2), (8, 16))),
+    ('1x4 1x1', tile_dict('v4r1_1x1_dynamic_kernel', 8, 16, 8, 1, 1, 4, (8, 2), (1, 8), (8, 1, 8, 2), (8, 16))),
+]
+
+# (key, values), every value except the first sets the flag
+FLAGS = [
+    ('kernarg_compact', (0, 1)),
+    ('magic_div',       (0, 1)),
+    ('grid_2d',         (0, 1)),
+    ('swizzle_group',   (0, 4)),
+    ('gemm_k_split',    (0, 1)),
+    ('persistent',      (0, 1)),
+    ('bias',            (0, 1)),
+    ('vector_store',    (0, 1)),
+]
+
+def emit_one(tunable_dict):
+    '''
+    return None if emitted, or message of the rejection by igemm_tunable_parameter_t
+    '''
+    try:
+        igemm_tunable_parameter_t(tunable_dict)
+    except AssertionError as e:
+        return str(e) or 'no message'
+    mc = codegen_asm_printer_t(codegen_emit_to_buffer_t(_codegen_indent_t(4)),
+            amdgpu_arch_config_t({'arch' : AMDGPU_ARCH_GFX906, 'data_type' : AMDGPU_PRECISION_FP32, 'code_object' : AMDGPU_CODEOBJECT_V3}))
+    igemm_v4r1_emit_global_macros(mc, [tunable_dict])
+    emit_v4r1_dynamic_macros(mc, [tunable_dict])
+    emit_v4r1_dynamic_kernel(mc, [tunable_dict])
+    return None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-v", "--verbose", action="store_true", help="print every rejected combination")
+    args = parser.parse_args()
+
+    fail = 0
+    for tile_name, base_dict in TILES:
+        emitted, rejected = 0, 0
+        for values in itertools.product(*[v for _, v in FLAGS]):
+            tunable_dict = dict(base_dict)
+            tunable_dict.update({key : value for (key, _), value in zip(FLAGS, values)})
+            flags = ','.join(key for (key, _), value in zip(FLAGS, values) if value) or 'none'
+            try:
+                message = emit_one(tunable_dict)
+            except Exception as e:
+                print('[{}] {}: emit fail, {}: {}'.format(tile_name, flags, type(e).__name__, e))
+                fail += 1
+                continue
+            if message is None:
+                emitted += 1
+                one_wide = tunable_dict['gemm_m_per_thread_subc'] == 1 and \
+                        tunable_dict['k_per_block'] == tunable_dict['gemm_m_level0_cluster'] * tunable_dict['gemm_m_level1_cluster']
+                if one_wide and tunable_dict['gemm_k_split']:
+                    print('[{}] {}: gemm_k_split on 1-wide m tile is not rejected'.format(tile_name, flags))
+                    fail += 1
+            else:
+                rejected += 1
+                if args.verbose:
+                    print('[{}] {}: rejected, {}'.format(tile_name, flags, message))
+        print('[{}] {} emitted, {} rejected'.format(tile_name, emitted, rejected))
+    print('fail {}'.format(fail))
+    if fail:
+        sys.exit(1)
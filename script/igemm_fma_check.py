@@ -0,0 +1,123 @@
+################################################################################
+#
+#  MIT License
+#
+#  Copyright (c) 2020 Advanced Micro Devices, Inc.
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+################################################################################
+# check the fma loop of every kernel in a config, on cpu. need numpy.
+#   python3 script/igemm_fma_check.py config/igemm_v4r1_dynamic.config
+# emitted fma body is run for all threads of a workgroup, with both LDS buffers holding the same
+# random a, b tile. global load and LDS store are skipped, so every loop of e_per_block add the
+# same a^T*b, and v_c of a thread (k0, k1, n1, n2 from slowest) is compared with it. only ds_read
+# and fma touch v_a, v_b, v_c here, s_waitcnt is checked by igemm_waitcnt_check.py.
+# exit 1 if anything differ.
+from __future__ import print_function
+import argparse
+import collections
+import sys, os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from igemm.codegen import *
+from igemm.igemm_base import *
+from igemm.igemm_algo_v4r1 import *
+from igemm.config_parser import *
+from igemm_codegen import igemm_v4r1_arch_config, igemm_v4r1_tunable_dicts
+
+try:
+    import numpy as np
+except ImportError:
+    print('numpy is needed by this check')
+    sys.exit(1)
+
+from igemm_lane_emulator import *
+
+FMA_LOOPS = 3       # number of e_per_block of the fma loop
+
+def check(arch, tunable_dict, rng):
+    tunable = igemm_tunable_parameter_t(tunable_dict)
+    mc = codegen_asm_printer_t(codegen_emit_to_buffer_t(), arch)
+    kernel = emit_v4r1_dynamic_kernel_t(mc, tunable)
+    symbols = kernel.get_kernel_symbols()
+    t_n2, t_n1, t_k1, t_k0 = tunable.gemm_n_per_thread_subc, tunable.gemm_n_repeat, \
+                tunable.gemm_m_per_thread_subc, tunable.gemm_m_repeat
+    m_cluster = tunable.gemm_m_level0_cluster * tunable.gemm_m_level1_cluster
+    n_cluster = tunable.gemm_n_level0_cluster * tunable.gemm_n_level1_cluster
+    e = tunable.e_per_block
+    num_k, num_n = tunable.k_per_block, t_n1 * t_n2 * n_cluster
+
+    # small integer, so sum of any order is exact
+    a = rng.randint(-4, 5, (e, num_k)).astype(np.float32)
+    b = rng.randint(-4, 5, (e, num_n)).astype(np.float32)
+    lds = np.zeros(tunable.byte_lds_total // 4, dtype=np.float32)
+    for buf in (0, tunable.byte_lds_single // 4):
+        lds[buf : buf + e * num_n] = b.reshape(-1)
+        lds[buf + tunable.byte_lds_b_np2 // 4 : buf + tunable.byte_lds_b_np2 // 4 + e * num_k] = a.reshape(-1)
+
+    # only register of the gemm, v_a, v_b, v_c and v_sld_*_os, is tracked, global load, LDS store and
+    # others are skipped. sgpr not set is 0
+    tracked = set()
+    for reg, num in (('v_a', tunable.num_accumulate_a_vgpr), ('v_b', tunable.num_accumulate_b_vgpr),
+                ('v_c', tunable.num_accumulate_c_vgpr), ('v_sld_a_os', 1), ('v_sld_b_os', 1)):
+        tracked.update(range(symbols[reg], symbols[reg] + num))
+    # thread of gemm im, in. same as v_sld_a_os, v_sld_b_os from v_gemm_im, v_gemm_in of the kernel
+    tid_m, tid_n = np.meshgrid(np.arange(m_cluster), np.arange(n_cluster), indexing='ij')
+    tid_m, tid_n = tid_m.reshape(-1), tid_n.reshape(-1)
+    m = lane_machine_t(symbols, len(tid_m), tracked = tracked)
+    m.lds = f32_to_bits(lds)
+    m.sgpr = collections.defaultdict(int)
+    m.vgpr[symbols['v_sld_a_os']] = (tid_m * t_k1 * 4 + tunable.byte_lds_b_np2).astype(np.uint64)
+    m.vgpr[symbols['v_sld_b_os']] = (tid_n * t_n2 * 4).astype(np.uint64)
+    for i in range(tunable.num_accumulate_c_vgpr):
+        m.vgpr[symbols['v_c'] + i] = np.zeros(len(tid_m), dtype=np.uint64)
+    # e of whole loop, by any of the sgpr the kernel get it from
+    e_total = FMA_LOOPS * e
+    for s, v in (('s_c', e_total), ('s_split_c', e_total), ('s_wei_stride_c', 1), ('s_wei_stride_k', 4 * e_total)):
+        if s in symbols:
+            m.sgpr[symbols[s]] = v
+    m.run(kernel_stream(kernel, kernel.emit_kernel_fma_body))
+
+    ref = FMA_LOOPS * np.dot(a.T, b)
+    wrong = 0
+    for i in range(tunable.num_accumulate_c_vgpr):
+        i_n2, i_n1, i_k1, i_k0 = i % t_n2, (i // t_n2) % t_n1, (i // (t_n2 * t_n1)) % t_k1, i // (t_n2 * t_n1 * t_k1)
+        k = i_k0 * t_k1 * m_cluster + tid_m * t_k1 + i_k1
+        n = i_n1 * t_n2 * n_cluster + tid_n * t_n2 + i_n2
+        wrong += int(np.count_nonzero(bits_to_f32(m.vgpr[symbols['v_c'] + i]) != ref[k, n]))
+    return kernel.name(), wrong
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("config_file", help="config file as input")
+    parser.add_argument("--seed", type=int, help="seed of random a, b", default = 0)
+    args = parser.parse_args()
+    config_content = config_parser_t(args.config_file)()
+    arch = igemm_v4r1_arch_config(config_content)
+    rng = np.random.RandomState(args.seed)
+
+    failed = False
+    for tunable_dict in igemm_v4r1_tunable_dicts(config_content):
+        name, wrong = check(arch, tunable_dict, rng)
+        print('{}: {} wrong'.format(name, wrong))
+        failed = failed or wrong != 0
+    if failed:
+        sys.exit(1)
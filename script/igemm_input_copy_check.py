@@ -0,0 +1,178 @@
+################################################################################
+#
+#  MIT License
+#
+#  Copyright (c) 2020 Advanced Micro Devices, Inc.
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+################################################################################
+# check global load of input and store of it to LDS of every kernel in a config, on cpu. need numpy.
+#   python3 script/igemm_input_copy_check.py config/igemm_v4r1_dynamic.config
+# every kernel is checked with each way to split its e (1x1 only) and b of input copy into cluster and thread of 1, 2, 4,
+# on convs the kernel is applicable to. emitted in_load and in_sst are run for all threads of a workgroup,
+# LDS of the e_n1_b_n2 tile must be the same as input_ref(), 0 where out of input. exit 1 if anything differ.
+from __future__ import print_function
+import argparse
+import sys, os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from igemm.codegen import *
+from igemm.igemm_base import *
+from igemm.igemm_algo_v4r1 import *
+from igemm.config_parser import *
+from igemm.conv import *
+from igemm_codegen import igemm_v4r1_arch_config, igemm_v4r1_tunable_dicts
+
+try:
+    import numpy as np
+except ImportError:
+    print('numpy is needed by this check')
+    sys.exit(1)
+
+from igemm_lane_emulator import *
+
+# n, hi, wi, y, x, py, px, sy, sx, dy, dx. c is 2 * e_per_block
+INPUT_COPY_CONVS = [(16, 14, 14, 3, 3, 1, 1, 1, 1, 1, 1),
+                    (16, 14, 16, 3, 3, 1, 0, 1, 1, 1, 1),
+                    (16, 9, 10, 3, 3, 1, 0, 1, 1, 1, 1),
+                    (16, 17, 20, 5, 5, 2, 0, 2, 1, 1, 1),
+                    (16, 16, 18, 3, 3, 2, 0, 1, 1, 2, 2),
+                    (16, 15, 15, 3, 3, 1, 1, 2, 2, 1, 1),
+                    (16, 12, 12, 1, 1, 0, 0, 1, 1, 1, 1),
+                    (16, 7, 7, 1, 1, 0, 0, 1, 1, 1, 1)]
+
+def input_copy_variants(tunable_dict):
+    '''
+    every way to copy input by a thread of e (1x1 only) and b of 1, 2, 4, rest of the block goes to n1, n2 cluster
+    '''
+    tunable = igemm_tunable_parameter_t(tunable_dict)
+    variants = []
+    for sub_e in ((1, 2, 4) if tunable.is_1x1() else (1,)):
+        for sub_b in (1, 2, 4):
+            if tunable.e_per_block % sub_e != 0 or tunable.b_per_block % sub_b != 0:
+                continue
+            cluster_e_b = (tunable.e_per_block // sub_e) * (tunable.b_per_block // sub_b)
+            if tunable.block_size % cluster_e_b != 0:
+                continue
+            cluster_n1_n2 = tunable.block_size // cluster_e_b
+            for cluster_n1 in (1, 2, 4, 8):
+                cluster_n2 = cluster_n1_n2 // cluster_n1
+                if cluster_n2 == 0 or cluster_n1 * cluster_n2 != cluster_n1_n2 or tunable.gemm_n_repeat % cluster_n1 != 0 or \
+                        tunable.gemm_n_per_thread_subc % cluster_n2 != 0 or tunable.gemm_n_per_thread_subc // cluster_n2 < 2:
+                    continue
+                td = dict(tunable_dict)
+                td['in_block_copy_cluster_lengths_e'] = tunable.e_per_block // sub_e
+                td['in_block_copy_cluster_lengths_b'] = tunable.b_per_block // sub_b
+                td['in_block_copy_cluster_lengths_n1'] = cluster_n1
+                td['in_block_copy_cluster_lengths_n2'] = cluster_n2
+                variants.append(td)
+    return variants
+
+def input_ref(tunable, conv_param, data, block_ib, e0):
+    '''
+    e_n1_b_n2 tile of input in LDS, e from e0, b from block_ib. 0 if out of input
+    '''
+    n1, n2 = tunable.gemm_n_repeat, tunable.gemm_n_per_thread_subc
+    ie, in1, ib, in2 = np.meshgrid(np.arange(tunable.e_per_block), np.arange(n1), np.arange(tunable.b_per_block), np.arange(n2), indexing='ij')
+    b = block_ib + ib
+    yx = conv_param.y * conv_param.x
+    e = e0 + ie
+    ic, iy, ix = e // yx, (e % yx) // conv_param.x, e % conv_param.x
+    iho, iwo = (b % (conv_param.ho * conv_param.wo)) // conv_param.wo, b % conv_param.wo
+    ihi = conv_param.sy * iho + conv_param.dy * iy - conv_param.py
+    iwi = conv_param.sx * iwo + conv_param.dx * ix - conv_param.px
+    n = (b // (conv_param.ho * conv_param.wo) * n1 + in1) * n2 + in2
+    valid = (ihi >= 0) & (ihi < conv_param.hi) & (iwi >= 0) & (iwi < conv_param.wi)
+    ref = data[n, ic, np.clip(ihi, 0, conv_param.hi - 1), np.clip(iwi, 0, conv_param.wi - 1)]
+    return np.where(valid, ref, np.float32(0)).reshape(-1)
+
+def check(arch, tunable_dict, conv_param, rng):
+    tunable = igemm_tunable_parameter_t(tunable_dict)
+    mc = codegen_asm_printer_t(codegen_emit_to_buffer_t(), arch)
+    kernel = emit_v4r1_dynamic_kernel_t(mc, tunable)
+    symbols = kernel.get_kernel_symbols()
+    n1, n2 = tunable.gemm_n_repeat, tunable.gemm_n_per_thread_subc
+    data = rng.uniform(-4, 4, (conv_param.n, conv_param.c, conv_param.hi, conv_param.wi)).astype(np.float32)
+    b_block_work = conv_param.n // (n1 * n2) * conv_param.ho * conv_param.wo // tunable.b_per_block
+    block_ib = rng.randint(0, b_block_work) * tunable.b_per_block
+    e0 = rng.randint(0, conv_param.c * conv_param.y * conv_param.x // tunable.e_per_block) * tunable.e_per_block
+
+    # index of prepare phase, of every thread
+    index = [v4r1_dynamic_get_dynamic_index(tunable, conv_param, tid, 0) for tid in range(tunable.block_size)]
+    ie, in1, ib, in2 = [np.array([getattr(d, 'v_in_' + x) for d in index]) for x in ('ie', 'in1', 'ib', 'in2')]
+    yx = conv_param.y * conv_param.x
+    e, b = e0 + ie, block_ib + ib
+    iho, iwo = (b % (conv_param.ho * conv_param.wo)) // conv_param.wo, b % conv_param.wo
+    ihi = conv_param.sy * iho + conv_param.dy * ((e % yx) // conv_param.x) - conv_param.py
+    iwi = conv_param.sx * iwo + conv_param.dx * (e % conv_param.x) - conv_param.px
+    n = (b // (conv_param.ho * conv_param.wo) * n1 + in1) * n2 + in2
+    in_os = 4 * (((n * conv_param.c + e // yx) * conv_param.hi + ihi) * conv_param.wi + iwi)
+    flag = (ihi >= 0) & (ihi < conv_param.hi) & (iwi >= 0) & (iwi < conv_param.wi)
+    if tunable.no_pad:
+        assert np.all(flag)
+
+    # buffer load is only from input, its sgpr is marked by 'input'
+    m = lane_machine_t(symbols, tunable.block_size, lds_size = tunable.byte_lds_b, buffers = {'input' : f32_to_bits(data.reshape(-1))})
+    m.vgpr[symbols['v_in_os']] = (in_os & 0xffffffff).astype(np.uint64)
+    m.vgpr[symbols['v_flag']] = flag.astype(np.uint64)
+    m.vgpr[symbols['v_sst_b_os']] = (4 * (((ie * n1 + in1) * tunable.b_per_block + ib) * n2 + in2)).astype(np.uint64)
+    m.sgpr[symbols['s_p_buf_in']] = 'input'
+    m.sgpr[symbols['s_in_stride_n2']] = 4 * conv_param.c * conv_param.hi * conv_param.wi
+    m.sgpr[symbols['s_in_stride_n1']] = 4 * n2 * conv_param.c * conv_param.hi * conv_param.wi
+    if 's_in_stride_e' in symbols:
+        m.sgpr[symbols['s_in_stride_e']] = 4 * conv_param.hi * conv_param.wi
+
+    def copy():
+        kernel._emit(emit_in_load_e_n1_b_n2_t(mc, tunable)('v_gld_b', 's_p_buf_in', 'v_in_os', 's_in_stride_n1', 's_in_stride_n2', 's_in_stride_e', 'v_flag', 's_tmp'))
+        kernel._emit(emit_in_sst_e_n1_b_n2_t(mc, tunable)('v_gld_b', 'v_sst_b_os'))
+    m.run(kernel_stream(kernel, copy))
+    assert np.all(m.mask['exec'])
+
+    ref = f32_to_bits(input_ref(tunable, conv_param, data, block_ib, e0))
+    return kernel.name(), int(np.count_nonzero(m.lds[:len(ref)] != ref))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("config_file", help="config file as input")
+    parser.add_argument("--seed", type=int, help="seed of random input and block position", default = 0)
+    args = parser.parse_args()
+    config_content = config_parser_t(args.config_file)()
+    arch = igemm_v4r1_arch_config(config_content)
+    rng = np.random.RandomState(args.seed)
+
+    failed = False
+    for tunable_dict in igemm_v4r1_tunable_dicts(config_content):
+        for td in input_copy_variants(tunable_dict):
+            tunable = igemm_tunable_parameter_t(td)
+            name, wrong, num_conv = None, 0, 0
+            for n, hi, wi, y, x, py, px, sy, sx, dy, dx in INPUT_COPY_CONVS:
+                conv_param = conv_param_t(n, 1, 2 * tunable.e_per_block, hi, wi, 8, y, x, py, px, sy, sx, dy, dx,
+                                0, 0, CONV_DIRECTION_FWD)
+                if not v4r1_dynamic_is_applicable(tunable, conv_param):
+                    continue
+                name, w = check(arch, td, conv_param, rng)
+                wrong, num_conv = wrong + w, num_conv + 1
+            if num_conv:
+                print('{}, sub_e {}, sub_b {}: {} conv, {} wrong'.format(name, tunable.in_block_copy_sub_lengths_e,
+                            tunable.in_block_copy_sub_lengths_b, num_conv, wrong))
+            failed = failed or wrong != 0
+    if failed:
+        sys.exit(1)
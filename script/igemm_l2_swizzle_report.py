@@ -0,0 +1,61 @@
+################################################################################
+#
+#  MIT License
+#
+#  Copyright (c) 2020 Advanced Micro Devices, Inc.
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+################################################################################
+# L2 traffic estimated by v4r1_dynamic_l2_estimator_t for every swizzle_group of every kernel in
+# a config, and the suggested one, on cpu. conv is forward, n c hi wi k y x [py px sy sx dy dx]
+#   python3 script/igemm_l2_swizzle_report.py config/igemm_v4r1_dynamic.config 128 1024 14 14 2048 1 1
+# only the L2 of gfx906 is modeled, same swizzle_group may not be the best on hardware.
+from __future__ import print_function
+import argparse
+import sys, os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from igemm.amdgpu import *
+from igemm.conv import *
+from igemm.igemm_base import *
+from igemm.igemm_algo_v4r1 import *
+from igemm.config_parser import *
+from igemm_codegen import igemm_v4r1_tunable_dicts
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("config_file", help="config file as input")
+    parser.add_argument("conv", type=int, nargs='+', help="n c hi wi k y x [py px sy sx dy dx]")
+    args = parser.parse_args()
+    assert len(args.conv) in (7, 9, 11, 13), 'need n c hi wi k y x, then optional pad, stride, dilation'
+
+    n, c, hi, wi, k, y, x = args.conv[:7]
+    py, px, sy, sx, dy, dx = (args.conv[7:] + [0, 0, 1, 1, 1, 1][len(args.conv) - 7:])
+    conv_param = conv_param_t(n, 1, c, hi, wi, k, y, x, py, px, sy, sx, dy, dx, 0, 0, CONV_DIRECTION_FWD)
+    arch_detail = get_amdgpu_gfx906_60cu()
+    config_content = config_parser_t(args.config_file)()
+    for tunable_dict in igemm_v4r1_tunable_dicts(config_content):
+        tunable = igemm_tunable_parameter_t(tunable_dict)
+        if not v4r1_dynamic_is_valid(tunable, conv_param):
+            continue
+        estimator = v4r1_dynamic_l2_estimator_t(arch_detail, tunable, conv_param)
+        traffic = ', '.join('{}:{:.1f}MB'.format(g, estimator(g) / (1 << 20)) for g in estimator.get_groups())
+        print('{:<72} swizzle_group {:<4} ({})'.format(igemm_encode_v4r1_kernel_name(tunable), estimator.suggest(), traffic))
@@ -0,0 +1,248 @@
+################################################################################
+#
+#  MIT License
+#
+#  Copyright (c) 2020 Advanced Micro Devices, Inc.
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+################################################################################
+# numpy emulator of emitted code on all lanes of a workgroup, shared by the igemm_*_check.py scripts.
+# only the instructions used by the parts of the kernel they check are known, anything else is an
+# assert. each check keeps its reference model, this only runs the code.
+from __future__ import print_function
+import sys, os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from igemm.codegen import *
+
+import numpy as np
+
+def kernel_stream(kernel, emit):
+    '''
+    ir of what emit() write into kernel, macros expanded
+    '''
+    with kernel._ir_context():
+        emit()
+    return ir_expand(kernel._get_ir(), kernel.get_kernel_macros(), kernel.get_kernel_symbols())
+
+def f32_to_bits(v):
+    return np.asarray(v, dtype=np.float32).view(np.uint32).astype(np.uint64)
+
+def bits_to_f32(v):
+    return np.asarray(v).astype(np.uint32).view(np.float32)
+
+def _i32(v):
+    return v - (1 << 32) if v & 0x80000000 else v
+
+_u = np.uint64
+_vi32 = lambda a: a.astype(np.uint32).view(np.int32).astype(np.int64)
+_vi24 = lambda a: ((a & _u(0xffffff)).astype(np.int64) ^ 0x800000) - 0x800000
+_vf32 = lambda f: lambda *x: f32_to_bits(f(*[bits_to_f32(a) for a in x]))
+
+LANE_VALU = {'v_mov_b32'      : lambda a: a,
+             'v_add_u32'      : lambda a, b: a + b,
+             'v_add_i32'      : lambda a, b: a + b,
+             'v_sub_u32'      : lambda a, b: a - b,
+             'v_sub_i32'      : lambda a, b: a - b,
+             'v_subrev_u32'   : lambda a, b: b - a,
+             'v_mul_lo_u32'   : lambda a, b: a * b,
+             'v_mul_hi_u32'   : lambda a, b: (a * b) >> _u(32),
+             'v_mul_i32_i24'  : lambda a, b: (_vi24(a) * _vi24(b)).astype(np.uint64),
+             'v_lshlrev_b32'  : lambda a, b: b << (a & _u(31)),
+             'v_lshrrev_b32'  : lambda a, b: b >> (a & _u(31)),
+             'v_and_b32'      : lambda a, b: a & b,
+             'v_xor_b32'      : lambda a, b: a ^ b,
+             'v_lshl_or_b32'  : lambda a, b, c: (a << (b & _u(31))) | c,
+             'v_lshl_add_u32' : lambda a, b, c: (a << (b & _u(31))) + c,
+             'v_add_f32'      : _vf32(np.add),
+             'v_max_f32'      : _vf32(np.maximum),
+             'v_min_f32'      : _vf32(np.minimum)}
+
+# dst is also the accumulator
+LANE_VMAC = {'v_mac_f32'      : _vf32(lambda c, a, b: c + a * b),
+             'v_fmac_f32'     : _vf32(lambda c, a, b: c + a * b)}
+
+LANE_VCMP = {'v_cmp_eq_u32'   : lambda a, b: a == b,
+             'v_cmp_le_u32'   : lambda a, b: a <= b,
+             'v_cmp_le_i32'   : lambda a, b: _vi32(a) <= _vi32(b),
+             'v_cmp_gt_i32'   : lambda a, b: _vi32(a) > _vi32(b)}
+
+LANE_SALU = {'s_mov_b32'      : lambda a: a,
+             's_add_u32'      : lambda a, b: a + b,
+             's_sub_i32'      : lambda a, b: a - b,
+             's_mul_i32'      : lambda a, b: a * b,
+             's_lshl_b32'     : lambda a, b: a << (b & 31),
+             's_lshr_b32'     : lambda a, b: a >> (b & 31),
+             's_and_b32'      : lambda a, b: a & b,
+             's_bfe_u32'      : lambda a, b: (a >> (b & 31)) & ((1 << ((b >> 16) & 0x7f)) - 1)}
+
+LANE_SCMP = {'s_cmp_eq_u32'   : lambda a, b: a == b,
+             's_cmp_lt_u32'   : lambda a, b: a < b,
+             's_cmp_gt_i32'   : lambda a, b: _i32(a) > _i32(b)}
+
+LANE_NOP = ('s_waitcnt', 's_barrier')
+
+class lane_machine_t(object):
+    '''
+    every thread of the workgroup in lanes. vgpr is uint64 array of lanes holding 32 bit, a float is kept
+    by its bits. sgpr is int, or a name marking the buffer resource of one of buffers. vcc, exec and sgpr
+    pairs written by compare are bool array of lanes in mask, vector instructions write lanes of exec.
+    LDS is shared by all lanes, so s_barrier is nothing. buffer store is recorded as address -> list of value.
+    with tracked, only scalar, ds_read and instructions writing these vgpr are run, others are skipped
+    '''
+    def __init__(self, symbols, num_lanes, lds_size = 0, buffers = None, tracked = None):
+        self.symbols = symbols
+        self.num_lanes = num_lanes
+        self.vgpr = dict()
+        self.sgpr = dict()
+        self.scc = 0
+        self.mask = {'exec' : np.ones(num_lanes, dtype=bool)}
+        self.lds = np.full(lds_size // 4, 0xffffffff, dtype=np.uint64)
+        self.buffers = {name : np.asarray(data, dtype=np.uint64) for name, data in (buffers or dict()).items()}
+        self.mem = dict()
+        self.tracked = tracked
+
+    def reg(self, operand):
+        return operand.resolve(self.symbols)
+
+    def value(self, operand):
+        if isinstance(operand, ir_reg_t):
+            index, _ = self.reg(operand)
+            if operand.kind == IR_REG_VGPR:
+                return self.vgpr[index]
+            return np.full(self.num_lanes, self.sgpr[index], dtype=np.uint64)
+        return np.full(self.num_lanes, operand.value(self.symbols) & 0xffffffff, dtype=np.uint64)
+
+    def svalue(self, operand):
+        if isinstance(operand, ir_reg_t):
+            return self.sgpr[self.reg(operand)[0]]
+        return operand.value(self.symbols) & 0xffffffff
+
+    def mask_key(self, operand):
+        return operand.name if isinstance(operand, ir_special_t) else self.reg(operand)[0]
+
+    def set_v(self, index, v):
+        old = self.vgpr.get(index, np.zeros(self.num_lanes, dtype=np.uint64))
+        self.vgpr[index] = np.where(self.mask['exec'], np.asarray(v, dtype=np.uint64) & _u(0xffffffff), old).astype(np.uint64)
+
+    def is_run(self, inst):
+        op = inst.opcode
+        if self.tracked is None or op in LANE_SALU or op in LANE_SCMP or op.startswith(('s_branch', 's_cbranch', 'ds_read')):
+            return True
+        dsts = [self.reg(o) for o in inst.operands[:1] if isinstance(o, ir_reg_t) and o.kind == IR_REG_VGPR]
+        return any(set(range(d, d + w)) & self.tracked for d, w in dsts)
+
+    def buffer_address(self, inst):
+        '''
+        byte address of buffer_load/store of every lane, base of the buffer resource is not added
+        '''
+        o = inst.operands
+        assert inst.get_modifier('offen')
+        return self.vgpr[self.reg(o[1])[0]] + self.value(o[3]) + _u(int(inst.get_modifier('offset', 0)))
+
+    def step(self, inst):
+        '''
+        return label to branch to, or None
+        '''
+        op = inst.opcode
+        o = inst.operands
+        if op in LANE_NOP or not self.is_run(inst):
+            return None
+        if op == 's_branch':
+            return o[0].name
+        if op in ('s_cbranch_scc0', 's_cbranch_scc1'):
+            return o[0].name if self.scc == int(op == 's_cbranch_scc1') else None
+        if op in LANE_VALU:
+            self.set_v(self.reg(o[0])[0], LANE_VALU[op](*[self.value(x) for x in o[1:]]))
+        elif op in LANE_VMAC:
+            self.set_v(self.reg(o[0])[0], LANE_VMAC[op](*[self.value(x) for x in o]))
+        elif op in LANE_VCMP:
+            self.mask[self.mask_key(o[0])] = LANE_VCMP[op](self.value(o[1]), self.value(o[2])) & self.mask['exec']
+        elif op == 'v_cndmask_b32':
+            self.set_v(self.reg(o[0])[0], np.where(self.mask[self.mask_key(o[3])], self.value(o[2]), self.value(o[1])))
+        elif op == 'v_swap_b32':
+            a, b = self.reg(o[0])[0], self.reg(o[1])[0]
+            va, vb = self.vgpr[a], self.vgpr[b]
+            self.set_v(a, vb)
+            self.set_v(b, va)
+        elif op in LANE_SALU:
+            self.sgpr[self.reg(o[0])[0]] = LANE_SALU[op](*[self.svalue(x) for x in o[1:]]) & 0xffffffff
+        elif op in LANE_SCMP:
+            self.scc = int(LANE_SCMP[op](self.svalue(o[0]), self.svalue(o[1])))
+        elif op == 's_mov_b64':
+            dst, src = self.reg(o[0])[0], self.reg(o[1])[0]
+            self.sgpr[dst], self.sgpr[dst + 1] = self.sgpr[src], self.sgpr[src + 1]
+        elif op == 's_and_saveexec_b64':
+            self.mask[self.mask_key(o[0])] = self.mask['exec']
+            self.mask['exec'] = self.mask['exec'] & self.mask[self.mask_key(o[1])]
+        elif op in ('s_and_b64', 's_or_b64'):
+            f = np.logical_and if op == 's_and_b64' else np.logical_or
+            self.mask[self.mask_key(o[0])] = f(self.mask[self.mask_key(o[1])], self.mask[self.mask_key(o[2])])
+        elif op.startswith('buffer_load_dword') or op.startswith('buffer_store_dword'):
+            load = op.startswith('buffer_load_dword')
+            data, width = self.reg(o[0])
+            assert width == {'': 1, 'x2': 2, 'x4': 4}[op[len('buffer_load_dword' if load else 'buffer_store_dword'):]]
+            address = self.buffer_address(inst)
+            active = self.mask['exec']
+            assert np.all(address[active] % 4 == 0)
+            if load:
+                name = self.sgpr.get(self.reg(o[2])[0])
+                assert name in self.buffers, 'load not from a known buffer'
+                buf = self.buffers[name]
+                assert np.all(address[active] // 4 + _u(width) <= len(buf))
+                for i in range(width):
+                    self.set_v(data + i, buf[np.where(active, address // 4 + _u(i), 0).astype(np.int64)])
+            else:
+                for lane in np.nonzero(active)[0]:
+                    for i in range(width):
+                        self.mem.setdefault(int(address[lane]) + 4 * i, []).append(self.vgpr[data + i][lane])
+        elif op.startswith('ds_write_b') or op.startswith('ds_read_b'):
+            write = op.startswith('ds_write_b')
+            data, width = self.reg(o[1] if write else o[0])
+            assert width * 32 == int(op[len('ds_write_b' if write else 'ds_read_b'):])
+            address = self.vgpr[self.reg(o[0] if write else o[1])[0]] + _u(int(inst.get_modifier('offset', 0)))
+            active = self.mask['exec']
+            assert np.all(address[active] % 4 == 0) and np.all(address[active] // 4 + _u(width) <= len(self.lds))
+            for i in range(width):
+                index = np.where(active, address // 4 + _u(i), 0).astype(np.int64)
+                if write:
+                    self.lds[index[active]] = self.vgpr[data + i][active]
+                else:
+                    self.set_v(data + i, self.lds[index])
+        else:
+            assert False, 'not known instruction {}'.format(inst.render().strip())
+        return None
+
+    def run(self, stream):
+        '''
+        run stream from the first instruction, branch can only go to label in it
+        '''
+        nodes = [n for n in stream.nodes if isinstance(n, (ir_inst_t, ir_label_t))]
+        labels = {n.name : i for i, n in enumerate(nodes) if isinstance(n, ir_label_t)}
+        pc = 0
+        while pc < len(nodes):
+            n = nodes[pc]
+            pc += 1
+            if isinstance(n, ir_inst_t):
+                target = self.step(n)
+                if target is not None:
+                    assert target in labels, 'branch to {}, out of the code checked'.format(target)
+                    pc = labels[target]
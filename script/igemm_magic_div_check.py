@@ -0,0 +1,124 @@
+################################################################################
+#
+#  MIT License
+#
+#  Copyright (c) 2020 Advanced Micro Devices, Inc.
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+################################################################################
+# check magic number division of magic_div against n // d, on cpu. need numpy.
+#   python3 script/igemm_magic_div_check.py                 every divisor in [1, 2^31)
+#   python3 script/igemm_magic_div_check.py --full 3 7 49   every numerator in [0, 2^31) of given divisors
+#
+# with M = 2^32 + magic, the kernel compute floor(n * M / 2^(32+shift)) = n/d + n*e/(d*2^(32+shift)),
+# e = M*d - 2^(32+shift) is in (0, d]. error term only grow with n, so for a divisor, if the largest
+# multiple of d and the largest n of remainder d-1 below 2^31 are right, every n below 2^31 is.
+# default mode check these 2 numerators and 2^31-1 of every divisor, --full check every numerator.
+from __future__ import print_function
+import argparse
+import sys, os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from igemm.amdgpu import *
+
+try:
+    import numpy as np
+except ImportError:
+    print('numpy is needed by this check')
+    sys.exit(1)
+
+MAGIC_DIV_N_MAX = 0x7fffffff
+
+def magic_div_gen(d):
+    '''
+    vectorized amdgpu_magic_div_u32_gen(), d is uint64 array
+    '''
+    _, shift = np.frexp((d - 1).astype(np.float64))     # bit length of d-1, exact below 2^53
+    shift = shift.astype(np.uint64)
+    one = np.uint64(1)
+    magic = (((one << shift) - d) << np.uint64(32)) // d + one
+    return magic, shift
+
+def magic_div(n, magic, shift):
+    return ((((n * magic) >> np.uint64(32)) + n) & np.uint64(0xffffffff)) >> shift
+
+def check_divisors(d_start, d_end, chunk):
+    '''
+    return list of (d, n) wrong
+    '''
+    failed = []
+    for start in range(d_start, d_end, chunk):
+        d = np.arange(start, min(start + chunk, d_end), dtype=np.uint64)
+        magic, shift = magic_div_gen(d)
+        assert np.all(magic <= np.uint64(0xffffffff))
+        last_multiple = np.uint64(MAGIC_DIV_N_MAX) // d * d
+        last_remainder = np.uint64(MAGIC_DIV_N_MAX + 1) // d * d - np.uint64(1)
+        for n in (last_multiple, last_remainder, np.full_like(d, MAGIC_DIV_N_MAX)):
+            q = magic_div(n, magic, shift)
+            wrong = np.nonzero(q != n // d)[0]
+            failed.extend((int(d[i]), int(n[i])) for i in wrong[:16])
+    return failed
+
+def check_numerators(d, chunk):
+    magic, shift = amdgpu_magic_div_u32_gen(d)
+    failed = []
+    for start in range(0, MAGIC_DIV_N_MAX + 1, chunk):
+        n = np.arange(start, min(start + chunk, MAGIC_DIV_N_MAX + 1), dtype=np.uint64)
+        q = magic_div(n, np.uint64(magic), np.uint64(shift))
+        # q*d <= n < (q+1)*d, cheaper than n // d
+        qd = q * np.uint64(d)
+        wrong = np.nonzero((qd > n) | (qd + np.uint64(d) <= n))[0]
+        failed.extend((d, int(n[i])) for i in wrong[:16])
+    return failed
+
+def check_reference(divisors):
+    '''
+    numpy path here is the same as amdgpu_magic_div_u32_gen()/amdgpu_magic_div_u32()
+    '''
+    d = np.array(divisors, dtype=np.uint64)
+    magic, shift = magic_div_gen(d)
+    for i, di in enumerate(divisors):
+        assert (int(magic[i]), int(shift[i])) == amdgpu_magic_div_u32_gen(di), 'magic of {} differ'.format(di)
+        for n in (0, 1, di - 1, di, MAGIC_DIV_N_MAX // di * di - 1, MAGIC_DIV_N_MAX):
+            assert amdgpu_magic_div_u32(n, int(magic[i]), int(shift[i])) == n // di, '{} / {}'.format(n, di)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--full", type=int, nargs='+', help="check every numerator of these divisors", default = None)
+    parser.add_argument("--max-divisor", type=int, help="check divisors below this", default = MAGIC_DIV_N_MAX + 1)
+    parser.add_argument("--chunk", type=int, help="number of values in one numpy array", default = 1 << 22)
+    args = parser.parse_args()
+
+    check_reference(list(range(1, 4097)) + [(1 << i) + j for i in range(12, 31) for j in (-1, 0, 1)] + [MAGIC_DIV_N_MAX])
+    if args.full:
+        failed = []
+        for d in args.full:
+            f = check_numerators(d, args.chunk)
+            print('divisor {}: every numerator below 2^31, {} wrong'.format(d, len(f)))
+            failed.extend(f)
+    else:
+        failed = check_divisors(1, min(args.max_divisor, MAGIC_DIV_N_MAX + 1), args.chunk)
+        print('divisor 1 ~ {}: {} wrong'.format(min(args.max_divisor, MAGIC_DIV_N_MAX + 1) - 1, len(failed)))
+    for d, n in failed[:16]:
+        print('    {} / {}, magic {}, shift {}, get {}'.format(n, d, *amdgpu_magic_div_u32_gen(d),
+                    amdgpu_magic_div_u32(n, *amdgpu_magic_div_u32_gen(d))))
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,66 @@
+################################################################################
+#
+#  MIT License
+#
+#  Copyright (c) 2020 Advanced Micro Devices, Inc.
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+################################################################################
+# wave quantization of every kernel in a config by v4r1_dynamic_quantization_t, for tile mode (one tile a
+# workgroup, or persistent = 1) and stream-k mode (persistent = 1, gemm_k_split = 1) of the best split, on cpu.
+# conv is forward, n c hi wi k y x [py px sy sx dy dx]
+#   python3 script/igemm_quantization_report.py config/igemm_v4r1_dynamic.config 64 1024 14 14 256 3 3 1 1
+# cost of a unit is in e_per_block loops, only the relative number of two modes make sense.
+from __future__ import print_function
+import argparse
+import sys, os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from igemm.amdgpu import *
+from igemm.conv import *
+from igemm.igemm_base import *
+from igemm.igemm_algo_v4r1 import *
+from igemm.config_parser import *
+from igemm_codegen import igemm_v4r1_tunable_dicts
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("config_file", help="config file as input")
+    parser.add_argument("conv", type=int, nargs='+', help="n c hi wi k y x [py px sy sx dy dx]")
+    args = parser.parse_args()
+    assert len(args.conv) in (7, 9, 11, 13), 'need n c hi wi k y x, then optional pad, stride, dilation'
+
+    n, c, hi, wi, k, y, x = args.conv[:7]
+    py, px, sy, sx, dy, dx = (args.conv[7:] + [0, 0, 1, 1, 1, 1][len(args.conv) - 7:])
+    conv_param = conv_param_t(n, 1, c, hi, wi, k, y, x, py, px, sy, sx, dy, dx, 0, 0, CONV_DIRECTION_FWD)
+    arch_detail = get_amdgpu_gfx906_60cu()
+    config_content = config_parser_t(args.config_file)()
+    for tunable_dict in igemm_v4r1_tunable_dicts(config_content):
+        tunable = igemm_tunable_parameter_t(tunable_dict)
+        if not v4r1_dynamic_is_valid(tunable, conv_param):
+            continue
+        stream_k_dict = dict(tunable_dict)
+        stream_k_dict.update({'persistent' : 1, 'gemm_k_split' : 1, 'grid_2d' : 0})
+        model = v4r1_dynamic_quantization_t(arch_detail, igemm_tunable_parameter_t(stream_k_dict), conv_param)
+        split = model.suggest()
+        print('{:<72} {} tile, {} slot, tile mode {:.3f}, stream-k split {} {:.3f}, use {}'.format(
+                    igemm_encode_v4r1_kernel_name(tunable), model.num_tile, model.slots, model(1), split, model(split),
+                    'stream-k' if split > 1 else 'tile mode'))
@@ -0,0 +1,84 @@
+################################################################################
+#
+#  MIT License
+#
+#  Copyright (c) 2020 Advanced Micro Devices, Inc.
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+# count the igemm tilings populated by v4r1_dynamic_kernel_sequencer_t from the seq config, against a fixed number.
+#   python3 script/igemm_sequencer_count_check.py config/igemm_v4r1_dynamic_seq.config
+# a change of the sequencer that changes the number need update SEQ_CONFIG_TILINGS as well. also checks
+# that input copy shapes of a tiling keep the occupancy of the gemm, and that no two shapes of the
+# same gemm tiling have the same vector width and number of buffer_load of a thread.
+from __future__ import print_function
+import argparse
+import sys, os, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from igemm.amdgpu import *
+from igemm.config_parser import *
+from igemm.igemm_algo_v4r1 import *
+
+# number of tilings of config/igemm_v4r1_dynamic_seq.config
+SEQ_CONFIG_TILINGS = 54973
+
+def check_in_copy_shapes(kseq, tilings):
+    '''
+    return number of tilings breaking the occupancy or the vector width/buffer_load rule of input copy shapes
+    '''
+    fail = 0
+    in_load_of_tiling = dict()
+    for d in tilings:
+        if amdgpu_calculate_occupancy(kseq.arch_detail, d.vgpr_total + kseq.in_copy_vgpr_increase(d.in_copy_thread_e,
+                    d.in_copy_thread_b), d.block_size, d.lds_total) < d.occupancy:
+            print('in copy {}x{} drop occupancy of {}'.format(d.in_copy_thread_e, d.in_copy_thread_b, d.key()))
+            fail += 1
+        gemm_tiling = (d.gemm_m_repeat, d.gemm_n_repeat, d.gemm_m_level0_cluster, d.gemm_n_level0_cluster,
+                    d.gemm_m_level1_cluster, d.gemm_n_level1_cluster)
+        in_load = (d.in_copy_thread_b, d.in_copy_thread_e * d.in_copy_thread_n1 * d.in_copy_thread_n2)
+        thread_e = in_load_of_tiling.setdefault((gemm_tiling, in_load), d.in_copy_thread_e)
+        if thread_e != d.in_copy_thread_e:
+            print('in copy {}x{} and {}x{} have the same load of {}'.format(thread_e, d.in_copy_thread_b,
+                    d.in_copy_thread_e, d.in_copy_thread_b, d.key()))
+            fail += 1
+    return fail
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("config_file", help="seq config file as input")
+    parser.add_argument("-n", "--tilings", type=int, help="expected number of tilings", default = SEQ_CONFIG_TILINGS)
+    args = parser.parse_args()
+    config_content = config_parser_t(args.config_file)()
+
+    kseq = v4r1_dynamic_kernel_sequencer_t(get_amdgpu_gfx906_60cu(), config_content.get_section('v4r1_dynamic_kernel')[0].to_dict())
+    fail = 0
+    num_tilings = 0
+    start = time.time()
+    for gemm_detail in kseq.step_gemm_kernel():
+        tilings = kseq.populate_possible_igemm_tiling(gemm_detail)
+        fail += check_in_copy_shapes(kseq, tilings)
+        num_tilings += len(tilings)
+    print('{} tilings in {:.1f}s, expect {}'.format(num_tilings, time.time() - start, args.tilings))
+    if num_tilings != args.tilings:
+        fail += 1
+    print('fail {}'.format(fail))
+    if fail:
+        sys.exit(1)
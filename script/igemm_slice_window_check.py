@@ -0,0 +1,160 @@
+################################################################################
+#
+#  MIT License
+#
+#  Copyright (c) 2020 Advanced Micro Devices, Inc.
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+################################################################################
+# check the input slice window move of every non 1x1 kernel in a config, on cpu. need numpy.
+#   python3 script/igemm_slice_window_check.py config/igemm_v4r1_dynamic.config
+# every kernel is checked with and without slice_table, and no_pad, unit_stride if the conv allow.
+# emitted window move (and load of next step of slice_table) is run over the whole e=c*y*x for
+# threads of every ie in e_per_block, from the index of prepare phase. v_in_os, and v_in_ihi, v_in_iwi,
+# v_flag if not no_pad, must be the same as computed from e after every move. exit 1 if anything differ.
+from __future__ import print_function
+import argparse
+import sys, os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from igemm.codegen import *
+from igemm.igemm_base import *
+from igemm.igemm_algo_v4r1 import *
+from igemm.config_parser import *
+from igemm.conv import *
+from igemm_codegen import igemm_v4r1_arch_config, igemm_v4r1_tunable_dicts
+
+try:
+    import numpy as np
+except ImportError:
+    print('numpy is needed by this check')
+    sys.exit(1)
+
+from igemm_lane_emulator import *
+
+# n, c_per_e, hi, wi, y, x, py, px, sy, sx, dy, dx. c is c_per_e * e_per_block, so c*y*x is multiple of it
+SLICE_WINDOW_CONVS = [(2, 2, 14, 14, 3, 3, 1, 1, 1, 1, 1, 1),
+                      (2, 2, 14, 14, 3, 3, 0, 0, 1, 1, 1, 1),
+                      (2, 1, 17, 19, 5, 5, 2, 2, 2, 2, 1, 1),
+                      (2, 1, 16, 16, 3, 3, 2, 2, 1, 1, 2, 2),
+                      (2, 3, 9, 12, 1, 7, 0, 3, 1, 1, 1, 1),
+                      (2, 3, 12, 9, 7, 1, 3, 0, 2, 1, 1, 1),
+                      (2, 1, 35, 35, 11, 11, 5, 5, 4, 4, 1, 1),
+                      (2, 2, 8, 10, 2, 3, 0, 1, 1, 2, 3, 1)]
+
+def window_ref(tunable, conv_param, e, iho, iwo, n_os):
+    '''
+    ihi, iwi, flag, offset in byte of input of e, same as v4r1_dynamic_get_dynamic_index()
+    '''
+    yx = conv_param.y * conv_param.x
+    ic, iy, ix = e // yx, (e % yx) // conv_param.x, e % conv_param.x
+    ihi = conv_param.sy * iho + conv_param.dy * iy - conv_param.py
+    iwi = conv_param.sx * iwo + conv_param.dx * ix - conv_param.px
+    flag = (ihi >= 0) & (ihi < conv_param.hi) & (iwi >= 0) & (iwi < conv_param.wi)
+    os = 4 * (n_os + ic * conv_param.hi * conv_param.wi + ihi * conv_param.wi + iwi)
+    return ihi, iwi, flag, os
+
+def check(arch, tunable_dict, conv_param, rng):
+    tunable = igemm_tunable_parameter_t(tunable_dict)
+    mc = codegen_asm_printer_t(codegen_emit_to_buffer_t(), arch)
+    kernel = emit_v4r1_dynamic_kernel_t(mc, tunable)
+    symbols = kernel.get_kernel_symbols()
+    e_per_block, yx = tunable.e_per_block, conv_param.y * conv_param.x
+
+    # every ie in e_per_block, each of 4 random position in output
+    ie = np.tile(np.arange(e_per_block), 4)
+    num_lanes = len(ie)
+    iho, iwo = rng.randint(0, conv_param.ho, num_lanes), rng.randint(0, conv_param.wo, num_lanes)
+    n_os = rng.randint(0, conv_param.n, num_lanes) * conv_param.c * conv_param.hi * conv_param.wi
+    # buffer load is only from slice table, its sgpr is marked by 'slice_table'
+    table = np.array(v4r1_dynamic_get_slice_table(tunable, conv_param), dtype=np.int64) & 0xffffffff
+    m = lane_machine_t(symbols, num_lanes, buffers = {'slice_table' : table})
+    def set_v(symbol, v, offset = 0):
+        m.vgpr[symbols[symbol] + offset] = (np.asarray(v, dtype=np.int64) & 0xffffffff).astype(np.uint64)
+    def get_v(symbol):
+        return m.vgpr[symbols[symbol]]
+
+    # prepare phase
+    ihi, iwi, flag, os = window_ref(tunable, conv_param, ie, iho, iwo, n_os)
+    set_v('v_in_os', os)
+    set_v('v_in_ihi', ihi)
+    set_v('v_in_iwi', iwi)
+    set_v('v_flag', flag)
+    set_v('v_in_ic', ie // yx)
+    set_v('v_in_iy', (ie % yx) // conv_param.x)
+    set_v('v_in_ix', ie % conv_param.x)
+    for s, value in (('s_hi', conv_param.hi), ('s_wi', conv_param.wi), ('s_y', conv_param.y), ('s_x', conv_param.x),
+                     ('s_in_stride_c', conv_param.hi * conv_param.wi), ('s_dilation_h', conv_param.dy),
+                     ('s_dilation_w', conv_param.dx), ('s_in_ic', e_per_block // yx),
+                     ('s_in_iy', (e_per_block % yx) // conv_param.x), ('s_in_ix', e_per_block % conv_param.x)):
+        m.sgpr[symbols[s]] = value
+    if tunable.slice_table:
+        # same as v_lshlrev_b32 v[v_in_tbl+1], 4, v[v_tmp+4] of prepare phase
+        set_v('v_in_tbl', 16 * (ie % yx), 1)
+        m.sgpr[symbols['s_p_buf_tbl']] = 'slice_table'
+        m.run(kernel_stream(kernel, kernel.emit_in_slice_table_load))
+
+    def move():
+        kernel.emit_in_move_slice_window()
+        kernel.emit_in_slice_table_load()
+    body = kernel_stream(kernel, move)
+    wrong = 0
+    for i in range(1, conv_param.c * yx // e_per_block):
+        m.run(body)
+        ihi, iwi, flag, os = window_ref(tunable, conv_param, ie + i * e_per_block, iho, iwo, n_os)
+        wrong += int(np.count_nonzero(get_v('v_in_os') != (os & 0xffffffff)))
+        if not tunable.no_pad:
+            wrong += int(np.count_nonzero(get_v('v_in_ihi') != (ihi & 0xffffffff)))
+            wrong += int(np.count_nonzero(get_v('v_in_iwi') != (iwi & 0xffffffff)))
+            wrong += int(np.count_nonzero(get_v('v_flag') != flag))
+        assert np.all(m.mask['exec'])
+    return kernel.name(), wrong
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("config_file", help="config file as input")
+    parser.add_argument("--seed", type=int, help="seed of random output position", default = 0)
+    args = parser.parse_args()
+    config_content = config_parser_t(args.config_file)()
+    arch = igemm_v4r1_arch_config(config_content)
+    rng = np.random.RandomState(args.seed)
+
+    failed = False
+    for tunable_dict in igemm_v4r1_tunable_dicts(config_content):
+        if igemm_tunable_parameter_t(tunable_dict).is_1x1():
+            continue
+        for slice_table in (0, 1):
+            for no_pad, unit_stride in ((0, 0), (1, 0), (0, 1), (1, 1)):
+                td = dict(tunable_dict)
+                td['slice_table'], td['no_pad'], td['unit_stride'] = slice_table, no_pad, unit_stride
+                name, wrong, num_conv = None, 0, 0
+                for n, c_per_e, hi, wi, y, x, py, px, sy, sx, dy, dx in SLICE_WINDOW_CONVS:
+                    conv_param = conv_param_t(n, 1, c_per_e * td['e_per_block'], hi, wi, 8, y, x, py, px, sy, sx, dy, dx,
+                                    0, 0, CONV_DIRECTION_FWD)
+                    if not v4r1_dynamic_is_applicable(igemm_tunable_parameter_t(td), conv_param):
+                        continue
+                    name, w = check(arch, td, conv_param, rng)
+                    wrong, num_conv = wrong + w, num_conv + 1
+                if num_conv:
+                    print('{}: {} conv, {} wrong'.format(name, num_conv, wrong))
+                failed = failed or wrong != 0
+    if failed:
+        sys.exit(1)
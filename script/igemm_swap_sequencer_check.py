@@ -0,0 +1,143 @@
+################################################################################
+#
+#  MIT License
+#
+#  Copyright (c) 2020 Advanced Micro Devices, Inc.
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+################################################################################
+# check amdgpu_swap_sequencer_t against the scan based planner it replaced, for every power of 2 shape up to 16x16.
+#   python3 script/igemm_swap_sequencer_check.py
+# row r of the matrix need be in register r*col ~ r*col+col-1 right after swaps of row r, and number of
+# v_swap_b32 can not be more than the old planner, and is row*col minus number of cycles of the transpose.
+# old planner is kept here as scan_swap_ref(), it fail or give wrong row on some non-square shapes.
+from __future__ import print_function
+import argparse
+import sys, os, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from igemm.amdgpu import *
+
+def scan_swap_ref(row, col):
+    '''
+    amdgpu_swap_sequencer_t.create_2d_swap() before memoization, linear scan to locate every target
+    '''
+    def check_row_can_omit_swap(indice_2d, cur_row):
+        vector_diff = [abs(indice_2d[cur_row][c] - c) for c in range(col)]
+        if vector_diff[0] % 2 != 0:
+            return False
+        return all(d == vector_diff[0] for d in vector_diff)
+    def locate_indice(indice_2d, target_indice, start_row):
+        for tr in range(start_row, row):
+            for tc in range(0, col):
+                if target_indice == indice_2d[tr][tc]:
+                    return (tr, tc)
+        assert False
+    indice_2d = [[r + c * row for c in range(col)] for r in range(row)]
+    row_touched = [0] * row
+    def next_untouched_row():
+        for r in range(row):
+            if row_touched[r] == 0:
+                return r
+        assert False
+    swap_list = []
+    for r in range(row):
+        if check_row_can_omit_swap(indice_2d, r):
+            swap_list.append('unified for row {}'.format(r))
+            row_touched[indice_2d[r][0] // col] = 1
+            continue
+        swap_list_per_row = []
+        for c in range(col):
+            target_indice = next_untouched_row() * col + c
+            origin_indice = indice_2d[r][c]
+            if origin_indice == target_indice:
+                continue
+            (tr, tc) = locate_indice(indice_2d, target_indice, r)
+            indice_2d[tr][tc] = origin_indice
+            indice_2d[r][c] = target_indice
+            swap_list_per_row.append((origin_indice, target_indice))
+        swap_list.append(swap_list_per_row)
+        row_touched[r] = 1
+    return swap_list
+
+def num_swap(swap_list):
+    return sum(len(sw) for sw in swap_list if type(sw) is not str)
+
+def num_cycle(row, col):
+    '''
+    cycles of register r*col+c <- r+c*row
+    '''
+    seen = [False] * (row * col)
+    cycles = 0
+    for i in range(row * col):
+        if seen[i]:
+            continue
+        cycles += 1
+        while not seen[i]:
+            seen[i] = True
+            r, c = i // col, i % col
+            i = r + c * row
+    return cycles
+
+def wrong_rows(row, col, swap_list):
+    '''
+    rows not in place at the time they are written
+    '''
+    element = list(range(row * col))
+    wrong = []
+    for r in range(row):
+        if type(swap_list[r]) is not str:
+            for a, b in swap_list[r]:
+                element[a], element[b] = element[b], element[a]
+        if element[r * col : (r + 1) * col] != [r + c * row for c in range(col)]:
+            wrong.append(r)
+    return wrong
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-size", type=int, help="check power of 2 row, col from 2 up to this", default = 16)
+    args = parser.parse_args()
+
+    failed = False
+    sizes = [1 << i for i in range(1, args.max_size.bit_length()) if (1 << i) <= args.max_size]
+    for row in sizes:
+        for col in sizes:
+            start = time.time()
+            swap_list = amdgpu_swap_sequencer_t(row, col)()
+            elapsed = time.time() - start
+            assert amdgpu_swap_sequencer_t(row, col)() is swap_list, 'not memoized'
+            start = time.time()
+            try:
+                ref = scan_swap_ref(row, col)
+                ref_text = '{} swaps{}'.format(num_swap(ref), ', wrong row {}'.format(wrong_rows(row, col, ref)) if wrong_rows(row, col, ref) else '')
+            except AssertionError:
+                ref = None
+                ref_text = 'fail'
+            ref_elapsed = time.time() - start
+            wrong = wrong_rows(row, col, swap_list)
+            ok = not wrong and num_swap(swap_list) == row * col - num_cycle(row, col)
+            if ref is not None and not wrong_rows(row, col, ref):
+                ok = ok and num_swap(swap_list) <= num_swap(ref)
+            print('{:2}x{:<2}: {} swaps{}, {:.2f}ms. scan: {}, {:.2f}ms{}'.format(row, col, num_swap(swap_list),
+                        ', wrong row {}'.format(wrong) if wrong else '', elapsed * 1e3, ref_text, ref_elapsed * 1e3, '' if ok else '  <- fail'))
+            failed = failed or not ok
+    if failed:
+        sys.exit(1)
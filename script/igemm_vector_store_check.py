@@ -0,0 +1,133 @@
+################################################################################
+#
+#  MIT License
+#
+#  Copyright (c) 2020 Advanced Micro Devices, Inc.
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+################################################################################
+# check the vector_store writeout of every kernel in a config, on cpu. need numpy.
+#   python3 script/igemm_vector_store_check.py config/igemm_v4r1_dynamic.config
+# vector_store of each kernel is turned on. offsets from emit_kernel_out_vector_prepare() and the
+# store of emit_kernel_writeout_vector() are run for all threads of a workgroup, with a block whose
+# b cross images. every output of the tile must be stored once, with its value. exit 1 if not.
+# division is run by magic_div, the same result as .v_u32_div_vs, see igemm_magic_div_check.py.
+from __future__ import print_function
+import argparse
+import sys, os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from igemm.amdgpu import *
+from igemm.codegen import *
+from igemm.igemm_base import *
+from igemm.igemm_algo_v4r1 import *
+from igemm.config_parser import *
+from igemm_codegen import igemm_v4r1_arch_config, igemm_v4r1_tunable_dicts
+
+try:
+    import numpy as np
+except ImportError:
+    print('numpy is needed by this check')
+    sys.exit(1)
+
+from igemm_lane_emulator import *
+
+def check(arch, tunable_dict, howo, k, rng):
+    tunable = igemm_tunable_parameter_t(tunable_dict)
+    mc = codegen_asm_printer_t(codegen_emit_to_buffer_t(), arch)
+    kernel = emit_v4r1_dynamic_kernel_t(mc, tunable)
+    symbols = kernel.get_kernel_symbols()
+    t_n2, t_n1, t_k1, t_k0 = tunable.gemm_n_per_thread_subc, tunable.gemm_n_repeat, \
+                tunable.gemm_m_per_thread_subc, tunable.gemm_m_repeat
+    m_cluster = tunable.gemm_m_level0_cluster * tunable.gemm_m_level1_cluster
+    k1_len = t_k1 * m_cluster
+    block_ik = tunable.k_per_block * rng.randint(0, k // tunable.k_per_block)
+    block_ib = tunable.b_per_block * rng.randint(1, 8)
+
+    # thread id to gemm_im, gemm_in can be any of them, kernel compute it in prepare phase
+    tid = np.arange(tunable.block_size)
+    gemm_im, gemm_in = tid // tunable.b_per_block, tid % tunable.b_per_block
+    m = lane_machine_t(symbols, tunable.block_size, lds_size = tunable.byte_lds_total)
+    m.vgpr[0] = tid.astype(np.uint64)
+    m.vgpr[symbols['v_gemm_im']] = gemm_im.astype(np.uint64)
+    m.vgpr[symbols['v_gemm_in']] = gemm_in.astype(np.uint64)
+    m.sgpr[symbols['s_block_ik']], m.sgpr[symbols['s_block_ib']] = block_ik, block_ib
+    if tunable.magic_div:
+        magic, shift = amdgpu_magic_div_u32_gen(howo)
+        m.sgpr[symbols['s_magic_1']] = magic
+        m.sgpr[symbols['s_shift_pack_0']] = shift << AMDGPU_MAGIC_DIV_SHIFT_BITS
+    # strides of k1, n1 not scaled by 4 in prepare phase
+    m.sgpr[symbols['s_out_stride_k1']] = howo
+    m.sgpr[symbols['s_out_stride_n1']] = k * howo * t_n2
+    m.run(kernel_stream(kernel, kernel.emit_kernel_out_vector_prepare))
+
+    m.sgpr[symbols['s_out_stride_k0']] = 4 * k1_len * howo
+    m.sgpr[symbols['s_out_stride_k1']] = 4 * howo
+    m.sgpr[symbols['s_out_stride_n1']] = 4 * k * howo * t_n2
+    m.sgpr[symbols['s_out_stride_n2']] = 4 * k * howo
+    out = rng.randint(0, 1 << 30, (tunable.num_accumulate_c_vgpr, tunable.block_size)).astype(np.uint64)
+    for i in range(tunable.num_accumulate_c_vgpr):
+        m.vgpr[symbols['v_c'] + i] = out[i].copy()
+    # branch to L_scalar is out of the code run, so vector store must be taken
+    m.run(kernel_stream(kernel, lambda: kernel.emit_kernel_writeout_vector('L_scalar')))
+
+    # v_c is k0, k1, n1, n2 from slowest, out is n, k, ho*wo, gemm n is n1, b, n2 and b is n0, ho*wo
+    wrong = 0
+    expect = dict()
+    for i in range(tunable.num_accumulate_c_vgpr):
+        i_n2, i_n1, i_k1, i_k0 = i % t_n2, (i // t_n2) % t_n1, (i // (t_n2 * t_n1)) % t_k1, i // (t_n2 * t_n1 * t_k1)
+        k_index = block_ik + i_k0 * k1_len + gemm_im * t_k1 + i_k1
+        b_index = block_ib + gemm_in
+        n_index = (b_index // howo) * t_n1 * t_n2 + i_n1 * t_n2 + i_n2
+        address = 4 * ((n_index * k + k_index) * howo + b_index % howo)
+        for lane in range(tunable.block_size):
+            expect[int(address[lane])] = out[i][lane]
+    for address, value in expect.items():
+        stored = m.mem.get(address, [])
+        if len(stored) != 1 or stored[0] != value:
+            wrong += 1
+    wrong += len(set(m.mem) - set(expect))
+    return kernel.name(), wrong
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("config_file", help="config file as input")
+    parser.add_argument("--seed", type=int, help="seed of random block and output", default = 0)
+    args = parser.parse_args()
+    config_content = config_parser_t(args.config_file)()
+    arch = igemm_v4r1_arch_config(config_content)
+    rng = np.random.RandomState(args.seed)
+
+    failed = False
+    for tunable_dict in igemm_v4r1_tunable_dicts(config_content):
+        td = dict(tunable_dict)
+        td['vector_store'], td['gemm_k_split'], td['magic_div'] = 1, 0, 1
+        try:
+            igemm_tunable_parameter_t(td)
+        except AssertionError as e:
+            print('{}: skip, {}'.format(igemm_encode_v4r1_kernel_name(igemm_tunable_parameter_t(tunable_dict)), e))
+            continue
+        for howo in (td['gemm_n_per_thread_subc'] * 3, 28 * 28, 7 * 8):
+            name, wrong = check(arch, td, howo, 2 * td['k_per_block'], rng)
+            print('{}, ho*wo {}: {} wrong'.format(name, howo, wrong))
+            failed = failed or wrong != 0
+    if failed:
+        sys.exit(1)
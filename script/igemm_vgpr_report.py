@@ -0,0 +1,62 @@
+################################################################################
+#
+#  MIT License
+#
+#  Copyright (c) 2020 Advanced Micro Devices, Inc.
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+################################################################################
+# vgpr count and occupancy of every kernel in a config, hand aliased layout against the
+# one from liveness (vgpr_alloc = 1), on cpu.
+#   python3 script/igemm_vgpr_report.py config/igemm_v4r1_dynamic.config
+# occupancy is waves per CU of gfx906, limited by vgpr and LDS.
+from __future__ import print_function
+import argparse
+import sys, os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from igemm.amdgpu import *
+from igemm.codegen import *
+from igemm.igemm_base import *
+from igemm.igemm_algo_v4r1 import *
+from igemm.config_parser import *
+from igemm_codegen import igemm_v4r1_arch_config, igemm_v4r1_tunable_dicts
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("config_file", nargs='+', help="config files as input")
+    args = parser.parse_args()
+
+    arch_detail = get_amdgpu_gfx906_60cu()
+    print('{:<72}{:>6}{:>6}{:>8}{:>8}'.format('kernel', 'vgpr', 'alloc', 'waves', 'alloc'))
+    for config_file in args.config_file:
+        config_content = config_parser_t(config_file)()
+        arch = igemm_v4r1_arch_config(config_content)
+        for tunable_dict in igemm_v4r1_tunable_dicts(config_content):
+            tunable_dict = dict(tunable_dict)
+            tunable_dict['vgpr_alloc'] = 1
+            tunable = igemm_tunable_parameter_t(tunable_dict)
+            mc = codegen_asm_printer_t(codegen_emit_to_buffer_t(), arch)
+            kernel = emit_v4r1_dynamic_kernel_t(mc, tunable)
+            block_size = v4r1_dynamic_get_block_size(tunable)
+            counts = (kernel.kernel_vgpr.create_layout().get_count(), kernel.kernel_vgpr.get_count())
+            waves = [amdgpu_calculate_waves_per_cu(arch_detail, c, block_size, tunable.byte_lds_total) for c in counts]
+            print('{:<72}{:>6}{:>6}{:>8}{:>8}'.format(kernel.name(), counts[0], counts[1], waves[0], waves[1]))
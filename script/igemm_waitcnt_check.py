@@ -0,0 +1,80 @@
+################################################################################
+#
+#  MIT License
+#
+#  Copyright (c) 2020 Advanced Micro Devices, Inc.
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+################################################################################
+# check s_waitcnt of every kernel in a config, on cpu.
+#   python3 script/igemm_waitcnt_check.py config/igemm_v4r1_dynamic.config
+# the hand placed s_waitcnt and the ones from waitcnt_t are both walked by waitcnt_checker_t,
+# and the count of s_waitcnt/sum of wait count is printed. exit 1 if any register is read
+# before its load complete.
+from __future__ import print_function
+import argparse
+import sys, os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from igemm.codegen import *
+from igemm.igemm_base import *
+from igemm.igemm_algo_v4r1 import *
+from igemm.codegen_waitcnt import *
+from igemm.config_parser import *
+from igemm_codegen import igemm_v4r1_arch_config, igemm_v4r1_tunable_dicts
+
+def kernel_body(arch, tunable_dict):
+    '''
+    expanded body of a kernel, as it is before any pass, and its symbols
+    '''
+    mc = codegen_asm_printer_t(codegen_emit_to_buffer_t(), arch)
+    kernel = emit_v4r1_dynamic_kernel_t(mc, igemm_tunable_parameter_t(tunable_dict))
+    with kernel._ir_context():
+        kernel.emit_kernel_body()
+    symbols = kernel.get_kernel_symbols()
+    return kernel.name(), ir_expand(kernel._get_ir(), kernel.get_kernel_macros(), symbols), symbols
+
+def wait_summary(stream):
+    waits = [ir_parse_waitcnt(n) for n in stream.instructions() if n.opcode == 's_waitcnt']
+    return '{:>3} s_waitcnt, vmcnt sum {:>3}, lgkmcnt sum {:>3}'.format(len(waits),
+                sum(w.get('vmcnt', 0) for w in waits if 'vmcnt' in w), sum(w.get('lgkmcnt', 0) for w in waits if 'lgkmcnt' in w))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("config_file", help="config file as input")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print every error")
+    args = parser.parse_args()
+    config_content = config_parser_t(args.config_file)()
+    arch = igemm_v4r1_arch_config(config_content)
+
+    failed = False
+    for tunable_dict in igemm_v4r1_tunable_dicts(config_content):
+        name, body, symbols = kernel_body(arch, tunable_dict)
+        checker = waitcnt_checker_t(symbols)
+        for title, stream in (('hand', body), ('pass', waitcnt_t(symbols)(body))):
+            errors = checker(stream)
+            print('{} {}: {}, {} error'.format(name, title, wait_summary(stream), len(errors)))
+            if args.verbose:
+                for e in errors:
+                    print('    ' + e)
+            failed = failed or len(errors) != 0
+    if failed:
+        sys.exit(1)